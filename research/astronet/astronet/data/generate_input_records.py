@@ -78,6 +78,7 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
+import collections
 import multiprocessing
 import os
 import sys
@@ -86,6 +87,7 @@ import numpy as np
 import pandas as pd
 import tensorflow as tf
 
+from astronet.data import light_curve_cache
 from astronet.data import preprocess
 
 
@@ -126,24 +128,69 @@ parser.add_argument(
     default=5,
     help="Number of subprocesses for processing the TCEs in parallel.")
 
+parser.add_argument(
+    "--light_curve_cache_dir",
+    type=str,
+    default=None,
+    help="Optional directory of a cache of detrended light curves. If set, each "
+    "Kepler target is detrended once (in parallel, reusing light curves already "
+    "in the cache) before any TCEs are processed, and TCEs on the same target "
+    "share the cached light curve.")
+
+parser.add_argument(
+    "--fast_spline_search",
+    action="store_true",
+    help="Whether to speed up the normalization spline search by warm starting "
+    "outlier rejection between breakpoint spacings and stopping once the BIC "
+    "has stopped improving. The resulting splines may differ slightly.")
+
 # Name and values of the column in the input CSV file to use as training labels.
 _LABEL_COLUMN = "av_training_set"
 _ALLOWED_LABELS = {"PC", "AFP", "NTP"}
 
+# Number of breakpoint spacings without improvement in the BIC after which the
+# spline search stops when --fast_spline_search is set.
+_FAST_SPLINE_SEARCH_PATIENCE = 3
+
 
-def _process_tce(tce):
-  """Processes the light curve for a Kepler TCE and returns an Example proto.
+def _process_tces(tces):
+  """Processes the light curve of a Kepler target and returns Example protos.
 
   Args:
-    tce: Row of the input TCE table.
+    tces: List of rows of the input TCE table, all with the same Kepler ID.
 
   Returns:
-    A tensorflow.train.Example proto containing TCE features.
+    A list of tensorflow.train.Example protos containing the features of each
+    TCE in `tces`.
   """
-  all_time, all_flux = preprocess.read_light_curve(tce.kepid,
-                                                   FLAGS.kepler_data_dir)
-  time, flux = preprocess.process_light_curve(all_time, all_flux)
-  return preprocess.generate_example_for_tce(time, flux, tce)
+  kepid = tces[0].kepid
+  if FLAGS.light_curve_cache_dir:
+    time, flux = _get_light_curve_cache().get(kepid)
+  else:
+    all_time, all_flux = preprocess.read_light_curve(kepid,
+                                                     FLAGS.kepler_data_dir)
+    time, flux = preprocess.process_light_curve(
+        all_time, all_flux, **_spline_params()._asdict())
+  return preprocess.generate_examples_for_tces(time, flux, tces)
+
+
+def _spline_params():
+  if FLAGS.fast_spline_search:
+    return light_curve_cache.SplineParams(
+        warm_start=True, early_stop_patience=_FAST_SPLINE_SEARCH_PATIENCE)
+  return light_curve_cache.SplineParams()
+
+
+_LIGHT_CURVE_CACHE = None
+
+
+def _get_light_curve_cache():
+  """Opens the light curve cache once per process."""
+  global _LIGHT_CURVE_CACHE
+  if _LIGHT_CURVE_CACHE is None:
+    _LIGHT_CURVE_CACHE = light_curve_cache.LightCurveCache(
+        FLAGS.light_curve_cache_dir, _spline_params())
+  return _LIGHT_CURVE_CACHE
 
 
 def _process_file_shard(tce_table, file_name):
@@ -159,18 +206,30 @@ def _process_file_shard(tce_table, file_name):
   tf.logging.info("%s: Processing %d items in shard %s", process_name,
                   shard_size, shard_name)
 
+  # Group the TCEs by Kepler target, so that the light curve of each target is
+  # read once and the views of all its TCEs are generated together.
+  tces_by_kepid = collections.OrderedDict()
+  for i, (_, tce) in enumerate(tce_table.iterrows()):
+    tces_by_kepid.setdefault(tce.kepid, []).append((i, tce))
+
+  examples = [None] * shard_size
+  num_processed = 0
+  for indexed_tces in tces_by_kepid.values():
+    indices, tces = zip(*indexed_tces)
+    for i, example in zip(indices, _process_tces(list(tces))):
+      examples[i] = example
+
+    num_processed += len(tces)
+    if num_processed // 10 > (num_processed - len(tces)) // 10:
+      tf.logging.info("%s: Processed %d/%d items in shard %s", process_name,
+                      num_processed, shard_size, shard_name)
+
+  # Write the examples in the order of the TCE table.
   with tf.python_io.TFRecordWriter(file_name) as writer:
-    num_processed = 0
-    for _, tce in tce_table.iterrows():
-      example = _process_tce(tce)
+    for example in examples:
       if example is not None:
         writer.write(example.SerializeToString())
 
-      num_processed += 1
-      if not num_processed % 10:
-        tf.logging.info("%s: Processed %d/%d items in shard %s", process_name,
-                        num_processed, shard_size, shard_name)
-
   tf.logging.info("%s: Wrote %d items in shard %s", process_name, shard_size,
                   shard_name)
 
@@ -194,6 +253,17 @@ def main(argv):
   tf.logging.info("Filtered to %d TCEs with labels in %s.", num_tces,
                   list(_ALLOWED_LABELS))
 
+  # Detrend each Kepler target once, however many TCEs it has.
+  if FLAGS.light_curve_cache_dir:
+    cache = light_curve_cache.LightCurveCache(FLAGS.light_curve_cache_dir,
+                                              _spline_params())
+    light_curve_cache.build_cache(
+        cache,
+        tce_table["kepid"],
+        FLAGS.kepler_data_dir,
+        num_processes=FLAGS.num_worker_processes)
+    tf.logging.info("Light curve cache contains %d Kepler targets.", len(cache))
+
   # Randomly shuffle the TCE table.
   np.random.seed(123)
   tce_table = tce_table.iloc[np.random.permutation(num_tces)]
@@ -0,0 +1,247 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memory-mapped cache of detrended Kepler light curves.
+
+Several TCEs are often detected on the same target star, and the expensive part
+of preprocessing a TCE (reading the FITS files and fitting the normalization
+spline) only depends on the star. This module detrends each star once and
+stores the result in a columnar on-disk store:
+
+  ${cache_dir}/${spline_params}/time.bin   Contiguous float64 time values.
+  ${cache_dir}/${spline_params}/flux.bin   Contiguous float64 flux values.
+  ${cache_dir}/${spline_params}/index.npy  (kepid, offset, length) records.
+
+where ${spline_params} is a directory name encoding the SplineParams used for
+detrending, so that light curves detrended with different parameters never mix.
+Readers memory map the data files, so any number of processes can read light
+curves from the cache without copying them into memory up front.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import multiprocessing
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from astronet.data import preprocess
+
+_INDEX_DTYPE = np.dtype([("kepid", np.int64), ("offset", np.int64),
+                         ("length", np.int64)])
+
+
+class SplineParams(
+    collections.namedtuple("SplineParams", [
+        "gap_width", "bkspace_min", "bkspace_max", "bkspace_num", "maxiter",
+        "penalty_coeff", "warm_start", "early_stop_patience"
+    ])):
+  """Arguments of preprocess.process_light_curve() other than the light curve.
+
+  The defaults match the defaults of preprocess.process_light_curve().
+  """
+
+  def __new__(cls,
+              gap_width=0.75,
+              bkspace_min=0.5,
+              bkspace_max=20,
+              bkspace_num=20,
+              maxiter=5,
+              penalty_coeff=1.0,
+              warm_start=False,
+              early_stop_patience=None):
+    return super(SplineParams, cls).__new__(cls, gap_width, bkspace_min,
+                                            bkspace_max, bkspace_num, maxiter,
+                                            penalty_coeff, warm_start,
+                                            early_stop_patience)
+
+  @property
+  def dirname(self):
+    return "_".join(
+        "%s=%r" % (name, value) for name, value in self._asdict().items())
+
+
+class LightCurveCache(object):
+  """Columnar store of detrended light curves for one set of SplineParams.
+
+  A single process should add light curves (see build_cache()); after flush(),
+  any number of processes can open the cache and read from it.
+  """
+
+  def __init__(self, cache_dir, spline_params=None):
+    """Opens (or creates) a cache.
+
+    Args:
+      cache_dir: Base directory of the cache.
+      spline_params: SplineParams used to detrend the light curves. Defaults to
+          SplineParams().
+    """
+    self.spline_params = spline_params or SplineParams()
+    self._dir = os.path.join(cache_dir, self.spline_params.dirname)
+    if not os.path.isdir(self._dir):
+      os.makedirs(self._dir)
+
+    self._time_file = os.path.join(self._dir, "time.bin")
+    self._flux_file = os.path.join(self._dir, "flux.bin")
+    self._index_file = os.path.join(self._dir, "index.npy")
+
+    self._index = {}  # kepid -> (offset, length)
+    if os.path.exists(self._index_file):
+      for kepid, offset, length in np.load(self._index_file):
+        self._index[int(kepid)] = (int(offset), int(length))
+    self._size = max([offset + length
+                      for offset, length in self._index.values()] or [0])
+    self._truncated = False
+    self._time = None
+    self._flux = None
+
+  def __len__(self):
+    return len(self._index)
+
+  def __contains__(self, kepid):
+    return int(kepid) in self._index
+
+  def kepids(self):
+    """Returns the set of Kepler ids in the cache."""
+    return set(self._index)
+
+  def add(self, kepid, time, flux):
+    """Appends the detrended light curve of a Kepler target to the cache.
+
+    The light curve is not visible to other processes until flush() is called.
+
+    Args:
+      kepid: Kepler id of the target star.
+      time: 1D NumPy array; the time values of the light curve.
+      flux: 1D NumPy array; the normalized flux values of the light curve.
+
+    Raises:
+      ValueError: If time and flux have different lengths.
+    """
+    if len(time) != len(flux):
+      raise ValueError("time and flux must have the same length. Got %d vs %d" %
+                       (len(time), len(flux)))
+    if not self._truncated:
+      # Drop data appended after the last flush, e.g. by an interrupted build.
+      for data_file in (self._time_file, self._flux_file):
+        if os.path.exists(data_file):
+          with open(data_file, "r+b") as f:
+            f.truncate(self._size * 8)
+      self._truncated = True
+    with open(self._time_file, "ab") as f:
+      f.write(np.ascontiguousarray(time, dtype=np.float64).tobytes())
+    with open(self._flux_file, "ab") as f:
+      f.write(np.ascontiguousarray(flux, dtype=np.float64).tobytes())
+    self._index[int(kepid)] = (self._size, len(time))
+    self._size += len(time)
+    # The memory maps no longer cover the whole file.
+    self._time = None
+    self._flux = None
+
+  def flush(self):
+    """Writes the index of light curves added so far."""
+    index = np.array(
+        [(kepid, offset, length)
+         for kepid, (offset, length) in sorted(self._index.items())],
+        dtype=_INDEX_DTYPE)
+    tmp_file = self._index_file + ".tmp.npy"
+    np.save(tmp_file, index)
+    os.rename(tmp_file, self._index_file)
+
+  def get(self, kepid):
+    """Returns the detrended light curve of a Kepler target.
+
+    Args:
+      kepid: Kepler id of the target star.
+
+    Returns:
+      time: 1D NumPy array; read-only view of the time values.
+      flux: 1D NumPy array; read-only view of the normalized flux values.
+
+    Raises:
+      KeyError: If the light curve is not in the cache.
+    """
+    offset, length = self._index[int(kepid)]
+    if self._time is None:
+      if self._size:
+        self._time = np.memmap(
+            self._time_file, dtype=np.float64, mode="r", shape=(self._size,))
+        self._flux = np.memmap(
+            self._flux_file, dtype=np.float64, mode="r", shape=(self._size,))
+      else:
+        self._time = self._flux = np.zeros([0], dtype=np.float64)
+    return (self._time[offset:offset + length],
+            self._flux[offset:offset + length])
+
+
+def _detrend_star(args):
+  """Reads and detrends the light curve of a single Kepler target."""
+  kepid, kepler_data_dir, spline_params = args
+  all_time, all_flux = preprocess.read_light_curve(kepid, kepler_data_dir)
+  time, flux = preprocess.process_light_curve(all_time, all_flux,
+                                              **spline_params._asdict())
+  return kepid, time, flux
+
+
+def build_cache(cache, kepids, kepler_data_dir, num_processes=1,
+                flush_every=100):
+  """Detrends every Kepler target not already in the cache.
+
+  Targets are detrended in a pool of worker processes and written to the cache
+  by the calling process. The index is flushed periodically, so an interrupted
+  build resumes where it stopped.
+
+  Args:
+    cache: LightCurveCache to fill.
+    kepids: Iterable of Kepler ids; duplicates are detrended only once.
+    kepler_data_dir: Base directory containing Kepler data. See
+        kepler_io.kepler_filenames().
+    num_processes: Number of worker processes.
+    flush_every: Number of new light curves between flushes of the index.
+
+  Returns:
+    The number of light curves added to the cache.
+  """
+  missing = sorted(set(int(kepid) for kepid in kepids) - cache.kepids())
+  tf.logging.info("%d of %d Kepler targets are not in the cache.", len(missing),
+                  len(missing) + len(cache))
+  if not missing:
+    return 0
+
+  tasks = [(kepid, kepler_data_dir, cache.spline_params) for kepid in missing]
+  if num_processes > 1:
+    pool = multiprocessing.Pool(processes=num_processes)
+    results = pool.imap_unordered(_detrend_star, tasks)
+  else:
+    pool = None
+    results = (_detrend_star(task) for task in tasks)
+
+  try:
+    for num_added, (kepid, time, flux) in enumerate(results, 1):
+      cache.add(kepid, time, flux)
+      if not num_added % flush_every:
+        cache.flush()
+        tf.logging.info("Detrended %d/%d Kepler targets.", num_added,
+                        len(missing))
+  finally:
+    cache.flush()
+    if pool is not None:
+      pool.close()
+      pool.join()
+
+  return len(missing)
@@ -0,0 +1,102 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for light_curve_cache.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tempfile
+
+from absl import flags
+from absl.testing import absltest
+import numpy as np
+
+from astronet.data import light_curve_cache
+
+FLAGS = flags.FLAGS
+
+
+class LightCurveCacheTest(absltest.TestCase):
+
+  def setUp(self):
+    super(LightCurveCacheTest, self).setUp()
+    self.cache_dir = tempfile.mkdtemp(dir=FLAGS.test_tmpdir)
+
+  def testAddAndGet(self):
+    cache = light_curve_cache.LightCurveCache(self.cache_dir)
+    cache.add(1234, np.arange(5.0), np.ones(5))
+    cache.add(5678, np.arange(3.0) + 10, np.zeros(3))
+    self.assertLen(cache, 2)
+    self.assertIn(1234, cache)
+    self.assertNotIn(42, cache)
+
+    time, flux = cache.get(1234)
+    np.testing.assert_array_equal(time, [0, 1, 2, 3, 4])
+    np.testing.assert_array_equal(flux, [1, 1, 1, 1, 1])
+    time, flux = cache.get(5678)
+    np.testing.assert_array_equal(time, [10, 11, 12])
+    np.testing.assert_array_equal(flux, [0, 0, 0])
+
+    with self.assertRaises(KeyError):
+      cache.get(42)
+    with self.assertRaises(ValueError):
+      cache.add(42, np.arange(3.0), np.ones(2))
+
+  def testReopen(self):
+    cache = light_curve_cache.LightCurveCache(self.cache_dir)
+    cache.add(1234, np.arange(5.0), np.ones(5))
+    cache.flush()
+    # Not flushed, so it is discarded when the cache is next written to.
+    cache.add(5678, np.arange(3.0), np.zeros(3))
+
+    cache = light_curve_cache.LightCurveCache(self.cache_dir)
+    self.assertEqual({1234}, cache.kepids())
+    cache.add(9012, np.arange(2.0) + 7, np.ones(2) * 2)
+    cache.flush()
+
+    cache = light_curve_cache.LightCurveCache(self.cache_dir)
+    self.assertEqual({1234, 9012}, cache.kepids())
+    time, flux = cache.get(1234)
+    np.testing.assert_array_equal(time, [0, 1, 2, 3, 4])
+    np.testing.assert_array_equal(flux, [1, 1, 1, 1, 1])
+    time, flux = cache.get(9012)
+    np.testing.assert_array_equal(time, [7, 8])
+    np.testing.assert_array_equal(flux, [2, 2])
+
+  def testSplineParamsAreSeparate(self):
+    cache = light_curve_cache.LightCurveCache(self.cache_dir)
+    cache.add(1234, np.arange(5.0), np.ones(5))
+    cache.flush()
+
+    other_params = light_curve_cache.SplineParams(bkspace_num=10)
+    self.assertNotEqual(light_curve_cache.SplineParams().dirname,
+                        other_params.dirname)
+    other_cache = light_curve_cache.LightCurveCache(self.cache_dir,
+                                                    other_params)
+    self.assertEmpty(other_cache)
+
+  def testBuildCacheSkipsCachedTargets(self):
+    cache = light_curve_cache.LightCurveCache(self.cache_dir)
+    cache.add(1234, np.arange(5.0), np.ones(5))
+    cache.flush()
+    # All targets are cached, so nothing is read from the (missing) data dir.
+    num_added = light_curve_cache.build_cache(cache, [1234, 1234],
+                                              "/does/not/exist")
+    self.assertEqual(0, num_added)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -53,23 +53,56 @@ def read_light_curve(kepid, kepler_data_dir):
   return kepler_io.read_kepler_light_curve(file_names)
 
 
-def process_light_curve(all_time, all_flux):
+def process_light_curve(all_time,
+                        all_flux,
+                        gap_width=0.75,
+                        bkspace_min=0.5,
+                        bkspace_max=20,
+                        bkspace_num=20,
+                        maxiter=5,
+                        penalty_coeff=1.0,
+                        warm_start=False,
+                        early_stop_patience=None):
   """Removes low-frequency variability from a light curve.
 
   Args:
     all_time: A list of numpy arrays; the time values of the raw light curve.
     all_flux: A list of numpy arrays corresponding to the time arrays in
         all_time.
+    gap_width: Minimum gap size (in time units) on which to split the light
+        curve into segments before fitting the spline.
+    bkspace_min: Minimum breakpoint spacing to try. See
+        kepler_spline.fit_kepler_spline().
+    bkspace_max: Maximum breakpoint spacing to try.
+    bkspace_num: Number of breakpoint spacings to try.
+    maxiter: Maximum number of attempts to fit each spline after removing badly
+        fit points.
+    penalty_coeff: Coefficient of the penalty term for using more parameters in
+        the Bayesian Information Criterion.
+    warm_start: Whether to warm start outlier rejection from the previous
+        breakpoint spacing. See kepler_spline.choose_kepler_spline().
+    early_stop_patience: Number of consecutive breakpoint spacings without
+        improvement in the BIC after which to stop, or None to try them all.
 
   Returns:
     time: 1D NumPy array; the time values of the light curve.
     flux: 1D NumPy array; the normalized flux values of the light curve.
   """
   # Split on gaps.
-  all_time, all_flux = util.split(all_time, all_flux, gap_width=0.75)
-
-  # Fit a piecewise-cubic spline with default arguments.
-  spline = kepler_spline.fit_kepler_spline(all_time, all_flux, verbose=False)[0]
+  all_time, all_flux = util.split(all_time, all_flux, gap_width=gap_width)
+
+  # Fit a piecewise-cubic spline.
+  spline = kepler_spline.fit_kepler_spline(
+      all_time,
+      all_flux,
+      bkspace_min=bkspace_min,
+      bkspace_max=bkspace_max,
+      bkspace_num=bkspace_num,
+      maxiter=maxiter,
+      penalty_coeff=penalty_coeff,
+      verbose=False,
+      warm_start=warm_start,
+      early_stop_patience=early_stop_patience)[0]
 
   # Concatenate the piecewise light curve and spline.
   time = np.concatenate(all_time)
@@ -207,6 +240,95 @@ def local_view(time,
       t_max=min(period / 2, duration * num_durations))
 
 
+def _normalize_views(views):
+  """Batched version of the normalization in generate_view()."""
+  views -= np.median(views, axis=1, keepdims=True)
+  views /= np.abs(np.min(views, axis=1, keepdims=True))
+  return views
+
+
+def generate_views_for_tces(time,
+                            flux,
+                            tces,
+                            num_global_bins=2001,
+                            global_bin_width_factor=1 / 2001,
+                            num_local_bins=201,
+                            local_bin_width_factor=0.16,
+                            num_durations=4):
+  """Generates global and local views for many TCEs on the same light curve.
+
+  Equivalent to calling global_view() and local_view() on the phase folded
+  light curve of each TCE, but the median filters of all TCEs are computed
+  together by median_filter.median_filter_batch().
+
+  Args:
+    time: 1D NumPy array; the time values of the light curve.
+    flux: 1D NumPy array; the normalized flux values of the light curve.
+    tces: List of dict-like objects containing at least 'tce_period',
+        'tce_duration', and 'tce_time0bk'.
+    num_global_bins: The number of bins of the global views.
+    global_bin_width_factor: Width of the global view bins, as a fraction of
+        period.
+    num_local_bins: The number of bins of the local views.
+    local_bin_width_factor: Width of the local view bins, as a fraction of
+        duration.
+    num_durations: The number of durations to consider on either side of 0 in
+        the local views.
+
+  Returns:
+    global_views: NumPy array of shape [len(tces), num_global_bins].
+    local_views: NumPy array of shape [len(tces), num_local_bins].
+  """
+  folded_times = []
+  folded_fluxes = []
+  for tce in tces:
+    folded_time, folded_flux = phase_fold_and_sort_light_curve(
+        time, flux, tce["tce_period"], tce["tce_time0bk"])
+    folded_times.append(folded_time)
+    folded_fluxes.append(folded_flux)
+
+  periods = [tce["tce_period"] for tce in tces]
+  durations = [tce["tce_duration"] for tce in tces]
+
+  global_views = median_filter.median_filter_batch(
+      folded_times,
+      folded_fluxes,
+      num_global_bins,
+      bin_widths=[period * global_bin_width_factor for period in periods],
+      x_mins=[-period / 2 for period in periods],
+      x_maxs=[period / 2 for period in periods])
+  local_views = median_filter.median_filter_batch(
+      folded_times,
+      folded_fluxes,
+      num_local_bins,
+      bin_widths=[duration * local_bin_width_factor for duration in durations],
+      x_mins=[
+          max(-period / 2, -duration * num_durations)
+          for period, duration in zip(periods, durations)
+      ],
+      x_maxs=[
+          min(period / 2, duration * num_durations)
+          for period, duration in zip(periods, durations)
+      ])
+
+  return _normalize_views(global_views), _normalize_views(local_views)
+
+
+def _make_example(tce, global_view_values, local_view_values):
+  """Makes a tf.train.Example from the views and features of a TCE."""
+  ex = tf.train.Example()
+
+  # Set time series features.
+  example_util.set_float_feature(ex, "global_view", global_view_values)
+  example_util.set_float_feature(ex, "local_view", local_view_values)
+
+  # Set other features in `tce`.
+  for name, value in tce.items():
+    example_util.set_feature(ex, name, [value])
+
+  return ex
+
+
 def generate_example_for_tce(time, flux, tce):
   """Generates a tf.train.Example representing an input TCE.
 
@@ -226,17 +348,29 @@ def generate_example_for_tce(time, flux, tce):
 
   time, flux = phase_fold_and_sort_light_curve(time, flux, period, t0)
 
-  # Make output proto.
-  ex = tf.train.Example()
+  return _make_example(tce, global_view(time, flux, period),
+                       local_view(time, flux, period, duration))
 
-  # Set time series features.
-  example_util.set_float_feature(ex, "global_view",
-                                 global_view(time, flux, period))
-  example_util.set_float_feature(ex, "local_view",
-                                 local_view(time, flux, period, duration))
 
-  # Set other features in `tce`.
-  for name, value in tce.items():
-    example_util.set_feature(ex, name, [value])
+def generate_examples_for_tces(time, flux, tces):
+  """Generates tf.train.Examples for many TCEs on the same light curve.
 
-  return ex
+  Equivalent to calling generate_example_for_tce() on each TCE, but the views
+  of all TCEs are computed together by generate_views_for_tces().
+
+  Args:
+    time: 1D NumPy array; the time values of the light curve.
+    flux: 1D NumPy array; the normalized flux values of the light curve.
+    tces: List of dict-like objects containing at least 'tce_period',
+        'tce_duration', and 'tce_time0bk'. Additional items are included as
+        features in the output.
+
+  Returns:
+    A list of tf.train.Examples, one for each TCE in `tces`.
+  """
+  global_views, local_views = generate_views_for_tces(time, flux, tces)
+  return [
+      _make_example(tce, global_view_values, local_view_values)
+      for tce, global_view_values, local_view_values in zip(
+          tces, global_views, local_views)
+  ]
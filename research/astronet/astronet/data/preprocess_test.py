@@ -0,0 +1,79 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for preprocess.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+import numpy as np
+
+from astronet.data import preprocess
+
+
+class PreprocessTest(absltest.TestCase):
+
+  def setUp(self):
+    super(PreprocessTest, self).setUp()
+    rng = np.random.RandomState(0)
+    self.time = np.sort(rng.uniform(0, 90, 4000))
+    self.flux = 1 + 0.01 * rng.randn(4000)
+    self.tces = [
+        {"tce_period": 3.5, "tce_duration": 0.2, "tce_time0bk": 1.3},
+        {"tce_period": 11.0, "tce_duration": 0.45, "tce_time0bk": 4.0},
+        {"tce_period": 0.9, "tce_duration": 0.3, "tce_time0bk": 0.1},
+    ]
+    for tce in self.tces:
+      # Add a transit to the light curve.
+      phase = np.mod(self.time - tce["tce_time0bk"] + tce["tce_period"] / 2,
+                     tce["tce_period"]) - tce["tce_period"] / 2
+      self.flux[np.abs(phase) < tce["tce_duration"] / 2] -= 0.05
+
+  def testGenerateViewsForTces(self):
+    global_views, local_views = preprocess.generate_views_for_tces(
+        self.time, self.flux, self.tces)
+    self.assertEqual(global_views.shape, (3, 2001))
+    self.assertEqual(local_views.shape, (3, 201))
+
+    for i, tce in enumerate(self.tces):
+      time, flux = preprocess.phase_fold_and_sort_light_curve(
+          self.time, self.flux, tce["tce_period"], tce["tce_time0bk"])
+      np.testing.assert_allclose(
+          global_views[i], preprocess.global_view(time, flux,
+                                                  tce["tce_period"]))
+      np.testing.assert_allclose(
+          local_views[i],
+          preprocess.local_view(time, flux, tce["tce_period"],
+                                tce["tce_duration"]))
+
+  def testGenerateExamplesForTces(self):
+    examples = preprocess.generate_examples_for_tces(self.time, self.flux,
+                                                     self.tces)
+    self.assertLen(examples, 3)
+
+    for tce, ex in zip(self.tces, examples):
+      expected = preprocess.generate_example_for_tce(self.time, self.flux, tce)
+      for name in ["global_view", "local_view"]:
+        np.testing.assert_allclose(
+            ex.features.feature[name].float_list.value,
+            expected.features.feature[name].float_list.value)
+      for name in tce:
+        self.assertEqual(ex.features.feature[name],
+                         expected.features.feature[name])
+
+
+if __name__ == "__main__":
+  absltest.main()
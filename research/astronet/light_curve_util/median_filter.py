@@ -21,31 +21,15 @@ from __future__ import print_function
 import numpy as np
 
 
-def median_filter(x, y, num_bins, bin_width=None, x_min=None, x_max=None):
-  """Computes the median y-value in uniform intervals (bins) along the x-axis.
-
-  The interval [x_min, x_max) is divided into num_bins uniformly spaced
-  intervals of width bin_width. The value computed for each bin is the median
-  of all y-values whose corresponding x-value is in the interval.
+# Upper bound on the number of elements gathered at once by _binned_medians().
+_MAX_GATHER_SIZE = 1 << 22
 
-  NOTE: x must be sorted in ascending order or the results will be incorrect.
 
-  Args:
-    x: 1D array of x-coordinates sorted in ascending order. Must have at least 2
-        elements, and all elements cannot be the same value.
-    y: 1D array of y-coordinates with the same size as x.
-    num_bins: The number of intervals to divide the x-axis into. Must be at
-        least 2.
-    bin_width: The width of each bin on the x-axis. Must be positive, and less
-        than x_max - x_min. Defaults to (x_max - x_min) / num_bins.
-    x_min: The inclusive leftmost value to consider on the x-axis. Must be less
-        than or equal to the largest value of x. Defaults to min(x).
-    x_max: The exclusive rightmost value to consider on the x-axis. Must be
-        greater than x_min. Defaults to max(x).
+def _validate_args(x, y, num_bins, bin_width, x_min, x_max):
+  """Validates the arguments of median_filter() and fills in defaults.
 
   Returns:
-    1D NumPy array of size num_bins containing the median y-values of uniformly
-    spaced bins on the x-axis.
+    bin_width, x_min, x_max: The validated values, with defaults filled in.
 
   Raises:
     ValueError: If an argument has an inappropriate value.
@@ -81,40 +65,155 @@ def median_filter(x, y, num_bins, bin_width=None, x_min=None, x_max=None):
         "bin_width (got: %d) must be less than x_max - x_min (got: %d)" %
         (bin_width, x_max - x_min))
 
+  return bin_width, x_min, x_max
+
+
+def _bin_bounds(x, num_bins, bin_width, x_min, x_max):
+  """Returns the [start, end) index range of x falling in each bin.
+
+  The bin at index i contains all elements x[j] such that
+  bin_min <= x[j] < bin_max, where bin_min and bin_max are the endpoints of
+  bin i. The endpoints are accumulated exactly as a loop advancing one bin at
+  a time would, so bins match the C++ implementation at their boundaries.
+  """
   bin_spacing = (x_max - x_min - bin_width) / (num_bins - 1)
+  steps = np.full(num_bins, bin_spacing, dtype=np.float64)
+  steps[0] = x_min
+  bin_mins = np.cumsum(steps)
+  steps[0] = x_min + bin_width
+  bin_maxs = np.cumsum(steps)
+  return (np.searchsorted(x, bin_mins, side="left"),
+          np.searchsorted(x, bin_maxs, side="left"))
 
-  # Bins with no y-values will fall back to the global median.
-  result = np.repeat(np.median(y), num_bins)
-
-  # Find the first element of x >= x_min. This loop is guaranteed to produce
-  # a valid index because we know that x_min <= x[-1].
-  x_start = 0
-  while x[x_start] < x_min:
-    x_start += 1
-
-  # The bin at index i is the median of all elements y[j] such that
-  # bin_min <= x[j] < bin_max, where bin_min and bin_max are the endpoints of
-  # bin i.
-  bin_min = x_min  # Left endpoint of the current bin.
-  bin_max = x_min + bin_width  # Right endpoint of the current bin.
-  j_start = x_start  # Inclusive left index of the current bin.
-  j_end = x_start  # Exclusive end index of the current bin.
-
-  for i in range(num_bins):
-    # Move j_start to the first index of x >= bin_min.
-    while j_start < x_len and x[j_start] < bin_min:
-      j_start += 1
-
-    # Move j_end to the first index of x >= bin_max (exclusive end index).
-    while j_end < x_len and x[j_end] < bin_max:
-      j_end += 1
-
-    if j_end > j_start:
-      # Compute and insert the median bin value.
-      result[i] = np.median(y[j_start:j_end])
-
-    # Advance the bin.
-    bin_min += bin_spacing
-    bin_max += bin_spacing
+
+def _binned_medians(y, starts, ends, default):
+  """Computes the median of y[starts[i]:ends[i]] for every i.
+
+  The bins are gathered into a padded 2D array (in chunks of bounded size) and
+  sorted along rows, so the medians of all bins are computed in a handful of
+  vectorized operations regardless of how much the bins overlap.
+
+  Args:
+    y: 1D NumPy array.
+    starts: 1D array of inclusive start indices into y.
+    ends: 1D array of exclusive end indices into y.
+    default: 1D array of values for empty bins.
+
+  Returns:
+    1D float64 NumPy array with one median per bin.
+  """
+  result = np.array(default, dtype=np.float64)
+  lengths = ends - starts
+  nonempty = np.flatnonzero(lengths > 0)
+  if not nonempty.size:
+    return result
+
+  # Process bins in order of size so that little padding is needed per chunk.
+  nonempty = nonempty[np.argsort(lengths[nonempty], kind="mergesort")]
+  chunk_start = 0
+  while chunk_start < len(nonempty):
+    # The last bin of a chunk is its largest.
+    max_length = lengths[nonempty[min(chunk_start + 1024, len(nonempty)) - 1]]
+    chunk_size = max(1, min(1024, _MAX_GATHER_SIZE // int(max_length)))
+    bins = nonempty[chunk_start:chunk_start + chunk_size]
+    chunk_start += chunk_size
+    bin_starts = starts[bins]
+    bin_lengths = lengths[bins]
+    offsets = np.arange(bin_lengths.max())
+    valid = offsets < bin_lengths[:, np.newaxis]
+    indices = np.where(valid, bin_starts[:, np.newaxis] + offsets, 0)
+    # Padding sorts after every real value.
+    values = np.where(valid, y[indices], np.inf)
+    values.sort(axis=1)
+    rows = np.arange(len(bins))
+    lo = values[rows, (bin_lengths - 1) // 2]
+    hi = values[rows, bin_lengths // 2]
+    result[bins] = (lo + hi) / 2
 
   return result
+
+
+def median_filter(x, y, num_bins, bin_width=None, x_min=None, x_max=None):
+  """Computes the median y-value in uniform intervals (bins) along the x-axis.
+
+  The interval [x_min, x_max) is divided into num_bins uniformly spaced
+  intervals of width bin_width. The value computed for each bin is the median
+  of all y-values whose corresponding x-value is in the interval.
+
+  NOTE: x must be sorted in ascending order or the results will be incorrect.
+
+  Args:
+    x: 1D array of x-coordinates sorted in ascending order. Must have at least 2
+        elements, and all elements cannot be the same value.
+    y: 1D array of y-coordinates with the same size as x.
+    num_bins: The number of intervals to divide the x-axis into. Must be at
+        least 2.
+    bin_width: The width of each bin on the x-axis. Must be positive, and less
+        than x_max - x_min. Defaults to (x_max - x_min) / num_bins.
+    x_min: The inclusive leftmost value to consider on the x-axis. Must be less
+        than or equal to the largest value of x. Defaults to min(x).
+    x_max: The exclusive rightmost value to consider on the x-axis. Must be
+        greater than x_min. Defaults to max(x).
+
+  Returns:
+    1D NumPy array of size num_bins containing the median y-values of uniformly
+    spaced bins on the x-axis.
+
+  Raises:
+    ValueError: If an argument has an inappropriate value.
+  """
+  bin_width, x_min, x_max = _validate_args(x, y, num_bins, bin_width, x_min,
+                                           x_max)
+  x = np.asarray(x)
+  y = np.asarray(y)
+  starts, ends = _bin_bounds(x, num_bins, bin_width, x_min, x_max)
+
+  # Bins with no y-values will fall back to the global median.
+  return _binned_medians(y, starts, ends, np.repeat(np.median(y), num_bins))
+
+
+def median_filter_batch(xs, ys, num_bins, bin_widths, x_mins, x_maxs):
+  """Applies median_filter() to many (x, y) pairs at once.
+
+  All inputs share num_bins, so the bins of every input are reduced together.
+  This is used to build the views of many TCEs in one pass.
+
+  Args:
+    xs: List of 1D arrays of x-coordinates, each sorted in ascending order.
+    ys: List of 1D arrays of y-coordinates corresponding to xs.
+    num_bins: The number of intervals to divide each x-axis into.
+    bin_widths: List of bin widths, one per input (None entries use the
+        default of median_filter()).
+    x_mins: List of inclusive leftmost values, one per input (or None).
+    x_maxs: List of exclusive rightmost values, one per input (or None).
+
+  Returns:
+    2D NumPy array of shape [len(xs), num_bins]; row i equals
+    median_filter(xs[i], ys[i], num_bins, bin_widths[i], x_mins[i], x_maxs[i]).
+
+  Raises:
+    ValueError: If an argument has an inappropriate value.
+  """
+  if not len(xs) == len(ys) == len(bin_widths) == len(x_mins) == len(x_maxs):
+    raise ValueError("xs, ys, bin_widths, x_mins and x_maxs must have the same "
+                     "length")
+
+  all_starts = []
+  all_ends = []
+  defaults = []
+  offset = 0
+  for x, y, bin_width, x_min, x_max in zip(xs, ys, bin_widths, x_mins, x_maxs):
+    bin_width, x_min, x_max = _validate_args(x, y, num_bins, bin_width, x_min,
+                                             x_max)
+    starts, ends = _bin_bounds(np.asarray(x), num_bins, bin_width, x_min, x_max)
+    all_starts.append(starts + offset)
+    all_ends.append(ends + offset)
+    defaults.append(np.repeat(np.median(y), num_bins))
+    offset += len(x)
+
+  if not offset:
+    return np.zeros([0, num_bins])
+  result = _binned_medians(
+      np.concatenate([np.asarray(y) for y in ys]), np.concatenate(all_starts),
+      np.concatenate(all_ends), np.concatenate(defaults))
+  return result.reshape([len(xs), num_bins])
@@ -0,0 +1,150 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+r"""Benchmarks implementations of the binned median filter.
+
+Times the global (2001 bins) and local (201 bins) views of synthetic phase
+folded light curves computed with:
+  loop:   The original bin-by-bin Python loop (reproduced below).
+  numpy:  median_filter.median_filter().
+  batch:  median_filter.median_filter_batch() over all TCEs at once.
+  c++:    The CLIF wrapper of light_curve_util/cc/median_filter.h, if built.
+
+Usage:
+  python light_curve_util/median_filter_benchmark.py --num_tces=100
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from light_curve_util import median_filter
+
+try:
+  from light_curve_util.cc.python import median_filter as cc_median_filter  # pylint:disable=g-import-not-at-top
+except ImportError:
+  cc_median_filter = None
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument(
+    "--num_tces", type=int, default=100, help="Number of TCEs to process.")
+
+parser.add_argument(
+    "--num_points",
+    type=int,
+    default=65000,
+    help="Number of points per light curve (about 4 years of long cadence "
+    "data).")
+
+
+def _median_filter_loop(x, y, num_bins, bin_width, x_min, x_max):
+  """The original implementation of median_filter.median_filter()."""
+  x_len = len(x)
+  bin_spacing = (x_max - x_min - bin_width) / (num_bins - 1)
+  result = np.repeat(np.median(y), num_bins)
+  x_start = 0
+  while x[x_start] < x_min:
+    x_start += 1
+  bin_min = x_min
+  bin_max = x_min + bin_width
+  j_start = x_start
+  j_end = x_start
+  for i in range(num_bins):
+    while j_start < x_len and x[j_start] < bin_min:
+      j_start += 1
+    while j_end < x_len and x[j_end] < bin_max:
+      j_end += 1
+    if j_end > j_start:
+      result[i] = np.median(y[j_start:j_end])
+    bin_min += bin_spacing
+    bin_max += bin_spacing
+  return result
+
+
+def _make_tces(num_tces, num_points, seed=0):
+  """Returns synthetic (x, y, period, duration) phase folded light curves."""
+  rng = np.random.RandomState(seed)
+  tces = []
+  for _ in range(num_tces):
+    period = rng.uniform(0.5, 50)
+    duration = rng.uniform(0.05, 0.5)
+    x = np.sort(rng.uniform(-period / 2, period / 2, size=num_points))
+    y = 1 + 1e-4 * rng.normal(size=num_points)
+    y[np.abs(x) < duration / 2] -= 1e-3
+    tces.append((x, y, period, duration))
+  return tces
+
+
+def _view_args(tce):
+  x, y, period, duration = tce
+  global_args = (x, y, 2001, period / 2001, -period / 2, period / 2)
+  local_args = (x, y, 201, duration * 0.16, max(-period / 2, -duration * 4),
+                min(period / 2, duration * 4))
+  return global_args, local_args
+
+
+def _time_per_tce(fn, tces):
+  start = time.time()
+  results = []
+  for tce in tces:
+    global_args, local_args = _view_args(tce)
+    results.append((fn(*global_args), fn(*local_args)))
+  return time.time() - start, results
+
+
+def _time_batch(tces):
+  start = time.time()
+  global_args, local_args = zip(*[_view_args(tce) for tce in tces])
+  results = []
+  for args in (global_args, local_args):
+    xs, ys, num_bins, bin_widths, x_mins, x_maxs = zip(*args)
+    results.append(
+        median_filter.median_filter_batch(xs, ys, num_bins[0], bin_widths,
+                                          x_mins, x_maxs))
+  return time.time() - start, list(zip(*results))
+
+
+def main(argv):
+  del argv  # Unused.
+
+  tces = _make_tces(FLAGS.num_tces, FLAGS.num_points)
+  timings = [("loop", _time_per_tce(_median_filter_loop, tces)),
+             ("numpy", _time_per_tce(median_filter.median_filter, tces)),
+             ("batch", _time_batch(tces))]
+  if cc_median_filter is not None:
+    timings.append(("c++", _time_per_tce(cc_median_filter.median_filter, tces)))
+  else:
+    print("C++ median filter is not built; skipping.")
+
+  loop_time, expected = timings[0][1]
+  for name, (elapsed, results) in timings:
+    max_error = max(
+        np.max(np.abs(np.asarray(view) - expected_view))
+        for result, expected_result in zip(results, expected)
+        for view, expected_view in zip(result, expected_result))
+    print("%-6s %8.3f s  %8.2f ms/TCE  %6.1fx  max abs diff %g" %
+          (name, elapsed, 1000 * elapsed / len(tces), loop_time / elapsed,
+           max_error))
+
+
+if __name__ == "__main__":
+  FLAGS, unparsed = parser.parse_known_args()
+  main([sys.argv[0]] + unparsed)
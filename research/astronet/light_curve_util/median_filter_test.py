@@ -123,6 +123,40 @@ class MedianFilterTest(absltest.TestCase):
     result = median_filter.median_filter(x, y, num_bins=5)
     np.testing.assert_array_equal([7, 1, 5, 2, 3], result)
 
+  def testMatchesBruteForce(self):
+    rng = np.random.RandomState(123)
+    x = np.sort(rng.uniform(-3, 3, size=1000))
+    y = rng.normal(size=1000)
+    for num_bins, bin_width in [(50, 0.01), (50, 0.5), (201, 0.3)]:
+      result = median_filter.median_filter(
+          x, y, num_bins=num_bins, bin_width=bin_width, x_min=-3.5, x_max=3.5)
+      bin_spacing = (7 - bin_width) / (num_bins - 1)
+      for i in range(num_bins):
+        bin_min = -3.5 + i * bin_spacing
+        in_bin = (x >= bin_min) & (x < bin_min + bin_width)
+        if np.any(in_bin):
+          self.assertAlmostEqual(np.median(y[in_bin]), result[i])
+        else:
+          self.assertEqual(np.median(y), result[i])
+
+  def testBatch(self):
+    rng = np.random.RandomState(123)
+    xs = [np.sort(rng.uniform(-3, 3, size=n)) for n in (10, 1000, 500)]
+    ys = [rng.normal(size=len(x)) for x in xs]
+    bin_widths = [1, 0.05, None]
+    x_mins = [-2, -3, None]
+    x_maxs = [2, 3, None]
+    result = median_filter.median_filter_batch(xs, ys, 31, bin_widths, x_mins,
+                                               x_maxs)
+    self.assertEqual((3, 31), result.shape)
+    for i in range(3):
+      np.testing.assert_array_equal(
+          median_filter.median_filter(xs[i], ys[i], 31, bin_widths[i],
+                                      x_mins[i], x_maxs[i]), result[i])
+
+    with self.assertRaises(ValueError):
+      median_filter.median_filter_batch(xs, ys, 31, bin_widths, x_mins, [])
+
 
 if __name__ == '__main__':
   absltest.main()
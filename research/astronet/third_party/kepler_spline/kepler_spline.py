@@ -4,6 +4,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import multiprocessing
 import warnings
 
 import numpy as np
@@ -22,7 +23,12 @@ class SplineError(Exception):
   pass
 
 
-def kepler_spline(time, flux, bkspace=1.5, maxiter=5, outlier_cut=3):
+def kepler_spline(time,
+                  flux,
+                  bkspace=1.5,
+                  maxiter=5,
+                  outlier_cut=3,
+                  initial_mask=None):
   """Computes a best-fit spline curve for a light curve segment.
 
   The spline is fit using an iterative process to remove outliers that may cause
@@ -40,6 +46,9 @@ def kepler_spline(time, flux, bkspace=1.5, maxiter=5, outlier_cut=3):
         fit points.
     outlier_cut: The maximum number of standard deviations from the median
         spline residual before a point is considered an outlier.
+    initial_mask: Optional boolean mask of the points to use for the first fit,
+        e.g. the final mask of a fit with a similar break point spacing. If
+        None, the first fit uses all points.
 
   Returns:
     spline: The values of the fitted spline corresponding to the input time
@@ -70,7 +79,10 @@ def kepler_spline(time, flux, bkspace=1.5, maxiter=5, outlier_cut=3):
 
   for _ in range(maxiter):
     if spline is None:
-      mask = np.ones_like(time, dtype=np.bool)  # Try to fit all points.
+      if initial_mask is None:
+        mask = np.ones_like(time, dtype=np.bool)  # Try to fit all points.
+      else:
+        mask = np.asarray(initial_mask, dtype=np.bool)
     else:
       # Choose points where the absolute deviation from the median residual is
       # less than outlier_cut*sigma, where sigma is a robust estimate of the
@@ -138,12 +150,82 @@ class SplineMetadata(object):
     self.bic = None
 
 
+def _fit_piecewise_spline(args):
+  """Fits a spline with a single break-point spacing to every segment.
+
+  Args:
+    args: Tuple (all_time, all_flux, bkspace, maxiter, initial_masks, verbose);
+        see choose_kepler_spline(). initial_masks is a list with an initial
+        mask (or None) for each segment, or None.
+
+  Returns:
+    spline: List of numpy arrays; the spline of each segment, or None if the
+        break-point spacing caused a SplineError.
+    light_curve_mask: List of boolean numpy arrays indicating which points were
+        used to fit the spline of each segment.
+    nparams: Total number of free parameters in the piecewise spline.
+    npoints: Total number of data points used to fit the piecewise spline.
+    ssr: Sum of squared residuals between the model and the spline.
+  """
+  all_time, all_flux, bkspace, maxiter, initial_masks, verbose = args
+  if initial_masks is None:
+    initial_masks = [None] * len(all_time)
+
+  nparams = 0  # Total number of free parameters in the piecewise spline.
+  npoints = 0  # Total number of data points used to fit the piecewise spline.
+  ssr = 0  # Sum of squared residuals between the model and the spline.
+
+  spline = []
+  light_curve_mask = []
+  for time, flux, initial_mask in zip(all_time, all_flux, initial_masks):
+    # Fit B-spline to this light-curve segment.
+    try:
+      spline_piece, mask = kepler_spline(
+          time,
+          flux,
+          bkspace=bkspace,
+          maxiter=maxiter,
+          initial_mask=initial_mask)
+    except InsufficientPointsError as e:
+      # It's expected to occasionally see intervals with insufficient points,
+      # especially if periodic signals have been removed from the light curve.
+      # Skip this interval, but continue fitting the spline.
+      if verbose:
+        warnings.warn(str(e))
+      spline.append(np.array([np.nan] * len(flux)))
+      light_curve_mask.append(np.zeros_like(flux, dtype=np.bool))
+      continue
+    except SplineError as e:
+      # It's expected to get a SplineError occasionally for small values of
+      # bkspace. Skip this bkspace.
+      if verbose:
+        warnings.warn("Bad bkspace %.4f: %s" % (bkspace, e))
+      return None, None, 0, 0, 0
+
+    spline.append(spline_piece)
+    light_curve_mask.append(mask)
+
+    # Accumulate the number of free parameters.
+    total_time = np.max(time) - np.min(time)
+    nknots = int(total_time / bkspace) + 1  # From the bspline implementation.
+    nparams += nknots + 3 - 1  # number of knots + degree of spline - 1
+
+    # Accumulate the number of points and the squared residuals.
+    npoints += np.sum(mask)
+    ssr += np.sum((flux[mask] - spline_piece[mask])**2)
+
+  return spline, light_curve_mask, nparams, npoints, ssr
+
+
 def choose_kepler_spline(all_time,
                          all_flux,
                          bkspaces,
                          maxiter=5,
                          penalty_coeff=1.0,
-                         verbose=True):
+                         verbose=True,
+                         warm_start=False,
+                         early_stop_patience=None,
+                         num_processes=1):
   """Computes the best-fit Kepler spline across a break-point spacings.
 
   Some Kepler light curves have low-frequency variability, while others have
@@ -157,6 +239,12 @@ def choose_kepler_spline(all_time,
   divided into different segments (e.g. split by quarter breaks or gaps in the
   in the data). A separate spline is fit for each segment.
 
+  The break-point spacings are tried in the given order, num_processes at a
+  time. With the default arguments the result does not depend on
+  num_processes. Setting warm_start and early_stop_patience trades exactness
+  for speed: outlier masks are carried over from the previous spacing, and the
+  search stops once the BIC has not improved for several spacings.
+
   Args:
     all_time: List of 1D numpy arrays; the time values of the light curve.
     all_flux: List of 1D numpy arrays; the flux values of the light curve.
@@ -170,6 +258,15 @@ def choose_kepler_spline(all_time,
     verbose: Whether to log individual spline errors. Note that if bkspaces
         contains many values (particularly small ones) then this may cause
         logging pollution if calling this function for many light curves.
+    warm_start: Whether to start the outlier rejection of each segment from the
+        mask found with the most recently completed break-point spacing, rather
+        than from all points. Neighbouring spacings usually reject the same
+        outliers, so this saves refitting iterations.
+    early_stop_patience: If set, stop trying break-point spacings once this many
+        consecutive spacings have failed to improve on the best BIC.
+    num_processes: Number of break-point spacings to fit in parallel, each in a
+        separate process. When many light curves are processed it is usually
+        better to parallelize across light curves instead.
 
   Returns:
     spline: List of numpy arrays; values of the best-fit spline corresponding to
@@ -201,70 +298,63 @@ def choose_kepler_spline(all_time,
   # https://www.mathworks.com/help/stats/mad.html.
   sigma = np.median(np.abs(scaled_diffs)) * 1.48
 
-  for bkspace in bkspaces:
-    nparams = 0  # Total number of free parameters in the piecewise spline.
-    npoints = 0  # Total number of data points used to fit the piecewise spline.
-    ssr = 0  # Sum of squared residuals between the model and the spline.
-
-    spline = []
-    light_curve_mask = []
-    bad_bkspace = False  # Indicates that the current bkspace should be skipped.
-    for time, flux in zip(all_time, all_flux):
-      # Fit B-spline to this light-curve segment.
-      try:
-        spline_piece, mask = kepler_spline(
-            time, flux, bkspace=bkspace, maxiter=maxiter)
-      except InsufficientPointsError as e:
-        # It's expected to occasionally see intervals with insufficient points,
-        # especially if periodic signals have been removed from the light curve.
-        # Skip this interval, but continue fitting the spline.
-        if verbose:
-          warnings.warn(str(e))
-        spline.append(np.array([np.nan] * len(flux)))
-        light_curve_mask.append(np.zeros_like(flux, dtype=np.bool))
-        continue
-      except SplineError as e:
-        # It's expected to get a SplineError occasionally for small values of
-        # bkspace. Skip this bkspace.
-        if verbose:
-          warnings.warn("Bad bkspace %.4f: %s" % (bkspace, e))
-        metadata.bad_bkspaces.append(bkspace)
-        bad_bkspace = True
-        break
-
-      spline.append(spline_piece)
-      light_curve_mask.append(mask)
-
-      # Accumulate the number of free parameters.
-      total_time = np.max(time) - np.min(time)
-      nknots = int(total_time / bkspace) + 1  # From the bspline implementation.
-      nparams += nknots + 3 - 1  # number of knots + degree of spline - 1
-
-      # Accumulate the number of points and the squared residuals.
-      npoints += np.sum(mask)
-      ssr += np.sum((flux[mask] - spline_piece[mask])**2)
-
-    if bad_bkspace or not npoints:
-      continue
-
-    # The following term is -2*ln(L), where L is the likelihood of the data
-    # given the model, under the assumption that the model errors are iid
-    # Gaussian with mean 0 and standard deviation sigma.
-    likelihood_term = npoints * np.log(2 * np.pi * sigma**2) + ssr / sigma**2
-
-    # Penalty term for the number of parameters used to fit the model.
-    penalty_term = nparams * np.log(npoints)
-
-    # Bayesian information criterion.
-    bic = likelihood_term + penalty_coeff * penalty_term
-
-    if best_spline is None or bic < metadata.bic:
-      best_spline = spline
-      metadata.light_curve_mask = light_curve_mask
-      metadata.bkspace = bkspace
-      metadata.likelihood_term = likelihood_term
-      metadata.penalty_term = penalty_term
-      metadata.bic = bic
+  pool = multiprocessing.Pool(num_processes) if num_processes > 1 else None
+  map_fn = pool.map if pool is not None else map
+
+  initial_masks = None  # Outlier masks to warm start the next spacings with.
+  num_not_improved = 0  # Consecutive spacings that did not improve the BIC.
+  try:
+    for wave_start in range(0, len(bkspaces), num_processes):
+      wave = bkspaces[wave_start:wave_start + num_processes]
+      results = map_fn(_fit_piecewise_spline, [
+          (all_time, all_flux, bkspace, maxiter, initial_masks, verbose)
+          for bkspace in wave
+      ])
+
+      for bkspace, result in zip(wave, results):
+        spline, light_curve_mask, nparams, npoints, ssr = result
+        if spline is None:
+          metadata.bad_bkspaces.append(bkspace)
+          continue
+
+        if warm_start:
+          # Segments with insufficient points start from all points again.
+          initial_masks = [mask if np.sum(mask) >= 4 else None
+                           for mask in light_curve_mask]
+
+        if not npoints:
+          continue
+
+        # The following term is -2*ln(L), where L is the likelihood of the
+        # data given the model, under the assumption that the model errors are
+        # iid Gaussian with mean 0 and standard deviation sigma.
+        likelihood_term = (
+            npoints * np.log(2 * np.pi * sigma**2) + ssr / sigma**2)
+
+        # Penalty term for the number of parameters used to fit the model.
+        penalty_term = nparams * np.log(npoints)
+
+        # Bayesian information criterion.
+        bic = likelihood_term + penalty_coeff * penalty_term
+
+        if best_spline is None or bic < metadata.bic:
+          best_spline = spline
+          metadata.light_curve_mask = light_curve_mask
+          metadata.bkspace = bkspace
+          metadata.likelihood_term = likelihood_term
+          metadata.penalty_term = penalty_term
+          metadata.bic = bic
+          num_not_improved = 0
+        else:
+          num_not_improved += 1
+
+      if (early_stop_patience is not None and
+          num_not_improved >= early_stop_patience):
+        break  # The BIC has bottomed out.
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
 
   if best_spline is None:
     # All bkspaces resulted in a SplineError, or all light curve intervals had
@@ -284,7 +374,10 @@ def fit_kepler_spline(all_time,
                       bkspace_num=20,
                       maxiter=5,
                       penalty_coeff=1.0,
-                      verbose=True):
+                      verbose=True,
+                      warm_start=False,
+                      early_stop_patience=None,
+                      num_processes=1):
   """Fits a Kepler spline with logarithmically-sampled breakpoint spacings.
 
   Args:
@@ -302,6 +395,11 @@ def fit_kepler_spline(all_time,
     verbose: Whether to log individual spline errors. Note that if bkspaces
         contains many values (particularly small ones) then this may cause
         logging pollution if calling this function for many light curves.
+    warm_start: Whether to warm start outlier rejection from the previous
+        breakpoint spacing. See choose_kepler_spline().
+    early_stop_patience: Number of consecutive breakpoint spacings without
+        improvement in the BIC after which to stop, or None to try them all.
+    num_processes: Number of breakpoint spacings to fit in parallel.
 
   Returns:
     spline: List of numpy arrays; values of the best-fit spline corresponding to
@@ -319,4 +417,7 @@ def fit_kepler_spline(all_time,
       bkspaces,
       maxiter=maxiter,
       penalty_coeff=penalty_coeff,
-      verbose=verbose)
+      verbose=verbose,
+      warm_start=warm_start,
+      early_stop_patience=early_stop_patience,
+      num_processes=num_processes)
@@ -61,6 +61,27 @@ class KeplerSplineTest(absltest.TestCase):
     self.assertLess(rmse, 1e-12)
     self.assertTrue(np.all(mask))
 
+  def testInitialMask(self):
+    time = np.arange(0, 10, 0.1)
+    flux = np.sin(time)
+    flux[35] = 10
+    flux[77] = -3
+    flux[95] = 2.9
+
+    # Starting from the final mask of a cold start converges to the same fit.
+    spline, mask = kepler_spline.kepler_spline(time, flux, bkspace=0.5)
+    warm_spline, warm_mask = kepler_spline.kepler_spline(
+        time, flux, bkspace=0.5, initial_mask=mask)
+    np.testing.assert_array_equal(mask, warm_mask)
+    np.testing.assert_array_almost_equal(spline, warm_spline)
+
+    # With maxiter=1 only the initial mask is used.
+    initial_mask = np.ones_like(time, dtype=np.bool)
+    initial_mask[:10] = False
+    _, mask = kepler_spline.kepler_spline(
+        time, flux, bkspace=0.5, maxiter=1, initial_mask=initial_mask)
+    np.testing.assert_array_equal(initial_mask, mask)
+
   def testInsufficientPointsError(self):
     # Empty light curve.
     time = np.array([])
@@ -195,6 +216,44 @@ class ChooseKeplerSplineTest(absltest.TestCase):
     self.assertAlmostEqual(metadata.penalty_term, 836.099270549629)
     self.assertAlmostEqual(metadata.bic, -4823.45710177978)
 
+  def testParallelMatchesSequential(self):
+    all_time = [np.arange(0, 100, 0.1), np.arange(100, 200, 0.1)]
+    all_flux = [np.sin(t) for t in all_time]
+    bkspaces = np.logspace(np.log10(0.5), np.log10(5), num=20)
+
+    spline, metadata = kepler_spline.choose_kepler_spline(
+        all_time, all_flux, bkspaces)
+    parallel_spline, parallel_metadata = kepler_spline.choose_kepler_spline(
+        all_time, all_flux, bkspaces, num_processes=3)
+    for s1, s2 in zip(spline, parallel_spline):
+      np.testing.assert_array_equal(s1, s2)
+    self.assertEqual(metadata.bkspace, parallel_metadata.bkspace)
+    self.assertEqual(metadata.bic, parallel_metadata.bic)
+
+  def testEarlyStopAndWarmStart(self):
+    all_time = [np.arange(0, 100, 0.1), np.arange(100, 200, 0.1)]
+    all_flux = [np.sin(t) for t in all_time]
+    bkspaces = np.logspace(np.log10(0.5), np.log10(5), num=20)
+
+    _, metadata = kepler_spline.choose_kepler_spline(
+        all_time, all_flux, bkspaces)
+
+    # The BIC has a single minimum, so stopping early finds the same spacing.
+    _, early_metadata = kepler_spline.choose_kepler_spline(
+        all_time, all_flux, bkspaces, early_stop_patience=2)
+    self.assertEqual(metadata.bkspace, early_metadata.bkspace)
+    self.assertEqual(metadata.bic, early_metadata.bic)
+
+    _, warm_metadata = kepler_spline.choose_kepler_spline(
+        all_time,
+        all_flux,
+        bkspaces,
+        warm_start=True,
+        early_stop_patience=2,
+        num_processes=2)
+    self.assertEqual(metadata.bkspace, warm_metadata.bkspace)
+    self.assertTrue(np.all(warm_metadata.light_curve_mask))
+
 
 if __name__ == "__main__":
   absltest.main()
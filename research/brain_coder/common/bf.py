@@ -8,9 +8,15 @@ Language info: https://en.wikipedia.org/wiki/Brainfuck
 
 Based on public implementation:
 https://github.com/pocmo/Python-Brainfuck/blob/master/brainfuck.py
+
+Code is compiled before it is run: runs of the same op are folded into a
+single op with a count, `[-]` and `[+]` become a single clear op, and jump
+targets are precomputed. Compiled programs and execution results are cached,
+since the same programs are evaluated over and over during training.
 """
 
 from collections import namedtuple
+from collections import OrderedDict
 import time
 
 
@@ -47,7 +53,7 @@ class LookAheadIterator(object):
 
   def _preload_next(self):
     try:
-      self._current_element = self._it.next()
+      self._current_element = next(self._it)
     except StopIteration:
       self._done = True
 
@@ -58,6 +64,8 @@ class LookAheadIterator(object):
     self._preload_next()
     return element
 
+  __next__ = next
+
   def peek(self, default_value=None):
     if self._done:
       if default_value is None:
@@ -145,6 +153,68 @@ def evaluate(code, input_buffer=None, init_memory=None, base=256, timeout=1.0,
       memory: If `output_memory` is True, a list of memory cells up to the last
           one written to. otherwise, None.
   """
+  if debug:
+    return _interpret(code, input_buffer, init_memory, base, timeout,
+                      max_steps, require_correct_syntax, output_memory)
+
+  code = ''.join(code)
+  key = (code, tuple(input_buffer) if input_buffer else (),
+         tuple(init_memory) if init_memory else (), base, timeout, max_steps,
+         require_correct_syntax, output_memory)
+  result = _result_cache.get(key)
+  if result is None:
+    program = _program_cache.get(code)
+    if program is None:
+      program = compile_code(code)
+      _program_cache.put(code, program)
+    result = run_program(program, input_buffer, init_memory, base, timeout,
+                         max_steps, require_correct_syntax, output_memory)
+    # Timeouts depend on the machine load, so they are not cached.
+    if result.failure_reason != Status.TIMEOUT:
+      _result_cache.put(key, result)
+  return _copy_result(result)
+
+
+def evaluate_batch(code, input_buffers, stop_on_failure=False, **kwargs):
+  """Execute BF code on each of a list of input buffers.
+
+  The code is compiled once and every execution goes through the result cache.
+
+  Args:
+    code: String or list of BF characters.
+    input_buffers: List of input buffers, each a list of ints.
+    stop_on_failure: If True, stop at the first input on which execution
+        is not successful. The failed result is the last one returned.
+    **kwargs: Any other arguments of `evaluate`.
+
+  Returns:
+    List of EvalResult namedtuples, one per input buffer that was run.
+  """
+  code = ''.join(code)
+  results = []
+  for input_buffer in input_buffers:
+    results.append(evaluate(code, input_buffer=input_buffer, **kwargs))
+    if stop_on_failure and not results[-1].success:
+      break
+  return results
+
+
+def clear_cache():
+  """Clear the compiled program and execution result caches."""
+  _program_cache.clear()
+  _result_cache.clear()
+
+
+def _copy_result(result):
+  # Callers own the lists in a result, so never hand out the cached ones.
+  return result._replace(
+      output=list(result.output),
+      memory=list(result.memory) if result.memory is not None else None)
+
+
+def _interpret(code, input_buffer, init_memory, base, timeout, max_steps,
+               require_correct_syntax, output_memory, debug=True):
+  """Execute BF code one character at a time, optionally tracing it."""
   input_iter = (
       LookAheadIterator(input_buffer) if input_buffer is not None
       else LookAheadIterator([]))
@@ -232,3 +302,186 @@ def evaluate(code, input_buffer=None, init_memory=None, base=256, timeout=1.0,
       program_trace=program_trace)
 
 
+class _LRUCache(object):
+  """Dict with a maximum size, evicting the least recently used keys."""
+
+  def __init__(self, max_size):
+    self.max_size = max_size
+    self._items = OrderedDict()
+
+  def get(self, key):
+    value = self._items.pop(key, None)
+    if value is not None:
+      self._items[key] = value
+    return value
+
+  def put(self, key, value):
+    self._items.pop(key, None)
+    self._items[key] = value
+    if len(self._items) > self.max_size:
+      self._items.popitem(last=False)
+
+  def clear(self):
+    self._items.clear()
+
+  def __len__(self):
+    return len(self._items)
+
+
+_program_cache = _LRUCache(10000)
+_result_cache = _LRUCache(100000)
+
+
+# Compiled opcodes. Runs of the ops up to OP_NOP are folded into one op.
+OP_RIGHT, OP_LEFT, OP_ADD, OP_SUB, OP_NOP = range(5)
+OP_OPEN, OP_CLOSE, OP_OUT, OP_IN = range(5, 9)
+OP_CLEAR = 9  # `[-]` or `[+]`. The loop ops follow it, for partial runs.
+_CHAR_TO_OP = {'>': OP_RIGHT, '<': OP_LEFT, '+': OP_ADD, '-': OP_SUB,
+               '[': OP_OPEN, ']': OP_CLOSE, '.': OP_OUT, ',': OP_IN}
+
+# Check the timeout once every this many steps.
+_TIMEOUT_CHECK_STEPS = 1000
+
+Program = namedtuple('Program', ['ops', 'args', 'correct_syntax'])
+
+
+def compile_code(code):
+  """Compile BF code into a list of ops.
+
+  Characters not in CHARS, and unmatched braces, become no-ops, which take a
+  step each like they do in `evaluate`.
+
+  Args:
+    code: String or list of BF characters.
+
+  Returns:
+    Program namedtuple with
+      ops: List of opcodes.
+      args: List with an int per op. The number of characters of a folded op,
+          and the index to continue at after a jump for `[`, `]` and clear ops.
+      correct_syntax: False if there are unmatched braces.
+  """
+  ops, args = [], []
+  for char in code:
+    op = _CHAR_TO_OP.get(char, OP_NOP)
+    if op <= OP_NOP and ops and ops[-1] == op:
+      args[-1] += 1
+    else:
+      ops.append(op)
+      args.append(1)
+
+  bracemap, correct_syntax = buildbracemap(
+      ['[' if op == OP_OPEN else ']' if op == OP_CLOSE else ' ' for op in ops])
+  for position, op in enumerate(ops):
+    if op in (OP_OPEN, OP_CLOSE):
+      if bracemap[position] == position:
+        ops[position] = OP_NOP
+      else:
+        # Execution continues after the matching brace.
+        args[position] = bracemap[position] + 1
+  for position, op in enumerate(ops):
+    if (op == OP_OPEN and args[position] == position + 3
+        and ops[position + 1] in (OP_ADD, OP_SUB)
+        and args[position + 1] == 1):
+      ops[position] = OP_CLEAR
+  return Program(ops, args, correct_syntax)
+
+
+def run_program(program, input_buffer=None, init_memory=None, base=256,
+                timeout=1.0, max_steps=None, require_correct_syntax=True,
+                output_memory=False):
+  """Execute a compiled program. See `evaluate` for the arguments.
+
+  Produces the same result as `evaluate`, counting steps in BF characters.
+  """
+  if require_correct_syntax and not program.correct_syntax:
+    return EvalResult([], False, Status.SYNTAX_ERROR, 0, 0.0,
+                      [] if output_memory else None, None)
+
+  ops, args = program.ops, program.args
+  num_ops = len(ops)
+  inputs = list(input_buffer) if input_buffer is not None else []
+  num_inputs = len(inputs)
+  input_pos = 0
+  output_buffer = []
+  cells = list(init_memory) if init_memory else [0]
+  limit = max_steps if max_steps is not None else float('inf')
+  next_timeout_check = _TIMEOUT_CHECK_STEPS
+
+  success = True
+  reason = Status.SUCCESS
+  start_time = time.time()
+  codeptr, cellptr, steps = 0, 0, 0
+  while codeptr < num_ops:
+    op = ops[codeptr]
+    arg = args[codeptr]
+    codeptr += 1
+
+    if op <= OP_NOP:
+      if steps + arg > limit:
+        arg = limit - steps
+      steps += arg
+      if op == OP_RIGHT:
+        cellptr += arg
+        if cellptr >= len(cells):
+          cells.extend([0] * (cellptr + 1 - len(cells)))
+      elif op == OP_LEFT:
+        cellptr = cellptr - arg if cellptr > arg else 0
+      elif op != OP_NOP:
+        value = cells[cellptr]
+        if 0 <= value < base:
+          cells[cellptr] = (value + arg if op == OP_ADD else value - arg) % base
+        else:
+          for _ in range(arg):
+            if op == OP_ADD:
+              value = value + 1 if value < (base - 1) else 0
+            else:
+              value = value - 1 if value > 0 else (base - 1)
+          cells[cellptr] = value
+    else:
+      steps += 1
+      if op == OP_OPEN:
+        if cells[cellptr] == 0:
+          codeptr = arg
+      elif op == OP_CLOSE:
+        if cells[cellptr] != 0:
+          codeptr = arg
+      elif op == OP_OUT:
+        output_buffer.append(cells[cellptr])
+      elif op == OP_IN:
+        if input_pos < num_inputs:
+          cells[cellptr] = inputs[input_pos]
+          input_pos += 1
+        else:
+          cells[cellptr] = 0
+      elif op == OP_CLEAR:
+        value = cells[cellptr]
+        if value == 0:
+          codeptr = arg
+        elif 0 < value < base:
+          # One step per `-` (or `+`) and `]` until the cell reaches 0.
+          loop_steps = 2 * (value if ops[codeptr] == OP_SUB else base - value)
+          if steps + loop_steps < limit:
+            cells[cellptr] = 0
+            steps += loop_steps
+            codeptr = arg
+
+    if steps >= next_timeout_check:
+      next_timeout_check = steps + _TIMEOUT_CHECK_STEPS
+      if timeout is not None and time.time() - start_time > timeout:
+        success = False
+        reason = Status.TIMEOUT
+        break
+    if steps >= limit:
+      success = False
+      reason = Status.STEP_LIMIT
+      break
+
+  return EvalResult(
+      output=output_buffer,
+      success=success,
+      failure_reason=reason,
+      steps=steps,
+      time=time.time() - start_time,
+      memory=cells if output_memory else None,
+      program_trace=None)
@@ -132,6 +132,42 @@ class BfTest(tf.test.TestCase):
             next_input=0, output_buffer=[2, 1, 0])],
         er.program_trace)
 
+  def testFoldedOpsStepLimit(self):
+    # The step limit falls inside runs of folded ops and in a clear loop.
+    for code in ['+++++.>>>>>.<<<<<<.', '++++++++[-].', '+[+].']:
+      for max_steps in range(1, 25):
+        er = bf.evaluate(code, base=10, input_buffer=[], timeout=None,
+                         max_steps=max_steps, output_memory=True)
+        ref = bf.evaluate(code, base=10, input_buffer=[], timeout=None,
+                          max_steps=max_steps, output_memory=True, debug=True)
+        self.assertEqual(
+            (ref.output, ref.failure_reason, ref.steps, ref.memory),
+            (er.output, er.failure_reason, er.steps, er.memory))
+
+  def testCompileCode(self):
+    program = bf.compile_code('+++[-]>>x,]')
+    self.assertEqual(
+        [bf.OP_ADD, bf.OP_CLEAR, bf.OP_SUB, bf.OP_CLOSE, bf.OP_RIGHT,
+         bf.OP_NOP, bf.OP_IN, bf.OP_NOP],
+        program.ops)
+    self.assertEqual([3, 4, 1, 2, 2, 1, 1, 1], program.args)
+    self.assertFalse(program.correct_syntax)
+
+  def testEvaluateBatch(self):
+    results = bf.evaluate_batch(',[.,]', [[1, 2], [3], []])
+    self.assertEqual([[1, 2], [3], []], [r.output for r in results])
+
+    results = bf.evaluate_batch(
+        ',[.[]]', [[0], [1], [0]], stop_on_failure=True, timeout=None,
+        max_steps=50)
+    self.assertEqual([True, False], [r.success for r in results])
+
+  def testResultCache(self):
+    bf.clear_cache()
+    er = bf.evaluate(',[.,]', input_buffer=[1, 2])
+    er.output.append(3)
+    self.assertEqual([1, 2], bf.evaluate(',[.,]', input_buffer=[1, 2]).output)
+
 
 if __name__ == '__main__':
   tf.test.main()
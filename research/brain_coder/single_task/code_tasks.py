@@ -195,12 +195,11 @@ class MultiIOTaskManager(object):
     terminal_reward = 0.0
     results = []
     reason = 'correct'
-    for input_seq, output_seq in io_seqs:
-      eval_result = bf.evaluate(
-          code, input_buffer=input_seq, timeout=0.1,
-          max_steps=self.max_execution_steps,
-          base=self.task.base,
-          require_correct_syntax=self.require_correct_syntax)
+    eval_results = bf.evaluate_batch(
+        code, [input_seq for input_seq, _ in io_seqs], stop_on_failure=True,
+        timeout=0.1, max_steps=self.max_execution_steps, base=self.task.base,
+        require_correct_syntax=self.require_correct_syntax)
+    for (_, output_seq), eval_result in zip(io_seqs, eval_results):
       result, success = eval_result.output, eval_result.success
       if not success:
         # Code execution timed out.
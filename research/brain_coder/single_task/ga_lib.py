@@ -8,8 +8,12 @@ Inspired by https://github.com/primaryobjects/AI-Programmer.
 GA function code borrowed from https://github.com/DEAP/deap.
 """
 
+from collections import deque
 from collections import namedtuple
+import multiprocessing
 import random
+import signal
+import time
 
 from absl import flags
 from absl import logging
@@ -122,6 +126,157 @@ def make_task_eval_fn(task_manager):
   return evalbf
 
 
+EvalStats = namedtuple(
+    'EvalStats',
+    ['num_individuals', 'num_unique', 'num_cached', 'num_evaluated',
+     'num_timeouts', 'seconds'])
+
+
+class _ProgramTimeout(Exception):
+  pass
+
+
+# State of a worker process of PopulationEvaluator.
+_worker_eval_fn = None
+_worker_timeout = None
+_worker_running = False
+
+
+def _handle_alarm(signum, frame):  # pylint: disable=unused-argument
+  if _worker_running:
+    raise _ProgramTimeout()
+
+
+def _init_worker(task_eval_fn, program_timeout):
+  global _worker_eval_fn, _worker_timeout
+  _worker_eval_fn = task_eval_fn
+  _worker_timeout = program_timeout
+  if program_timeout:
+    signal.signal(signal.SIGALRM, _handle_alarm)
+
+
+def _eval_in_worker(code):
+  """Returns the reward of a code string, or None if it ran out of time."""
+  global _worker_running
+  _worker_running = True
+  if _worker_timeout:
+    signal.setitimer(signal.ITIMER_REAL, _worker_timeout)
+  try:
+    return _worker_eval_fn(code).reward
+  except _ProgramTimeout:
+    return None
+  finally:
+    _worker_running = False
+    if _worker_timeout:
+      signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class PopulationEvaluator(object):
+  """Computes the fitness of individuals, optionally in a pool of processes.
+
+  Identical code strings are only evaluated once per call, and rewards of
+  previously seen code strings are reused if `use_reward_cache` is True.
+  The EvalStats of the last `stats_window` calls are kept in `self.stats`.
+  """
+
+  def __init__(self, task_eval_fn, num_processes=1, program_timeout=None,
+               timeout_reward=0.0, use_reward_cache=USE_REWARD_CACHE,
+               stats_window=100):
+    """Constructs the evaluator.
+
+    Args:
+      task_eval_fn: A python function which maps an Individual to a Result
+          namedtuple. See `make_task_eval_fn`.
+      num_processes: Number of worker processes. If 1, individuals are
+          evaluated in this process.
+      program_timeout: Time limit in seconds for evaluating one code string on
+          all test cases, enforced in the worker processes. None or 0 to
+          disable.
+      timeout_reward: Reward given to code strings that exceed
+          `program_timeout`.
+      use_reward_cache: Whether to remember the reward of every code string.
+      stats_window: Number of calls to `evaluate` to keep EvalStats for.
+    """
+    self.task_eval_fn = task_eval_fn
+    self.timeout_reward = timeout_reward
+    self.reward_cache = {} if use_reward_cache else None
+    self.stats = deque(maxlen=stats_window)
+    self._pool = None
+    if num_processes > 1:
+      # Workers are forked, so task_eval_fn does not need to be picklable.
+      self._pool = multiprocessing.Pool(
+          num_processes, initializer=_init_worker,
+          initargs=(task_eval_fn, program_timeout))
+
+  def evaluate(self, individuals):
+    """Sets the fitness of each individual.
+
+    Args:
+      individuals: A list of Individual objects.
+
+    Returns:
+      EvalStats namedtuple for this call. It is also added to `self.stats`.
+    """
+    start_time = time.time()
+    codes = [''.join(ind) for ind in individuals]
+    rewards = {}
+    to_evaluate = []
+    num_cached = 0
+    for code in codes:
+      if code in rewards:
+        continue
+      if self.reward_cache is not None and code in self.reward_cache:
+        rewards[code] = self.reward_cache[code]
+        num_cached += 1
+      else:
+        to_evaluate.append(code)
+        rewards[code] = None
+
+    if self._pool is not None:
+      new_rewards = self._pool.map(_eval_in_worker, to_evaluate, chunksize=1)
+    else:
+      new_rewards = [self.task_eval_fn(code).reward for code in to_evaluate]
+    num_timeouts = 0
+    for code, reward in zip(to_evaluate, new_rewards):
+      if reward is None:
+        reward = self.timeout_reward
+        num_timeouts += 1
+      rewards[code] = reward
+      if self.reward_cache is not None:
+        self.reward_cache[code] = reward
+
+    for ind, code in zip(individuals, codes):
+      ind.fitness.values = (rewards[code],)
+
+    stats = EvalStats(
+        num_individuals=len(individuals), num_unique=len(rewards),
+        num_cached=num_cached, num_evaluated=len(to_evaluate),
+        num_timeouts=num_timeouts, seconds=time.time() - start_time)
+    self.stats.append(stats)
+    return stats
+
+  def close(self):
+    if self._pool is not None:
+      self._pool.terminate()
+      self._pool.join()
+      self._pool = None
+
+
+def stats_summary(stats):
+  """Make human readable summary of a list of EvalStats."""
+  if not stats:
+    return 'no evaluations'
+  total = EvalStats(*[sum(values) for values in zip(*stats)])
+  return (
+      '%.1f ms/gen, %.0f programs/sec, %.1f%% unique, %.1f%% cached, '
+      '%d timeouts' % (
+          1000.0 * total.seconds / len(stats),
+          total.num_evaluated / max(total.seconds, 1e-9),
+          100.0 * total.num_unique / max(total.num_individuals, 1),
+          100.0 * total.num_cached / max(total.num_unique, 1),
+          total.num_timeouts))
+
+
 def debug_str(individual, task_eval_fn):
   res = task_eval_fn(individual)
   input_str, target_output_str, code_output_str = io_repr(res)
@@ -258,7 +413,7 @@ def mutate_and_crossover(population, mutation_rate, crossover_rate):
 
 
 def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
-            checkpoint_writer=None):
+            checkpoint_writer=None, evaluator=None):
   """A bare bones genetic algorithm.
 
   Similar to chapter 7 of Back, Fogel and Michalewicz, "Evolutionary
@@ -277,12 +432,17 @@ def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
         Needs to have `write`, `load`, and `has_checkpoint` methods. Used to
         periodically save progress. In event of a restart, the population will
         be loaded from disk.
+    evaluator: (optional) a PopulationEvaluator used to compute fitness. By
+        default, individuals are evaluated in this process with
+        `task_eval_fn`.
 
   Returns:
     GaResult namedtuple instance. This contains information about the GA run,
     including the resulting population, best reward (fitness) obtained, and
     the best code string found.
   """
+  if evaluator is None:
+    evaluator = PopulationEvaluator(task_eval_fn)
 
   has_checkpoint = False
   if checkpoint_writer and checkpoint_writer.has_checkpoint():
@@ -297,16 +457,13 @@ def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
 
       # Evaluate the individuals with an invalid fitness
       invalid_ind = [ind for ind in population if not ind.fitness.valid]
-      for ind in invalid_ind:
-        ind.fitness.values = task_eval_fn(ind).reward,
-      for _, ind in halloffame.iter_in_order():
-        ind.fitness.values = task_eval_fn(ind).reward,
+      evaluator.evaluate(
+          invalid_ind + [ind for _, ind in halloffame.iter_in_order()])
 
   if not has_checkpoint:
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in population if not ind.fitness.valid]
-    for ind in invalid_ind:
-      ind.fitness.values = task_eval_fn(ind).reward,
+    evaluator.evaluate(invalid_ind)
 
     if halloffame is not None:
       for ind in population:
@@ -317,7 +474,6 @@ def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
     gen = 1
 
   pop_size = len(population)
-  program_reward_cache = {} if USE_REWARD_CACHE else None
 
   # Begin the generational process
   while ngen == 0 or gen <= ngen:
@@ -331,15 +487,7 @@ def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
 
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-    for ind in invalid_ind:
-      str_repr = ''.join(ind)
-      if program_reward_cache is not None and str_repr in program_reward_cache:
-        ind.fitness.values = (program_reward_cache[str_repr],)
-      else:
-        eval_result = task_eval_fn(ind)
-        ind.fitness.values = (eval_result.reward,)
-        if program_reward_cache is not None:
-          program_reward_cache[str_repr] = eval_result.reward
+    evaluator.evaluate(invalid_ind)
 
     # Replace the current population by the offspring
     population = list(offspring)
@@ -356,6 +504,8 @@ def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
       top_code = '\n'.join([debug_str(ind, task_eval_fn)
                             for ind in topk(population, k=4)])
       logging.info('gen: %d\nNPE: %d\n%s\n\n', gen, gen * pop_size, top_code)
+      logging.info('Fitness evaluation over the last %d generations: %s',
+                   evaluator.stats.maxlen, stats_summary(evaluator.stats))
 
       best_code = ''.join(halloffame.get_max()[1])
       res = task_eval_fn(best_code)
@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+"""Tests for ga_lib."""
+
+import time
+
+import tensorflow as tf
+
+from single_task import ga_lib  # brain coder
+
+
+def _length_eval_fn(code):
+  """Reward is the code length. Programs containing ']' never finish."""
+  if ']' in code:
+    time.sleep(60)
+  return ga_lib.Result(
+      reward=float(len(code)), inputs=[], code_outputs=[], target_outputs=[],
+      type_in=ga_lib.IOType.integer, type_out=ga_lib.IOType.integer, base=256,
+      correct=False)
+
+
+class CountingEvalFn(object):
+
+  def __init__(self):
+    self.codes = []
+
+  def __call__(self, code):
+    self.codes.append(''.join(code))
+    return _length_eval_fn(code)
+
+
+class GaLibTest(tf.test.TestCase):
+
+  def testEvaluatorDeduplicates(self):
+    eval_fn = CountingEvalFn()
+    evaluator = ga_lib.PopulationEvaluator(eval_fn)
+    population = [ga_lib.Individual(code)
+                  for code in ['+', '++', '+', '+++', '++']]
+    stats = evaluator.evaluate(population)
+    self.assertEqual(['+', '++', '+++'], eval_fn.codes)
+    self.assertEqual([1.0, 2.0, 1.0, 3.0, 2.0],
+                     [ind.fitness.values[0] for ind in population])
+    self.assertEqual((5, 3, 0, 3, 0), stats[:5])
+
+    # Rewards are cached across calls.
+    stats = evaluator.evaluate([ga_lib.Individual('++'),
+                                ga_lib.Individual('-')])
+    self.assertEqual(['+', '++', '+++', '-'], eval_fn.codes)
+    self.assertEqual((2, 2, 1, 1, 0), stats[:5])
+    self.assertEqual(2, len(evaluator.stats))
+
+  def testEvaluatorProcessPool(self):
+    evaluator = ga_lib.PopulationEvaluator(
+        _length_eval_fn, num_processes=2, program_timeout=0.5,
+        timeout_reward=-1.0)
+    try:
+      population = [ga_lib.Individual(code)
+                    for code in ['+', '>>', '[]', '...', '>>']]
+      stats = evaluator.evaluate(population)
+    finally:
+      evaluator.close()
+    self.assertEqual([1.0, 2.0, -1.0, 3.0, 2.0],
+                     [ind.fitness.values[0] for ind in population])
+    self.assertEqual(1, stats.num_timeouts)
+    self.assertLess(stats.seconds, 30)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -28,6 +28,15 @@ from single_task import ga_lib  # brain coder
 from single_task import results_lib  # brain coder
 
 FLAGS = flags.FLAGS
+flags.DEFINE_integer(
+    'ga_eval_processes', 1,
+    'Number of worker processes which compute the fitness of the GA '
+    'population. If 1, fitness is computed in the training process.')
+flags.DEFINE_float(
+    'ga_program_timeout', 5.0,
+    'Time limit in seconds for evaluating one program on all of its test '
+    'cases. Only enforced in worker processes, i.e. when ga_eval_processes > '
+    '1. Set to 0 to disable.')
 
 
 def define_tuner_hparam_space(hparam_space_type):
@@ -203,12 +212,25 @@ def run_training(config=None, tuner=None, logdir=None, trial_name=None,  # pylin
           ga_lib.random_individual(config.timestep_limit),
           n=config.batch_size)
       hof = utils.MaxUniquePriorityQueue(2)  # Hall of fame.
-      result = ga_lib.ga_loop(
-          pop,
-          cxpb=config.agent.crossover_rate, mutpb=config.agent.mutation_rate,
-          task_eval_fn=task_eval_fn,
-          ngen=max_generations, halloffame=hof,
-          checkpoint_writer=checkpoint_writer)
+      rl_task = data_manager.rl_task
+      evaluator = ga_lib.PopulationEvaluator(
+          task_eval_fn, num_processes=FLAGS.ga_eval_processes,
+          program_timeout=FLAGS.ga_program_timeout,
+          # Same reward as a program which fails to execute.
+          timeout_reward=rl_task.failure_reward / rl_task.best_reward)
+      try:
+        result = ga_lib.ga_loop(
+            pop,
+            cxpb=config.agent.crossover_rate,
+            mutpb=config.agent.mutation_rate,
+            task_eval_fn=task_eval_fn,
+            ngen=max_generations, halloffame=hof,
+            checkpoint_writer=checkpoint_writer,
+            evaluator=evaluator)
+      finally:
+        evaluator.close()
+      logging.info('Fitness evaluation: %s',
+                   ga_lib.stats_summary(evaluator.stats))
 
     logging.info('Finished rep. Num gens: %d', result.generations)
 
@@ -231,8 +231,12 @@ def process_navtask_str(navtask_str):
     navtask.task_params.type = 'rng_rejection_sampling_many'
     navtask.task_params.rejection_sampling_M = 2000
     navtask.task_params.min_dist = 10
+    # Rejection sampling computes several distance fields per episode, cache
+    # them.
+    navtask.task_params.dist_cache_size = 500
   elif navtask_vars.task == 'r2r':
     navtask.task_params.type = 'room_to_room_many'
+    navtask.task_params.dist_cache_size = 500
   elif navtask_vars.task == 'ST':
     # Semantic task at hand.
     navtask.task_params.goal_channels = \
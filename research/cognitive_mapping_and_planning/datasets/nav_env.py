@@ -61,6 +61,7 @@ rng_next_goal_rejection_sampling = gu.rng_next_goal_rejection_sampling
 rng_next_goal                    = gu.rng_next_goal
 rng_room_to_room                 = gu.rng_room_to_room
 rng_target_dist_field            = gu.rng_target_dist_field
+DistanceFieldCache               = gu.DistanceFieldCache
 
 compute_traversibility           = mu.compute_traversibility
 make_map                         = mu.make_map
@@ -674,13 +675,16 @@ class MeshMapper(Building):
     return inputs
 
 def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
-                          num_steps, num_goals, data_augment, **kwargs):
-  """Generates and returns a new episode."""
+                          num_steps, num_goals, data_augment, dist_cache=None,
+                          **kwargs):
+  """Generates and returns a new episode. Distance fields are looked up in
+  dist_cache, a DistanceFieldCache, if given."""
   max_compute = max_dist + 4*num_steps
   if type == 'general':
     start_node_ids, end_node_ids, dist, pred_map, paths = \
         rng_target_dist_field(batch_size, gtG, rng, max_dist, max_compute,
-                              nodes=nodes, compute_path=False)
+                              nodes=nodes, compute_path=False,
+                              dist_cache=dist_cache)
     target_class = None
 
   elif type == 'room_to_room_many':
@@ -689,7 +693,7 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
     # Sample the first one
     start_node_ids_, end_node_ids_, dist_, _, _ = rng_room_to_room(
         batch_size, gtG, rng, max_dist, max_compute,
-        node_room_ids=node_room_ids, nodes=nodes)
+        node_room_ids=node_room_ids, nodes=nodes, dist_cache=dist_cache)
     start_node_ids = start_node_ids_
     goal_node_ids.append(end_node_ids_)
     dists.append(dist_)
@@ -697,7 +701,7 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
       start_node_ids_, end_node_ids_, dist_, _, _ = rng_next_goal(
           goal_node_ids[n], batch_size, gtG, rng, max_dist,
           max_compute, node_room_ids=node_room_ids, nodes=nodes,
-          dists_from_start_node=dists[n])
+          dists_from_start_node=dists[n], dist_cache=dist_cache)
       goal_node_ids.append(end_node_ids_)
       dists.append(dist_)
     target_class = None
@@ -720,7 +724,8 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
       start_node_ids_, end_node_ids_, dist_, _, _, _, _ = rng_next_goal_rejection_sampling(
               input_nodes, batch_size, gtG, rng, max_dist, min_dist,
               max_compute, sampling_distribution, target_distribution, nodes,
-              n_ori, step_size, distribution_bins, rejection_sampling_M)
+              n_ori, step_size, distribution_bins, rejection_sampling_M,
+              dist_cache=dist_cache)
       if n == 0: start_node_ids = start_node_ids_
       goal_node_ids.append(end_node_ids_)
       dists.append(dist_)
@@ -734,7 +739,7 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
     # Sample the first one.
     start_node_ids_, end_node_ids_, dist_, _, _ = rng_room_to_room(
         batch_size, gtG, rng, max_dist, max_compute,
-        node_room_ids=node_room_ids, nodes=nodes)
+        node_room_ids=node_room_ids, nodes=nodes, dist_cache=dist_cache)
     start_node_ids = start_node_ids_
     goal_node_ids.append(end_node_ids_)
     dists.append(dist_)
@@ -743,10 +748,13 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
     goal_node_ids.append(start_node_ids)
     dist = []
     for i in range(batch_size):
-      dist_ = gt.topology.shortest_distance(
-          gt.GraphView(gtG, reversed=True),
-          source=gtG.vertex(start_node_ids[i]), target=None)
-      dist_ = np.array(dist_.get_array())
+      if dist_cache is None:
+        dist_ = gt.topology.shortest_distance(
+            gt.GraphView(gtG, reversed=True),
+            source=gtG.vertex(start_node_ids[i]), target=None)
+        dist_ = np.array(dist_.get_array())
+      else:
+        dist_ = dist_cache.get([start_node_ids[i]], 'to')
       dist.append(dist_)
     dists.append(dist)
     target_class = None
@@ -870,6 +878,19 @@ class NavigationEnv(GridWorld, Building):
 
       logging.info('Building %s, #V=%d, #E=%d', self.building_name,
                    self.task.nodes.shape[0], self.task.gtG.num_edges())
+
+      # Cache of distance fields for sampling episodes. Older configs do not
+      # set the dist_cache_* parameters.
+      tp = self.task_params
+      self.task.dist_cache = None
+      if getattr(tp, 'dist_cache_size', 0) > 0:
+        self.task.dist_cache = DistanceFieldCache(
+            gtG, max_size=tp.dist_cache_size,
+            table_max_dist=tp.max_dist + 4*tp.num_steps,
+            table_max_nodes=getattr(tp, 'dist_table_max_nodes', 0),
+            cache_dir=getattr(tp, 'dist_cache_dir', None),
+            name=self.building_name)
+
       type = self.task_params.type
       if type == 'general':
         # Do nothing
@@ -957,6 +978,7 @@ class NavigationEnv(GridWorld, Building):
         _nav_env_reset_helper(tp.type, rng, self.task.nodes, tp.batch_size,
                               self.task.gtG, tp.max_dist, tp.num_steps,
                               tp.num_goals, tp.data_augment,
+                              dist_cache=self.task.dist_cache,
                               **(self.task.reset_kwargs))
 
     start_nodes = [tuple(nodes[_,:]) for _ in start_node_ids]
@@ -1165,9 +1187,10 @@ class VisualNavigationEnv(NavigationEnv):
       XYZ = get_point_cloud_from_z(100./d[...,0], cm)
       XYZ = make_geocentric(XYZ*100., self.robot.sensor_height,
                                       self.robot.camera_elevation_degree)
+      # bin_points bins all the images at once, and does not modify XYZ.
       for i in range(len(self.task_params.analytical_counts.map_sizes)):
         non_linearity = self.task_params.analytical_counts.non_linearity[i]
-        count, isvalid = bin_points(XYZ*1.,
+        count, isvalid = bin_points(XYZ,
                                     map_size=self.task_params.analytical_counts.map_sizes[i],
                                     xy_resolution=self.task_params.analytical_counts.xy_resolution[i],
                                     z_bins=self.task_params.analytical_counts.z_bins[i])
@@ -38,15 +38,16 @@ def get_point_cloud_from_z(Y, camera_matrix):
     Z is positive up in the image
     XYZ is ...xHxWx3
   """
-  x, z = np.meshgrid(np.arange(Y.shape[-1]),
-                     np.arange(Y.shape[-2]-1, -1, -1))
-  for i in range(Y.ndim-2):
-    x = np.expand_dims(x, axis=0)
-    z = np.expand_dims(z, axis=0)
-  X = (x-camera_matrix.xc) * Y / camera_matrix.f
-  Z = (z-camera_matrix.zc) * Y / camera_matrix.f
-  XYZ = np.concatenate((X[...,np.newaxis], Y[...,np.newaxis],
-                        Z[...,np.newaxis]), axis=X.ndim)
+  # Offsets of pixel columns and rows from the camera center, broadcast
+  # against all the depth images.
+  x = np.arange(Y.shape[-1]) - camera_matrix.xc
+  z = np.arange(Y.shape[-2]-1, -1, -1)[:,np.newaxis] - camera_matrix.zc
+  X = x * Y / camera_matrix.f
+  Z = z * Y / camera_matrix.f
+  XYZ = np.empty(X.shape + (3,), dtype=np.result_type(X, Y, Z))
+  XYZ[...,0] = X
+  XYZ[...,1] = Y
+  XYZ[...,2] = Z
   return XYZ
 
 def make_geocentric(XYZ, sensor_height, camera_elevation_degree):
@@ -67,30 +68,28 @@ def bin_points(XYZ_cms, map_size, z_bins, xy_resolution):
   """Bins points into xy-z bins
   XYZ_cms is ... x H x W x3
   Outputs is ... x map_size x map_size x (len(z_bins)+1)
+  Points of all the images are binned together, with a single bincount.
   """
   sh = XYZ_cms.shape
   XYZ_cms = XYZ_cms.reshape([-1, sh[-3], sh[-2], sh[-1]])
+  n_images = XYZ_cms.shape[0]
   n_z_bins = len(z_bins)+1
   map_center = (map_size-1.)/2.
-  counts = []
-  isvalids = []
-  for XYZ_cm in XYZ_cms:
-    isnotnan = np.logical_not(np.isnan(XYZ_cm[:,:,0]))
-    X_bin = np.round(XYZ_cm[:,:,0] / xy_resolution + map_center).astype(np.int32)
-    Y_bin = np.round(XYZ_cm[:,:,1] / xy_resolution + map_center).astype(np.int32)
-    Z_bin = np.digitize(XYZ_cm[:,:,2], bins=z_bins).astype(np.int32)
+  isnotnan = np.logical_not(np.isnan(XYZ_cms[...,0]))
+  X_bin = np.round(XYZ_cms[...,0] / xy_resolution + map_center).astype(np.int32)
+  Y_bin = np.round(XYZ_cms[...,1] / xy_resolution + map_center).astype(np.int32)
+  Z_bin = np.digitize(XYZ_cms[...,2], bins=z_bins).astype(np.int32)
 
-    isvalid = np.array([X_bin >= 0, X_bin < map_size, Y_bin >= 0, Y_bin < map_size,
-                        Z_bin >= 0, Z_bin < n_z_bins, isnotnan])
-    isvalid = np.all(isvalid, axis=0)
+  isvalid = np.array([X_bin >= 0, X_bin < map_size, Y_bin >= 0, Y_bin < map_size,
+                      Z_bin >= 0, Z_bin < n_z_bins, isnotnan])
+  isvalid = np.all(isvalid, axis=0)
 
-    ind = (Y_bin * map_size + X_bin) * n_z_bins + Z_bin
-    ind[np.logical_not(isvalid)] = 0
-    count = np.bincount(ind.ravel(), isvalid.ravel().astype(np.int32),
-                         minlength=map_size*map_size*n_z_bins)
-    count = np.reshape(count, [map_size, map_size, n_z_bins])
-    counts.append(count)
-    isvalids.append(isvalid)
-  counts = np.array(counts).reshape(list(sh[:-3]) + [map_size, map_size, n_z_bins])
-  isvalids = np.array(isvalids).reshape(list(sh[:-3]) + [sh[-3], sh[-2], 1])
+  # Bins of different images are offset by the size of the map.
+  image_ind = np.arange(n_images, dtype=np.int64).reshape([-1, 1, 1])
+  ind = ((image_ind * map_size + Y_bin) * map_size + X_bin) * n_z_bins + Z_bin
+  counts = np.bincount(ind[isvalid],
+                       minlength=n_images*map_size*map_size*n_z_bins)
+  counts = counts.astype(np.float64)
+  counts = counts.reshape(list(sh[:-3]) + [map_size, map_size, n_z_bins])
+  isvalids = isvalid.reshape(list(sh[:-3]) + [sh[-3], sh[-2], 1])
   return counts, isvalids
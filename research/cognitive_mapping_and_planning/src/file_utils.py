@@ -26,6 +26,7 @@ fopen    = lambda path, mode: gfile.Open(path, mode)
 makedirs = lambda path: gfile.MakeDirs(path)
 listdir  = lambda path: gfile.ListDir(path)
 copyfile = lambda a, b, o: gfile.Copy(a,b,o)
+rename   = lambda a, b, o: gfile.Rename(a,b,o)
 
 def write_image(image_path, rgb):
   ext = os.path.splitext(image_path)[1]
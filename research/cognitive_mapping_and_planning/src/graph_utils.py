@@ -20,11 +20,15 @@ import numpy as np
 import networkx as nx
 import itertools
 import logging
+import collections
+import hashlib
+import os
 from datasets.nav_env import get_path_ids
 import graph_tool as gt
 import graph_tool.topology
 import graph_tool.generation
 import src.utils as utils
+import src.file_utils as fu
 
 # Compute shortest path from all nodes to or from all source nodes
 def get_distance_node_list(gtG, source_nodes, direction, weights=None):
@@ -53,6 +57,135 @@ def get_distance_node_list(gtG, source_nodes, direction, weights=None):
     dist = dist-1
   return dist
 
+# Distance fields are stored as uint16, with _UINT16_MAX standing in for
+# unreachable nodes.
+_UINT16_MAX = np.iinfo(np.uint16).max
+
+def _compress_dist(dist):
+  big = dist >= _UINT16_MAX
+  big_vals = np.unique(dist[big])
+  small = dist[np.logical_not(big)]
+  if (big_vals.size > 1 or (small.size > 0 and np.min(small) < 0) or
+      not np.all(small == np.floor(small))):
+    # Can not be represented exactly (including non-integer or nan distances),
+    # keep as is.
+    return (dist.copy(), None, dist.dtype)
+  big_val = big_vals[0] if big_vals.size == 1 else None
+  return (np.minimum(dist, _UINT16_MAX).astype(np.uint16), big_val, dist.dtype)
+
+def _decompress_dist(dist, big_val, dtype):
+  out = dist.astype(dtype)
+  if big_val is not None and dist.dtype == np.uint16:
+    out[dist == _UINT16_MAX] = big_val
+  return out
+
+class DistanceFieldCache(object):
+  """LRU cache of distance fields to or from sets of nodes of a graph.
+
+  Fields are stored as uint16 arrays. For graphs with at most table_max_nodes
+  vertices, the fields to every node with max_dist = table_max_dist are
+  precomputed into a single table, which is saved in cache_dir (if given) and
+  reused for the same graph.
+  """
+  def __init__(self, gtG, max_size=500, table_max_dist=None, table_max_nodes=0,
+               cache_dir=None, name=''):
+    self.gtG = gtG
+    self.max_size = max_size
+    self.fields = collections.OrderedDict()
+    self.table = None
+    self.table_max_dist = table_max_dist
+    if table_max_dist is not None and gtG.num_vertices() <= table_max_nodes:
+      self._load_or_compute_table(cache_dir, name)
+
+  def _graph_hash(self):
+    # The first two columns of get_edges() hold the source and target nodes.
+    edges = np.ascontiguousarray(self.gtG.get_edges()[:, :2], dtype=np.int64)
+    h = hashlib.md5()
+    h.update(np.array([self.gtG.num_vertices(), self.table_max_dist],
+                      dtype=np.int64).tobytes())
+    h.update(edges.tobytes())
+    return h.hexdigest()
+
+  def _load_or_compute_table(self, cache_dir, name):
+    file_name = None
+    if cache_dir is not None:
+      file_name = os.path.join(cache_dir, '{:s}_dist_{:s}.pkl'.format(
+          name, self._graph_hash()))
+      if fu.exists(file_name):
+        logging.info('Loading distance table from %s.', file_name)
+        a = utils.load_variables(file_name)
+        self.table, self.table_big_val, self.table_dtype = \
+            a['table'], a['big_val'], a['dtype']
+        return
+
+    timer = utils.Timer(); timer.tic()
+    num_nodes = self.gtG.num_vertices()
+    table = np.zeros((num_nodes, num_nodes), dtype=np.uint16)
+    big_val = None; dtype = None
+    for i in range(num_nodes):
+      dist, big_val_, dtype = _compress_dist(
+          self._compute([i], 'to', self.table_max_dist))
+      if dist.dtype != np.uint16 or (big_val is not None and
+                                     big_val_ is not None and
+                                     big_val_ != big_val):
+        logging.error('Distances can not be stored as uint16, not using a table.')
+        return
+      big_val = big_val_ if big_val_ is not None else big_val
+      table[i, :] = dist
+    self.table, self.table_big_val, self.table_dtype = table, big_val, dtype
+    timer.toc(log_at=1, log_str='DistanceFieldCache: distance table')
+
+    if file_name is not None:
+      if not fu.exists(cache_dir):
+        fu.makedirs(cache_dir)
+      # Write to a temporary file first, so that an interrupted write does not
+      # leave a truncated table behind.
+      tmp_file_name = '{:s}.tmp.{:d}'.format(file_name, os.getpid())
+      utils.save_variables(tmp_file_name, [table, big_val, dtype],
+                           ['table', 'big_val', 'dtype'], overwrite=True)
+      fu.rename(tmp_file_name, file_name, True)
+
+  def _compute(self, nodes, direction, max_dist):
+    if len(nodes) == 1:
+      dist = gt.topology.shortest_distance(
+          gt.GraphView(self.gtG, reversed=direction == 'to'),
+          source=self.gtG.vertex(int(nodes[0])), target=None,
+          max_dist=max_dist)
+      return np.array(dist.get_array())
+    assert(max_dist is None), 'max_dist is only supported for a single node.'
+    return get_distance_node_list(self.gtG, nodes, direction)
+
+  def get(self, nodes, direction='to', max_dist=None):
+    """Returns the distance field to (or from) the set of nodes, as computed by
+    gt.topology.shortest_distance for a single node and by
+    get_distance_node_list for several."""
+    nodes = tuple(sorted(set(int(n) for n in nodes)))
+    if (self.table is not None and len(nodes) == 1 and direction == 'to' and
+        max_dist == self.table_max_dist):
+      return _decompress_dist(self.table[nodes[0], :], self.table_big_val,
+                              self.table_dtype)
+    key = (nodes, direction, max_dist)
+    if key in self.fields:
+      field = self.fields.pop(key)
+    else:
+      field = _compress_dist(self._compute(list(nodes), direction, max_dist))
+      if len(self.fields) >= self.max_size:
+        self.fields.popitem(last=False)
+    self.fields[key] = field
+    return _decompress_dist(*field)
+
+def _distance_field(gtG, node_id, direction, max_dist, dist_cache=None,
+                    pred_map=True):
+  # Distance field to or from node_id and its predecessor map. Distances come
+  # from dist_cache if given and the predecessor map is not needed, in which
+  # case None is returned for it.
+  if dist_cache is not None and not pred_map:
+    return dist_cache.get([node_id], direction, max_dist), None
+  dist, pred_map = gt.topology.shortest_distance(
+      gt.GraphView(gtG, reversed=direction == 'to'),
+      source=gtG.vertex(node_id), target=None, max_dist=max_dist, pred_map=True)
+  return np.array(dist.get_array()), np.array(pred_map.get_array())
+
 # Functions for semantically labelling nodes in the traversal graph.
 def generate_lattice(sz_x, sz_y):
   """Generates a lattice with sz_x vertices along x and sz_y vertices along y
@@ -372,7 +505,8 @@ def get_hardness_distribution(gtG, max_dist, min_dist, rng, trials, bins, nodes,
 def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
                                      max_dist, min_dist, max_dist_to_compute,
                                      sampling_d, target_d,
-                                     nodes, n_ori, step_size, bins, M):
+                                     nodes, n_ori, step_size, bins, M,
+                                     dist_cache=None):
   sample_start_nodes = start_node_ids is None
   dists = []; pred_maps = []; end_node_ids = []; start_node_ids_ = [];
   hardnesss = []; gt_dists = [];
@@ -385,10 +519,13 @@ def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
       else:
         start_node_id = start_node_ids[i]
 
-      gt_dist = gt.topology.shortest_distance(
-          gt.GraphView(gtG, reversed=False), source=start_node_id, target=None,
-          max_dist=max_dist)
-      gt_dist = np.array(gt_dist.get_array())
+      if dist_cache is None:
+        gt_dist = gt.topology.shortest_distance(
+            gt.GraphView(gtG, reversed=False), source=start_node_id, target=None,
+            max_dist=max_dist)
+        gt_dist = np.array(gt_dist.get_array())
+      else:
+        gt_dist = dist_cache.get([start_node_id], 'from', max_dist)
       ind = np.where(np.logical_and(gt_dist <= max_dist, gt_dist >= min_dist))[0]
       ind = rng.permutation(ind)
       gt_dist = gt_dist[ind]*1.
@@ -405,11 +542,9 @@ def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
         done = True
 
     # Compute distance from end node to all nodes, to return.
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=end_node_id, target=None,
-        max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = _distance_field(gtG, end_node_id, 'to',
+                                     max_dist_to_compute, dist_cache,
+                                     pred_map=False)
 
     hardnesss.append(hardness); dists.append(dist); pred_maps.append(pred_map);
     start_node_ids_.append(start_node_id); end_node_ids.append(end_node_id);
@@ -420,7 +555,8 @@ def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
 
 def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
                   max_dist_to_compute, node_room_ids, nodes=None,
-                  compute_path=False, dists_from_start_node=None):
+                  compute_path=False, dists_from_start_node=None,
+                  dist_cache=None):
   # Compute the distance field from the starting location, and then pick a
   # destination in another room if possible otherwise anywhere outside this
   # room.
@@ -429,10 +565,8 @@ def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
     room_id = node_room_ids[start_node_ids[i]]
     # Compute distances.
     if dists_from_start_node == None:
-      dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=False), source=gtG.vertex(start_node_ids[i]),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-      dist = np.array(dist.get_array())
+      dist, _ = _distance_field(gtG, start_node_ids[i], 'from',
+                                max_dist_to_compute, dist_cache, pred_map=False)
     else:
       dist = dists_from_start_node[i]
 
@@ -455,11 +589,9 @@ def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
       logging.error('Did not find any good nodes.')
 
     # Compute distance to this new goal for doing distance queries.
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=gtG.vertex(end_node_id),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = _distance_field(gtG, end_node_id, 'to',
+                                     max_dist_to_compute, dist_cache,
+                                     pred_map=compute_path)
 
     dists.append(dist)
     pred_maps.append(pred_map)
@@ -474,7 +606,8 @@ def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
 
 
 def rng_room_to_room(batch_size, gtG, rng, max_dist, max_dist_to_compute,
-                     node_room_ids, nodes=None, compute_path=False):
+                     node_room_ids, nodes=None, compute_path=False,
+                     dist_cache=None):
   # Sample one of the rooms, compute the distance field. Pick a destination in
   # another room if possible otherwise anywhere outside this room.
   dists = []; pred_maps = []; paths = []; start_node_ids = []; end_node_ids = [];
@@ -485,11 +618,9 @@ def rng_room_to_room(batch_size, gtG, rng, max_dist, max_dist_to_compute,
     end_node_ids.append(end_node_id)
 
     # Compute distances.
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=gtG.vertex(end_node_id),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = _distance_field(gtG, end_node_id, 'to',
+                                     max_dist_to_compute, dist_cache,
+                                     pred_map=compute_path)
     dists.append(dist)
     pred_maps.append(pred_map)
 
@@ -523,7 +654,7 @@ def rng_room_to_room(batch_size, gtG, rng, max_dist, max_dist_to_compute,
 
 
 def rng_target_dist_field(batch_size, gtG, rng, max_dist, max_dist_to_compute,
-                          nodes=None, compute_path=False):
+                          nodes=None, compute_path=False, dist_cache=None):
   # Sample a single node, compute distance to all nodes less than max_dist,
   # sample nodes which are a particular distance away.
   dists = []; pred_maps = []; paths = []; start_node_ids = []
@@ -531,11 +662,9 @@ def rng_target_dist_field(batch_size, gtG, rng, max_dist, max_dist_to_compute,
                             replace=False).tolist()
 
   for i in range(batch_size):
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=gtG.vertex(end_node_ids[i]),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = _distance_field(gtG, end_node_ids[i], 'to',
+                                     max_dist_to_compute, dist_cache,
+                                     pred_map=compute_path)
     dists.append(dist)
     pred_maps.append(pred_map)
 
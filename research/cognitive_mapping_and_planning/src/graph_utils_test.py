@@ -0,0 +1,131 @@
+# Copyright 2016 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the distance field cache in graph_utils.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import graph_tool as gt
+import graph_tool.topology
+import src.graph_utils as gu
+
+def _make_graph(edges, num_nodes):
+  gtG = gt.Graph(directed=True)
+  gtG.add_vertex(num_nodes)
+  for s, t in edges:
+    gtG.add_edge(s, t)
+  return gtG
+
+def _shortest_distance(gtG, node_id, direction, max_dist):
+  dist = gt.topology.shortest_distance(
+      gt.GraphView(gtG, reversed=direction == 'to'),
+      source=gtG.vertex(node_id), target=None, max_dist=max_dist)
+  return np.array(dist.get_array())
+
+class CompressDistTest(unittest.TestCase):
+  def _check_round_trip(self, dist, compressed_dtype):
+    compressed = gu._compress_dist(dist)
+    self.assertEqual(compressed[0].dtype, compressed_dtype)
+    out = gu._decompress_dist(*compressed)
+    self.assertEqual(out.dtype, dist.dtype)
+    np.testing.assert_array_equal(out, dist)
+
+  def test_round_trip(self):
+    unreachable = np.iinfo(np.int32).max
+    self._check_round_trip(np.array([0, 3, 65534, 7], dtype=np.int32),
+                           np.uint16)
+    # Unreachable nodes hold a single big value, which is restored exactly.
+    self._check_round_trip(
+        np.array([0, unreachable, 2, unreachable], dtype=np.int32), np.uint16)
+    self._check_round_trip(np.array([0., np.inf, 2.]), np.uint16)
+    self._check_round_trip(np.zeros(0, dtype=np.int32), np.uint16)
+
+  def test_large_distances(self):
+    unreachable = np.iinfo(np.int32).max
+    # A single distance above 65535 is also restored exactly.
+    self._check_round_trip(np.array([0, 70000, 65535], dtype=np.int32),
+                           np.int32)
+    self._check_round_trip(np.array([0, 70000, 3], dtype=np.int32), np.uint16)
+    # Distances above 65535 besides the unreachable ones, or negative ones,
+    # can not be stored as uint16 and are kept as is.
+    self._check_round_trip(
+        np.array([0, 70000, unreachable, 5], dtype=np.int32), np.int32)
+    self._check_round_trip(np.array([0, -1, 5], dtype=np.int32), np.int32)
+    # Non-integer and nan distances are kept as is too.
+    self._check_round_trip(np.array([0., 1.5, np.inf]), np.float64)
+    self._check_round_trip(np.array([0., np.nan, 2.]), np.float64)
+
+class DistanceFieldCacheTest(unittest.TestCase):
+  def setUp(self):
+    # A directed chain 0 -> 1 -> ... -> 5 with a shortcut 0 -> 4 and a node 6
+    # which can not be reached.
+    self.edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (0, 4), (6, 0)]
+    self.gtG = _make_graph(self.edges, 7)
+    self.cache_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.cache_dir)
+
+  def test_matches_shortest_distance(self):
+    cache = gu.DistanceFieldCache(self.gtG, max_size=2)
+    for _ in range(2):
+      for node_id in range(7):
+        for direction in ['to', 'from']:
+          for max_dist in [None, 2]:
+            np.testing.assert_array_equal(
+                cache.get([node_id], direction, max_dist),
+                _shortest_distance(self.gtG, node_id, direction, max_dist))
+    self.assertEqual(len(cache.fields), 2)
+
+    for direction in ['to', 'from']:
+      np.testing.assert_array_equal(
+          cache.get([5, 2, 5], direction),
+          gu.get_distance_node_list(self.gtG, [2, 5], direction))
+
+  def test_table(self):
+    cache = gu.DistanceFieldCache(self.gtG, table_max_dist=3,
+                                  table_max_nodes=7, cache_dir=self.cache_dir,
+                                  name='chain')
+    self.assertEqual(cache.table.dtype, np.uint16)
+    for node_id in range(7):
+      np.testing.assert_array_equal(
+          cache.get([node_id], 'to', 3),
+          _shortest_distance(self.gtG, node_id, 'to', 3))
+    self.assertEqual(len(cache.fields), 0)
+
+    # The table is loaded for the same graph, and recomputed for another one.
+    file_names = os.listdir(self.cache_dir)
+    self.assertEqual(len(file_names), 1)
+    loaded = gu.DistanceFieldCache(self.gtG, table_max_dist=3,
+                                   table_max_nodes=7, cache_dir=self.cache_dir,
+                                   name='chain')
+    np.testing.assert_array_equal(loaded.table, cache.table)
+    self.assertEqual(loaded.table_big_val, cache.table_big_val)
+    self.assertEqual(os.listdir(self.cache_dir), file_names)
+    gu.DistanceFieldCache(_make_graph(self.edges[:-1] + [(6, 1)], 7),
+                          table_max_dist=3, table_max_nodes=7,
+                          cache_dir=self.cache_dir, name='chain')
+    self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+  def test_no_table_for_large_graphs(self):
+    cache = gu.DistanceFieldCache(self.gtG, table_max_dist=3,
+                                  table_max_nodes=6)
+    self.assertIsNone(cache.table)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -35,7 +35,10 @@ def _get_xy_bounding_box(vertex, padding):
 def _project_to_map(map, vertex, wt=None, ignore_points_outside_map=False):
   """Projects points to map, returns how many points are present at each
   location."""
-  num_points = np.zeros((map.size[1], map.size[0]))
+  shape = (map.size[1], map.size[0])
+  if wt is not None:
+    assert(wt.shape[0] == vertex.shape[0]), \
+      'number of weights should be same as vertices.'
   vertex_ = vertex[:, :2] - map.origin
   vertex_ = np.round(vertex_ / map.resolution).astype(np.int)
   if ignore_points_outside_map:
@@ -44,13 +47,10 @@ def _project_to_map(map, vertex, wt=None, ignore_points_outside_map=False):
                       axis=0)
     vertex_ = vertex_[good_ind, :]
     if wt is not None:
-      wt = wt[good_ind, :]
-  if wt is None:
-    np.add.at(num_points, (vertex_[:, 1], vertex_[:, 0]), 1)
-  else:
-    assert(wt.shape[0] == vertex.shape[0]), \
-      'number of weights should be same as vertices.'
-    np.add.at(num_points, (vertex_[:, 1], vertex_[:, 0]), wt)
+      wt = wt[good_ind]
+  ind = np.ravel_multi_index((vertex_[:, 1], vertex_[:, 0]), shape)
+  num_points = np.bincount(ind, weights=wt, minlength=shape[0]*shape[1])
+  num_points = num_points.reshape(shape).astype(np.float64)
   return num_points
 
 def make_map(padding, resolution, vertex=None, sc=1.):
@@ -170,9 +170,10 @@ def generate_egocentric_maps(scaled_maps, map_scales, map_crop_sizes, loc,
                              x_axis, y_axis, theta):
   maps = []
   for i, (map_, sc, map_crop_size) in enumerate(zip(scaled_maps, map_scales, map_crop_sizes)):
-    maps_i = np.array(get_map_to_predict(loc*sc, x_axis, y_axis, map_,
-                                         map_crop_size,
-                                         interpolation=cv2.INTER_LINEAR)[0])
+    transforms = _get_egocentric_transforms(loc*sc, x_axis, y_axis,
+                                            map_crop_size)
+    maps_i = _warp_maps(map_, transforms, map_crop_size,
+                        interpolation=cv2.INTER_LINEAR)
     maps_i[np.isnan(maps_i)] = 0
     maps.append(maps_i)
   return maps
@@ -210,11 +211,10 @@ def generate_goal_images(map_scales, map_crop_sizes, n_ori, goal_dist,
     goals.append(goal_i)
   return goals
 
-def get_map_to_predict(src_locs, src_x_axiss, src_y_axiss, map, map_size,
-                       interpolation=cv2.INTER_LINEAR):
-  fss = []
-  valids = []
-
+def _get_egocentric_transforms(src_locs, src_x_axiss, src_y_axiss, map_size):
+  """Returns the N x 2 x 3 affine transforms that map each of the N locations
+  (and axes) to the center of a map_size x map_size egocentric map, all
+  computed at once."""
   center = (map_size-1.0)/2.0
   dst_theta = np.pi/2.0
   dst_loc = np.array([center, center])
@@ -222,24 +222,36 @@ def get_map_to_predict(src_locs, src_x_axiss, src_y_axiss, map, map_size,
   dst_y_axis = np.array([np.cos(dst_theta+np.pi/2), np.sin(dst_theta+np.pi/2)])
 
   def compute_points(center, x_axis, y_axis):
-    points = np.zeros((3,2),dtype=np.float32)
-    points[0,:] = center
-    points[1,:] = center + x_axis
-    points[2,:] = center + y_axis
+    points = np.zeros(center.shape[:-1] + (3,2), dtype=np.float32)
+    points[...,0,:] = center
+    points[...,1,:] = center + x_axis
+    points[...,2,:] = center + y_axis
     return points
 
-  dst_points = compute_points(dst_loc, dst_x_axis, dst_y_axis)
-  for i in range(src_locs.shape[0]):
-    src_loc = src_locs[i,:]
-    src_x_axis = src_x_axiss[i,:]
-    src_y_axis = src_y_axiss[i,:]
-    src_points = compute_points(src_loc, src_x_axis, src_y_axis)
-    M = cv2.getAffineTransform(src_points, dst_points)
-
-    fs = cv2.warpAffine(map, M, (map_size, map_size), None, flags=interpolation,
-                        borderValue=np.NaN)
-    valid = np.invert(np.isnan(fs))
-    valids.append(valid)
-    fss.append(fs)
-  return fss, valids
+  n = src_locs.shape[0]
+  dst_points = compute_points(dst_loc, dst_x_axis, dst_y_axis).astype(np.float64)
+  src_points = compute_points(src_locs, src_x_axiss, src_y_axiss).astype(np.float64)
+  # Solve for M such that M [src_point; 1] = dst_point for the 3 point pairs,
+  # as cv2.getAffineTransform does.
+  src_points = np.concatenate((src_points, np.ones((n, 3, 1))), axis=2)
+  dst_points = np.broadcast_to(dst_points, (n, 3, 2))
+  M = np.linalg.solve(src_points, dst_points)
+  return np.transpose(M, [0, 2, 1])
+
+def _warp_maps(map, transforms, map_size, interpolation):
+  """Warps map with each of the transforms, returns N x map_size x map_size
+  array, with NaN outside the map."""
+  fss = np.zeros((transforms.shape[0], map_size, map_size), dtype=map.dtype)
+  for i in range(transforms.shape[0]):
+    fss[i] = cv2.warpAffine(map, transforms[i], (map_size, map_size), None,
+                            flags=interpolation, borderValue=np.NaN)
+  return fss
+
+def get_map_to_predict(src_locs, src_x_axiss, src_y_axiss, map, map_size,
+                       interpolation=cv2.INTER_LINEAR):
+  transforms = _get_egocentric_transforms(src_locs, src_x_axiss, src_y_axiss,
+                                          map_size)
+  fss = _warp_maps(map, transforms, map_size, interpolation)
+  valids = np.invert(np.isnan(fss))
+  return list(fss), list(valids)
 
@@ -161,6 +161,10 @@ class DeepSpeechDataset(object):
     self.entries = _preprocess_data(self.config.data_path)
     # The generated spectrogram will have 161 feature bins.
     self.num_feature_bins = 161
+    # Optional feature_store.FeatureStore with the precomputed features of the
+    # entries. If set, input_fn reads the features from the store instead of
+    # computing them from the audio files.
+    self.feature_store = None
 
 
 def batch_wise_dataset_shuffle(entries, epoch_index, sortagrad, batch_size):
@@ -199,13 +203,70 @@ def batch_wise_dataset_shuffle(entries, epoch_index, sortagrad, batch_size):
   return shuffled_entries
 
 
-def input_fn(batch_size, deep_speech_dataset, repeat=1):
+def _feature_store_dataset(deep_speech_dataset, num_parallel_calls):
+  """Reads the features of the dataset entries from its feature store.
+
+  The examples are produced in the order of deep_speech_dataset.entries, so
+  the SortaGrad ordering of batch_wise_dataset_shuffle is preserved.
+
+  Args:
+    deep_speech_dataset: DeepSpeechDataset object with a feature_store.
+    num_parallel_calls: an integer for the number of examples read in parallel.
+
+  Returns:
+    a tf.data.Dataset of (features, labels) tuples, as in input_fn.
+  """
+  feature_store = deep_speech_dataset.feature_store
+  num_feature_bins = deep_speech_dataset.num_feature_bins
+  token_to_index = deep_speech_dataset.text_featurizer.token_to_index
+
+  # Look up the store rows and labels once rather than in every epoch.
+  rows = [feature_store.row(audio_file)
+          for audio_file, _, _ in deep_speech_dataset.entries]
+  labels = [
+      np.array(featurizer.compute_label_feature(transcript, token_to_index),
+               dtype=np.int32)
+      for _, _, transcript in deep_speech_dataset.entries]
+
+  def _read_example(index):
+    """Reads the features of an entry from the memory-mapped store."""
+    features = feature_store.get_row(rows[index]).astype(np.float32)
+    example_labels = labels[index]
+    return (np.expand_dims(features, axis=2),
+            np.array([features.shape[0]], dtype=np.int32),
+            np.array([len(example_labels)], dtype=np.int32),
+            example_labels)
+
+  def _to_example(index):
+    features, input_length, label_length, example_labels = tf.py_func(
+        _read_example, [index], [tf.float32, tf.int32, tf.int32, tf.int32],
+        stateful=False)
+    features.set_shape([None, num_feature_bins, 1])
+    input_length.set_shape([1])
+    label_length.set_shape([1])
+    example_labels.set_shape([None])
+    return (
+        {
+            "features": features,
+            "input_length": input_length,
+            "label_length": label_length
+        },
+        example_labels)
+
+  dataset = tf.data.Dataset.range(len(rows))
+  # Mapping in parallel keeps the order of the entries.
+  return dataset.map(_to_example, num_parallel_calls=num_parallel_calls)
+
+
+def input_fn(batch_size, deep_speech_dataset, repeat=1, num_parallel_calls=1):
   """Input function for model training and evaluation.
 
   Args:
     batch_size: an integer denoting the size of a batch.
     deep_speech_dataset: DeepSpeechDataset object.
     repeat: an integer for how many times to repeat the dataset.
+    num_parallel_calls: an integer for the number of examples read from the
+      feature store in parallel, if deep_speech_dataset has one.
 
   Returns:
     a tf.data.Dataset object for model to consume.
@@ -236,23 +297,26 @@ def input_fn(batch_size, deep_speech_dataset, repeat=1):
           },
           labels)
 
-  dataset = tf.data.Dataset.from_generator(
-      _gen_data,
-      output_types=(
-          {
-              "features": tf.float32,
-              "input_length": tf.int32,
-              "label_length": tf.int32
-          },
-          tf.int32),
-      output_shapes=(
-          {
-              "features": tf.TensorShape([None, num_feature_bins, 1]),
-              "input_length": tf.TensorShape([1]),
-              "label_length": tf.TensorShape([1])
-          },
-          tf.TensorShape([None]))
-  )
+  if deep_speech_dataset.feature_store is not None:
+    dataset = _feature_store_dataset(deep_speech_dataset, num_parallel_calls)
+  else:
+    dataset = tf.data.Dataset.from_generator(
+        _gen_data,
+        output_types=(
+            {
+                "features": tf.float32,
+                "input_length": tf.int32,
+                "label_length": tf.int32
+            },
+            tf.int32),
+        output_shapes=(
+            {
+                "features": tf.TensorShape([None, num_feature_bins, 1]),
+                "input_length": tf.TensorShape([1]),
+                "label_length": tf.TensorShape([1])
+            },
+            tf.TensorShape([None]))
+    )
 
   # Repeat and batch the dataset
   dataset = dataset.repeat(repeat)
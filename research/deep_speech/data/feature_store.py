@@ -0,0 +1,252 @@
+#  Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+# ==============================================================================
+"""Memory-mapped store of precomputed spectrogram features.
+
+Computing the spectrogram of every audio file in every epoch keeps the input
+pipeline busy in a single Python thread. The feature store extracts the
+spectrograms once, in a pool of processes, and writes them in segments of a
+bounded number of audio files:
+
+  ${store_dir}/${audio_config}/segment-${n}.bin        float16 spectrogram
+                                                      frames of segment n,
+                                                      num_feature_bins wide.
+  ${store_dir}/${audio_config}/segment-${n}.index.npz  Audio files of segment n
+                                                      and their frame counts.
+
+where ${audio_config} encodes the AudioConfig the features were computed with,
+so that features computed with different configs never mix. A segment is
+written under temporary names and renamed into place when it is complete, and
+is never modified afterwards; a build that is interrupted loses at most the
+segment in progress, which the next build discards. The frames are memory
+mapped, so reading an utterance only copies its own frames.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import os
+# pylint: disable=g-bad-import-order
+import numpy as np
+import tensorflow as tf
+
+import data.dataset as dataset
+import data.featurizer as featurizer
+# pylint: enable=g-bad-import-order
+
+_TMP_SUFFIX = ".tmp"
+
+
+def _config_dirname(audio_config):
+  return "sample_rate={}_window_ms={}_stride_ms={}_normalize={}".format(
+      audio_config.sample_rate, audio_config.window_ms, audio_config.stride_ms,
+      audio_config.normalize)
+
+
+def _compute_feature(args):
+  """Computes the spectrogram of one audio file, without a channel axis."""
+  audio_file, audio_config = args
+  audio_featurizer = featurizer.AudioFeaturizer(
+      sample_rate=audio_config.sample_rate,
+      window_ms=audio_config.window_ms,
+      stride_ms=audio_config.stride_ms)
+  feature = dataset._preprocess_audio(  # pylint: disable=protected-access
+      audio_file, audio_featurizer, audio_config.normalize)
+  return audio_file, np.squeeze(feature, axis=2).astype(np.float16)
+
+
+class _Segment(object):
+  """The spectrograms of a group of audio files, stored in one frames file."""
+
+  def __init__(self, frames_file, audio_files, lengths, num_feature_bins):
+    self.frames_file = frames_file
+    self.audio_files = audio_files
+    self.lengths = lengths
+    self.offsets = np.cumsum([0] + list(lengths[:-1])).astype(np.int64)
+    self.num_feature_bins = num_feature_bins
+    self._frames = None
+
+  def feature(self, i):
+    """Returns a read-only view of the spectrogram of audio_files[i]."""
+    if self._frames is None:
+      num_frames = int(np.sum(self.lengths))
+      if num_frames:
+        self._frames = np.memmap(
+            self.frames_file, dtype=np.float16, mode="r",
+            shape=(num_frames, self.num_feature_bins))
+      else:
+        self._frames = np.zeros([0, self.num_feature_bins], np.float16)
+    offset = self.offsets[i]
+    return self._frames[offset:offset + self.lengths[i]]
+
+
+class _SegmentWriter(object):
+  """Writes the spectrograms of a new segment under temporary file names."""
+
+  def __init__(self, frames_file, index_file, num_feature_bins):
+    self.frames_file = frames_file
+    self.index_file = index_file
+    self.num_feature_bins = num_feature_bins
+    self.audio_files = []
+    self.lengths = []
+    self._file = open(frames_file + _TMP_SUFFIX, "wb")
+
+  def __len__(self):
+    return len(self.audio_files)
+
+  def add(self, audio_file, feature):
+    if feature.ndim != 2 or feature.shape[1] != self.num_feature_bins:
+      raise ValueError("Expected a [time, {}] feature, got shape {}".format(
+          self.num_feature_bins, feature.shape))
+    self._file.write(np.ascontiguousarray(feature, dtype=np.float16).tobytes())
+    self.audio_files.append(audio_file)
+    self.lengths.append(len(feature))
+
+  def close(self):
+    """Renames the files of the segment into place and returns the _Segment."""
+    self._file.close()
+    # np.savez appends .npz to names that do not end with it.
+    tmp_index_file = self.index_file[:-len(".npz")] + _TMP_SUFFIX + ".npz"
+    np.savez(tmp_index_file, audio_files=np.array(self.audio_files),
+             lengths=np.array(self.lengths, dtype=np.int64))
+    os.rename(tmp_index_file, self.index_file)
+    # The segment exists once its frames file does.
+    os.rename(self.frames_file + _TMP_SUFFIX, self.frames_file)
+    return _Segment(self.frames_file, self.audio_files,
+                    np.array(self.lengths, dtype=np.int64),
+                    self.num_feature_bins)
+
+
+class FeatureStore(object):
+  """Store of the spectrogram features of audio files for one AudioConfig.
+
+  A single process should add features to a store, with build(). Other
+  processes see the segments that were complete when they opened the store.
+  """
+
+  def __init__(self, store_dir, audio_config, num_feature_bins):
+    """Opens (or creates) a feature store.
+
+    Args:
+      store_dir: Base directory of the feature store.
+      audio_config: AudioConfig object the features are computed with.
+      num_feature_bins: an integer for the number of feature bins per frame.
+    """
+    self.audio_config = audio_config
+    self.num_feature_bins = num_feature_bins
+    self._dir = os.path.join(store_dir, _config_dirname(audio_config))
+    if not tf.gfile.Exists(self._dir):
+      tf.gfile.MakeDirs(self._dir)
+
+    self._segments = []
+    # (segment, position in segment) of each row, and the row of each file.
+    self._row_locations = []
+    self._rows = {}
+    while True:
+      frames_file, index_file = self._segment_files(len(self._segments))
+      if not os.path.exists(frames_file):
+        break
+      index = np.load(index_file)
+      self._add_segment(_Segment(frames_file, list(index["audio_files"]),
+                                 index["lengths"], num_feature_bins))
+
+  def _segment_files(self, segment_number):
+    prefix = os.path.join(self._dir, "segment-%05d" % segment_number)
+    return prefix + ".bin", prefix + ".index.npz"
+
+  def _add_segment(self, segment):
+    segment_number = len(self._segments)
+    self._segments.append(segment)
+    for i, audio_file in enumerate(segment.audio_files):
+      self._rows[audio_file] = len(self._row_locations)
+      self._row_locations.append((segment_number, i))
+
+  def _discard_incomplete_segment(self):
+    """Deletes the files of a segment whose build was interrupted."""
+    frames_file, index_file = self._segment_files(len(self._segments))
+    prefix = os.path.basename(frames_file)[:-len(".bin")]
+    for name in os.listdir(self._dir):
+      if name.startswith(prefix) or _TMP_SUFFIX in name:
+        tf.logging.info("Discarding %s of an interrupted build.", name)
+        os.remove(os.path.join(self._dir, name))
+
+  def __len__(self):
+    return len(self._row_locations)
+
+  def __contains__(self, audio_file):
+    return audio_file in self._rows
+
+  def row(self, audio_file):
+    """Returns the index row of an audio file; raises KeyError if missing."""
+    return self._rows[audio_file]
+
+  def get_row(self, row):
+    """Returns a read-only float16 view of the feature in an index row."""
+    segment_number, i = self._row_locations[row]
+    return self._segments[segment_number].feature(i)
+
+  def get(self, audio_file):
+    """Returns a read-only float16 view of the feature of an audio file."""
+    return self.get_row(self.row(audio_file))
+
+  def build(self, audio_files, num_processes=1, segment_size=256):
+    """Computes the features of every audio file not already in the store.
+
+    Features are computed in a pool of worker processes and written to the
+    store by the calling process, segment_size audio files per segment, so an
+    interrupted build resumes after the last complete segment.
+
+    Args:
+      audio_files: Iterable of audio file paths.
+      num_processes: Number of worker processes.
+      segment_size: Number of audio files per segment.
+
+    Returns:
+      The number of features added to the store.
+    """
+    missing = sorted(set(audio_files) - set(self._rows))
+    tf.logging.info("Computing features of %d of %d audio files.",
+                    len(missing), len(missing) + len(self))
+    if not missing:
+      return 0
+    self._discard_incomplete_segment()
+
+    tasks = [(audio_file, self.audio_config) for audio_file in missing]
+    if num_processes > 1:
+      pool = multiprocessing.Pool(processes=num_processes)
+      results = pool.imap_unordered(_compute_feature, tasks, chunksize=16)
+    else:
+      pool = None
+      results = (_compute_feature(task) for task in tasks)
+
+    try:
+      writer = None
+      for num_added, (audio_file, feature) in enumerate(results, 1):
+        if writer is None:
+          writer = _SegmentWriter(
+              *self._segment_files(len(self._segments)),
+              num_feature_bins=self.num_feature_bins)
+        writer.add(audio_file, feature)
+        if len(writer) == segment_size or num_added == len(missing):
+          self._add_segment(writer.close())
+          writer = None
+          tf.logging.info("Computed %d/%d features.", num_added, len(missing))
+    finally:
+      if pool is not None:
+        # All results have been consumed, unless the build failed.
+        pool.terminate()
+        pool.join()
+
+    return len(missing)
@@ -0,0 +1,156 @@
+#  Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+# ==============================================================================
+"""Tests for data/feature_store.py."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+# pylint: disable=g-bad-import-order
+import numpy as np
+import soundfile
+import tensorflow as tf
+
+import data.dataset as dataset
+import data.feature_store as feature_store
+import data.featurizer as featurizer
+# pylint: enable=g-bad-import-order
+
+_SAMPLE_RATE = 16000
+_NUM_FEATURE_BINS = 161
+
+
+class FeatureStoreTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(FeatureStoreTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    self.store_dir = os.path.join(self.tmp_dir, "store")
+    self.audio_config = dataset.AudioConfig(
+        _SAMPLE_RATE, window_ms=20, stride_ms=10, normalize=True)
+    rng = np.random.RandomState(0)
+    self.audio_files = []
+    for i in range(5):
+      audio_file = os.path.join(self.tmp_dir, "audio-%d.wav" % i)
+      samples = 0.1 * rng.normal(size=_SAMPLE_RATE * (i + 1) // 4)
+      soundfile.write(audio_file, samples, _SAMPLE_RATE)
+      self.audio_files.append(audio_file)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(FeatureStoreTest, self).tearDown()
+
+  def _open_store(self):
+    return feature_store.FeatureStore(
+        self.store_dir, self.audio_config, _NUM_FEATURE_BINS)
+
+  def _assert_features(self, store, audio_files):
+    audio_featurizer = featurizer.AudioFeaturizer(
+        sample_rate=_SAMPLE_RATE, window_ms=20, stride_ms=10)
+    for audio_file in audio_files:
+      expected = dataset._preprocess_audio(  # pylint: disable=protected-access
+          audio_file, audio_featurizer, True)[:, :, 0].astype(np.float16)
+      self.assertAllEqual(expected, store.get(audio_file))
+
+  def _store_files(self):
+    config_dirname = feature_store._config_dirname(  # pylint: disable=protected-access
+        self.audio_config)
+    return sorted(os.listdir(os.path.join(self.store_dir, config_dirname)))
+
+  def testBuild(self):
+    store = self._open_store()
+    self.assertEqual(5, store.build(self.audio_files, segment_size=2))
+    self.assertEqual(5, len(store))
+    self._assert_features(store, self.audio_files)
+    self.assertEqual(
+        ["segment-00000.bin", "segment-00000.index.npz",
+         "segment-00001.bin", "segment-00001.index.npz",
+         "segment-00002.bin", "segment-00002.index.npz"],
+        self._store_files())
+
+  def testBuildInProcessPool(self):
+    store = self._open_store()
+    self.assertEqual(5, store.build(self.audio_files, num_processes=2))
+    self._assert_features(store, self.audio_files)
+
+  def testReopen(self):
+    self._open_store().build(self.audio_files[:3], segment_size=2)
+
+    store = self._open_store()
+    self.assertEqual(3, len(store))
+    self._assert_features(store, self.audio_files[:3])
+    self.assertEqual(0, store.build(self.audio_files[:3]))
+
+    self.assertEqual(2, store.build(self.audio_files))
+    store = self._open_store()
+    self.assertEqual(5, len(store))
+    self._assert_features(store, self.audio_files)
+
+  def testInterruptedBuild(self):
+    compute_feature = feature_store._compute_feature  # pylint: disable=protected-access
+    num_computed = [0]
+
+    def failing_compute_feature(args):
+      if num_computed[0] == 3:
+        raise KeyboardInterrupt()
+      num_computed[0] += 1
+      return compute_feature(args)
+
+    feature_store._compute_feature = failing_compute_feature  # pylint: disable=protected-access
+    try:
+      with self.assertRaises(KeyboardInterrupt):
+        self._open_store().build(self.audio_files, segment_size=2)
+    finally:
+      feature_store._compute_feature = compute_feature  # pylint: disable=protected-access
+    # The second segment was in progress when the build failed.
+    self.assertIn("segment-00001.bin.tmp", self._store_files())
+
+    store = self._open_store()
+    self.assertEqual(2, len(store))
+    self._assert_features(store, self.audio_files[:2])
+
+    self.assertEqual(3, store.build(self.audio_files, segment_size=2))
+    self.assertEqual(5, len(store))
+    self._assert_features(store, self.audio_files)
+    self.assertFalse([name for name in self._store_files() if ".tmp" in name])
+
+  def testLookup(self):
+    store = self._open_store()
+    store.build(self.audio_files, segment_size=2)
+    for audio_file in self.audio_files:
+      self.assertIn(audio_file, store)
+      self.assertAllEqual(store.get(audio_file),
+                          store.get_row(store.row(audio_file)))
+    self.assertEqual(list(range(5)),
+                     sorted(store.row(f) for f in self.audio_files))
+    missing_file = os.path.join(self.tmp_dir, "missing.wav")
+    self.assertNotIn(missing_file, store)
+    with self.assertRaises(KeyError):
+      store.row(missing_file)
+    with self.assertRaises(KeyError):
+      store.get(missing_file)
+
+  def testRejectsWrongFeatureWidth(self):
+    writer = feature_store._SegmentWriter(  # pylint: disable=protected-access
+        os.path.join(self.tmp_dir, "segment.bin"),
+        os.path.join(self.tmp_dir, "segment.index.npz"), _NUM_FEATURE_BINS)
+    with self.assertRaises(ValueError):
+      writer.add("audio.wav", np.zeros([4, _NUM_FEATURE_BINS + 1]))
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -1,17 +1,16 @@
-
-# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#  Copyright 2018 The TensorFlow Authors. All Rights Reserved.
 #
-# Licensed under the Apache License, Version 2.0 (the "License");
-# you may not use this file except in compliance with the License.
-# You may obtain a copy of the License at
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
 #
-#     http://www.apache.org/licenses/LICENSE-2.0
+#   http://www.apache.org/licenses/LICENSE-2.0
 #
-# Unless required by applicable law or agreed to in writing, software
-# distributed under the License is distributed on an "AS IS" BASIS,
-# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
-# See the License for the specific language governing permissions and
-# limitations under the License.
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
 # ==============================================================================
 """Deep speech decoder."""
 from __future__ import absolute_import
@@ -19,26 +18,367 @@ from __future__ import division
 from __future__ import print_function
 
 import itertools
+import math
+import multiprocessing
+import time
 
-from nltk.metrics import distance
 import numpy as np
+from six.moves import xrange  # pylint: disable=redefined-builtin
+
+# Natural log of 10, to convert the log10 probabilities of ARPA files.
+_LN_10 = math.log(10.0)
+# Log10 probability of words that are unknown to a language model without an
+# <unk> entry.
+_UNK_LOG10_PROB = -10.0
+
+
+class NGramLanguageModel(object):
+  """Back-off n-gram language model loaded from an ARPA file.
+
+  Tokens are mapped to integer ids, and each n-gram is packed into a single
+  integer key of a hash table per order, which points into float32 arrays of
+  log probabilities and back-off weights.
+  """
+
+  def __init__(self, arpa_file, cache_size=1 << 20):
+    """Loads the language model.
+
+    Arguments:
+      arpa_file: a string for the path of the ARPA file.
+      cache_size: an integer for the maximum number of cached scores.
+
+    Raises:
+      ValueError: if the file is not a valid ARPA file.
+    """
+    self._token_to_id = {}
+    self._tables = [None]
+    self._logprobs = [None]
+    self._backoffs = [None]
+    self._cache = {}
+    self._cache_size = cache_size
+
+    counts = {}
+    order = 0
+    entries = []
+    with open(arpa_file, "r") as f:
+      for line in f:
+        line = line.strip()
+        if not line:
+          continue
+        if line.startswith("ngram "):
+          n, count = line[len("ngram "):].split("=")
+          counts[int(n)] = int(count)
+        elif line.startswith("\\") and line.endswith("-grams:"):
+          self._add_order(order, entries)
+          order = int(line[1:-len("-grams:")])
+          entries = []
+        elif line == "\\end\\":
+          break
+        elif order:
+          entries.append(line.split())
+    self._add_order(order, entries)
+
+    if not counts or len(self._tables) - 1 != max(counts):
+      raise ValueError("{} is not a valid ARPA file.".format(arpa_file))
+    self.order = len(self._tables) - 1
+
+    unk_id = self._token_to_id.get("<unk>")
+    if unk_id is not None:
+      self._unk_log10_prob = float(
+          self._logprobs[1][self._tables[1][unk_id]])
+    else:
+      self._unk_log10_prob = _UNK_LOG10_PROB
+
+  def _add_order(self, order, entries):
+    """Adds the n-grams of one order to the hash tables."""
+    if not order:
+      return
+    if order != len(self._tables):
+      raise ValueError("Expected {}-grams, got {}-grams.".format(
+          len(self._tables), order))
+
+    table = {}
+    logprobs = np.zeros(len(entries), dtype=np.float32)
+    backoffs = np.zeros(len(entries), dtype=np.float32)
+    for row, parts in enumerate(entries):
+      tokens = parts[1:1 + order]
+      if order == 1:
+        self._token_to_id.setdefault(tokens[0], len(self._token_to_id) + 1)
+      key = self._pack([self._token_to_id.get(t, 0) for t in tokens])
+      table[key] = row
+      logprobs[row] = float(parts[0])
+      if len(parts) > order + 1:
+        backoffs[row] = float(parts[order + 1])
+    self._tables.append(table)
+    self._logprobs.append(logprobs)
+    self._backoffs.append(backoffs)
+
+  def trim_context(self, context):
+    """Returns the last order - 1 tokens of a context, as a tuple."""
+    return tuple(context[max(0, len(context) - self.order + 1):])
+
+  def _pack(self, ids):
+    key = 0
+    for token_id in ids:
+      key = key * (len(self._token_to_id) + 1) + token_id
+    return key
+
+  def score(self, context, token):
+    """Returns the natural log probability of a token after a context.
+
+    Arguments:
+      context: a tuple of the preceding tokens, e.g. ("<s>", "the").
+      token: a string for the scored token.
+
+    Returns:
+      A float for log P(token | context), with Katz back-off.
+    """
+    context = self.trim_context(context)
+    cache_key = (context, token)
+    cached = self._cache.get(cache_key)
+    if cached is not None:
+      return cached
+
+    token_id = self._token_to_id.get(token, 0)
+    if not token_id:
+      log10_prob = self._unk_log10_prob
+    else:
+      ids = [self._token_to_id.get(t, 0) for t in context]
+      log10_prob = self._unk_log10_prob
+      backoff = 0.0
+      for start in xrange(len(ids) + 1):
+        n = len(ids) - start + 1
+        row = self._tables[n].get(self._pack(ids[start:] + [token_id]))
+        if row is not None:
+          log10_prob = self._logprobs[n][row] + backoff
+          break
+        # Back off to a shorter context.
+        context_row = self._tables[n - 1].get(self._pack(ids[start:]))
+        if context_row is not None:
+          backoff += self._backoffs[n - 1][context_row]
+
+    if len(self._cache) >= self._cache_size:
+      self._cache.clear()
+    self._cache[cache_key] = float(log10_prob) * _LN_10
+    return self._cache[cache_key]
+
+
+def _edit_distances(hyps, refs):
+  """Computes the Levenshtein distances of pairs of integer sequences.
+
+  The dynamic program runs one hypothesis position at a time for all pairs at
+  once. Within a row, insertions are resolved with a running minimum:
+  d[i][j] = min_k(t[k] + j - k), where t holds the deletion/substitution costs.
+
+  Arguments:
+    hyps: a list of integer sequences.
+    refs: a list of integer sequences, as long as hyps.
+
+  Returns:
+    A numpy array with the edit distance of each (hyp, ref) pair.
+  """
+  num_pairs = len(hyps)
+  if not num_pairs:
+    return np.zeros([0], dtype=np.int64)
+  hyp_lens = np.array([len(h) for h in hyps])
+  ref_lens = np.array([len(r) for r in refs])
+  max_hyp, max_ref = hyp_lens.max(), ref_lens.max()
+
+  # Pad with values that never match each other.
+  hyp_arr = np.full((num_pairs, max_hyp), -1, dtype=np.int64)
+  ref_arr = np.full((num_pairs, max_ref), -2, dtype=np.int64)
+  for i, (hyp, ref) in enumerate(zip(hyps, refs)):
+    hyp_arr[i, :len(hyp)] = hyp
+    ref_arr[i, :len(ref)] = ref
+
+  cols = np.arange(max_ref + 1)
+  prev = np.tile(cols, (num_pairs, 1))
+  result = ref_lens.copy()  # Distances for empty hypotheses.
+  for i in xrange(1, max_hyp + 1):
+    cost = (hyp_arr[:, i - 1:i] != ref_arr).astype(np.int64)
+    row = np.empty_like(prev)
+    row[:, 0] = i
+    row[:, 1:] = np.minimum(prev[:, 1:] + 1, prev[:, :-1] + cost)
+    row = np.minimum.accumulate(row - cols, axis=1) + cols
+    done = hyp_lens == i
+    result[done] = row[done, ref_lens[done]]
+    prev = row
+  return result
+
+
+def _word_ids(sentences_a, sentences_b):
+  """Maps the words of two lists of sentences to shared integer ids."""
+  vocab = {}
+  def to_ids(sentence):
+    return [vocab.setdefault(w, len(vocab)) for w in sentence.split()]
+  return ([to_ids(s) for s in sentences_a], [to_ids(s) for s in sentences_b])
+
+
+def wer_batch(decodes, targets):
+  """Computes the word-level edit distance of each decode-target pair."""
+  decode_ids, target_ids = _word_ids(decodes, targets)
+  return _edit_distances(decode_ids, target_ids)
+
+
+def cer_batch(decodes, targets):
+  """Computes the character-level edit distance of each decode-target pair."""
+  return _edit_distances([[ord(c) for c in d] for d in decodes],
+                         [[ord(c) for c in t] for t in targets])
+
+
+# Decoder of the batch decoding worker processes; see decode_batch().
+_worker_decoder = None
+
+
+def _init_decode_worker(decoder):
+  global _worker_decoder
+  _worker_decoder = decoder
+
+
+def _decode_timed(probs):
+  """Decodes one utterance; returns the transcript and the latency."""
+  start = time.time()
+  transcript = _worker_decoder.decode_probs(probs)
+  return transcript, time.time() - start
+
+
+class _PrefixTrie(object):
+  """Trie of the label prefixes of a beam search, with integer prefix ids.
+
+  The children of the trie are found with a binary search over the sorted
+  packed keys parent * num_labels + label, so that all extensions of a beam
+  are looked up, and added, at once.
+  """
+
+  def __init__(self, num_labels, space_index, root_state=None):
+    """Creates a trie with only the empty prefix, whose id is 0.
+
+    Arguments:
+      num_labels: an integer for the number of labels.
+      space_index: an integer for the index of the space label.
+      root_state: the language model state of the empty prefix, or None to
+        skip tracking language model states.
+    """
+    self._num_labels = num_labels
+    self._space_index = space_index
+    self._keys = np.zeros(0, dtype=np.int64)
+    self._key_ids = np.zeros(0, dtype=np.int64)
+    self._size = 1
+    self.parent = np.full(1024, -1, dtype=np.int64)
+    self.last = np.full(1024, -1, dtype=np.int64)
+    self.word_length = np.zeros(1024, dtype=np.int64)
+    self.num_words = np.zeros(1024, dtype=np.int64)
+    self.lm_score = np.zeros(1024)
+    self.states = [root_state] if root_state is not None else None
+
+  def _grow(self, size):
+    capacity = len(self.parent)
+    while capacity < size:
+      capacity *= 2
+    if capacity == len(self.parent):
+      return
+    for name in ("parent", "last", "word_length", "num_words", "lm_score"):
+      array = getattr(self, name)
+      grown = np.zeros(capacity, dtype=array.dtype)
+      grown[:len(array)] = array
+      setattr(self, name, grown)
+
+  def children(self, prefixes, labels, extend_state=None):
+    """Returns the ids of the prefixes extended by labels, adding new ones.
+
+    Arguments:
+      prefixes: an integer numpy array of prefix ids.
+      labels: an integer numpy array of label indices, broadcastable with
+        prefixes.
+      extend_state: a function (state, label) -> (LM score, new state), called
+        for each new prefix if the trie tracks language model states.
+
+    Returns:
+      An integer numpy array with the id of each extended prefix, in the
+      broadcast shape of prefixes and labels.
+    """
+    prefixes, labels = np.broadcast_arrays(prefixes, labels)
+    keys = (prefixes * self._num_labels + labels).ravel()
+    positions = np.searchsorted(self._keys, keys)
+    found = np.zeros(len(keys), dtype=bool)
+    in_range = positions < len(self._keys)
+    found[in_range] = self._keys[positions[in_range]] == keys[in_range]
+    ids = np.empty(len(keys), dtype=np.int64)
+    ids[found] = self._key_ids[positions[found]]
+
+    new_keys, inverse = np.unique(keys[~found], return_inverse=True)
+    new_ids = np.arange(self._size, self._size + len(new_keys))
+    ids[~found] = new_ids[inverse]
+    self._size += len(new_keys)
+    self._grow(self._size)
+    insert_at = np.searchsorted(self._keys, new_keys)
+    self._keys = np.insert(self._keys, insert_at, new_keys)
+    self._key_ids = np.insert(self._key_ids, insert_at, new_ids)
+
+    parents = new_keys // self._num_labels
+    new_labels = new_keys % self._num_labels
+    is_space = new_labels == self._space_index
+    self.parent[new_ids] = parents
+    self.last[new_ids] = new_labels
+    self.word_length[new_ids] = np.where(
+        is_space, 0, self.word_length[parents] + 1)
+    # A space completes the current word, if there is one.
+    self.num_words[new_ids] = self.num_words[parents] + (
+        is_space & (self.word_length[parents] > 0))
+    if self.states is not None:
+      for child, parent, label in zip(new_ids, parents, new_labels):
+        self.lm_score[child], state = extend_state(self.states[parent], label)
+        self.states.append(state)
+    return ids.reshape(prefixes.shape)
+
+  def labels(self, prefix):
+    """Returns the list of labels of a prefix id."""
+    labels = []
+    while prefix > 0:
+      labels.append(self.last[prefix])
+      prefix = self.parent[prefix]
+    return labels[::-1]
 
 
 class DeepSpeechDecoder(object):
-  """Greedy decoder implementation for Deep Speech model."""
+  """Greedy and CTC prefix beam search decoder for Deep Speech model."""
 
-  def __init__(self, labels, blank_index=28):
+  def __init__(self, labels, blank_index=28, beam_width=1, lm=None,
+               lm_alpha=0.5, lm_beta=1.0, lm_level="word",
+               space_token="<space>", cutoff_prob=0.999, cutoff_top_n=40):
     """Decoder initialization.
 
     Arguments:
       labels: a string specifying the speech labels for the decoder to use.
       blank_index: an integer specifying index for the blank character.
         Defaults to 28.
+      beam_width: an integer for the beam width of the prefix beam search. The
+        default of 1 without a language model decodes greedily.
+      lm: an optional NGramLanguageModel to score the beams with.
+      lm_alpha: a float for the weight of the language model.
+      lm_beta: a float for the bonus of each decoded word, if there is a
+        language model.
+      lm_level: "word" if the language model is over words, or "char" if it is
+        over the characters of the labels.
+      space_token: a string for the space token of a character language model.
+      cutoff_prob: a float; at each time step, only the most likely characters
+        with this cumulative probability are used to extend the beams.
+      cutoff_top_n: an integer for the maximum number of characters used to
+        extend the beams at each time step.
     """
     # e.g. labels = "[a-z]' _"
     self.labels = labels
     self.blank_index = blank_index
     self.int_to_char = dict([(i, c) for (i, c) in enumerate(labels)])
+    self.space_index = labels.find(" ")
+    self.beam_width = beam_width
+    self.lm = lm
+    self.lm_alpha = lm_alpha
+    self.lm_beta = lm_beta
+    self.lm_level = lm_level
+    self.space_token = space_token
+    self.cutoff_prob = cutoff_prob
+    self.cutoff_top_n = cutoff_top_n
 
   def convert_to_string(self, sequence):
     """Convert a sequence of indexes into corresponding string."""
@@ -57,14 +397,7 @@ class DeepSpeechDecoder(object):
     Returns:
       A float number for the WER of the current decode-target pair.
     """
-    # Map each word to a new char.
-    words = set(decode.split() + target.split())
-    word2char = dict(zip(words, range(len(words))))
-
-    new_decode = [chr(word2char[w]) for w in decode.split()]
-    new_target = [chr(word2char[w]) for w in target.split()]
-
-    return distance.edit_distance(''.join(new_decode), ''.join(new_target))
+    return int(wer_batch([decode], [target])[0])
 
   def cer(self, decode, target):
     """Computes the Character Error Rate (CER).
@@ -78,7 +411,7 @@ class DeepSpeechDecoder(object):
     Returns:
       A float number denoting the CER for the current sentence pair.
     """
-    return distance.edit_distance(decode, target)
+    return int(cer_batch([decode], [target])[0])
 
   def decode(self, logits):
     """Decode the best guess from logits using greedy algorithm."""
@@ -93,3 +426,156 @@ class DeepSpeechDecoder(object):
         merge_remove_blank.append(k)
 
     return self.convert_to_string(merge_remove_blank)
+
+  def decode_probs(self, probs):
+    """Decodes the [time, num_labels] probabilities of an utterance.
+
+    Uses the greedy decoder for a beam width of 1 without a language model,
+    and the prefix beam search otherwise.
+    """
+    if self.beam_width <= 1 and self.lm is None:
+      return self.decode(probs)
+    return self.beam_search_decode(probs)
+
+  def _extend_state(self, state, index):
+    """Returns (LM log prob, new state) after appending a label to a prefix.
+
+    A state is a tuple (context, word, num_words) of the language model
+    context, the characters of the current partial word and the number of
+    completed words.
+    """
+    context, word, num_words = state
+    if index == self.space_index:
+      if not word:
+        return 0.0, state
+      lm_score = 0.0
+      if self.lm is not None:
+        if self.lm_level == "word":
+          lm_score = self.lm.score(context, word)
+          context = self.lm.trim_context(context + (word,))
+        else:
+          lm_score = self.lm.score(context, self.space_token)
+          context = self.lm.trim_context(context + (self.space_token,))
+      return lm_score, (context, "", num_words + 1)
+
+    char = self.int_to_char[index]
+    lm_score = 0.0
+    if self.lm is not None and self.lm_level == "char":
+      lm_score = self.lm.score(context, char)
+      context = self.lm.trim_context(context + (char,))
+    return lm_score, (context, word + char, num_words)
+
+  def _final_score(self, state):
+    """Returns (LM log prob, number of words) for ending a prefix."""
+    lm_score, state = self._extend_state(state, self.space_index)
+    context, _, num_words = state
+    if self.lm is not None:
+      lm_score += self.lm.score(context, "</s>")
+    return lm_score, num_words
+
+  def beam_search_decode(self, probs):
+    """Decodes the probabilities with CTC prefix beam search.
+
+    Follows Hannun et al., 2014 (https://arxiv.org/abs/1408.2873). Each beam
+    keeps the log probabilities of its prefix ending in a blank (pb) and in a
+    non-blank label (pnb). At each time step, the extensions of all beams are
+    scored at once over the labels that survive the cumulative probability
+    pruning; language model scores (weighted by lm_alpha) are added when a
+    word (or, for a character model, a character) is completed, and beams are
+    ranked with a bonus of lm_beta per word.
+
+    Arguments:
+      probs: a [time, num_labels] numpy array of label probabilities.
+
+    Returns:
+      A string of the best decoding.
+    """
+    log_probs = np.log(np.asarray(probs, dtype=np.float64) + 1e-30)
+    num_labels = log_probs.shape[1]
+    blank = self.blank_index
+    # The word bonus offsets the language model's preference for few words.
+    beta = self.lm_beta if self.lm is not None else 0.0
+
+    # The prefixes form a trie, so that each prefix is an integer id. For each
+    # id, keep the parent, the last label, the number of words and, with a
+    # language model, the LM state and the LM score of the edge from its parent.
+    root_state = (("<s>",), "", 0) if self.lm is not None else None
+    trie = _PrefixTrie(num_labels, self.space_index, root_state)
+    beam = np.array([0])
+    pb = np.array([0.0])
+    pnb = np.array([-np.inf])
+
+    for t in xrange(len(log_probs)):
+      step = log_probs[t]
+      # Prune the labels by cumulative probability.
+      order = np.argsort(-step)
+      cumulative = np.cumsum(np.exp(step[order]))
+      num_kept = min(int(np.searchsorted(cumulative, self.cutoff_prob)) + 1,
+                     self.cutoff_top_n, num_labels)
+      chars = order[:num_kept]
+      chars = chars[chars != blank]
+
+      last = trie.last[beam]
+      total = np.logaddexp(pb, pnb)
+
+      # Staying on the same prefix: emitting a blank, or repeating the last
+      # label (which CTC merges).
+      stay_pb = total + step[blank]
+      stay_pnb = np.where(last >= 0, pnb + step[np.maximum(last, 0)], -np.inf)
+      # Extending with a label; a repeated label needs a blank in between.
+      ext = np.where(chars[None, :] == last[:, None], pb[:, None],
+                     total[:, None]) + step[chars][None, :]
+      ext_ids = trie.children(beam[:, None], chars[None, :],
+                              self._extend_state)
+      # The LM score only depends on the prefix, so it applies to every path
+      # into the new prefix.
+      ext += self.lm_alpha * trie.lm_score[ext_ids]
+
+      # Merge the paths into the same prefix.
+      ids, inverse = np.unique(np.concatenate([beam, ext_ids.ravel()]),
+                               return_inverse=True)
+      next_pb = np.full(len(ids), -np.inf)
+      next_pb[inverse[:len(beam)]] = stay_pb
+      next_pnb = np.full(len(ids), -np.inf)
+      np.logaddexp.at(next_pnb, inverse,
+                      np.concatenate([stay_pnb, ext.ravel()]))
+
+      ranking = np.logaddexp(next_pb, next_pnb) + beta * trie.num_words[ids]
+      keep = np.argsort(-ranking, kind="mergesort")[:max(self.beam_width, 1)]
+      beam, pb, pnb = ids[keep], next_pb[keep], next_pnb[keep]
+
+    # Score the end of each beam, i.e. its last word and </s>.
+    final = np.logaddexp(pb, pnb)
+    if self.lm is not None:
+      for b, prefix in enumerate(beam):
+        lm_score, num_words = self._final_score(trie.states[prefix])
+        final[b] += self.lm_alpha * lm_score + beta * num_words
+    return self.convert_to_string(trie.labels(beam[int(np.argmax(final))]))
+
+  def decode_batch(self, probs_list, num_processes=1):
+    """Decodes a batch of utterances, optionally across processes.
+
+    Arguments:
+      probs_list: a list of [time, num_labels] numpy arrays of probabilities.
+      num_processes: an integer for the number of decoding processes.
+
+    Returns:
+      A tuple (transcripts, latencies) with the decoded string and the decoding
+      time in seconds of each utterance.
+    """
+    if num_processes > 1 and len(probs_list) > 1:
+      pool = multiprocessing.Pool(
+          num_processes, initializer=_init_decode_worker, initargs=(self,))
+      try:
+        results = pool.map(_decode_timed, probs_list)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      _init_decode_worker(self)
+      results = [_decode_timed(probs) for probs in probs_list]
+
+    if not results:
+      return [], []
+    transcripts, latencies = zip(*results)
+    return list(transcripts), list(latencies)
@@ -0,0 +1,149 @@
+#  Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+# ==============================================================================
+"""Tests for decoder.py."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tempfile
+# pylint: disable=g-bad-import-order
+import numpy as np
+import tensorflow as tf
+
+import decoder
+# pylint: enable=g-bad-import-order
+
+# The labels of data/vocabulary.txt, with the blank "-" last.
+_LABELS = " abcdefghijklmnopqrstuvwxyz'-"
+_BLANK = len(_LABELS) - 1
+
+_ARPA = """
+\\data\\
+ngram 1=6
+ngram 2=3
+
+\\1-grams:
+-1.0 <s> -0.3
+-1.2 </s>
+-0.8 the -0.2
+-0.9 cat -0.25
+-3.0 cab -0.1
+-4.0 <unk>
+
+\\2-grams:
+-0.2 <s> the
+-0.3 the cat
+-0.4 cat </s>
+
+\\end\\
+"""
+
+
+def _peaked_probs(text, repeat=2, peak=0.9):
+  """Returns probabilities whose greedy path spells text, with blanks."""
+  path = []
+  for char in text:
+    path.extend([_LABELS.index(char)] * repeat + [_BLANK])
+  probs = np.full([len(path), len(_LABELS)], (1 - peak) / (len(_LABELS) - 1))
+  probs[np.arange(len(path)), path] = peak
+  return probs
+
+
+class DecoderTest(tf.test.TestCase):
+
+  def _write_lm(self):
+    fd, path = tempfile.mkstemp(suffix=".arpa", dir=self.get_temp_dir())
+    with os.fdopen(fd, "w") as f:
+      f.write(_ARPA)
+    return decoder.NGramLanguageModel(path)
+
+  def testGreedyDecode(self):
+    speech_decoder = decoder.DeepSpeechDecoder(_LABELS, blank_index=_BLANK)
+    c, a, t, space = (_LABELS.index(x) for x in "cat ")
+    logits = np.eye(len(_LABELS))[[c, c, _BLANK, a, t, t, _BLANK, t, space]]
+    self.assertEqual("catt ", speech_decoder.decode(logits))
+    self.assertEqual("catt ", speech_decoder.decode_probs(logits))
+
+  def testBeamSearchMatchesGreedyFormat(self):
+    # Leading, repeated and trailing spaces are kept, as in greedy decoding.
+    for text in ["the cat", " the  cat ", "a", ""]:
+      probs = _peaked_probs(text)
+      greedy = decoder.DeepSpeechDecoder(_LABELS, blank_index=_BLANK)
+      beam = decoder.DeepSpeechDecoder(
+          _LABELS, blank_index=_BLANK, beam_width=8)
+      self.assertEqual(text, greedy.decode_probs(probs))
+      self.assertEqual(text, beam.decode_probs(probs))
+
+  def testBeamSearchSumsPaths(self):
+    # The most likely path is blank-blank, but "a" has more probability mass
+    # over its paths a-a, a-blank and blank-a.
+    probs = np.zeros([2, len(_LABELS)])
+    probs[:, _BLANK] = 0.4
+    probs[:, _LABELS.index("a")] = 0.35
+    probs[:, _LABELS.index("b")] = 0.25
+    greedy = decoder.DeepSpeechDecoder(_LABELS, blank_index=_BLANK)
+    beam = decoder.DeepSpeechDecoder(
+        _LABELS, blank_index=_BLANK, beam_width=4, cutoff_prob=1.0)
+    self.assertEqual("", greedy.decode_probs(probs))
+    self.assertEqual("a", beam.decode_probs(probs))
+
+  def testLanguageModelScores(self):
+    lm = self._write_lm()
+    self.assertAllClose(-0.3 * np.log(10), lm.score(("<s>", "the"), "cat"))
+    # Back off from "<s> cat" to the unigram "cat".
+    self.assertAllClose(-1.2 * np.log(10), lm.score(("<s>",), "cat"))
+    self.assertAllClose(-4.0 * np.log(10), lm.score(("the",), "dog"))
+
+  def testWordLanguageModelPicksWord(self):
+    # The acoustic model slightly prefers "the cab" over "the cat".
+    probs = _peaked_probs("the ca")
+    tail = np.full([3, len(_LABELS)], 0.01)
+    tail[:2, _LABELS.index("b")] = 0.5
+    tail[:2, _LABELS.index("t")] = 0.4
+    tail[2, _BLANK] = 0.9
+    probs = np.concatenate([probs, tail])
+    no_lm = decoder.DeepSpeechDecoder(
+        _LABELS, blank_index=_BLANK, beam_width=8)
+    with_lm = decoder.DeepSpeechDecoder(
+        _LABELS, blank_index=_BLANK, beam_width=8, lm=self._write_lm(),
+        lm_alpha=1.0, lm_beta=0.0)
+    self.assertEqual("the cab", no_lm.decode_probs(probs))
+    self.assertEqual("the cat", with_lm.decode_probs(probs))
+
+  def testDecodeBatch(self):
+    texts = ["the cat", "a b", "", "cab"]
+    probs_list = [_peaked_probs(text) for text in texts]
+    speech_decoder = decoder.DeepSpeechDecoder(
+        _LABELS, blank_index=_BLANK, beam_width=4)
+    for num_processes in [1, 2]:
+      transcripts, latencies = speech_decoder.decode_batch(
+          probs_list, num_processes=num_processes)
+      self.assertEqual(texts, transcripts)
+      self.assertEqual(len(texts), len(latencies))
+    self.assertEqual(([], []), speech_decoder.decode_batch([]))
+
+  def testErrorRates(self):
+    decodes = ["the cat sat", "", "a b c", "the cat"]
+    targets = ["the cat sat", "hi there", "a c", "a cat here"]
+    self.assertAllEqual([0, 2, 1, 2], decoder.wer_batch(decodes, targets))
+    self.assertAllEqual([0, 8, 2, 8], decoder.cer_batch(decodes, targets))
+    speech_decoder = decoder.DeepSpeechDecoder(_LABELS, blank_index=_BLANK)
+    self.assertEqual(2, speech_decoder.wer("the cat", "a cat here"))
+    self.assertEqual(8, speech_decoder.cer("the cat", "a cat here"))
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -21,10 +21,12 @@ import os
 # pylint: disable=g-bad-import-order
 from absl import app as absl_app
 from absl import flags
+import numpy as np
 import tensorflow as tf
 # pylint: enable=g-bad-import-order
 
 import data.dataset as dataset
+import data.feature_store as feature_store
 import decoder
 import deep_speech_model
 from official.utils.flags import core as flags_core
@@ -109,17 +111,22 @@ def evaluate_model(estimator, speech_labels, entries, input_fn_eval):
   num_of_examples = len(probs)
   targets = [entry[2] for entry in entries]  # The ground truth transcript
 
-  total_wer, total_cer = 0, 0
-  greedy_decoder = decoder.DeepSpeechDecoder(speech_labels)
-  for i in range(num_of_examples):
-    # Decode string.
-    decoded_str = greedy_decoder.decode(probs[i])
-    # Compute CER.
-    total_cer += greedy_decoder.cer(decoded_str, targets[i]) / float(
-        len(targets[i]))
-    # Compute WER.
-    total_wer += greedy_decoder.wer(decoded_str, targets[i]) / float(
-        len(targets[i].split()))
+  speech_decoder = generate_decoder(speech_labels)
+  # Decode strings.
+  decoded_strs, latencies = speech_decoder.decode_batch(
+      probs, num_processes=flags_obj.decoder_processes)
+  tf.logging.info(
+      "Decoded %d utterances: %.1f ms per utterance (p50 %.1f ms, p90 %.1f "
+      "ms).", num_of_examples, 1000 * np.mean(latencies),
+      1000 * np.percentile(latencies, 50), 1000 * np.percentile(latencies, 90))
+
+  targets = targets[:num_of_examples]
+  # Compute CER.
+  cers = decoder.cer_batch(decoded_strs, targets)
+  total_cer = np.sum(cers / np.array([float(len(t)) for t in targets]))
+  # Compute WER.
+  wers = decoder.wer_batch(decoded_strs, targets)
+  total_wer = np.sum(wers / np.array([float(len(t.split())) for t in targets]))
 
   # Get mean value
   total_cer /= num_of_examples
@@ -135,6 +142,17 @@ def evaluate_model(estimator, speech_labels, entries, input_fn_eval):
   return eval_results
 
 
+def generate_decoder(speech_labels):
+  """Generate the greedy or beam search decoder selected by the flags."""
+  lm = None
+  if flags_obj.lm_path:
+    lm = decoder.NGramLanguageModel(flags_obj.lm_path)
+  return decoder.DeepSpeechDecoder(
+      speech_labels, beam_width=flags_obj.beam_width, lm=lm,
+      lm_alpha=flags_obj.lm_alpha, lm_beta=flags_obj.lm_beta,
+      lm_level=flags_obj.lm_level)
+
+
 def model_fn(features, labels, mode, params):
   """Define model function for deep speech model.
 
@@ -207,6 +225,15 @@ def generate_dataset(data_dir):
       flags_obj.sortagrad
   )
   speech_dataset = dataset.DeepSpeechDataset(train_data_conf)
+
+  if flags_obj.feature_store_dir:
+    # Compute the features of the dataset once, and read them from the store.
+    store = feature_store.FeatureStore(
+        flags_obj.feature_store_dir, audio_conf,
+        speech_dataset.num_feature_bins)
+    store.build([entry[0] for entry in speech_dataset.entries],
+                num_processes=flags_obj.feature_store_processes)
+    speech_dataset.feature_store = store
   return speech_dataset
 
 
@@ -262,11 +289,13 @@ def run_deep_speech(_):
 
   def input_fn_train():
     return dataset.input_fn(
-        per_device_batch_size, train_speech_dataset)
+        per_device_batch_size, train_speech_dataset,
+        num_parallel_calls=flags_obj.num_parallel_calls)
 
   def input_fn_eval():
     return dataset.input_fn(
-        per_device_batch_size, eval_speech_dataset)
+        per_device_batch_size, eval_speech_dataset,
+        num_parallel_calls=flags_obj.num_parallel_calls)
 
   total_training_cycle = (flags_obj.train_epochs //
                           flags_obj.epochs_between_evals)
@@ -307,7 +336,7 @@ def define_deep_speech_flags():
       data_dir=False  # we use train_data_dir and eval_data_dir instead
   )
   flags_core.define_performance(
-      num_parallel_calls=False,
+      num_parallel_calls=True,
       inter_op=False,
       intra_op=False,
       synthetic_data=False,
@@ -361,6 +390,19 @@ def define_deep_speech_flags():
       name="vocabulary_file", default=_VOCABULARY_FILE,
       help=flags_core.help_wrap("The file path of vocabulary file."))
 
+  flags.DEFINE_string(
+      name="feature_store_dir", default=None,
+      help=flags_core.help_wrap(
+          "If set, the spectrograms are computed once and stored in this "
+          "directory. Training and evaluation then read them from the "
+          "memory-mapped store."))
+
+  flags.DEFINE_integer(
+      name="feature_store_processes", default=4,
+      help=flags_core.help_wrap(
+          "The number of processes that compute the spectrograms of the "
+          "feature store."))
+
   # RNN related flags
   flags.DEFINE_integer(
       name="rnn_hidden_size", default=800,
@@ -389,6 +431,37 @@ def define_deep_speech_flags():
       name="learning_rate", default=5e-4,
       help=flags_core.help_wrap("The initial learning rate."))
 
+  # Decoding related flags
+  flags.DEFINE_integer(
+      name="beam_width", default=1,
+      help=flags_core.help_wrap(
+          "The beam width of the CTC prefix beam search decoder. The default "
+          "of 1 decodes greedily, unless there is a language model."))
+
+  flags.DEFINE_string(
+      name="lm_path", default=None,
+      help=flags_core.help_wrap(
+          "The path of an ARPA n-gram language model for beam search."))
+
+  flags.DEFINE_float(
+      name="lm_alpha", default=0.5,
+      help=flags_core.help_wrap("The weight of the language model."))
+
+  flags.DEFINE_float(
+      name="lm_beta", default=1.0,
+      help=flags_core.help_wrap(
+          "The bonus of each decoded word when using a language model."))
+
+  flags.DEFINE_enum(
+      name="lm_level", default="word", enum_values=["word", "char"],
+      help=flags_core.help_wrap(
+          "Whether the language model is over words or characters."))
+
+  flags.DEFINE_integer(
+      name="decoder_processes", default=1,
+      help=flags_core.help_wrap(
+          "The number of processes decoding the evaluation predictions."))
+
   # Evaluation metrics threshold
   flags.DEFINE_float(
       name="wer_threshold", default=None,
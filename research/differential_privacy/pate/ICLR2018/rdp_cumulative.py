@@ -57,6 +57,61 @@ flags.DEFINE_string('figures_dir', '', 'Path where figures are written to.')
 
 flags.mark_flag_as_required('counts_file')
 
+def compute_rdp_batch(votes, mechanism, noise_scale, params, orders):
+  """Computes privacy costs of a batch of queries.
+
+  Args:
+    votes: A matrix of votes, where each row contains votes in one instance.
+    mechanism: A name of the mechanism ('lnmax', 'gnmax', or 'gnmax_conf')
+    noise_scale: A mechanism privacy parameter.
+    params: Other privacy parameters.
+    orders: A numpy array of Renyi orders.
+
+  Returns:
+    Three [num_queries, len(orders)] arrays: RDP of each query, its expected
+    square, and RDP of the selection step (zero unless mechanism is
+    'gnmax_conf'); and an array of probabilities that each query is answered.
+  """
+  n = votes.shape[0]
+  rdp_select = np.zeros((n, len(orders)))
+  if mechanism == 'lnmax':
+    rdp_query = np.array([
+        pate.rdp_pure_eps(
+            pate.compute_logq_laplace(v, noise_scale), 2. / noise_scale,
+            orders) for v in votes
+    ])
+    rdp_sqrd = rdp_query ** 2
+    pr_answered = np.ones(n)
+  elif mechanism == 'gnmax':
+    logq_gmax = pate.compute_logq_gaussian_batch(votes, noise_scale)
+    rdp_query = pate.rdp_gaussian_batch(logq_gmax, noise_scale, orders)
+    rdp_sqrd = rdp_query ** 2
+    pr_answered = np.ones(n)
+  elif mechanism == 'gnmax_conf':
+    logq_step1 = pate.compute_logpr_answered_batch(params['t'],
+                                                   params['sigma1'], votes)
+    logq_step2 = pate.compute_logq_gaussian_batch(votes, noise_scale)
+    q_step1 = np.exp(logq_step1)
+    logq_step1_min = np.minimum(logq_step1, np.log1p(-q_step1))
+    rdp_gnmax_step1 = pate.rdp_gaussian_batch(
+        logq_step1_min, 2 ** .5 * params['sigma1'], orders)
+    rdp_gnmax_step2 = pate.rdp_gaussian_batch(logq_step2, noise_scale, orders)
+    pr_answered = q_step1
+    q_step1 = q_step1[:, np.newaxis]
+    rdp_query = rdp_gnmax_step1 + q_step1 * rdp_gnmax_step2
+    # The expression below evaluates
+    #     E[(cost_of_step_1 + Bernoulli(pr_of_step_2) * cost_of_step_2)^2]
+    rdp_sqrd = (
+        rdp_gnmax_step1 ** 2 + 2 * rdp_gnmax_step1 * q_step1 * rdp_gnmax_step2
+        + q_step1 * rdp_gnmax_step2 ** 2)
+    rdp_select = rdp_gnmax_step1
+  else:
+    raise ValueError(
+        'Mechanism must be one of ["lnmax", "gnmax", "gnmax_conf"]')
+
+  return rdp_query, rdp_sqrd, rdp_select, pr_answered
+
+
 def run_analysis(votes, mechanism, noise_scale, params):
   """Computes data-dependent privacy.
 
@@ -71,7 +126,7 @@ def run_analysis(votes, mechanism, noise_scale, params):
     how many queries were answered, optimal order.
   """
 
-  def compute_partition(order_opt, eps):
+  def compute_partition(rdp_cum, rdp_select_cum, order_opt, eps):
     order_opt_idx = np.searchsorted(orders, order_opt)
     if mechanism == 'gnmax_conf':
       p = (rdp_select_cum[order_opt_idx],
@@ -101,47 +156,33 @@ def run_analysis(votes, mechanism, noise_scale, params):
   rdp_select_cum = np.zeros(len(orders))
   answered_sum = 0
 
-  for i in range(n):
-    v = votes[i,]
-    if mechanism == 'lnmax':
-      logq_lnmax = pate.compute_logq_laplace(v, noise_scale)
-      rdp_query = pate.rdp_pure_eps(logq_lnmax, 2. / noise_scale, orders)
-      rdp_sqrd = rdp_query ** 2
-      pr_answered = 1
-    elif mechanism == 'gnmax':
-      logq_gmax = pate.compute_logq_gaussian(v, noise_scale)
-      rdp_query = pate.rdp_gaussian(logq_gmax, noise_scale, orders)
-      rdp_sqrd = rdp_query ** 2
-      pr_answered = 1
-    elif mechanism == 'gnmax_conf':
-      logq_step1 = pate.compute_logpr_answered(params['t'], params['sigma1'], v)
-      logq_step2 = pate.compute_logq_gaussian(v, noise_scale)
-      q_step1 = np.exp(logq_step1)
-      logq_step1_min = min(logq_step1, math.log1p(-q_step1))
-      rdp_gnmax_step1 = pate.rdp_gaussian(logq_step1_min,
-                                          2 ** .5 * params['sigma1'], orders)
-      rdp_gnmax_step2 = pate.rdp_gaussian(logq_step2, noise_scale, orders)
-      rdp_query = rdp_gnmax_step1 + q_step1 * rdp_gnmax_step2
-      # The expression below evaluates
-      #     E[(cost_of_step_1 + Bernoulli(pr_of_step_2) * cost_of_step_2)^2]
-      rdp_sqrd = (
-          rdp_gnmax_step1 ** 2 + 2 * rdp_gnmax_step1 * q_step1 * rdp_gnmax_step2
-          + q_step1 * rdp_gnmax_step2 ** 2)
-      rdp_select_cum += rdp_gnmax_step1
-      pr_answered = q_step1
-    else:
-      raise ValueError(
-          'Mechanism must be one of ["lnmax", "gnmax", "gnmax_conf"]')
-
-    rdp_cum += rdp_query
-    rdp_sqrd_cum += rdp_sqrd
-    answered_sum += pr_answered
-
-    answered[i] = answered_sum
-    eps_total[i], order_opt[i] = pate.compute_eps_from_delta(
-        orders, rdp_cum, delta)
-    partition[i] = compute_partition(order_opt[i], eps_total[i])
-
+  # Queries are analyzed in batches, one row of the arrays below per query.
+  for start in range(0, n, 1000):
+    end = min(start + 1000, n)
+    rdp_query, rdp_sqrd, rdp_select, pr_answered = compute_rdp_batch(
+        votes[start:end], mechanism, noise_scale, params, orders)
+
+    # Cumulative costs after each query of the batch.
+    rdp_cum_batch = rdp_cum + np.cumsum(rdp_query, axis=0)
+    rdp_select_cum_batch = rdp_select_cum + np.cumsum(rdp_select, axis=0)
+    answered[start:end] = answered_sum + np.cumsum(pr_answered)
+
+    # Same as pate.compute_eps_from_delta, for all queries of the batch.
+    eps_batch = rdp_cum_batch - math.log(delta) / (orders - 1)
+    order_opt_idxs = np.argmin(eps_batch, axis=1)
+    eps_total[start:end] = eps_batch[np.arange(end - start), order_opt_idxs]
+    order_opt[start:end] = orders[order_opt_idxs]
+    for i in range(start, end):
+      partition[i] = compute_partition(rdp_cum_batch[i - start],
+                                       rdp_select_cum_batch[i - start],
+                                       order_opt[i], eps_total[i])
+
+    rdp_cum = rdp_cum_batch[-1]
+    rdp_sqrd_cum += np.sum(rdp_sqrd, axis=0)
+    rdp_select_cum = rdp_select_cum_batch[-1]
+    answered_sum = answered[end - 1]
+
+    i = end - 1
     if i > 0 and (i + 1) % 1000 == 0:
       rdp_var = rdp_sqrd_cum / i - (
           rdp_cum / i) ** 2  # Ignore Bessel's correction.
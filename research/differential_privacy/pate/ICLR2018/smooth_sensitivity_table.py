@@ -101,49 +101,54 @@ def _compute_rdp(votes, baseline, threshold, sigma1, sigma2, delta, orders,
   rdp_sqrd_cum = np.zeros(len(orders))
   answered = 0
 
-  for i, v in enumerate(votes):
+  # Queries are analyzed in batches, one row per query.
+  num_queries = votes.shape[0]
+  for start in range(0, num_queries, 1000):
+    end = min(start + 1000, num_queries)
+    v = votes[start:end]
+
     if threshold is None:
-      logq_step1 = 0  # No thresholding, always proceed to step 2.
+      logq_step1 = np.zeros(end - start)  # No thresholding, always do step 2.
       rdp_step1 = np.zeros(len(orders))
     else:
-      logq_step1 = pate.compute_logpr_answered(threshold, sigma1,
-                                               v - baseline[i,])
+      logq_step1 = pate.compute_logpr_answered_batch(
+          threshold, sigma1, v - baseline[start:end])
       if data_ind:
         rdp_step1 = pate.compute_rdp_data_independent_threshold(sigma1, orders)
       else:
-        rdp_step1 = pate.compute_rdp_threshold(logq_step1, sigma1, orders)
+        rdp_step1 = pate.compute_rdp_threshold_batch(logq_step1, sigma1,
+                                                     orders)
 
     if data_ind:
       rdp_step2 = pate.rdp_data_independent_gaussian(sigma2, orders)
     else:
-      logq_step2 = pate.compute_logq_gaussian(v, sigma2)
-      rdp_step2 = pate.rdp_gaussian(logq_step2, sigma2, orders)
+      logq_step2 = pate.compute_logq_gaussian_batch(v, sigma2)
+      rdp_step2 = pate.rdp_gaussian_batch(logq_step2, sigma2, orders)
 
-    q_step1 = np.exp(logq_step1)
+    q_step1 = np.exp(logq_step1)[:, np.newaxis]
     rdp = rdp_step1 + rdp_step2 * q_step1
     # The expression below evaluates
     #     E[(cost_of_step_1 + Bernoulli(pr_of_step_2) * cost_of_step_2)^2]
     rdp_sqrd = (
         rdp_step1**2 + 2 * rdp_step1 * q_step1 * rdp_step2 +
         q_step1 * rdp_step2**2)
-    rdp_sqrd_cum += rdp_sqrd
-
-    rdp_cum += rdp
-    answered += q_step1
-    if ((i + 1) % 1000 == 0) or (i == votes.shape[0] - 1):
-      rdp_var = rdp_sqrd_cum / i - (
-          rdp_cum / i)**2  # Ignore Bessel's correction.
-      eps_total, order_opt = pate.compute_eps_from_delta(orders, rdp_cum, delta)
-      order_opt_idx = np.searchsorted(orders, order_opt)
-      eps_std = ((i + 1) * rdp_var[order_opt_idx])**.5  # Std of the sum.
-      print(
-          'queries = {}, E[answered] = {:.2f}, E[eps] = {:.3f} (std = {:.5f}) '
-          'at order = {:.2f} (contribution from delta = {:.3f})'.format(
-              i + 1, answered, eps_total, eps_std, order_opt,
-              -math.log(delta) / (order_opt - 1)))
-      sys.stdout.flush()
-
-    _, order_opt = pate.compute_eps_from_delta(orders, rdp_cum, delta)
+    rdp_sqrd_cum += np.sum(rdp_sqrd, axis=0)
+
+    rdp_cum += np.sum(rdp, axis=0)
+    answered += np.sum(q_step1)
+
+    i = end - 1  # Reports progress after every 1000 queries and the last one.
+    rdp_var = rdp_sqrd_cum / i - (
+        rdp_cum / i)**2  # Ignore Bessel's correction.
+    eps_total, order_opt = pate.compute_eps_from_delta(orders, rdp_cum, delta)
+    order_opt_idx = np.searchsorted(orders, order_opt)
+    eps_std = ((i + 1) * rdp_var[order_opt_idx])**.5  # Std of the sum.
+    print(
+        'queries = {}, E[answered] = {:.2f}, E[eps] = {:.3f} (std = {:.5f}) '
+        'at order = {:.2f} (contribution from delta = {:.3f})'.format(
+            i + 1, answered, eps_total, eps_std, order_opt,
+            -math.log(delta) / (order_opt - 1)))
+    sys.stdout.flush()
 
   return order_opt
 
@@ -169,37 +174,49 @@ def _find_optimal_smooth_sensitivity_parameters(
   betas = np.arange(.3 / order, .495 / order, .01 / order)
   cost_delta = math.log(1 / delta) / (order - 1)
 
-  for i, v in enumerate(votes):
+  # Queries are analyzed in batches, one row per query. Parameters are only
+  # optimized at the end of a batch, when they are reported.
+  num_queries = votes.shape[0]
+  for start in range(0, num_queries, 100):
+    end = min(start + 100, num_queries)
+    v = votes[start:end]
+
     if threshold is None:
-      log_pr_answered = 0
+      log_pr_answered = np.zeros(end - start)
       rdp1 = 0
       ls_step1 = np.zeros(num_teachers)
     else:
-      log_pr_answered = pate.compute_logpr_answered(threshold, sigma1,
-                                                    v - baseline[i,])
+      log_pr_answered = pate.compute_logpr_answered_batch(
+          threshold, sigma1, v - baseline[start:end])
       if ind_step1:  # apply data-independent bound for step 1 (thresholding).
         rdp1 = pate.compute_rdp_data_independent_threshold(sigma1, order)
         ls_step1 = np.zeros(num_teachers)
       else:
-        rdp1 = pate.compute_rdp_threshold(log_pr_answered, sigma1, order)
-        ls_step1 = pate_ss.compute_local_sensitivity_bounds_threshold(
-            v - baseline[i,], num_teachers, threshold, sigma1, order)
+        rdp1 = pate.compute_rdp_threshold_batch(log_pr_answered, sigma1,
+                                                [order])[:, 0]
+        ls_step1 = np.array([
+            pate_ss.compute_local_sensitivity_bounds_threshold(
+                counts, num_teachers, threshold, sigma1, order)
+            for counts in v - baseline[start:end]
+        ])
 
-    pr_answered = math.exp(log_pr_answered)
-    answered_cum += pr_answered
+    pr_answered = np.exp(log_pr_answered)
+    answered_cum += np.sum(pr_answered)
 
     if ind_step2:  # apply data-independent bound for step 2 (GNMax).
       rdp2 = pate.rdp_data_independent_gaussian(sigma2, order)
       ls_step2 = np.zeros(num_teachers)
     else:
-      logq_step2 = pate.compute_logq_gaussian(v, sigma2)
-      rdp2 = pate.rdp_gaussian(logq_step2, sigma2, order)
+      logq_step2 = pate.compute_logq_gaussian_batch(v, sigma2)
+      rdp2 = pate.rdp_gaussian_batch(logq_step2, sigma2, [order])[:, 0]
       # Compute smooth sensitivity.
-      ls_step2 = pate_ss.compute_local_sensitivity_bounds_gnmax(
+      ls_step2 = pate_ss.compute_local_sensitivity_bounds_gnmax_batch(
           v, num_teachers, sigma2, order)
 
-    rdp_cum += rdp1 + pr_answered * rdp2
-    ls_cum += ls_step1 + pr_answered * ls_step2  # Expected local sensitivity.
+    rdp_cum += np.sum(rdp1 + pr_answered * rdp2)
+    # Expected local sensitivity.
+    ls_cum += np.sum(
+        ls_step1 + pr_answered[:, np.newaxis] * ls_step2, axis=0)
 
     if ind_step1 and ind_step2:
       # Data-independent bounds.
@@ -222,16 +239,15 @@ def _find_optimal_smooth_sensitivity_parameters(
         if cost < cost_opt:
           cost_opt, beta_opt, ss_opt, sigma_ss_opt = cost, beta, ss, sigma_ss
 
-    if ((i + 1) % 100 == 0) or (i == votes.shape[0] - 1):
-      eps_before_ss = rdp_cum + cost_delta
-      eps_with_ss = (
-          eps_before_ss + pate_ss.compute_rdp_of_smooth_sensitivity_gaussian(
-              beta_opt, sigma_ss_opt, order))
-      print('{}: E[answered queries] = {:.1f}, RDP at {} goes from {:.3f} to '
-            '{:.3f} +/- {:.3f} (ss = {:.4}, beta = {:.4f}, sigma_ss = {:.3f})'.
-            format(i + 1, answered_cum, order, eps_before_ss, eps_with_ss,
-                   ss_opt * sigma_ss_opt, ss_opt, beta_opt, sigma_ss_opt))
-      sys.stdout.flush()
+    eps_before_ss = rdp_cum + cost_delta
+    eps_with_ss = (
+        eps_before_ss + pate_ss.compute_rdp_of_smooth_sensitivity_gaussian(
+            beta_opt, sigma_ss_opt, order))
+    print('{}: E[answered queries] = {:.1f}, RDP at {} goes from {:.3f} to '
+          '{:.3f} +/- {:.3f} (ss = {:.4}, beta = {:.4f}, sigma_ss = {:.3f})'.
+          format(end, answered_cum, order, eps_before_ss, eps_with_ss,
+                 ss_opt * sigma_ss_opt, ss_opt, beta_opt, sigma_ss_opt))
+    sys.stdout.flush()
 
   # Return optimal parameters for the last iteration.
   return beta_opt, ss_opt, sigma_ss_opt
@@ -48,6 +48,16 @@ def _log1mexp(x):
     raise ValueError("Argument must be non-positive.")
 
 
+def _log1mexp_batch(x):
+  """Elementwise analogue of _log1mexp for a numpy array."""
+  x = np.asarray(x, dtype=float)
+  if np.any(x > 0):
+    raise ValueError("Argument must be non-positive.")
+  with np.errstate(divide="ignore"):
+    return np.where(x < -1, np.log1p(-np.exp(np.minimum(x, -1))),
+                    np.log(-np.expm1(np.maximum(x, -1))))
+
+
 def compute_eps_from_delta(orders, rdp, delta):
   """Translates between RDP and (eps, delta)-DP.
 
@@ -106,6 +116,33 @@ def compute_logq_gaussian(counts, sigma):
   return min(logq, math.log(1 - (1 / n)))
 
 
+def compute_logq_gaussian_batch(votes, sigma):
+  """Returns compute_logq_gaussian for every row of a matrix of votes.
+
+  Args:
+    votes: A numpy array of scores of shape [num_queries, num_classes].
+    sigma: The standard deviation of the Gaussian noise in the GNMax mechanism.
+
+  Returns:
+    A numpy array of length num_queries of logq for each query.
+  """
+  votes = np.asarray(votes)
+  if votes.ndim != 2:
+    raise ValueError("Expected a matrix of votes, got shape {}.".format(
+        votes.shape))
+  num_queries, n = votes.shape
+  rows = np.arange(num_queries)
+  idx_max = np.argmax(votes, axis=1)
+  counts_normalized = votes[rows, idx_max][:, np.newaxis] - votes
+  log_sf = scipy.stats.norm.logsf(
+      counts_normalized, scale=math.sqrt(2 * sigma**2))
+  log_sf[rows, idx_max] = -np.inf  # exclude the argmax
+  # Same as _logaddexp over the remaining classes of each row.
+  m = np.max(log_sf, axis=1)
+  logq = m + np.log(np.sum(np.exp(log_sf - m[:, np.newaxis]), axis=1))
+  return np.minimum(logq, math.log(1 - (1 / n)))
+
+
 def rdp_data_independent_gaussian(sigma, orders):
   """Computes a data-independent RDP curve for GNMax.
 
@@ -195,6 +232,64 @@ def rdp_gaussian(logq, sigma, orders):
     return ret
 
 
+def rdp_gaussian_batch(logq, sigma, orders):
+  """Computes rdp_gaussian for a vector of logq and a vector of orders.
+
+  Args:
+    logq: A numpy array of upper bounds on log Pr[outcome != argmax], one per
+      query, e.g., as returned by compute_logq_gaussian_batch.
+    sigma: Standard deviation of Gaussian noise.
+    orders: An array_like list of Renyi orders.
+
+  Returns:
+    A numpy array of shape [len(logq), len(orders)] of upper bounds on RDP.
+
+  Raises:
+    ValueError: If the input is malformed.
+  """
+  logq = np.atleast_1d(np.asarray(logq, dtype=float))
+  orders_vec = np.atleast_1d(np.asarray(orders, dtype=float))
+  if np.any(logq > 0) or sigma < 0 or np.any(orders_vec <= 1):
+    raise ValueError("Inputs are malformed.")
+
+  variance = sigma**2
+  ret = np.tile(orders_vec / variance, (len(logq), 1))
+  ret[np.isneginf(logq)] = 0.  # The mechanism's output is fixed.
+
+  # Rows where the data-dependent bound may apply (see rdp_gaussian).
+  rows = np.flatnonzero(np.logical_and(np.isfinite(logq), logq < 0))
+  logq = logq[rows]
+  mu_hi2 = np.sqrt(variance * -logq)
+  mu_hi1 = mu_hi2 + 1
+  rdp_hi1 = mu_hi1 / variance
+  rdp_hi2 = mu_hi2 / variance
+  log_a2 = (mu_hi2 - 1) * rdp_hi2
+
+  mask = np.logical_and(mu_hi1[:, np.newaxis] > orders_vec,
+                        (mu_hi2 > 1)[:, np.newaxis])
+  with np.errstate(divide="ignore", invalid="ignore"):
+    applies = (np.any(mask, axis=1) & (mu_hi2 > 1) &
+               (logq <= log_a2 - mu_hi2 * (np.log(1 + 1 / (mu_hi1 - 1)) +
+                                           np.log(1 + 1 / (mu_hi2 - 1)))) &
+               (-logq > rdp_hi2))
+  rows, mask = rows[applies], mask[applies]
+  logq, mu_hi1, mu_hi2 = logq[applies], mu_hi1[applies], mu_hi2[applies]
+  rdp_hi1, rdp_hi2 = rdp_hi1[applies], rdp_hi2[applies]
+
+  log1q = _log1mexp_batch(logq)[:, np.newaxis]  # log1q = log(1-q)
+  logq, mu_hi1 = logq[:, np.newaxis], mu_hi1[:, np.newaxis]
+  log_a = (orders_vec - 1) * (log1q - _log1mexp_batch(
+      (logq + rdp_hi2[:, np.newaxis]) * (1 - 1 / mu_hi2[:, np.newaxis])))
+  log_b = (orders_vec - 1) * (rdp_hi1[:, np.newaxis] - logq / (mu_hi1 - 1))
+  log_s = np.logaddexp(log1q + log_a, logq + log_b)
+  ret_rows = ret[rows]
+  ret[rows] = np.where(mask, np.minimum(ret_rows, log_s / (orders_vec - 1)),
+                       ret_rows)
+
+  assert np.all(ret >= 0)
+  return ret
+
+
 def is_data_independent_always_opt_gaussian(num_teachers, num_classes, sigma,
                                             orders):
   """Tests whether data-ind bound is always optimal for GNMax.
@@ -253,6 +348,19 @@ def compute_rdp_threshold(log_pr_answered, sigma, orders):
   return rdp_gaussian(logq, 2**.5 * sigma, orders)
 
 
+def compute_logpr_answered_batch(t, sigma, votes):
+  """Returns compute_logpr_answered for every row of a matrix of votes."""
+  return scipy.stats.norm.logsf(
+      t - np.round(np.max(votes, axis=1)), scale=sigma)
+
+
+def compute_rdp_threshold_batch(log_pr_answered, sigma, orders):
+  """Returns compute_rdp_threshold as a [len(log_pr_answered), len(orders)]
+  array."""
+  logq = np.minimum(log_pr_answered, _log1mexp_batch(log_pr_answered))
+  return rdp_gaussian_batch(logq, 2**.5 * sigma, orders)
+
+
 def is_data_independent_always_opt_threshold(num_teachers, threshold, sigma,
                                              orders):
   """Tests whether data-ind bound is always optimal for the threshold mechanism.
@@ -115,6 +115,42 @@ class PateTest(unittest.TestCase):
     self._test_rdp_gaussian_value_errors()
     self._test_rdp_gaussian_as_function_of_q()
 
+  def test_rdp_gaussian_batch(self):
+    # Batched bounds must match the per-query ones for all orders at once.
+    orders = np.array([1.1, 2.5, 32., 250.])
+    votes = np.array([[100, 0, 0, 0], [90, 10, 0, 0], [60, 30, 10, 0],
+                      [25, 25, 25, 25], [50, 49, 1, 0]])
+    for sigma in [1.5, 15., 40.]:
+      logq = pate.compute_logq_gaussian_batch(votes, sigma)
+      rdp = pate.rdp_gaussian_batch(logq, sigma, orders)
+      self.assertEqual(rdp.shape, (len(votes), len(orders)))
+      for i, v in enumerate(votes):
+        logq_i = pate.compute_logq_gaussian(v, sigma)
+        self.assertAlmostEqual(logq[i], logq_i, places=12)
+        self.assertTrue(
+            np.allclose(rdp[i], pate.rdp_gaussian(logq_i, sigma, orders),
+                        rtol=1e-12, atol=0))
+
+    rdp = pate.rdp_gaussian_batch([-np.inf, 0.], 15., orders)
+    self.assertTrue(np.array_equal(rdp[0], np.zeros(len(orders))))
+    self.assertTrue(np.array_equal(
+        rdp[1], pate.rdp_data_independent_gaussian(15., orders)))
+
+    with self.assertRaises(ValueError):
+      pate.rdp_gaussian_batch([np.log(0.5), 1.0], 1.0, orders)
+
+  def test_compute_rdp_threshold_batch(self):
+    orders = np.array([1.1, 2.5, 32., 250.])
+    votes = np.array([[100, 0, 0], [60, 30, 10], [34, 33, 33]])
+    log_pr_answered = pate.compute_logpr_answered_batch(50, 20., votes)
+    rdp = pate.compute_rdp_threshold_batch(log_pr_answered, 20., orders)
+    for i, v in enumerate(votes):
+      logpr_i = pate.compute_logpr_answered(50, 20., v)
+      self.assertAlmostEqual(log_pr_answered[i], logpr_i, places=12)
+      self.assertTrue(
+          np.allclose(rdp[i], pate.compute_rdp_threshold(logpr_i, 20., orders),
+                      rtol=1e-12, atol=0))
+
   def test_compute_eps_from_delta(self):
     self._test_compute_eps_from_delta_value_error()
     self._test_compute_eps_from_delta_monotonicity()
@@ -60,7 +60,7 @@ def _compute_logq1(sigma, order, num_classes):
 
 def _compute_mu1_mu2_gnmax(sigma, logq):
   # Computes mu1, mu2 according to Proposition 10.
-  mu2 = sigma * math.sqrt(-logq)
+  mu2 = sigma * np.sqrt(-logq)
   mu1 = mu2 + 1
   return mu1, mu2
 
@@ -74,9 +74,9 @@ def _compute_data_dep_bound_gnmax(sigma, logq, order):
   eps1 = mu1 / variance
   eps2 = mu2 / variance
 
-  log1q = np.log1p(-math.exp(logq))  # log1q = log(1-q)
+  log1q = np.log1p(-np.exp(logq))  # log1q = log(1-q)
   log_a = (order - 1) * (
-      log1q - (np.log1p(-math.exp((logq + eps2) * (1 - 1 / mu2)))))
+      log1q - (np.log1p(-np.exp((logq + eps2) * (1 - 1 / mu2)))))
   log_b = (order - 1) * (eps1 - logq / (mu1 - 1))
 
   return np.logaddexp(log1q + log_a, logq + log_b) / (order - 1)
@@ -146,7 +146,7 @@ def _compute_bl_gnmax(q, sigma, num_classes):
 
 
 def _compute_bu_gnmax(q, sigma, num_classes):
-  return min(1, (num_classes - 1) / 2 * scipy.special.erfc(
+  return np.minimum(1, (num_classes - 1) / 2 * scipy.special.erfc(
       -1 / sigma + scipy.special.erfcinv(2 * q / (num_classes - 1))))
 
 
@@ -170,6 +170,48 @@ def _compute_local_sens_gnmax(logq, sigma, num_classes, order):
   return max(beta_bu_q - beta, beta - beta_bl_q)
 
 
+# Global dictionary of the data-independent quantities of the local sensitivity
+# of GNMax, (logq0, logq1, plateau), keyed by (sigma, order, num_classes).
+_ls_gnmax_constants = {}
+
+
+def _compute_ls_gnmax_constants(sigma, order, num_classes):
+  key = (sigma, order, num_classes)
+  if key in _ls_gnmax_constants:
+    return _ls_gnmax_constants[key]
+
+  logq0 = _compute_logq0(sigma, order)
+  logq1 = _compute_logq1(sigma, order, num_classes)
+  plateau = _compute_local_sens_gnmax(logq1, sigma, num_classes, order)
+
+  _ls_gnmax_constants[key] = logq0, logq1, plateau
+  return logq0, logq1, plateau
+
+
+def _compute_rdp_gnmax_batch(sigma, logq, order):
+  """Applies _compute_rdp_gnmax to a numpy array of logq."""
+  logq0 = _compute_logq0(sigma, order)
+  res = np.full(len(logq), pate.rdp_data_independent_gaussian(sigma, order))
+  data_dep = ~(logq >= logq0)
+  res[data_dep] = _compute_data_dep_bound_gnmax(sigma, logq[data_dep], order)
+  return res
+
+
+def _compute_local_sens_gnmax_batch(logq, sigma, num_classes, order):
+  """Applies _compute_local_sens_gnmax to a numpy array of logq."""
+  logq0, logq1, _ = _compute_ls_gnmax_constants(sigma, order, num_classes)
+  logq = np.where((logq1 <= logq) & (logq <= logq0), logq1, logq)
+
+  q = np.exp(logq)
+  with np.errstate(divide="ignore", invalid="ignore"):
+    beta = _compute_rdp_gnmax_batch(sigma, logq, order)
+    beta_bu_q = _compute_rdp_gnmax_batch(
+        sigma, np.log(_compute_bu_gnmax(q, sigma, num_classes)), order)
+    beta_bl_q = _compute_rdp_gnmax_batch(
+        sigma, np.log(_compute_bl_gnmax(q, sigma, num_classes)), order)
+  return np.maximum(beta_bu_q - beta, beta - beta_bl_q)
+
+
 def compute_local_sensitivity_bounds_gnmax(votes, num_teachers, sigma, order):
   """Computes a list of max-LS-at-distance-d for the GNMax mechanism.
 
@@ -188,10 +230,9 @@ def compute_local_sensitivity_bounds_gnmax(votes, num_teachers, sigma, order):
 
   num_classes = len(votes)  # Called m in the paper.
 
-  logq0 = _compute_logq0(sigma, order)
-  logq1 = _compute_logq1(sigma, order, num_classes)
+  logq0, logq1, plateau = _compute_ls_gnmax_constants(sigma, order,
+                                                      num_classes)
   logq = pate.compute_logq_gaussian(votes, sigma)
-  plateau = _compute_local_sens_gnmax(logq1, sigma, num_classes, order)
 
   res = np.full(num_teachers, plateau)
 
@@ -233,6 +274,73 @@ def compute_local_sensitivity_bounds_gnmax(votes, num_teachers, sigma, order):
   return res
 
 
+def compute_local_sensitivity_bounds_gnmax_batch(votes, num_teachers, sigma,
+                                                 order):
+  """Computes compute_local_sensitivity_bounds_gnmax for a matrix of votes.
+
+  The walks over distances d of all queries advance in lockstep, so that every
+  step costs a few numpy operations over the queries still being walked rather
+  than a Python loop over queries.
+
+  Args:
+    votes: A numpy array of votes of shape [num_queries, num_classes].
+    num_teachers: Total number of voting teachers.
+    sigma: Standard deviation of the Guassian noise.
+    order: The Renyi order.
+
+  Returns:
+    A numpy array of shape [num_queries, num_teachers], whose rows are local
+    sensitivities at distances d, 0 <= d <= num_teachers.
+  """
+  votes = np.asarray(votes)
+  num_queries, num_classes = votes.shape
+
+  logq0, logq1, plateau = _compute_ls_gnmax_constants(sigma, order,
+                                                      num_classes)
+  logq = pate.compute_logq_gaussian_batch(votes, sigma)
+
+  res = np.full((num_queries, num_teachers), plateau)
+
+  # Indices of the queries being walked.
+  idxs = np.flatnonzero(~((logq1 <= logq) & (logq <= logq0)))
+  if not len(idxs):
+    return res
+
+  # Invariant: every row of votes is sorted in the non-increasing order.
+  votes = -np.sort(-votes[idxs], axis=1)
+  logq = logq[idxs]
+
+  res[idxs, 0] = _compute_local_sens_gnmax_batch(logq, sigma, num_classes,
+                                                 order)
+
+  go_left = logq > logq0  # Otherwise logq < logq1 and we go right.
+
+  for d in range(1, num_teachers):
+    # Same stopping conditions as in compute_local_sensitivity_bounds_gnmax.
+    walking = np.where(go_left, (logq > logq0) & (votes[:, 1] > 0),
+                       logq < logq1)
+    if not np.any(walking):
+      break
+    idxs, votes, go_left = idxs[walking], votes[walking], go_left[walking]
+
+    left = np.flatnonzero(go_left)
+    # Moving a vote from votes[1] to votes[0] and restoring the invariant is the
+    # same as taking the vote from the last entry equal to votes[1].
+    last = np.sum(votes[left] >= votes[left, 1:2], axis=1) - 1
+    votes[left, 0] += 1
+    votes[left, last] -= 1
+
+    right = np.flatnonzero(~go_left)
+    votes[right, 0] -= 1
+    votes[right, 1] += 1  # The invariant holds since otherwise logq >= logq1.
+
+    logq = pate.compute_logq_gaussian_batch(votes, sigma)
+    res[idxs, d] = _compute_local_sens_gnmax_batch(logq, sigma, num_classes,
+                                                   order)
+
+  return res
+
+
 ##################################################
 # SMOOTH SENSITIVITY FOR THE THRESHOLD MECHANISM #
 ##################################################
@@ -62,6 +62,21 @@ class PateSmoothSensitivityTest(unittest.TestCase):
                        [2.73113623988e-6] * 1700)
     self._assert_all_close(out2, answer2)
 
+  def test_compute_local_sensitivity_bounds_gnmax_batch(self):
+    # Queries going left, going right, and starting on the plateau.
+    votes = np.array([[1000, 500, 300, 200, 0], [2000, 0, 0, 0, 0],
+                      [400, 400, 400, 400, 400], [1990, 10, 0, 0, 0],
+                      [700, 700, 600, 0, 0]])
+    for sigma, order in [(250., 10.), (100., 20.)]:
+      out = pate_ss.compute_local_sensitivity_bounds_gnmax_batch(
+          votes, 2000, sigma, order)
+      self.assertEqual(out.shape, (len(votes), 2000))
+      for v, out_v in zip(votes, out):
+        self._assert_all_close(
+            out_v,
+            pate_ss.compute_local_sensitivity_bounds_gnmax(
+                v, 2000, sigma, order))
+
   def test_compute_local_sensitivity_bounds_threshold(self):
     counts1_3 = np.array([20, 10, 0])
     num_teachers = sum(counts1_3)
@@ -19,7 +19,6 @@ from __future__ import division
 from __future__ import print_function
 
 import heapq
-import math
 
 
 import numpy as np
@@ -148,64 +147,102 @@ class CaptionGenerator(object):
     Returns:
       A list of Caption sorted by descending score.
     """
-    # Feed in the image to get the initial state.
-    initial_state = self.model.feed_image(sess, encoded_image)
-
-    initial_beam = Caption(
-        sentence=[self.vocab.start_id],
-        state=initial_state[0],
-        logprob=0.0,
-        score=0.0,
-        metadata=[""])
-    partial_captions = TopN(self.beam_size)
-    partial_captions.push(initial_beam)
-    complete_captions = TopN(self.beam_size)
+    return self.beam_search_batch(sess, [encoded_image])[0]
+
+  def beam_search_batch(self, sess, encoded_images):
+    """Runs beam search caption generation on a batch of images.
+
+    The partial captions of all images are extended together, with a single
+    call to inference_step() per time step. Partial captions are kept in arrays
+    with one row per caption rather than in Caption objects.
+
+    Args:
+      sess: TensorFlow Session object.
+      encoded_images: A list of encoded image strings.
+
+    Returns:
+      A list with, for each image, a list of Caption sorted by descending score.
+    """
+    num_images = len(encoded_images)
+    if not num_images:
+      return []
+
+    # Feed in the images to get the initial states.
+    states = np.concatenate(
+        [self.model.feed_image(sess, image) for image in encoded_images])
+
+    # Partial captions of all images. At every step all partial captions have
+    # the same length, so sentences is a [num_partial_captions, length] array.
+    image_ids = np.arange(num_images)
+    sentences = np.full([num_images, 1], self.vocab.start_id, dtype=np.int64)
+    logprobs = np.zeros(num_images)
+    metadata = [[""] for _ in range(num_images)]
+    complete_captions = [TopN(self.beam_size) for _ in range(num_images)]
 
     # Run beam search.
     for _ in range(self.max_caption_length - 1):
-      partial_captions_list = partial_captions.extract()
-      partial_captions.reset()
-      input_feed = np.array([c.sentence[-1] for c in partial_captions_list])
-      state_feed = np.array([c.state for c in partial_captions_list])
-
-      softmax, new_states, metadata = self.model.inference_step(sess,
-                                                                input_feed,
-                                                                state_feed)
-
-      for i, partial_caption in enumerate(partial_captions_list):
-        word_probabilities = softmax[i]
-        state = new_states[i]
-        # For this partial caption, get the beam_size most probable next words.
-        words_and_probs = list(enumerate(word_probabilities))
-        words_and_probs.sort(key=lambda x: -x[1])
-        words_and_probs = words_and_probs[0:self.beam_size]
-        # Each next word gives a new partial caption.
-        for w, p in words_and_probs:
-          if p < 1e-12:
-            continue  # Avoid log(0).
-          sentence = partial_caption.sentence + [w]
-          logprob = partial_caption.logprob + math.log(p)
-          score = logprob
-          if metadata:
-            metadata_list = partial_caption.metadata + [metadata[i]]
-          else:
-            metadata_list = None
-          if w == self.vocab.end_id:
-            if self.length_normalization_factor > 0:
-              score /= len(sentence)**self.length_normalization_factor
-            beam = Caption(sentence, state, logprob, score, metadata_list)
-            complete_captions.push(beam)
-          else:
-            beam = Caption(sentence, state, logprob, score, metadata_list)
-            partial_captions.push(beam)
-      if partial_captions.size() == 0:
+      softmax, new_states, step_metadata = self.model.inference_step(
+          sess, sentences[:, -1], states)
+
+      # For each partial caption, get the beam_size most probable next words.
+      num_words = min(self.beam_size, softmax.shape[1])
+      if num_words < softmax.shape[1]:
+        words = np.argpartition(-softmax, num_words - 1, axis=1)[:, :num_words]
+      else:
+        words = np.tile(np.arange(num_words), [len(softmax), 1])
+      probs = softmax[np.arange(len(softmax))[:, np.newaxis], words]
+
+      # Each next word gives a new caption.
+      rows, cols = np.nonzero(probs >= 1e-12)  # Avoid log(0).
+      words = words[rows, cols]
+      new_logprobs = logprobs[rows] + np.log(probs[rows, cols])
+      if step_metadata:
+        new_metadata = [metadata[row] + [step_metadata[row]] for row in rows]
+      else:
+        new_metadata = None
+
+      is_end = words == self.vocab.end_id
+      for i in np.flatnonzero(is_end):
+        row = rows[i]
+        sentence = sentences[row].tolist() + [self.vocab.end_id]
+        score = new_logprobs[i]
+        if self.length_normalization_factor > 0:
+          score /= len(sentence)**self.length_normalization_factor
+        complete_captions[image_ids[row]].push(
+            Caption(sentence, new_states[row], new_logprobs[i], score,
+                    new_metadata[i] if new_metadata else None))
+
+      # Keep the beam_size most probable partial captions of each image.
+      partial = np.flatnonzero(~is_end)
+      partial = partial[np.lexsort((-new_logprobs[partial],
+                                    image_ids[rows[partial]]))]
+      partial_image_ids = image_ids[rows[partial]]
+      rank = (np.arange(len(partial)) -
+              np.searchsorted(partial_image_ids, partial_image_ids))
+      partial = partial[rank < self.beam_size]
+
+      rows = rows[partial]
+      image_ids = image_ids[rows]
+      sentences = np.column_stack([sentences[rows], words[partial]])
+      logprobs = new_logprobs[partial]
+      states = new_states[rows]
+      metadata = [new_metadata[i] for i in partial] if new_metadata else None
+      if not len(rows):
         # We have run out of partial candidates; happens when beam_size = 1.
         break
 
     # If we have no complete captions then fall back to the partial captions.
     # But never output a mixture of complete and partial captions because a
     # partial caption could have a higher score than all the complete captions.
-    if not complete_captions.size():
-      complete_captions = partial_captions
-
-    return complete_captions.extract(sort=True)
+    captions = []
+    for image_id, complete in enumerate(complete_captions):
+      if complete.size():
+        captions.append(complete.extract(sort=True))
+        continue
+      # Partial captions of an image are already in descending score order.
+      captions.append([
+          Caption(sentences[row].tolist(), states[row], logprobs[row],
+                  logprobs[row], metadata[row] if metadata else None)
+          for row in np.flatnonzero(image_ids == image_id)
+      ])
+    return captions
@@ -173,6 +173,21 @@ class CaptionGeneratorTest(tf.test.TestCase):
     self._assertExpectedCaptions(
         expected, beam_size=4, length_normalization_factor=3)
 
+  def testBatch(self):
+    # Captions of a batch of images are the same as those of each image alone.
+    generator = caption_generator.CaptionGenerator(
+        model=FakeModel(), vocab=FakeVocab(), beam_size=2)
+    expected = generator.beam_search(sess=None, encoded_image=None)
+    batch_captions = generator.beam_search_batch(
+        sess=None, encoded_images=[None] * 3)
+
+    self.assertEqual(3, len(batch_captions))
+    for actual in batch_captions:
+      self.assertEqual([c.sentence for c in expected],
+                       [c.sentence for c in actual])
+      self.assertAllClose([c.logprob for c in expected],
+                          [c.logprob for c in actual])
+
 
 if __name__ == '__main__':
   tf.test.main()
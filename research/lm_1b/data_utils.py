@@ -15,11 +15,40 @@
 
 """A library for loading 1B word benchmark dataset."""
 
+import hashlib
+import os
 import random
 
 import numpy as np
 import tensorflow as tf
 
+# Binary shards, written by write_binary_shard(), start with a header of
+# _BINARY_HEADER_SIZE int64s: _BINARY_MAGIC, vocab size, max word length, the
+# number of sentences, tokens and extra char ids rows, a hash of the vocab
+# words, the size and mtime (in ns) of the text shard it was converted from and
+# a reserved 0. The header is followed by
+#   offsets:     int64 [num_sentences + 1], start of each sentence in ids.
+#   ids:         int32 [num_tokens], word ids of all sentences, with <S> and
+#                </S> tokens.
+#   char_rows:   int32 [num_tokens], the row of each token's char ids: r >= 0
+#                is row r of CharsVocabulary.word_char_ids, and r < 0 is row
+#                -r - 1 of extra_chars.
+#   extra_chars: int32 [num_extra, max_word_length], char ids of the sentence
+#                begin and end tokens and of the words not in the vocabulary.
+BINARY_SUFFIX = '.lm1b'
+_BINARY_MAGIC = 0x3262316d6c
+_BINARY_HEADER_SIZE = 10
+
+
+def _vocab_hash(vocab):
+  """Returns an int64 hash of the words of a vocabulary, in id order."""
+  digest = hashlib.sha1()
+  for word_id in range(vocab.size):
+    word = vocab.id_to_word(word_id)
+    digest.update(word.encode('utf-8') if not isinstance(word, bytes) else word)
+    digest.update(b'\n')
+  return int(np.frombuffer(digest.digest()[:8], dtype=np.int64)[0])
+
 
 class Vocabulary(object):
   """Class that holds a vocabulary for the dataset."""
@@ -70,6 +99,9 @@ class Vocabulary(object):
   def size(self):
     return len(self._id_to_word)
 
+  def __contains__(self, word):
+    return word in self._word_to_id
+
   def word_to_id(self, word):
     if word in self._word_to_id:
       return self._word_to_id[word]
@@ -185,7 +217,7 @@ def get_batch(generator, batch_size, num_steps, max_word_length, pad=False):
       while cur_pos < num_steps:
         if cur_stream[i] is None or len(cur_stream[i][0]) <= 1:
           try:
-            cur_stream[i] = list(generator.next())
+            cur_stream[i] = list(next(generator))
           except StopIteration:
             # No more data, exhaust current streams and quit
             no_more_data = True
@@ -214,26 +246,186 @@ def get_batch(generator, batch_size, num_steps, max_word_length, pad=False):
     yield inputs, char_inputs, global_word_ids, targets, weights
 
 
+def write_binary_shard(shard_name, vocab, binary_name):
+  """Converts a text shard to the binary format read by load_binary_shard().
+
+  Args:
+    shard_name: Text file path, one tokenized sentence per line.
+    vocab: CharsVocabulary.
+    binary_name: Path of the binary shard to write.
+  """
+  tf.logging.info('Converting %s to %s', shard_name, binary_name)
+  # Stat the shard before reading it, so that changes made while it is read
+  # are picked up by the next run.
+  source_size, source_mtime = _shard_stamp(shard_name)
+  with tf.gfile.Open(shard_name) as f:
+    sentences = f.readlines()
+
+  offsets = np.zeros([len(sentences) + 1], dtype=np.int64)
+  ids = []
+  char_rows = []
+  extra_chars = [vocab.bos_chars, vocab.eos_chars]
+  extra_rows = {}  # word not in vocab -> its row of extra_chars
+  for i, sentence in enumerate(sentences):
+    words = sentence.split()
+    ids.append(vocab.encode(sentence))
+    rows = [-1]  # <S>
+    for word in words:
+      if word in vocab:
+        rows.append(vocab.word_to_id(word))
+      else:
+        if word not in extra_rows:
+          extra_rows[word] = len(extra_chars)
+          extra_chars.append(vocab.word_to_char_ids(word))
+        rows.append(-extra_rows[word] - 1)
+    rows.append(-2)  # </S>
+    char_rows.append(np.array(rows, dtype=np.int32))
+    offsets[i + 1] = offsets[i] + len(rows)
+
+  header = np.array([_BINARY_MAGIC, vocab.size, vocab.max_word_length,
+                     len(sentences), offsets[-1], len(extra_chars),
+                     _vocab_hash(vocab), source_size, source_mtime, 0],
+                    dtype=np.int64)
+  with tf.gfile.Open(binary_name + '.tmp', mode='wb') as f:
+    f.write(header.tobytes())
+    f.write(offsets.tobytes())
+    for sentence_ids in ids:
+      f.write(sentence_ids.astype(np.int32).tobytes())
+    for rows in char_rows:
+      f.write(rows.tobytes())
+    f.write(np.vstack(extra_chars).astype(np.int32).tobytes())
+  tf.gfile.Rename(binary_name + '.tmp', binary_name, overwrite=True)
+
+
+def _shard_stamp(shard_name):
+  """Returns the size and mtime (in ns) of a text shard."""
+  stat = tf.gfile.Stat(shard_name)
+  return stat.length, stat.mtime_nsec
+
+
+def _read_binary_header(binary_name):
+  """Returns the header of a binary shard, or None if it is not one."""
+  header = np.fromfile(binary_name, dtype=np.int64, count=_BINARY_HEADER_SIZE)
+  if len(header) != _BINARY_HEADER_SIZE or header[0] != _BINARY_MAGIC:
+    return None
+  return header
+
+
+def binary_shard_is_fresh(binary_name, shard_name):
+  """Whether binary_name was converted from the current shard_name.
+
+  Args:
+    binary_name: Path of the binary shard.
+    shard_name: Path of the text shard it is converted from.
+
+  Returns:
+    False if the binary shard is missing, has an older format, or records
+    another size or mtime of the text shard than it has now.
+  """
+  if not tf.gfile.Exists(binary_name):
+    return False
+  header = _read_binary_header(binary_name)
+  return (header is not None and
+          tuple(int(x) for x in header[7:9]) == _shard_stamp(shard_name))
+
+
+def load_binary_shard(binary_name, vocab):
+  """Memory maps a shard written by write_binary_shard().
+
+  Args:
+    binary_name: Path of the binary shard.
+    vocab: CharsVocabulary the shard was written with.
+
+  Returns:
+    offsets, ids, char_rows and extra_chars arrays, as described above.
+
+  Raises:
+    ValueError: If the shard is malformed or was written with another
+      vocabulary.
+  """
+  header = _read_binary_header(binary_name)
+  if header is None:
+    raise ValueError('%s is not a binary shard.' % binary_name)
+  (vocab_size, max_word_length, num_sentences, num_tokens,
+   num_extra) = [int(x) for x in header[1:6]]
+  if ((vocab_size, max_word_length, int(header[6])) !=
+      (vocab.size, vocab.max_word_length, _vocab_hash(vocab))):
+    raise ValueError('%s was written with another vocabulary.' % binary_name)
+
+  offset = header.nbytes
+  arrays = []
+  for dtype, shape in [(np.int64, [num_sentences + 1]),
+                       (np.int32, [num_tokens]),
+                       (np.int32, [num_tokens]),
+                       (np.int32, [num_extra, max_word_length])]:
+    arrays.append(np.memmap(binary_name, dtype=dtype, mode='r', offset=offset,
+                            shape=tuple(shape)))
+    offset += arrays[-1].nbytes
+  return tuple(arrays)
+
+
 class LM1BDataset(object):
   """Utility class for 1B word benchmark dataset.
 
   The current implementation reads the data from the tokenized text files.
   """
 
-  def __init__(self, filepattern, vocab):
+  def __init__(self, filepattern, vocab, binary_dir=None):
     """Initialize LM1BDataset reader.
 
     Args:
       filepattern: Dataset file pattern.
       vocab: Vocabulary.
+      binary_dir: If set, text shards are converted once to binary shards in
+        this directory, which are then memory mapped instead of being read and
+        encoded whenever they are loaded.
     """
     self._vocab = vocab
+    self._binary_dir = binary_dir
     self._all_shards = tf.gfile.Glob(filepattern)
     tf.logging.info('Found %d shards at %s', len(self._all_shards), filepattern)
 
   def _load_random_shard(self):
     """Randomly select a file and read it."""
-    return self._load_shard(random.choice(self._all_shards))
+    shard_name = random.choice(self._all_shards)
+    if self._binary_dir:
+      return self._load_binary_shard(shard_name)
+    return self._load_shard(shard_name)
+
+  def _load_binary_shard(self, shard_name):
+    """Memory map the binary shard of a text shard, converting it if stale.
+
+    Args:
+      shard_name: file path of the text shard.
+
+    Returns:
+      generator of (id, char_id, global_word_id) tuples of arrays; id is a view
+      of the memory mapped shard.
+    """
+    binary_name = os.path.join(self._binary_dir,
+                               os.path.basename(shard_name) + BINARY_SUFFIX)
+    if not binary_shard_is_fresh(binary_name, shard_name):
+      if not tf.gfile.Exists(self._binary_dir):
+        tf.gfile.MakeDirs(self._binary_dir)
+      write_binary_shard(shard_name, self.vocab, binary_name)
+    tf.logging.info('Loading data from: %s', binary_name)
+    offsets, ids, char_rows, extra_chars = load_binary_shard(binary_name,
+                                                             self.vocab)
+    tf.logging.info('Loaded %d words.', len(ids) - len(offsets) + 1)
+    return self._binary_sentences(offsets, ids, char_rows, extra_chars)
+
+  def _binary_sentences(self, offsets, ids, char_rows, extra_chars):
+    word_char_ids = self.vocab.word_char_ids
+    for i in range(len(offsets) - 1):
+      start, end = offsets[i], offsets[i + 1]
+      rows = char_rows[start:end]
+      chars_ids = word_char_ids[np.maximum(rows, 0)]
+      extra = rows < 0
+      chars_ids[extra] = extra_chars[-rows[extra] - 1]
+      # Words are numbered without the <S> of each sentence.
+      global_start = start - i
+      yield (ids[start:end], chars_ids,
+             np.arange(global_start, global_start + end - start - 1))
 
   def _load_shard(self, shard_name):
     """Read one file and convert to ids.
@@ -0,0 +1,122 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for data_utils."""
+
+import os
+import tempfile
+
+import tensorflow as tf
+
+import data_utils
+
+_WORDS = ['<S>', '</S>', '<UNK>', 'the', 'cat', 'sat', 'on', 'mat', '.']
+_SENTENCES = ['the cat sat on the mat .',
+              'a dog sat .',
+              '',
+              'the supercalifragilistic cat']
+_MAX_WORD_LENGTH = 10
+
+
+class BinaryShardTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(BinaryShardTest, self).setUp()
+    self._dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    self._vocab = self._write_vocab('vocab.txt', _WORDS)
+    self._shard_name = os.path.join(self._dir, 'news.en-00001-of-00100')
+    with open(self._shard_name, 'w') as f:
+      f.write(''.join(sentence + '\n' for sentence in _SENTENCES))
+
+  def _write_vocab(self, name, words):
+    filename = os.path.join(self._dir, name)
+    with open(filename, 'w') as f:
+      f.write(''.join(word + '\n' for word in words))
+    return data_utils.CharsVocabulary(filename, _MAX_WORD_LENGTH)
+
+  def testRoundTrip(self):
+    binary_name = os.path.join(self._dir, 'shard' + data_utils.BINARY_SUFFIX)
+    data_utils.write_binary_shard(self._shard_name, self._vocab, binary_name)
+    offsets, ids, char_rows, extra_chars = data_utils.load_binary_shard(
+        binary_name, self._vocab)
+    self.assertEqual(len(_SENTENCES) + 1, len(offsets))
+    self.assertEqual(len(ids), len(char_rows))
+    self.assertEqual(_MAX_WORD_LENGTH, extra_chars.shape[1])
+    for i, sentence in enumerate(_SENTENCES):
+      self.assertAllEqual(self._vocab.encode(sentence),
+                          ids[offsets[i]:offsets[i + 1]])
+
+  def testBinarySentencesMatchTextShard(self):
+    text_dataset = data_utils.LM1BDataset(self._shard_name, self._vocab)
+    binary_dataset = data_utils.LM1BDataset(
+        self._shard_name, self._vocab,
+        binary_dir=os.path.join(self._dir, 'binary'))
+    # The first load converts the shard, the second one reuses it.
+    for _ in range(2):
+      expected = list(text_dataset._load_shard(self._shard_name))  # pylint: disable=protected-access
+      actual = list(binary_dataset._load_random_shard())  # pylint: disable=protected-access
+      self.assertEqual(len(expected), len(actual))
+      for expected_arrays, actual_arrays in zip(expected, actual):
+        for expected_array, actual_array in zip(expected_arrays,
+                                                actual_arrays):
+          self.assertAllEqual(expected_array, actual_array)
+
+  def testChangedTextShardIsConvertedAgain(self):
+    binary_dir = os.path.join(self._dir, 'binary')
+    binary_dataset = data_utils.LM1BDataset(self._shard_name, self._vocab,
+                                            binary_dir=binary_dir)
+    list(binary_dataset._load_random_shard())  # pylint: disable=protected-access
+    binary_name = os.path.join(binary_dir, os.path.basename(
+        self._shard_name) + data_utils.BINARY_SUFFIX)
+    self.assertTrue(data_utils.binary_shard_is_fresh(binary_name,
+                                                     self._shard_name))
+
+    # Same name and size, other contents and mtime.
+    with open(self._shard_name, 'w') as f:
+      f.write(''.join(sentence[::-1] + '\n' for sentence in _SENTENCES))
+    stat = os.stat(self._shard_name)
+    os.utime(self._shard_name, (stat.st_atime, stat.st_mtime + 10))
+    self.assertFalse(data_utils.binary_shard_is_fresh(binary_name,
+                                                      self._shard_name))
+    text_dataset = data_utils.LM1BDataset(self._shard_name, self._vocab)
+    expected = list(text_dataset._load_shard(self._shard_name))  # pylint: disable=protected-access
+    actual = list(binary_dataset._load_random_shard())  # pylint: disable=protected-access
+    self.assertEqual(len(expected), len(actual))
+    for expected_arrays, actual_arrays in zip(expected, actual):
+      self.assertAllEqual(expected_arrays[0], actual_arrays[0])
+    self.assertTrue(data_utils.binary_shard_is_fresh(binary_name,
+                                                     self._shard_name))
+
+  def testOtherVocabularyRaises(self):
+    binary_name = os.path.join(self._dir, 'shard' + data_utils.BINARY_SUFFIX)
+    data_utils.write_binary_shard(self._shard_name, self._vocab, binary_name)
+    # Same size and max word length, different words.
+    other_vocab = self._write_vocab('other_vocab.txt',
+                                    _WORDS[:-1] + ['dog'])
+    with self.assertRaises(ValueError):
+      data_utils.load_binary_shard(binary_name, other_vocab)
+    # Same words, in another order.
+    other_vocab = self._write_vocab('reordered_vocab.txt',
+                                    _WORDS[:3] + _WORDS[:2:-1])
+    with self.assertRaises(ValueError):
+      data_utils.load_binary_shard(binary_name, other_vocab)
+
+  def testNotABinaryShardRaises(self):
+    with self.assertRaises(ValueError):
+      data_utils.load_binary_shard(self._shard_name, self._vocab)
+
+
+if __name__ == '__main__':
+  tf.test.main()
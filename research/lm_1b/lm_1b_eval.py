@@ -63,6 +63,10 @@ tf.flags.DEFINE_string('input_data', '',
                        'Input data files for eval model.')
 tf.flags.DEFINE_integer('max_eval_steps', 1000000,
                         'Maximum mumber of steps to run "eval" mode.')
+tf.flags.DEFINE_string('binary_data_dir', '',
+                       'If set, input data files are converted once to binary '
+                       'shards in this directory, which are memory mapped in '
+                       'later runs instead of being read and encoded.')
 
 
 # For saving demo resources, use batch size 1 and step 1.
@@ -292,7 +296,8 @@ def main(unused_argv):
   vocab = data_utils.CharsVocabulary(FLAGS.vocab_file, MAX_WORD_LEN)
 
   if FLAGS.mode == 'eval':
-    dataset = data_utils.LM1BDataset(FLAGS.input_data, vocab)
+    dataset = data_utils.LM1BDataset(FLAGS.input_data, vocab,
+                                     binary_dir=FLAGS.binary_data_dir)
     _EvalModel(dataset)
   elif FLAGS.mode == 'sample':
     _SampleModel(FLAGS.prefix, vocab)
@@ -20,47 +20,146 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from six.moves import xrange
+import collections
+import os
+import zlib
 
+import numpy as np
+import tensorflow as tf
 
-def hash_function(input_tuple):
-  """Hash function for a tuple."""
-  return hash(input_tuple)
+# Sorted unique n-gram keys of a text, their counts, the base the word ids
+# were packed with (see ngram_keys) and a checksum of the text.
+NgramTable = collections.namedtuple('NgramTable',
+                                    ['keys', 'counts', 'base', 'checksum'])
 
 
 def find_all_ngrams(dataset, n):
-  """Generate a list of all ngrams."""
-  return zip(*[dataset[i:] for i in xrange(n)])
-
-
-def construct_ngrams_dict(ngrams_list):
-  """Construct a ngram dictionary which maps an ngram tuple to the number
-  of times it appears in the text."""
-  counts = {}
-
-  for t in ngrams_list:
-    key = hash_function(t)
-    if key in counts:
-      counts[key] += 1
-    else:
-      counts[key] = 1
-  return counts
-
-
-def percent_unique_ngrams_in_train(train_ngrams_dict, gen_ngrams_dict):
+  """Generate an array of all ngrams.
+
+  Args:
+    dataset:  Sequence of word ids, or a [batch_size, sequence_length] array
+      of sequences, whose ngrams are found separately.
+    n:  Degree of n-grams.
+
+  Returns:
+    A [num_ngrams, n] np.int64 array.
+  """
+  dataset = np.asarray(dataset, dtype=np.int64)
+  length = dataset.shape[-1] - n + 1
+  if length <= 0:
+    return np.zeros([0, n], dtype=np.int64)
+  ngrams = np.stack([dataset[..., i:i + length] for i in range(n)], axis=-1)
+  return ngrams.reshape([-1, n])
+
+
+def ngram_keys(ngrams, base):
+  """Packs each ngram into a single key which sorts like the ngram.
+
+  Args:
+    ngrams:  A [num_ngrams, n] array of word ids in [0, base).
+    base:  Int, one more than the largest word id.
+
+  Returns:
+    np.int64 keys if base**n fits in them, else an array of opaque fixed-size
+    byte strings.
+  """
+  n = ngrams.shape[1]
+  if base ** n <= np.iinfo(np.int64).max:
+    keys = np.zeros([len(ngrams)], dtype=np.int64)
+    for i in range(n):
+      keys *= base
+      keys += ngrams[:, i]
+    return keys
+  ngrams = np.ascontiguousarray(ngrams, dtype=np.int64)
+  return ngrams.view(np.dtype((np.void, 8 * n))).ravel()
+
+
+def construct_ngrams_table(dataset, n):
+  """Construct a table of the unique ngrams of dataset and their counts."""
+  dataset = np.asarray(dataset, dtype=np.int64)
+  base = int(dataset.max()) + 1 if dataset.size else 1
+  keys, counts = np.unique(
+      ngram_keys(find_all_ngrams(dataset, n), base), return_counts=True)
+  return NgramTable(keys, counts, base, _checksum(dataset))
+
+
+def _checksum(dataset):
+  return zlib.crc32(np.ascontiguousarray(dataset, dtype=np.int64).tobytes())
+
+
+def load_or_construct_ngrams_tables(dataset, n_list, cache_path=None):
+  """Construct the ngram tables of dataset, caching them in cache_path.
+
+  The cached tables are reused as long as they were computed for the same
+  dataset and values of n.
+
+  Args:
+    dataset:  Sequence of word ids.
+    n_list:  List of ints, the degrees of n-grams.
+    cache_path:  Optional path of an .npz file to cache the tables in.
+
+  Returns:
+    Dictionary of n to NgramTable.
+  """
+  dataset = np.asarray(dataset, dtype=np.int64)
+  checksum = _checksum(dataset)
+  if cache_path and tf.gfile.Exists(cache_path):
+    try:
+      with tf.gfile.GFile(cache_path, mode='rb') as f:
+        cache = np.load(f)
+        tables = {}
+        for n in n_list:
+          if 'keys_%d' % n not in cache or cache['checksum'] != checksum:
+            break
+          tables[n] = NgramTable(cache['keys_%d' % n], cache['counts_%d' % n],
+                                 int(cache['base_%d' % n]), checksum)
+        else:
+          return tables
+      tf.logging.info('Ignoring stale ngram cache %s.', cache_path)
+    except Exception as e:  # pylint: disable=broad-except
+      tf.logging.warning('Ignoring unreadable ngram cache %s: %s', cache_path,
+                         e)
+
+  tables = dict((n, construct_ngrams_table(dataset, n)) for n in n_list)
+  if cache_path:
+    arrays = {'checksum': checksum}
+    for n, table in tables.items():
+      arrays['keys_%d' % n] = table.keys
+      arrays['counts_%d' % n] = table.counts
+      arrays['base_%d' % n] = table.base
+    # Written to a temporary file first, so that an interrupted write does
+    # not leave a truncated cache.
+    tmp_path = '%s.tmp.%d' % (cache_path, os.getpid())
+    with tf.gfile.GFile(tmp_path, mode='wb') as f:
+      np.savez(f, **arrays)
+    tf.gfile.Rename(tmp_path, cache_path, overwrite=True)
+  return tables
+
+
+def percent_unique_ngrams_in_train(train_ngrams_table, gen_ngrams):
   """Compute the percent of ngrams generated by the model that are
-  present in the training text and are unique."""
-
-  # *Total* number of n-grams produced by the generator.
-  total_ngrams_produced = 0
-
-  for _, value in gen_ngrams_dict.iteritems():
-    total_ngrams_produced += value
+  present in the training text and are unique.
+
+  Args:
+    train_ngrams_table:  NgramTable of the training text.
+    gen_ngrams:  A [num_ngrams, n] array of the generated ngrams.
+
+  Returns:
+    The number of unique generated ngrams present in the training text over
+    the *total* number of generated ngrams.
+  """
+  train_keys = train_ngrams_table.keys
+  if not len(train_keys):
+    # The training text is shorter than n, so has no ngrams.
+    return 0.
+
+  # Ngrams with words the training text does not have cannot be in it.
+  known = np.all(gen_ngrams < train_ngrams_table.base, axis=1)
+  gen_keys = np.unique(
+      ngram_keys(gen_ngrams[known], train_ngrams_table.base))
 
   # The unique ngrams in the training set.
-  unique_ngrams_in_train = 0.
-
-  for key, _ in gen_ngrams_dict.iteritems():
-    if key in train_ngrams_dict:
-      unique_ngrams_in_train += 1
-  return float(unique_ngrams_in_train) / float(total_ngrams_produced)
+  positions = np.searchsorted(train_keys, gen_keys)
+  positions = np.minimum(positions, len(train_keys) - 1)
+  unique_ngrams_in_train = np.sum(train_keys[positions] == gen_keys)
+  return float(unique_ngrams_in_train) / float(len(gen_ngrams))
@@ -0,0 +1,134 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for n_gram."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from model_utils import n_gram
+
+
+def _dict_ngram_counts(sequence, n):
+  """Counts the ngrams of sequence in a dictionary of tuples."""
+  return collections.Counter(zip(*[sequence[i:] for i in range(n)]))
+
+
+def _dict_percent_unique_ngrams_in_train(train_data, gen_sequences, n):
+  """The percent captured metric, computed with dictionaries of tuples."""
+  train_counts = _dict_ngram_counts(list(train_data), n)
+  gen_counts = collections.Counter()
+  for sequence in gen_sequences:
+    gen_counts += _dict_ngram_counts(list(sequence), n)
+  unique_ngrams_in_train = sum(1 for key in gen_counts if key in train_counts)
+  return float(unique_ngrams_in_train) / float(sum(gen_counts.values()))
+
+
+class NGramTest(tf.test.TestCase):
+
+  def _assertTablesEqual(self, expected, actual):
+    self.assertAllEqual(expected.keys, actual.keys)
+    self.assertAllEqual(expected.counts, actual.counts)
+    self.assertEqual(expected.base, actual.base)
+    self.assertEqual(expected.checksum, actual.checksum)
+
+  def _check_matches_dict(self, train_data, gen_sequences):
+    for n in [1, 2, 3, 4]:
+      table = n_gram.construct_ngrams_table(train_data, n)
+      expected_counts = _dict_ngram_counts(list(train_data), n)
+      self.assertEqual(len(expected_counts), len(table.keys))
+      self.assertEqual(sorted(expected_counts.values()),
+                       sorted(table.counts.tolist()))
+      self.assertAllClose(
+          _dict_percent_unique_ngrams_in_train(train_data, gen_sequences, n),
+          n_gram.percent_unique_ngrams_in_train(
+              table, n_gram.find_all_ngrams(gen_sequences, n)))
+
+  def testMatchesDictionaries(self):
+    rng = np.random.RandomState(0)
+    train_data = rng.randint(0, 6, size=500)
+    # Generated words may be missing from the training text.
+    gen_sequences = rng.randint(0, 8, size=[10, 12])
+    self._check_matches_dict(train_data, gen_sequences)
+
+  def testMatchesDictionariesWithByteKeys(self):
+    rng = np.random.RandomState(1)
+    # base**4 does not fit in an int64, so the keys are byte strings.
+    train_data = rng.randint(0, 3, size=300) * 10**6
+    gen_sequences = rng.randint(0, 4, size=[5, 10]) * 10**6
+    table = n_gram.construct_ngrams_table(train_data, 4)
+    self.assertEqual(np.void, table.keys.dtype.type)
+    self._check_matches_dict(train_data, gen_sequences)
+
+  def testFindAllNgrams(self):
+    self.assertAllEqual([[1, 2], [2, 3], [5, 6], [6, 7]],
+                        n_gram.find_all_ngrams([[1, 2, 3], [5, 6, 7]], 2))
+    self.assertEqual((0, 4), n_gram.find_all_ngrams([1, 2, 3], 4).shape)
+
+  def testTrainTextShorterThanN(self):
+    table = n_gram.construct_ngrams_table([3, 1], 3)
+    self.assertEqual(0, len(table.keys))
+    self.assertEqual(0., n_gram.percent_unique_ngrams_in_train(
+        table, n_gram.find_all_ngrams([[3, 1, 2]], 3)))
+
+  def testTruncatedCacheIsRecounted(self):
+    rng = np.random.RandomState(3)
+    train_data = rng.randint(0, 20, size=200)
+    cache_path = os.path.join(self.get_temp_dir(), 'truncated_ngrams.npz')
+    n_gram.load_or_construct_ngrams_tables(train_data, [2],
+                                           cache_path=cache_path)
+    with open(cache_path, 'rb') as f:
+      contents = f.read()
+    with open(cache_path, 'wb') as f:
+      f.write(contents[:len(contents) // 2])
+    tables = n_gram.load_or_construct_ngrams_tables(train_data, [2],
+                                                    cache_path=cache_path)
+    self._assertTablesEqual(n_gram.construct_ngrams_table(train_data, 2),
+                            tables[2])
+    # The cache was written again.
+    with open(cache_path, 'rb') as f:
+      self.assertEqual(contents, f.read())
+
+  def testCacheRoundTrip(self):
+    rng = np.random.RandomState(2)
+    train_data = rng.randint(0, 20, size=200)
+    cache_path = os.path.join(self.get_temp_dir(), 'ngrams.npz')
+    tables = n_gram.load_or_construct_ngrams_tables(train_data, [2, 3],
+                                                    cache_path=cache_path)
+    self.assertTrue(os.path.exists(cache_path))
+    cached = n_gram.load_or_construct_ngrams_tables(train_data, [2, 3],
+                                                    cache_path=cache_path)
+    for n in [2, 3]:
+      self._assertTablesEqual(tables[n], cached[n])
+
+    # Other data or values of n are recounted.
+    other_data = train_data.copy()
+    other_data[:3] = 20
+    for n in [2, 4]:
+      other = n_gram.load_or_construct_ngrams_tables(other_data, [n],
+                                                     cache_path=cache_path)
+      self._assertTablesEqual(n_gram.construct_ngrams_table(other_data, n),
+                              other[n])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -19,7 +19,6 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from collections import Counter
 # Dependency imports
 import numpy as np
 from scipy.special import expit
@@ -229,29 +228,6 @@ def generate_logs(sess, model, log, id_to_word, feed):
   return samples
 
 
-def create_merged_ngram_dictionaries(indices, n):
-  """Generate a single dictionary for the full batch.
-
-  Args:
-    indices:  List of lists of indices.
-    n:  Degree of n-grams.
-
-  Returns:
-    Dictionary of hashed(n-gram tuples) to counts in the batch of indices.
-  """
-  ngram_dicts = []
-
-  for ind in indices:
-    ngrams = n_gram.find_all_ngrams(ind, n=n)
-    ngram_counts = n_gram.construct_ngrams_dict(ngrams)
-    ngram_dicts.append(ngram_counts)
-
-  merged_gen_dict = Counter()
-  for ngram_dict in ngram_dicts:
-    merged_gen_dict += Counter(ngram_dict)
-  return merged_gen_dict
-
-
 def sequence_ngram_evaluation(sess, sequence, log, feed, data_ngram_count, n):
   """Calculates the percent of ngrams produced in the sequence is present in
   data_ngram_count.
@@ -261,8 +237,8 @@ def sequence_ngram_evaluation(sess, sequence, log, feed, data_ngram_count, n):
     sequence: Sequence Tensor from the MaskGAN model.
     log:  gFile log.
     feed: Feed to evaluate.
-    data_ngram_count:  Dictionary of hashed(n-gram tuples) to counts in the
-      data_set.
+    data_ngram_count:  n_gram.NgramTable of the n-grams in the data_set.
+    n:  Degree of n-grams.
 
   Returns:
     avg_percent_captured: Percent of produced ngrams that appear in the
@@ -273,8 +249,6 @@ def sequence_ngram_evaluation(sess, sequence, log, feed, data_ngram_count, n):
   [sequence_eval] = sess.run([sequence], feed_dict=feed)
   indices = sequence_eval
 
-  # Retrieve the counts across the batch of indices.
-  gen_ngram_counts = create_merged_ngram_dictionaries(
-      indices, n=n)
-  return n_gram.percent_unique_ngrams_in_train(data_ngram_count,
-                                               gen_ngram_counts)
+  # Retrieve the n-grams of each sequence in the batch of indices.
+  gen_ngrams = n_gram.find_all_ngrams(indices, n=n)
+  return n_gram.percent_unique_ngrams_in_train(data_ngram_count, gen_ngrams)
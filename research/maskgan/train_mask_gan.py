@@ -179,6 +179,10 @@ tf.app.flags.DEFINE_string('data_set', 'ptb', 'Data set to operate on.  One of'
                            "['ptb', 'imdb']")
 tf.app.flags.DEFINE_string('data_dir', '/tmp/data/ptb',
                            'Directory for the training data.')
+tf.app.flags.DEFINE_string(
+    'ngram_cache_dir', None,
+    'Directory to cache the n-gram tables of the data set in across runs.  '
+    'Defaults to base_directory.')
 tf.app.flags.DEFINE_string(
     'language_model_ckpt_dir', None,
     'Directory storing checkpoints to initialize the model.  Pretrained models'
@@ -499,8 +503,8 @@ def train_model(hparams, data, log_dir, log, id_to_word, data_ngram_counts):
     log_dir: Directory to save checkpoints.
     log: Readable log for the experiment.
     id_to_word: Dictionary of indices to words.
-    data_ngram_counts: Dictionary of hashed(n-gram tuples) to counts in the
-      data_set.
+    data_ngram_counts: Dictionary of n (as a string) to the n_gram.NgramTable
+      of the data_set.
   """
   print('Training model.')
   tf.logging.info('Training model.')
@@ -849,8 +853,8 @@ def evaluate_once(data, sv, model, sess, train_dir, log, id_to_word,
     train_dir: Path to a directory containing checkpoints.
     log: Evaluation log for evaluation.
     id_to_word: Dictionary of indices to words.
-    data_ngram_counts: Dictionary of hashed(n-gram tuples) to counts in the
-      data_set.
+    data_ngram_counts: Dictionary of n (as a string) to the n_gram.NgramTable
+      of the data_set.
     eval_saver:  Evaluation saver.r.
   """
   tf.logging.info('Evaluate Once.')
@@ -1011,8 +1015,8 @@ def evaluate_model(hparams, data, train_dir, log, id_to_word,
     data: Data to evaluate.
     train_dir: Path to a directory containing checkpoints.
     id_to_word: Dictionary of indices to words.
-    data_ngram_counts: Dictionary of hashed(n-gram tuples) to counts in the
-      data_set.
+    data_ngram_counts: Dictionary of n (as a string) to the n_gram.NgramTable
+      of the data_set.
   """
   tf.logging.error('Evaluate model.')
 
@@ -1105,22 +1109,16 @@ def main(_):
   id_to_word = {v: k for k, v in word_to_id.iteritems()}
 
   # Dictionary of Training Set n-gram counts.
-  bigram_tuples = n_gram.find_all_ngrams(valid_data_flat, n=2)
-  trigram_tuples = n_gram.find_all_ngrams(valid_data_flat, n=3)
-  fourgram_tuples = n_gram.find_all_ngrams(valid_data_flat, n=4)
-
-  bigram_counts = n_gram.construct_ngrams_dict(bigram_tuples)
-  trigram_counts = n_gram.construct_ngrams_dict(trigram_tuples)
-  fourgram_counts = n_gram.construct_ngrams_dict(fourgram_tuples)
-  print('Unique %d-grams: %d' % (2, len(bigram_counts)))
-  print('Unique %d-grams: %d' % (3, len(trigram_counts)))
-  print('Unique %d-grams: %d' % (4, len(fourgram_counts)))
-
-  data_ngram_counts = {
-      '2': bigram_counts,
-      '3': trigram_counts,
-      '4': fourgram_counts
-  }
+  ngram_cache_dir = FLAGS.ngram_cache_dir or FLAGS.base_directory
+  tf.gfile.MakeDirs(ngram_cache_dir)
+  ngram_tables = n_gram.load_or_construct_ngrams_tables(
+      valid_data_flat, [2, 3, 4],
+      cache_path=os.path.join(ngram_cache_dir,
+                              '%s_ngrams.npz' % FLAGS.data_set))
+  for n in [2, 3, 4]:
+    print('Unique %d-grams: %d' % (n, len(ngram_tables[n].keys)))
+
+  data_ngram_counts = dict((str(n), table) for n, table in ngram_tables.items())
 
   # TODO(liamfedus):  This was necessary because there was a problem with our
   # originally trained IMDB models.  The EOS_INDEX was off by one, which means,
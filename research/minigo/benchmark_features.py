@@ -0,0 +1,119 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Benchmark per-position vs. batched feature extraction and symmetries.
+
+Compares the path DualNetRunner.run_many used to take (extract_features and
+random symmetries applied one position at a time) with extract_features_batch
+and the gather-based batched symmetries, for batch sizes 8..512.
+
+Usage:
+  python benchmark_features.py --board_size=19 --num_iters=20
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import random
+import sys
+import time
+
+import coords
+import features
+import go
+import numpy as np
+import symmetries
+
+BATCH_SIZES = (8, 16, 32, 64, 128, 256, 512)
+
+
+def random_game_positions(board_size, num_positions):
+  """Play random legal moves and collect (position, parent history) pairs."""
+  pairs = []
+  position = go.Position(board_size)
+  history = features.board_history(board_size, position)
+  while len(pairs) < num_positions:
+    legal = np.flatnonzero(position.all_legal_moves()[:-1])
+    if position.n > board_size * board_size or not legal.size:
+      position = go.Position(board_size)
+      history = features.board_history(board_size, position)
+      continue
+    move = coords.from_flat(board_size, random.choice(legal))
+    position = position.play_move(move)
+    history = features.board_history(board_size, position, history)
+    pairs.append((position, history))
+  return pairs
+
+
+def run_single(board_size, positions, pis):
+  processed = [features.extract_features(board_size, p) for p in positions]
+  syms_used, processed = symmetries.randomize_symmetries_feat(processed)
+  processed = np.stack(processed)
+  return processed, symmetries.invert_symmetries_pi(board_size, syms_used, pis)
+
+
+def run_batch(board_size, positions, pis, histories, out):
+  processed = features.extract_features_batch(
+      board_size, positions, histories=histories, out=out)
+  syms_used, processed = symmetries.randomize_symmetries_feat_batch(processed)
+  return processed, symmetries.invert_symmetries_pi_batch(
+      board_size, syms_used, pis)
+
+
+def time_it(fn, num_iters):
+  fn()  # warm up
+  start = time.time()
+  for _ in range(num_iters):
+    fn()
+  return (time.time() - start) / num_iters
+
+
+def main(unused_argv):
+  random.seed(FLAGS.seed)
+  np.random.seed(FLAGS.seed)
+  board_size = FLAGS.board_size
+  pairs = random_game_positions(board_size, max(BATCH_SIZES))
+  out = np.empty([max(BATCH_SIZES), board_size, board_size,
+                  features.NEW_FEATURES_PLANES], dtype=np.uint8)
+
+  print('{:>6} {:>12} {:>12} {:>12} {:>8}'.format(
+      'batch', 'single(ms)', 'batch(ms)', '+history(ms)', 'speedup'))
+  for batch_size in BATCH_SIZES:
+    positions = [p for p, _ in pairs[:batch_size]]
+    histories = [h for _, h in pairs[:batch_size]]
+    pis = np.random.random([batch_size, board_size * board_size + 1])
+    single = time_it(
+        lambda: run_single(board_size, positions, pis), FLAGS.num_iters)
+    batch = time_it(
+        lambda: run_batch(board_size, positions, pis, None, out),
+        FLAGS.num_iters)
+    cached = time_it(
+        lambda: run_batch(board_size, positions, pis, histories, out),
+        FLAGS.num_iters)
+    print('{:>6} {:>12.3f} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+        batch_size, single * 1e3, batch * 1e3, cached * 1e3, single / cached))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--board_size', type=int, default=19, help='Go board size.')
+  parser.add_argument(
+      '--num_iters', type=int, default=20,
+      help='Number of timed iterations per batch size.')
+  parser.add_argument(
+      '--seed', type=int, default=0, help='Random seed.')
+  FLAGS, unparsed = parser.parse_known_args()
+  main([sys.argv[0]] + unparsed)
@@ -17,6 +17,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import math
 import os
 import time
 
@@ -25,6 +26,16 @@ from gtp_wrapper import MCTSPlayer
 import sgf_wrapper
 
 
+def _write_sgf(params, sgf_dir, player, black_name, white_name, game_idx):
+  fname = '{:d}-{:s}-vs-{:s}-{:d}.sgf'.format(
+      int(time.time()), white_name, black_name, game_idx)
+  with open(os.path.join(sgf_dir, fname), 'w') as f:
+    sgfstr = sgf_wrapper.make_sgf(
+        params.board_size, player.position.recent, player.result_string,
+        black_name=black_name, white_name=white_name)
+    f.write(sgfstr)
+
+
 def play_match(params, black_net, white_net, games, readouts,
                sgf_dir, verbosity):
   """Plays matches between two neural nets.
@@ -83,13 +94,7 @@ def play_match(params, black_net, white_net, games, readouts,
             active.root.position.to_play, was_resign=True)
 
       if active.is_done():
-        fname = '{:d}-{:s}-vs-{:s}-{:d}.sgf'.format(
-            int(time.time()), white_name, black_name, i)
-        with open(os.path.join(sgf_dir, fname), 'w') as f:
-          sgfstr = sgf_wrapper.make_sgf(
-              params.board_size, active.position.recent, active.result_string,
-              black_name=black_name, white_name=white_name)
-          f.write(sgfstr)
+        _write_sgf(params, sgf_dir, active, black_name, white_name, i)
         print('Finished game', i, active.result_string)
         if active.result_string is not None:
           if active.result_string[0] == 'B':
@@ -112,7 +117,208 @@ def play_match(params, black_net, white_net, games, readouts,
         print('{:d}: {:d} readouts, {:.3f} s/100. ({:.2f} sec)'.format(
             num_move, readouts, timeper, dur))
 
-  if (black_win_counts - white_win_counts) > params.eval_win_rate * games:
+  return margin_rule_winner(black_win_counts, white_win_counts,
+                            params.eval_win_rate, games)
+
+
+def margin_rule_winner(black_wins, white_wins, win_rate, games):
+  """The winner of a match by the rule of play_match.
+
+  Black wins if it wins win_rate * games more games than white, i.e. at least
+  a fraction (1 + win_rate) / 2 of the games.
+  """
+  if (black_wins - white_wins) > win_rate * games:
     return go.BLACK_NAME
   else:
     return go.WHITE_NAME
+
+
+def sprt_decision(black_wins, white_wins, win_rate, margin, alpha, beta):
+  """Sequential probability ratio test on black's win rate.
+
+  The test is centered on the fraction of wins p = (1 + win_rate) / 2 that
+  margin_rule_winner requires of black: it tests H0: black wins with
+  probability p - margin against H1: black wins with probability p + margin,
+  after each finished game. A decision is only returned if margin_rule_winner
+  agrees with it on the games played so far, so that both rules accept the
+  same models.
+
+  Args:
+    black_wins: Number of games won by black so far.
+    white_wins: Number of games won by white so far.
+    win_rate: The margin that decides a match, e.g. 0.55 (see
+      margin_rule_winner).
+    margin: Half width of the indifference region of the test around
+      (1 + win_rate) / 2.
+    alpha: Probability of wrongly declaring black the winner.
+    beta: Probability of wrongly declaring white the winner.
+
+  Returns:
+    go.BLACK_NAME or go.WHITE_NAME once the test has decided, else None.
+  """
+  p = (1 + win_rate) / 2
+  p0, p1 = p - margin, min(p + margin, 1 - 1e-6)
+  llr = (black_wins * math.log(p1 / p0) +
+         white_wins * math.log((1 - p1) / (1 - p0)))
+  if llr >= math.log((1 - beta) / alpha):
+    decision = go.BLACK_NAME
+  elif llr <= math.log(beta / (1 - alpha)):
+    decision = go.WHITE_NAME
+  else:
+    return None
+  if decision != margin_rule_winner(black_wins, white_wins, win_rate,
+                                    black_wins + white_wins):
+    return None
+  return decision
+
+
+class _Game(object):
+  """Both players and the progress of one game in a concurrent match."""
+
+  def __init__(self, params, black_net, white_net, game_idx, verbosity):
+    self.game_idx = game_idx
+    self.black = MCTSPlayer(
+        params.board_size, black_net, verbosity=verbosity,
+        two_player_mode=True, num_parallel=params.simultaneous_leaves)
+    self.white = MCTSPlayer(
+        params.board_size, white_net, verbosity=verbosity,
+        two_player_mode=True, num_parallel=params.simultaneous_leaves)
+    self.black.initialize_game()
+    self.white.initialize_game()
+    self.num_move = 0
+    self.target_readouts = None
+
+  @property
+  def active(self):
+    return self.white if self.num_move % 2 else self.black
+
+  @property
+  def inactive(self):
+    return self.black if self.num_move % 2 else self.white
+
+
+def play_match_concurrent(params, black_net, white_net, games, readouts,
+                          sgf_dir, verbosity, concurrent_games=8,
+                          early_stop=True):
+  """Plays matches between two neural nets, several games at a time.
+
+  Up to concurrent_games games are in flight at once. Each search step
+  selects leaves in every in-flight game and evaluates them with one
+  run_many call per network, so both networks see large batches. With
+  early_stop, no new games are started once sprt_decision has decided the
+  match; otherwise the winner is decided by margin_rule_winner, as in
+  play_match.
+
+  Args:
+    params: An object of hyperparameters.
+    black_net: Instance of the DualNetRunner class to play as black.
+    white_net: Instance of the DualNetRunner class to play as white.
+    games: Maximum number of games to play.
+    readouts: Number of readouts to perform for each step in each game.
+    sgf_dir: Directory to write the sgf results.
+    verbosity: Verbosity to show evaluation process.
+    concurrent_games: Number of games played at the same time.
+    early_stop: Whether to stop once the SPRT has decided the match.
+
+  Returns:
+    'B' is the winner is black_net, otherwise 'W'.
+  """
+  black_name = os.path.basename(black_net.save_file)
+  white_name = os.path.basename(white_net.save_file)
+
+  black_win_counts = 0
+  white_win_counts = 0
+  games_started = 0
+  decision = None
+  in_flight = []
+  start = time.time()
+
+  while True:
+    while (decision is None and games_started < games and
+           len(in_flight) < concurrent_games):
+      in_flight.append(
+          _Game(params, black_net, white_net, games_started, verbosity))
+      games_started += 1
+    if not in_flight:
+      break
+
+    # Search every in-flight game up to its readout target, batching the
+    # leaves of all games by the network that has to evaluate them.
+    for game in in_flight:
+      game.target_readouts = game.active.root.N + readouts
+    searching = list(in_flight)
+    while searching:
+      batches = {}
+      for game in searching:
+        leaves = game.active.select_leaves()
+        batches.setdefault(id(game.active.network), []).append(
+            (game.active, leaves))
+      for players_and_leaves in batches.values():
+        all_leaves = [leaf for _, leaves in players_and_leaves
+                      for leaf in leaves]
+        if not all_leaves:
+          continue
+        network = players_and_leaves[0][0].network
+        move_probs, values = network.run_many(
+            [leaf.position for leaf in all_leaves],
+            histories=[leaf.history for leaf in all_leaves])
+        offset = 0
+        for player, leaves in players_and_leaves:
+          player.incorporate_leaves(
+              leaves, move_probs[offset:offset + len(leaves)],
+              values[offset:offset + len(leaves)])
+          offset += len(leaves)
+      searching = [game for game in searching
+                   if game.active.root.N < game.target_readouts]
+
+    still_playing = []
+    for game in in_flight:
+      active, inactive = game.active, game.inactive
+      if verbosity >= 3:
+        print(active.root.position)
+
+      # First, check the roots for hopeless games.
+      if active.should_resign():  # Force resign
+        active.set_result(-active.root.position.to_play, was_resign=True)
+        inactive.set_result(active.root.position.to_play, was_resign=True)
+
+      if active.is_done():
+        _write_sgf(params, sgf_dir, active, black_name, white_name,
+                   game.game_idx)
+        print('Finished game', game.game_idx, active.result_string)
+        if active.result_string is not None:
+          if active.result_string[0] == 'B':
+            black_win_counts += 1
+          elif active.result_string[0] == 'W':
+            white_win_counts += 1
+        if early_stop and decision is None:
+          decision = sprt_decision(
+              black_win_counts, white_win_counts, params.eval_win_rate,
+              params.eval_sprt_margin, params.eval_sprt_alpha,
+              params.eval_sprt_beta)
+        continue
+
+      move = active.pick_move()
+      active.play_move(move)
+      inactive.play_move(move)
+      game.num_move += 1
+      still_playing.append(game)
+
+      if (verbosity > 1) or (verbosity == 1 and game.num_move % 10 == 9):
+        print(active.root.position)
+        print('Game {:d}, move {:d}: {:d} readouts'.format(
+            game.game_idx, game.num_move, readouts))
+    in_flight = still_playing
+    if decision is not None:
+      # The remaining games cannot change the outcome; abandon them.
+      in_flight = []
+
+  finished = black_win_counts + white_win_counts
+  if verbosity >= 1:
+    print('Played {:d} of {:d} games in {:.1f} sec ({}).'.format(
+        finished, games, time.time() - start,
+        'stopped early by SPRT' if decision is not None else 'no early stop'))
+  if decision is not None:
+    return decision
+  return margin_rule_winner(black_win_counts, white_win_counts,
+                            params.eval_win_rate, games)
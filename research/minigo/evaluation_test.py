@@ -0,0 +1,107 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for evaluation."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tempfile
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+import evaluation
+import go
+import model_params
+import numpy as np
+import utils_test
+
+tf.logging.set_verbosity(tf.logging.ERROR)
+
+
+class CountingNet(object):
+  """A fake network with uniform priors that records its batch sizes."""
+
+  def __init__(self, save_file, fake_value=0):
+    self.save_file = save_file
+    self.fake_value = fake_value
+    self.batch_sizes = []
+
+  def run_many(self, positions, histories=None):
+    self.batch_sizes.append(len(positions))
+    priors = np.ones([len(positions), utils_test.BOARD_SIZE ** 2 + 1])
+    priors /= utils_test.BOARD_SIZE ** 2 + 1
+    return priors, np.full([len(positions)], self.fake_value)
+
+
+class EvalParams(model_params.DummyMiniGoParams):
+  board_size = utils_test.BOARD_SIZE
+  eval_readouts = 4
+  eval_verbose = 0
+
+
+class TestEvaluation(utils_test.MiniGoUnitTest):
+
+  def test_sprt_decision(self):
+    self.assertIsNone(evaluation.sprt_decision(0, 0, 0.55, 0.05, 0.05, 0.05))
+    self.assertIsNone(evaluation.sprt_decision(6, 4, 0.55, 0.05, 0.05, 0.05))
+    # 15 straight wins are not enough to show a win rate above 77.5%.
+    self.assertIsNone(evaluation.sprt_decision(15, 0, 0.55, 0.05, 0.05, 0.05))
+    self.assertEqual(go.BLACK_NAME,
+                     evaluation.sprt_decision(45, 5, 0.55, 0.05, 0.05, 0.05))
+    self.assertEqual(go.WHITE_NAME,
+                     evaluation.sprt_decision(5, 40, 0.55, 0.05, 0.05, 0.05))
+
+  def test_sprt_decision_agrees_with_margin_rule(self):
+    for win_rate in [0.1, 0.55, 0.8]:
+      for black_wins in range(60):
+        for white_wins in range(60):
+          decision = evaluation.sprt_decision(
+              black_wins, white_wins, win_rate, 0.05, 0.05, 0.05)
+          if decision is not None:
+            self.assertEqual(
+                evaluation.margin_rule_winner(black_wins, white_wins, win_rate,
+                                              black_wins + white_wins),
+                decision)
+
+  def test_concurrent_match_batches_games(self):
+    params = EvalParams()
+    # Black always believes white is winning, so it resigns right away.
+    black_net = CountingNet('000001-black', fake_value=-1)
+    white_net = CountingNet('000002-white')
+    with tempfile.TemporaryDirectory() as sgf_dir:
+      winner = evaluation.play_match_concurrent(
+          params, black_net, white_net, 6, params.eval_readouts, sgf_dir,
+          params.eval_verbose, concurrent_games=3, early_stop=False)
+      self.assertEqual(6, len(os.listdir(sgf_dir)))
+    self.assertEqual(go.WHITE_NAME, winner)
+    self.assertGreater(max(black_net.batch_sizes), params.simultaneous_leaves)
+
+  def test_concurrent_match_stops_early(self):
+    params = EvalParams()
+    black_net = CountingNet('000001-black', fake_value=-1)
+    white_net = CountingNet('000002-white')
+    with tempfile.TemporaryDirectory() as sgf_dir:
+      winner = evaluation.play_match_concurrent(
+          params, black_net, white_net, 50, params.eval_readouts, sgf_dir,
+          params.eval_verbose, concurrent_games=4, early_stop=True)
+      # 7 straight white wins decide at alpha=beta=0.05; the 8th game
+      # finished in the same round as the 7th.
+      self.assertEqual(8, len(os.listdir(sgf_dir)))
+    self.assertEqual(go.WHITE_NAME, winner)
+
+
+if __name__ == '__main__':
+  tf.test.main()
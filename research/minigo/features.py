@@ -55,15 +55,7 @@ def stone_features(board_size, position):
   # and then roll axis 0 to the end.
   features = np.zeros([16, board_size, board_size], dtype=np.uint8)
 
-  num_deltas_avail = position.board_deltas.shape[0]
-  cumulative_deltas = np.cumsum(position.board_deltas, axis=0)
-  last_eight = np.tile(position.board, [8, 1, 1])
-  # apply deltas to compute previous board states
-  last_eight[1:num_deltas_avail + 1] -= cumulative_deltas
-  # if no more deltas are available, just repeat oldest board.
-  last_eight[num_deltas_avail + 1:] = last_eight[num_deltas_avail].reshape(
-      1, board_size, board_size)
-
+  last_eight = board_history(board_size, position)
   features[::2] = last_eight == position.to_play
   features[1::2] = last_eight == -position.to_play
   return np.rollaxis(features, 0, 3)
@@ -89,3 +81,73 @@ def extract_features(board_size, position, features=None):
     features = NEW_FEATURES
   return np.concatenate([feature(board_size, position) for feature in features],
                         axis=2)
+
+
+def board_history(board_size, position, parent_history=None):
+  """Compute the last 8 board states of a position, most recent first.
+
+  Args:
+    board_size: the go board size.
+    position: a given go board status.
+    parent_history: optional [8, board_size, board_size] board history of the
+      position this one was played from. When given, the history is built by
+      shifting it by one instead of replaying the board deltas.
+
+  Returns:
+    An int8 array of shape [8, board_size, board_size].
+  """
+  history = np.empty([8, board_size, board_size], dtype=np.int8)
+  history[0] = position.board
+  if parent_history is not None:
+    history[1:] = parent_history[:7]
+    return history
+
+  num_deltas_avail = position.board_deltas.shape[0]
+  history[1:] = position.board
+  history[1:num_deltas_avail + 1] -= np.cumsum(position.board_deltas, axis=0)
+  # if no more deltas are available, just repeat oldest board.
+  history[num_deltas_avail + 1:] = history[num_deltas_avail]
+  return history
+
+
+def extract_features_batch(board_size, positions, histories=None, out=None):
+  """Extract NEW_FEATURES for many positions at once.
+
+  Equivalent to stacking extract_features(board_size, p) for each position,
+  but the stone planes of all positions are filled in with a single vectorized
+  comparison.
+
+  Args:
+    board_size: the go board size.
+    positions: a list of N go board statuses.
+    histories: optional list of N board histories (see board_history), or None
+      entries for positions whose history should be computed from scratch.
+    out: optional preallocated uint8 array of shape
+      [>=N, board_size, board_size, NEW_FEATURES_PLANES] to write into.
+
+  Returns:
+    A uint8 array of shape [N, board_size, board_size, NEW_FEATURES_PLANES].
+  """
+  num_positions = len(positions)
+  if out is None:
+    out = np.empty([num_positions, board_size, board_size,
+                    NEW_FEATURES_PLANES], dtype=np.uint8)
+  out = out[:num_positions]
+  if histories is None:
+    histories = [None] * num_positions
+
+  stacked = np.empty([num_positions, 8, board_size, board_size],
+                     dtype=np.int8)
+  to_play = np.empty([num_positions, 1, 1, 1], dtype=np.int8)
+  for i, (position, history) in enumerate(zip(positions, histories)):
+    if history is None:
+      history = board_history(board_size, position)
+    stacked[i] = history
+    to_play[i] = position.to_play
+
+  # Move the history axis last to line up with the feature planes.
+  stacked = np.transpose(stacked, [0, 2, 3, 1])
+  out[..., 0:16:2] = stacked == to_play
+  out[..., 1:16:2] = stacked == -to_play
+  out[..., 16] = (to_play[..., 0] == go.BLACK)
+  return out
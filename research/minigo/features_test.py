@@ -107,6 +107,38 @@ class TestFeatureExtraction(utils_test.MiniGoUnitTest):
       self.assertEqualNPArray(
           f[:, :, i], np.zeros([utils_test.BOARD_SIZE, utils_test.BOARD_SIZE]))
 
+  def test_board_history_from_parent(self):
+    parent = go.Position(utils_test.BOARD_SIZE)
+    parent_history = features.board_history(utils_test.BOARD_SIZE, parent)
+    for coord in ((0, 0), (0, 1), (0, 2), None, (0, 3), (1, 1), (2, 2), (3, 3),
+                  (4, 4), (5, 5)):
+      child = parent.play_move(coord)
+      child_history = features.board_history(
+          utils_test.BOARD_SIZE, child, parent_history)
+      self.assertEqualNPArray(
+          child_history, features.board_history(utils_test.BOARD_SIZE, child))
+      parent, parent_history = child, child_history
+
+  def test_extract_features_batch(self):
+    positions = [TEST_POSITION, TEST_POSITION2, TEST_POSITION3]
+    batch = features.extract_features_batch(utils_test.BOARD_SIZE, positions)
+    self.assertEqual(batch.shape, (3, 9, 9, features.NEW_FEATURES_PLANES))
+    for position, f in zip(positions, batch):
+      self.assertEqualNPArray(
+          f, features.extract_features(utils_test.BOARD_SIZE, position))
+
+  def test_extract_features_batch_with_histories(self):
+    positions = [TEST_POSITION, TEST_POSITION3]
+    histories = [None, features.board_history(
+        utils_test.BOARD_SIZE, TEST_POSITION3)]
+    out = np.zeros([4, 9, 9, features.NEW_FEATURES_PLANES], dtype=np.uint8)
+    batch = features.extract_features_batch(
+        utils_test.BOARD_SIZE, positions, histories=histories, out=out)
+    self.assertEqual(batch.shape, (2, 9, 9, features.NEW_FEATURES_PLANES))
+    for position, f in zip(positions, out[:2]):
+      self.assertEqualNPArray(
+          f, features.extract_features(utils_test.BOARD_SIZE, position))
+
 
 if __name__ == '__main__':
   tf.test.main()
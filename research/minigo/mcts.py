@@ -30,6 +30,7 @@ import collections
 import math
 
 import coords
+import features
 import numpy as np
 
 # Exploration constant
@@ -89,6 +90,20 @@ class MCTSNode(object):
                                    dtype=np.float32)
     self.child_prior = np.zeros([board_size * board_size + 1], dtype=np.float32)
     self.children = {}  # map of flattened moves to resulting MCTSNode
+    self._history = None  # last 8 board states, computed on first use
+
+  @property
+  def history(self):
+    """The last 8 board states of this node's position, most recent first.
+
+    Children are reached by playing a single move, so a child's history is
+    derived from its parent's cached history rather than replayed from deltas.
+    """
+    if self._history is None:
+      parent_history = getattr(self.parent, '_history', None)
+      self._history = features.board_history(
+          self.board_size, self.position, parent_history)
+    return self._history
 
   def __repr__(self):
     return '<MCTSNode move={}, N={}, to_play={}>'.format(
@@ -252,7 +252,8 @@ def evaluate(black_model_name, black_net, white_model_name, white_net,
 
   With two DualNetRunners to play as black and white in a Go match. Two models
   play several games, and the model that wins by a margin of 55% will be the
-  winner.
+  winner. Games are played concurrently with batched inference, and can stop
+  early once the result is statistically decided if enabled in params.
 
   Args:
     black_model_name: The name of the model playing black.
@@ -270,9 +271,16 @@ def evaluate(black_model_name, black_net, white_model_name, white_net,
       ValueError: if neither `WHITE` or `BLACK` is returned.
   """
   with utils.logged_timer('{} games'.format(params.eval_games)):
-    winner = evaluation.play_match(
-        params, black_net, white_net, params.eval_games,
-        params.eval_readouts, evaluate_dir, params.eval_verbose)
+    if params.eval_concurrent_games > 1:
+      winner = evaluation.play_match_concurrent(
+          params, black_net, white_net, params.eval_games,
+          params.eval_readouts, evaluate_dir, params.eval_verbose,
+          concurrent_games=params.eval_concurrent_games,
+          early_stop=params.eval_early_stop)
+    else:
+      winner = evaluation.play_match(
+          params, black_net, white_net, params.eval_games,
+          params.eval_readouts, evaluate_dir, params.eval_verbose)
 
   if winner != go.WHITE_NAME and winner != go.BLACK_NAME:
     raise ValueError('Winner should be either White or Black!')
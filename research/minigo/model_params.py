@@ -69,6 +69,16 @@ class MiniGoParams(object):
   eval_readouts = 100  # How many readouts to make per move in evaluation
   eval_verbose = 1  # How verbose the players should be in evaluation
   eval_win_rate = 0.55  # Winner needs to win by a margin of 55%.
+  # Games played at the same time, sharing batched inference. 1 plays the
+  # games one after another.
+  eval_concurrent_games = 8
+  # Stop evaluation once a sequential probability ratio test (SPRT) has
+  # decided whether black wins more than the (1 + eval_win_rate) / 2 of the
+  # games required above.
+  eval_early_stop = False
+  eval_sprt_margin = 0.05  # Half width of the SPRT's indifference region
+  eval_sprt_alpha = 0.05  # Chance of wrongly declaring black the winner
+  eval_sprt_beta = 0.05  # Chance of wrongly declaring white the winner
 
 
 class DummyMiniGoParams(MiniGoParams):
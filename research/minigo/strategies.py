@@ -167,6 +167,26 @@ class MCTSPlayerMixin(object):
     return coords.from_flat(self.board_size, fcoord)
 
   def tree_search(self, num_parallel=None):
+    leaves = self.select_leaves(num_parallel)
+    if leaves:
+      move_probs, values = self.network.run_many(
+          [leaf.position for leaf in leaves],
+          histories=[leaf.history for leaf in leaves])
+      self.incorporate_leaves(leaves, move_probs, values)
+
+  def select_leaves(self, num_parallel=None):
+    """Select up to num_parallel leaves to evaluate, with virtual losses.
+
+    tree_search evaluates the leaves right away; callers batching inference
+    across several players (see evaluation.play_match_concurrent) evaluate
+    them together and hand the results back through incorporate_leaves.
+
+    Args:
+      num_parallel: Number of leaves to select. Defaults to self.num_parallel.
+
+    Returns:
+      A list of MCTSNodes awaiting network evaluation.
+    """
     if num_parallel is None:
       num_parallel = self.num_parallel
     leaves = []
@@ -183,12 +203,13 @@ class MCTSPlayerMixin(object):
         continue
       leaf.add_virtual_loss(up_to=self.root)
       leaves.append(leaf)
-    if leaves:
-      move_probs, values = self.network.run_many(
-          [leaf.position for leaf in leaves])
-      for leaf, move_prob, value in zip(leaves, move_probs, values):
-        leaf.revert_virtual_loss(up_to=self.root)
-        leaf.incorporate_results(move_prob, value, up_to=self.root)
+    return leaves
+
+  def incorporate_leaves(self, leaves, move_probs, values):
+    """Back up network outputs for leaves returned by select_leaves."""
+    for leaf, move_prob, value in zip(leaves, move_probs, values):
+      leaf.revert_virtual_loss(up_to=self.root)
+      leaf.incorporate_results(move_prob, value, up_to=self.root)
 
   def show_path_to_root(self, node):
     max_depth = (self.board_size ** 2) * 1.4  # 505 moves for 19x19, 113 for 9x9
@@ -80,7 +80,7 @@ class DummyNet():
   def run(self, position):
     return self.fake_priors, self.fake_value
 
-  def run_many(self, positions):
+  def run_many(self, positions, histories=None):
     if not positions:
       raise ValueError(
           "No positions passed! (Tensorflow would have failed here.")
@@ -84,3 +84,80 @@ def randomize_symmetries_feat(features):
 def invert_symmetries_pi(board_size, symmetries, pis):
   return [apply_symmetry_pi(board_size, invert_symmetry(s), pi)
           for s, pi in zip(symmetries, pis)]
+
+
+@functools.lru_cache(maxsize=None)
+def symmetry_permutations(board_size):
+  """Precompute every symmetry as a permutation of flattened board indices.
+
+  Args:
+    board_size: the go board size.
+
+  Returns:
+    An int array of shape [len(SYMMETRIES), board_size * board_size], where
+    row i holds, for each flattened output point, the flattened input point
+    that SYMMETRIES[i] moves there.
+  """
+  indices = np.arange(board_size * board_size).reshape(board_size, board_size)
+  return np.stack([IMPLS[s](indices).ravel() for s in SYMMETRIES])
+
+
+def _symmetry_ids(symmetries):
+  return np.array([SYMMETRIES.index(s) for s in symmetries], dtype=np.int32)
+
+
+def apply_symmetries_feat_batch(symmetries, features):
+  """Apply one symmetry per example to a batch of features with one gather.
+
+  Args:
+    symmetries: a list of N symmetry names.
+    features: an array of shape [N, board_size, board_size, num_planes].
+
+  Returns:
+    An array with the same shape as features.
+  """
+  num, board_size = features.shape[0], features.shape[1]
+  perms = symmetry_permutations(board_size)[_symmetry_ids(symmetries)]
+  flat = features.reshape(num, board_size * board_size, -1)
+  return flat[np.arange(num)[:, np.newaxis], perms].reshape(features.shape)
+
+
+def apply_symmetries_pi_batch(board_size, symmetries, pis):
+  """Apply one symmetry per example to a batch of move probabilities.
+
+  Args:
+    board_size: the go board size.
+    symmetries: a list of N symmetry names.
+    pis: an array of shape [N, board_size * board_size + 1]; the pass move at
+      the end is left in place.
+
+  Returns:
+    An array with the same shape as pis.
+  """
+  pis = np.asarray(pis)
+  perms = symmetry_permutations(board_size)[_symmetry_ids(symmetries)]
+  result = np.empty_like(pis)
+  result[:, :-1] = pis[np.arange(len(pis))[:, np.newaxis], perms]
+  result[:, -1] = pis[:, -1]
+  return result
+
+
+def randomize_symmetries_feat_batch(features):
+  """Batched equivalent of randomize_symmetries_feat.
+
+  Args:
+    features: an array of shape [N, board_size, board_size, num_planes].
+
+  Returns:
+    symmetries_used, features: the list of N symmetry names applied and the
+      transformed features as a single array.
+  """
+  symmetries_used = [random.choice(SYMMETRIES) for _ in range(len(features))]
+  return symmetries_used, apply_symmetries_feat_batch(
+      symmetries_used, features)
+
+
+def invert_symmetries_pi_batch(board_size, symmetries, pis):
+  """Batched equivalent of invert_symmetries_pi."""
+  return apply_symmetries_pi_batch(
+      board_size, [invert_symmetry(s) for s in symmetries], pis)
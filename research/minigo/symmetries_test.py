@@ -114,6 +114,25 @@ class TestSymmetryOperations(utils_test.MiniGoUnitTest):
               transformed_board[
                   coords.from_flat(utils_test.BOARD_SIZE, new_coord)])
 
+  def test_batch_matches_single(self):
+    syms = symmetries.SYMMETRIES * 2
+    feats = np.random.random(
+        [len(syms), utils_test.BOARD_SIZE, utils_test.BOARD_SIZE, 3])
+    pis = np.random.random([len(syms), utils_test.BOARD_SIZE ** 2 + 1])
+    batch_feats = symmetries.apply_symmetries_feat_batch(syms, feats)
+    batch_pis = symmetries.apply_symmetries_pi_batch(
+        utils_test.BOARD_SIZE, syms, pis)
+    inverted_pis = symmetries.invert_symmetries_pi_batch(
+        utils_test.BOARD_SIZE, syms, batch_pis)
+    for i, s in enumerate(syms):
+      with self.subTest(symmetry=s):
+        self.assertEqualNPArray(
+            batch_feats[i], symmetries.apply_symmetry_feat(s, feats[i]))
+        self.assertEqualNPArray(
+            batch_pis[i], symmetries.apply_symmetry_pi(
+                utils_test.BOARD_SIZE, s, pis[i]))
+        self.assertEqualNPArray(inverted_pis[i], pis[i])
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -15,7 +15,9 @@
 
 """Replay buffer.
 
-Implements replay buffer in Python.
+Implements replay buffer in Python.  The prioritized replay buffer keeps its
+episodes in preallocated arrays and its sampling weights in a sum tree, so
+that sampling a batch and updating priorities take O(log N) per episode.
 """
 
 import random
@@ -70,7 +72,183 @@ class ReplayBuffer(object):
     pass
 
 
+class SegmentTree(object):
+  """Array-backed binary tree keeping the reduction of every subtree.
+
+  Leaves hold one value per buffer slot; each internal node holds
+  operation(left child, right child), so range reductions and updates
+  touch O(log N) nodes.
+  """
+
+  def __init__(self, size, operation, neutral):
+    self.capacity = 1
+    while self.capacity < size:
+      self.capacity *= 2
+    self.operation = operation
+    self.neutral = neutral
+    self.values = np.full(2 * self.capacity, neutral, dtype=np.float64)
+
+  def __getitem__(self, idxs):
+    return self.values[self.capacity + np.asarray(idxs)]
+
+  def __setitem__(self, idxs, values):
+    """Set leaves and recompute their ancestors, one tree level at a time."""
+    nodes = self.capacity + np.asarray(idxs, dtype=np.int64).ravel()
+    if not nodes.size:
+      return
+    self.values[nodes] = values
+    # Repeated parents are recomputed from the same children, so they need
+    # no deduplication.
+    nodes //= 2
+    while nodes[0] > 0:
+      self.values[nodes] = self.operation(self.values[2 * nodes],
+                                          self.values[2 * nodes + 1])
+      nodes //= 2
+
+  def root(self):
+    return self.values[1]
+
+  def reduce(self, start, end):
+    """Reduction of the leaves in [start, end)."""
+    result = self.neutral
+    start += self.capacity
+    end += self.capacity
+    while start < end:
+      if start & 1:
+        result = self.operation(result, self.values[start])
+        start += 1
+      if end & 1:
+        end -= 1
+        result = self.operation(result, self.values[end])
+      start //= 2
+      end //= 2
+    return result
+
+
+class SumTree(SegmentTree):
+
+  def __init__(self, size):
+    super(SumTree, self).__init__(size, np.add, 0.0)
+
+  def find_prefix_sum(self, masses):
+    """For each mass, find the leaf where the running sum of leaves passes it.
+
+    Zero-weight subtrees are never entered, so every returned leaf has
+    positive weight as long as the tree total is positive.
+    """
+    masses = np.array(masses, dtype=np.float64)
+    nodes = np.ones(len(masses), dtype=np.int64)
+    while nodes.size and nodes[0] < self.capacity:
+      left = 2 * nodes
+      left_sum = self.values[left]
+      go_right = (masses >= left_sum) & (self.values[left + 1] > 0)
+      go_right |= left_sum <= 0
+      masses = np.where(go_right, masses - left_sum, masses)
+      nodes = np.where(go_right, left + 1, left)
+    return nodes - self.capacity
+
+
+class MaxTree(SegmentTree):
+
+  def __init__(self, size, neutral=-np.inf):
+    super(MaxTree, self).__init__(size, np.maximum, neutral)
+
+
+class EpisodeStorage(object):
+  """Fixed number of episode slots backed by preallocated arrays.
+
+  An episode is [initial_state, observations, actions, rewards, terminated],
+  where observations and actions are lists of arrays with a leading time axis.
+  Each array of an episode goes into a [num_slots, capacity, ...] array whose
+  capacity grows to fit the longest episode seen, so episodes are copied once
+  when added and read back as views.
+  """
+
+  def __init__(self, num_slots):
+    self.num_slots = num_slots
+    self.capacity = 0
+    self.structure = None
+    self.fixed = None  # initial_state, terminated
+    self.sequences = None  # observations, actions, rewards
+    self.lengths = None
+
+  def _allocate(self, shape, dtype):
+    return np.zeros([self.num_slots] + list(shape), dtype=dtype)
+
+  def _fit(self, stored, value, time_axis):
+    """Returns stored, reallocated if needed to hold value."""
+    shape = value.shape[1:] if time_axis else value.shape
+    if stored is None:
+      if time_axis:
+        return self._allocate([self.capacity] + list(shape), value.dtype)
+      return self._allocate(shape, value.dtype)
+    stored_shape = stored.shape[2:] if time_axis else stored.shape[1:]
+    if tuple(stored_shape) != tuple(shape):
+      raise ValueError('Episode array of shape %s does not match stored '
+                       'shape %s' % (value.shape, stored.shape))
+    dtype = np.promote_types(stored.dtype, value.dtype)
+    if dtype != stored.dtype:
+      return stored.astype(dtype)
+    return stored
+
+  def _grow(self, length):
+    capacity = max(length, 2 * self.capacity)
+    for k, stored in enumerate(self.sequences):
+      if stored is not None:
+        grown = self._allocate([capacity] + list(stored.shape[2:]),
+                               stored.dtype)
+        grown[:, :self.capacity] = stored
+        self.sequences[k] = grown
+    self.capacity = capacity
+
+  def __setitem__(self, slot, episode):
+    initial_state, observations, actions, rewards, terminated = episode
+    structure = (len(observations), len(actions))
+    if self.structure is None:
+      self.structure = structure
+      self.fixed = [None, None]
+      self.sequences = [None] * (sum(structure) + 1)
+      self.lengths = np.zeros([self.num_slots, len(self.sequences)],
+                              dtype=np.int64)
+    elif structure != self.structure:
+      raise ValueError('Episode has %d observation and %d action arrays, '
+                       'expected %d and %d' % (structure + self.structure))
+
+    for k, value in enumerate([initial_state, terminated]):
+      value = np.asarray(value)
+      self.fixed[k] = self._fit(self.fixed[k], value, False)
+      self.fixed[k][slot] = value
+
+    for k, value in enumerate(list(observations) + list(actions) + [rewards]):
+      value = np.asarray(value)
+      if len(value) > self.capacity:
+        self._grow(len(value))
+      self.sequences[k] = self._fit(self.sequences[k], value, True)
+      self.sequences[k][slot, :len(value)] = value
+      self.lengths[slot, k] = len(value)
+
+  def __getitem__(self, slot):
+    lengths = self.lengths[slot]
+    sequences = [stored[slot, :length]
+                 for stored, length in zip(self.sequences, lengths)]
+    num_obs, num_act = self.structure
+    return [self.fixed[0][slot],
+            sequences[:num_obs],
+            sequences[num_obs:num_obs + num_act],
+            sequences[-1],
+            self.fixed[1][slot]]
+
+
 class PrioritizedReplayBuffer(ReplayBuffer):
+  """Replay buffer sampling episodes with probability ~ exp(alpha * priority).
+
+  The weight exp(alpha * priority - logit_ref) of every episode is kept in a
+  sum tree.  logit_ref is only moved, rebuilding the tree, when the largest
+  logit drifts more than LOGIT_SLACK away from it, which keeps the weights
+  finite without renormalizing on every update.
+  """
+
+  LOGIT_SLACK = 100.0
 
   def __init__(self, max_size, alpha=0.2,
                eviction_strategy='rand'):
@@ -81,10 +259,17 @@ class PrioritizedReplayBuffer(ReplayBuffer):
     self.remove_idx = 0
 
     self.cur_size = 0
-    self.buffer = {}
+    self.buffer = EpisodeStorage(self.max_size)
     self.priorities = np.zeros(self.max_size)
     self.init_length = 0
 
+    self.weights = SumTree(self.max_size)
+    self.logits = MaxTree(self.max_size)
+    # max of the priorities array, including the zeros of unused slots
+    self.max_priorities = MaxTree(self.max_size, neutral=0.0)
+    self.logit_ref = 0.0
+    self.last_batch = None
+
   def __len__(self):
     return self.cur_size
 
@@ -110,13 +295,30 @@ class PrioritizedReplayBuffer(ReplayBuffer):
       for new_idx, ep in zip(new_idxs, episodes):
         self.buffer[new_idx] = ep
 
-    self.priorities[new_idxs] = priorities
-    self.priorities[0:self.init_length] = np.max(
-        self.priorities[self.init_length:])
-
-    assert len(self.buffer) == self.cur_size
+    self.set_priorities(new_idxs, priorities)
     return new_idxs
 
+  def set_priorities(self, idxs, priorities):
+    """Set priorities of some slots; seed episodes get the max of the rest."""
+    idxs = np.asarray(idxs, dtype=np.int64).ravel()
+    self.priorities[idxs] = priorities
+    self.max_priorities[idxs] = self.priorities[idxs]
+    if self.init_length:
+      self.priorities[0:self.init_length] = self.max_priorities.reduce(
+          self.init_length, self.max_size)
+      idxs = np.union1d(idxs, np.arange(self.init_length))
+    self._update_weights(idxs[idxs < self.cur_size])
+
+  def _update_weights(self, idxs):
+    logits = self.alpha * self.priorities[idxs]
+    self.logits[idxs] = logits
+    max_logit = self.logits.root()
+    if abs(max_logit - self.logit_ref) > self.LOGIT_SLACK:
+      self.logit_ref = max_logit
+      idxs = np.arange(self.cur_size)
+      logits = self.alpha * self.priorities[idxs]
+    self.weights[idxs] = np.exp(logits - self.logit_ref)
+
   def remove_n(self, n):
     """Get n items for removal."""
     assert self.init_length + n <= self.cur_size
@@ -138,25 +340,57 @@ class PrioritizedReplayBuffer(ReplayBuffer):
     return idxs
 
   def sampling_distribution(self):
-    p = self.priorities[:self.cur_size]
-    p = np.exp(self.alpha * (p - np.max(p)))
+    p = self.weights[np.arange(self.cur_size)]
     norm = np.sum(p)
     if norm > 0:
-      uniform = 0.0
-      p = p / norm * (1 - uniform) + 1.0 / self.cur_size * uniform
+      p = p / norm
     else:
       p = np.ones(self.cur_size) / self.cur_size
     return p
 
+  def sample_idxs(self, n):
+    """Sample n distinct slots, like np.random.choice(replace=False).
+
+    The first occurrences in a sequence of independent draws are a sample
+    without replacement, so draws are made in vectorized rounds until n
+    distinct slots are found, zeroing the weights of the slots already chosen
+    whenever another round is needed.  The zeroed weights are restored before
+    returning, also when sampling fails.
+    """
+    total = self.weights.root()
+    chosen = []
+    chosen_set = set()
+    zeroed_idxs = []
+    zeroed_weights = []
+    try:
+      while True:
+        remaining = self.weights.root()
+        if remaining <= 0:
+          raise ValueError('Fewer non-zero entries in p than size')
+        draws = self.weights.find_prefix_sum(
+            np.random.random(n - len(chosen)) * remaining)
+        for idx in draws.tolist():
+          if idx not in chosen_set:
+            chosen_set.add(idx)
+            chosen.append(idx)
+        if len(chosen) == n:
+          break
+        new_idxs = chosen[len(zeroed_idxs):]
+        zeroed_weights.extend(self.weights[new_idxs].tolist())
+        zeroed_idxs.extend(new_idxs)
+        self.weights[new_idxs] = 0.0
+    finally:
+      self.weights[zeroed_idxs] = zeroed_weights
+
+    idxs = np.array(chosen, dtype=np.int64)
+    return idxs, self.weights[idxs] / total
+
   def get_batch(self, n):
     """Get batch of episodes to train on."""
-    p = self.sampling_distribution()
-    idxs = np.random.choice(self.cur_size, size=int(n), replace=False, p=p)
+    idxs, probs = self.sample_idxs(int(n))
     self.last_batch = idxs
-    return [self.buffer[idx] for idx in idxs], p[idxs]
+    return [self.buffer[idx] for idx in idxs], probs
 
   def update_last_batch(self, delta):
     """Update last batch idxs with new priority."""
-    self.priorities[self.last_batch] = np.abs(delta)
-    self.priorities[0:self.init_length] = np.max(
-        self.priorities[self.init_length:])
+    self.set_priorities(self.last_batch, np.abs(delta))
@@ -0,0 +1,138 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for replay_buffer."""
+
+import numpy as np
+import tensorflow as tf
+
+import replay_buffer
+
+
+def _episode(length):
+  return [np.zeros(4), [np.zeros([length, 3])], [np.zeros([length, 2])],
+          np.zeros(length), False]
+
+
+def _softmax(logits):
+  p = np.exp(logits - np.max(logits))
+  return p / np.sum(p)
+
+
+class SegmentTreeTest(tf.test.TestCase):
+
+  def testSumTree(self):
+    rng = np.random.RandomState(0)
+    values = rng.uniform(size=13)
+    values[[2, 3, 7]] = 0.0
+    tree = replay_buffer.SumTree(13)
+    tree[np.arange(13)] = values
+    values[[0, 5]] = [2.0, 0.5]
+    tree[[0, 5]] = [2.0, 0.5]
+
+    self.assertAllClose(values, tree[np.arange(13)])
+    self.assertAllClose(np.sum(values), tree.root())
+    for start, end in [(0, 13), (3, 9), (4, 5), (6, 6), (12, 13)]:
+      self.assertAllClose(np.sum(values[start:end]), tree.reduce(start, end))
+
+    masses = rng.uniform(size=1000) * np.sum(values)
+    expected = np.searchsorted(np.cumsum(values), masses, side='right')
+    self.assertAllEqual(expected, tree.find_prefix_sum(masses))
+    # Zero-weight leaves are never found, even at their boundaries.
+    boundaries = np.cumsum(values)[:-1]
+    self.assertAllEqual(
+        np.zeros(0, dtype=np.int64),
+        np.intersect1d(tree.find_prefix_sum(boundaries), [2, 3, 7]))
+
+  def testMaxTree(self):
+    rng = np.random.RandomState(1)
+    values = rng.normal(size=9)
+    tree = replay_buffer.MaxTree(9)
+    tree[np.arange(9)] = values
+    values[4] = 10.0
+    tree[4] = 10.0
+
+    self.assertAllClose(np.max(values), tree.root())
+    for start, end in [(0, 9), (1, 4), (5, 9), (8, 9)]:
+      self.assertAllClose(np.max(values[start:end]), tree.reduce(start, end))
+    self.assertEqual(-np.inf, tree.reduce(3, 3))
+    self.assertEqual(0.0, replay_buffer.MaxTree(9, neutral=0.0).reduce(3, 3))
+
+
+class PrioritizedReplayBufferTest(tf.test.TestCase):
+
+  def _make_buffer(self, priorities, alpha=0.5):
+    buf = replay_buffer.PrioritizedReplayBuffer(len(priorities), alpha=alpha)
+    buf.add([_episode(i + 1) for i in range(len(priorities))], priorities)
+    return buf
+
+  def testSamplingDistributionIsSoftmax(self):
+    priorities = np.array([0.0, 1.0, 3.0, 2.0, 0.5])
+    buf = self._make_buffer(priorities)
+    self.assertAllClose(_softmax(0.5 * priorities), buf.sampling_distribution())
+
+  def testSampledFrequencies(self):
+    np.random.seed(0)
+    priorities = np.array([0.0, 1.0, 3.0, 2.0, 0.5])
+    buf = self._make_buffer(priorities)
+    expected = _softmax(0.5 * priorities)
+
+    num_draws = 20000
+    counts = np.zeros(len(priorities))
+    for _ in range(num_draws):
+      idxs, probs = buf.sample_idxs(1)
+      counts[idxs] += 1
+      self.assertAllClose(expected[idxs], probs)
+    # Within 4 standard deviations of the binomial counts.
+    tolerance = 4 * np.sqrt(expected * (1 - expected) / num_draws)
+    self.assertTrue(np.all(np.abs(counts / num_draws - expected) < tolerance))
+
+  def testSampleWithoutReplacement(self):
+    np.random.seed(1)
+    priorities = np.array([0.0, 5.0, 3.0, 2.0, 0.5, 1.0])
+    buf = self._make_buffer(priorities, alpha=1.0)
+    weights = buf.weights[np.arange(6)]
+    for _ in range(100):
+      idxs, probs = buf.sample_idxs(5)
+      self.assertEqual(5, len(set(idxs.tolist())))
+      self.assertAllClose(_softmax(priorities)[idxs], probs)
+      # The weights zeroed between rounds are restored.
+      self.assertAllClose(weights, buf.weights[np.arange(6)])
+
+  def testWeightsRestoredWhenSamplingFails(self):
+    priorities = np.array([1.0, 2.0, 3.0])
+    buf = self._make_buffer(priorities)
+    weights = buf.weights[np.arange(3)]
+    buf.weights[[2]] = [0.0]
+    with self.assertRaises(ValueError):
+      buf.sample_idxs(3)
+    buf.weights[[2]] = weights[2:]
+    self.assertAllClose(weights, buf.weights[np.arange(3)])
+    self.assertAllClose(np.sum(weights), buf.weights.root())
+
+  def testGetBatchAndUpdate(self):
+    np.random.seed(2)
+    buf = self._make_buffer(np.zeros(4))
+    episodes, probs = buf.get_batch(2)
+    self.assertEqual(2, len(episodes))
+    self.assertAllClose([0.25, 0.25], probs)
+    buf.update_last_batch([4.0, -4.0])
+    expected = np.zeros(4)
+    expected[buf.last_batch] = 4.0
+    self.assertAllClose(_softmax(0.5 * expected), buf.sampling_distribution())
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -30,9 +30,6 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import collections
-
-
 import numpy as np
 import tensorflow as tf
 
@@ -68,17 +65,18 @@ class EncoderManager(object):
 
     tf.logging.info("Loading embedding matrix from %s", embedding_matrix_file)
     # Note: tf.gfile.GFile doesn't work here because np.load() calls f.seek()
-    # with 3 arguments.
-    embedding_matrix = np.load(embedding_matrix_file)
+    # with 3 arguments. The matrix is memory mapped, so only the rows of words
+    # that are encoded are read.
+    embedding_matrix = np.load(embedding_matrix_file, mmap_mode="r")
     tf.logging.info("Loaded embedding matrix with shape %s",
                     embedding_matrix.shape)
 
-    word_embeddings = collections.OrderedDict(
-        zip(reverse_vocab, embedding_matrix))
+    word_ids = dict((w, i) for i, w in enumerate(reverse_vocab))
 
     g = tf.Graph()
     with g.as_default():
-      encoder = skip_thoughts_encoder.SkipThoughtsEncoder(word_embeddings)
+      encoder = skip_thoughts_encoder.SkipThoughtsEncoder(
+          word_ids, embedding_matrix=embedding_matrix)
       restore_model = encoder.build_graph_from_config(model_config,
                                                       checkpoint_path)
 
@@ -93,7 +91,8 @@ class EncoderManager(object):
              use_norm=True,
              verbose=False,
              batch_size=128,
-             use_eos=False):
+             use_eos=False,
+             bucket_by_length=False):
     """Encodes a sequence of sentences as skip-thought vectors.
 
     Args:
@@ -102,6 +101,8 @@ class EncoderManager(object):
       verbose: Whether to log every batch.
       batch_size: Batch size for the RNN encoders.
       use_eos: If True, append the end-of-sentence word to each input sentence.
+      bucket_by_length: If True, batch sentences of similar length together to
+        reduce padding. The output is in the same order either way.
 
     Returns:
       thought_vectors: A list of numpy arrays corresponding to 'data'.
@@ -123,7 +124,8 @@ class EncoderManager(object):
                   use_norm=use_norm,
                   verbose=verbose,
                   batch_size=batch_size,
-                  use_eos=use_eos)))
+                  use_eos=use_eos,
+                  bucket_by_length=bucket_by_length)))
 
     return np.concatenate(encoded, axis=1)
 
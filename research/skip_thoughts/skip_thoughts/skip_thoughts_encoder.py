@@ -30,11 +30,14 @@ from __future__ import division
 from __future__ import print_function
 
 import os.path
+import threading
+import time
 
 
 import nltk
 import nltk.tokenize
 import numpy as np
+from six.moves import queue
 import tensorflow as tf
 
 from skip_thoughts import skip_thoughts_model
@@ -94,14 +97,19 @@ def _batch_and_pad(sequences):
 class SkipThoughtsEncoder(object):
   """Skip-thoughts sentence encoder."""
 
-  def __init__(self, embeddings):
+  def __init__(self, embeddings, embedding_matrix=None):
     """Initializes the encoder.
 
     Args:
-      embeddings: Dictionary of word to embedding vector (1D numpy array).
+      embeddings: Dictionary of word to embedding vector (1D numpy array), or
+        of word to row index of embedding_matrix if that is given.
+      embedding_matrix: Optional numpy array of shape [vocab_size,
+        embedding_dim], e.g. memory mapped from an embeddings file so that
+        rows are only read when looked up.
     """
     self._sentence_detector = nltk.data.load("tokenizers/punkt/english.pickle")
     self._embeddings = embeddings
+    self._embedding_matrix = embedding_matrix
 
   def _create_restore_fn(self, checkpoint_path, saver):
     """Creates a function that restores a model from checkpoint.
@@ -192,7 +200,10 @@ class SkipThoughtsEncoder(object):
 
   def _word_to_embedding(self, w):
     """Returns the embedding of a word."""
-    return self._embeddings.get(w, self._embeddings[special_words.UNK])
+    embedding = self._embeddings.get(w, self._embeddings[special_words.UNK])
+    if self._embedding_matrix is not None:
+      embedding = self._embedding_matrix[embedding]
+    return embedding
 
   def _preprocess(self, data, use_eos):
     """Preprocesses text for the encoder.
@@ -213,28 +224,147 @@ class SkipThoughtsEncoder(object):
       preprocessed_data.append([self._word_to_embedding(w) for w in tokenized])
     return preprocessed_data
 
+  def _bucketed_batches(self, data, use_eos, batch_size, bucket_batches):
+    """Yields batches of sentences of similar length.
+
+    Args:
+      data: A list of input strings.
+      use_eos: Whether to append the end-of-sentence word to each sentence.
+      batch_size: Batch size for the encoder.
+      bucket_batches: Number of batches of sentences to read ahead and sort by
+        length.
+
+    Yields:
+      (indices, embeddings, mask) tuples, where indices holds the positions in
+      data of the sentences of the batch, and embeddings and mask are as
+      returned by _batch_and_pad().
+    """
+    chunk_size = batch_size * bucket_batches
+    for chunk_start in range(0, len(data), chunk_size):
+      chunk = self._preprocess(data[chunk_start:chunk_start + chunk_size],
+                               use_eos)
+      order = np.argsort([len(seq) for seq in chunk], kind="mergesort")
+      for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        embeddings, mask = _batch_and_pad([chunk[i] for i in indices])
+        yield chunk_start + indices, embeddings, mask
+
+  def _encode_bucketed(self, sess, data, verbose, batch_size, use_eos,
+                       bucket_batches):
+    """Encodes sentences in batches of sentences of similar length.
+
+    The batches are prepared by a background thread while the session runs.
+    Arguments are as in encode().
+
+    Returns:
+      thought_vectors: A numpy array of the skip-thought encodings of the
+        sentences in 'data', in the same order.
+    """
+    data = list(data)
+    batch_queue = queue.Queue(maxsize=4)
+    stop = threading.Event()
+    errors = []
+
+    def _put(item):
+      """Queues item unless stopped, returning whether it was queued."""
+      while not stop.is_set():
+        try:
+          batch_queue.put(item, timeout=0.1)
+          return True
+        except queue.Full:
+          pass
+      return False
+
+    def _prepare_batches():
+      try:
+        for batch in self._bucketed_batches(data, use_eos, batch_size,
+                                            bucket_batches):
+          if not _put(batch):
+            return
+      except Exception as e:  # pylint: disable=broad-except
+        errors.append(e)
+      _put(None)
+
+    thread = threading.Thread(target=_prepare_batches)
+    thread.daemon = True
+    thread.start()
+
+    thought_vectors = None
+    num_batches = (len(data) + batch_size - 1) // batch_size
+    batch = 0
+    try:
+      while True:
+        item = batch_queue.get()
+        if item is None:
+          break
+        indices, embeddings, mask = item
+        if verbose:
+          tf.logging.info("Batch %d / %d.", batch, num_batches)
+        batch += 1
+
+        feed_dict = {
+            "encode_emb:0": embeddings,
+            "encode_mask:0": mask,
+        }
+        batch_vectors = sess.run("encoder/thought_vectors:0",
+                                 feed_dict=feed_dict)
+        if thought_vectors is None:
+          thought_vectors = np.zeros(
+              [len(data), batch_vectors.shape[1]], dtype=batch_vectors.dtype)
+        thought_vectors[indices] = batch_vectors
+    finally:
+      # Stops the thread if sess.run() raised.
+      stop.set()
+      thread.join()
+    if errors:
+      raise errors[0]
+
+    if thought_vectors is None:
+      thought_vectors = np.zeros([0, 0], dtype=np.float32)
+    return thought_vectors
+
   def encode(self,
              sess,
              data,
              use_norm=True,
              verbose=True,
              batch_size=128,
-             use_eos=False):
+             use_eos=False,
+             bucket_by_length=False,
+             bucket_batches=100):
     """Encodes a sequence of sentences as skip-thought vectors.
 
     Args:
       sess: TensorFlow Session.
-      data: A list of input strings.
+      data: A list or other iterable of input strings.
       use_norm: Whether to normalize skip-thought vectors to unit L2 norm.
       verbose: Whether to log every batch.
       batch_size: Batch size for the encoder.
       use_eos: Whether to append the end-of-sentence word to each input
         sentence.
+      bucket_by_length: Whether to batch sentences of similar length together
+        to reduce padding, preparing batches in a background thread while the
+        encoder runs. The output is in the same order either way.
+      bucket_batches: Number of batches of sentences to read ahead and sort by
+        length if bucket_by_length is True.
 
     Returns:
       thought_vectors: A list of numpy arrays corresponding to the skip-thought
         encodings of sentences in 'data'.
     """
+    if bucket_by_length:
+      start_time = time.time()
+      thought_vectors = self._encode_bucketed(sess, data, verbose, batch_size,
+                                              use_eos, bucket_batches)
+      num_sentences = len(thought_vectors)
+      tf.logging.info("Encoded %d sentences (%.1f sentences/sec).",
+                      num_sentences,
+                      num_sentences / max(time.time() - start_time, 1e-6))
+      if use_norm:
+        thought_vectors /= np.linalg.norm(thought_vectors, axis=1,
+                                          keepdims=True)
+      return list(thought_vectors)
+
     data = self._preprocess(data, use_eos)
     thought_vectors = []
 
@@ -0,0 +1,107 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for tensorflow_models.skip_thoughts.skip_thoughts_encoder."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from skip_thoughts import skip_thoughts_encoder
+from skip_thoughts.data import special_words
+
+
+class SkipThoughtsEncoder(skip_thoughts_encoder.SkipThoughtsEncoder):
+  """Subclass of SkipThoughtsEncoder which tokenizes on whitespace."""
+
+  def __init__(self, embeddings):  # pylint: disable=super-init-not-called
+    self._embeddings = embeddings
+    self._embedding_matrix = None
+
+  def _tokenize(self, item):
+    return item.split()
+
+
+class FakeSession(object):
+  """Encodes a batch as the masked sum and length of its word embeddings."""
+
+  def __init__(self, fail_after=None):
+    self.num_runs = 0
+    self._fail_after = fail_after
+
+  def run(self, fetches, feed_dict):
+    assert fetches == "encoder/thought_vectors:0"
+    if self.num_runs == self._fail_after:
+      raise RuntimeError("Session failed.")
+    self.num_runs += 1
+    embeddings = feed_dict["encode_emb:0"]
+    mask = feed_dict["encode_mask:0"]
+    summed = np.sum(embeddings * mask[:, :, None], axis=1)
+    return np.hstack([summed, np.sum(mask, axis=1, keepdims=True)])
+
+
+class SkipThoughtsEncoderTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(SkipThoughtsEncoderTest, self).setUp()
+    rng = np.random.RandomState(0)
+    words = ["w%d" % i for i in range(10)] + [special_words.EOS,
+                                              special_words.UNK]
+    self._encoder = SkipThoughtsEncoder(
+        dict((w, rng.randn(3)) for w in words))
+    self._data = [
+        " ".join("w%d" % rng.randint(12) for _ in range(rng.randint(1, 15)))
+        for _ in range(50)
+    ]
+
+  def testBucketedEncodingMatchesUnbucketed(self):
+    for use_eos in [False, True]:
+      expected = self._encoder.encode(
+          FakeSession(), self._data, verbose=False, batch_size=4,
+          use_eos=use_eos)
+      # A generator of the input, read ahead 3 batches at a time.
+      actual = self._encoder.encode(
+          FakeSession(), (item for item in self._data), verbose=False,
+          batch_size=4, use_eos=use_eos, bucket_by_length=True,
+          bucket_batches=3)
+      self.assertEqual(len(self._data), len(actual))
+      self.assertAllClose(expected, actual)
+
+  def testBucketedEncodingKeepsInputOrder(self):
+    vectors = self._encoder.encode(
+        FakeSession(), self._data, use_norm=False, verbose=False,
+        batch_size=4, bucket_by_length=True, bucket_batches=3)
+    self.assertEqual([len(item.split()) for item in self._data],
+                     [int(v[-1]) for v in vectors])
+
+  def testSessionErrorStopsBatchThread(self):
+    num_threads = threading.active_count()
+    with self.assertRaises(RuntimeError):
+      self._encoder.encode(
+          FakeSession(fail_after=1), self._data, verbose=False, batch_size=2,
+          bucket_by_length=True, bucket_batches=1)
+    self.assertEqual(num_threads, threading.active_count())
+
+  def testEmptyInput(self):
+    self.assertEqual([], self._encoder.encode(
+        FakeSession(), [], verbose=False, bucket_by_length=True))
+
+
+if __name__ == "__main__":
+  tf.test.main()
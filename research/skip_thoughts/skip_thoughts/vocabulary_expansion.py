@@ -44,7 +44,6 @@ import os.path
 
 import gensim.models
 import numpy as np
-import sklearn.linear_model
 import tensorflow as tf
 
 FLAGS = tf.flags.FLAGS
@@ -63,6 +62,9 @@ tf.flags.DEFINE_string("word2vec_model", None,
 
 tf.flags.DEFINE_string("output_dir", None, "Output directory.")
 
+tf.flags.DEFINE_integer("batch_size", 100000,
+                        "Number of word2vec embeddings to project at once.")
+
 tf.logging.set_verbosity(tf.logging.INFO)
 
 
@@ -116,7 +118,8 @@ def _load_vocabulary(filename):
   return vocab
 
 
-def _expand_vocabulary(skip_thoughts_emb, skip_thoughts_vocab, word2vec):
+def _expand_vocabulary(skip_thoughts_emb, skip_thoughts_vocab, word2vec,
+                       embeddings_file, batch_size=100000):
   """Runs vocabulary expansion on a skip-thoughts model using a word2vec model.
 
   Args:
@@ -124,9 +127,13 @@ def _expand_vocabulary(skip_thoughts_emb, skip_thoughts_vocab, word2vec):
         skip_thoughts_embedding_dim].
     skip_thoughts_vocab: A dictionary of word to id.
     word2vec: An instance of gensim.models.Word2Vec.
+    embeddings_file: Path of the .npy file to write the float32 embedding
+        matrix of the expanded vocabulary to.
+    batch_size: Number of word2vec embeddings to project at once.
 
   Returns:
-    combined_emb: A dictionary mapping words to embedding vectors.
+    combined_vocab: A list of the words of the expanded vocabulary, in the
+        order of the rows of the embedding matrix.
   """
   # Find words shared between the two vocabularies.
   tf.logging.info("Finding shared words")
@@ -139,26 +146,40 @@ def _expand_vocabulary(skip_thoughts_emb, skip_thoughts_vocab, word2vec):
   ]]
   shared_w2v_emb = word2vec[shared_words]
 
-  # Train a linear regression model on the shared embedding vectors.
+  # Solve the linear regression (with a bias term) on the shared embedding
+  # vectors by least squares.
   tf.logging.info("Training linear regression model")
-  model = sklearn.linear_model.LinearRegression()
-  model.fit(shared_w2v_emb, shared_st_emb)
+  shared_w2v_emb = np.hstack(
+      [shared_w2v_emb, np.ones([len(shared_words), 1], shared_w2v_emb.dtype)])
+  weights = np.linalg.lstsq(shared_w2v_emb, shared_st_emb, rcond=-1)[0]
 
-  # Create the expanded vocabulary.
+  # Create the expanded vocabulary. Words with underscores (spaces) are
+  # ignored, and words of the skip-thoughts vocabulary keep their embeddings.
   tf.logging.info("Creating embeddings for expanded vocabuary")
-  combined_emb = collections.OrderedDict()
-  for w in word2vec.vocab:
-    # Ignore words with underscores (spaces).
-    if "_" not in w:
-      w_emb = model.predict(word2vec[w].reshape(1, -1))
-      combined_emb[w] = w_emb.reshape(-1)
-
-  for w in skip_thoughts_vocab:
-    combined_emb[w] = skip_thoughts_emb[skip_thoughts_vocab[w]]
+  w2v_words = [w for w in word2vec.vocab if "_" not in w]
+  w2v_word_set = set(w2v_words)
+  combined_vocab = w2v_words + [
+      w for w in skip_thoughts_vocab if w not in w2v_word_set]
+
+  combined_emb = np.lib.format.open_memmap(
+      embeddings_file, mode="w+", dtype=np.float32,
+      shape=(len(combined_vocab), skip_thoughts_emb.shape[1]))
+  for start in range(0, len(w2v_words), batch_size):
+    w2v_emb = word2vec[w2v_words[start:start + batch_size]]
+    combined_emb[start:start + len(w2v_emb)] = (
+        np.dot(w2v_emb, weights[:-1]) + weights[-1])
+
+  st_rows = [i for i, w in enumerate(combined_vocab) if w in skip_thoughts_vocab]
+  combined_emb[st_rows] = skip_thoughts_emb[[
+      skip_thoughts_vocab[combined_vocab[i]] for i in st_rows
+  ]]
+  combined_emb.flush()
+  del combined_emb
 
-  tf.logging.info("Created expanded vocabulary of %d words", len(combined_emb))
+  tf.logging.info("Created expanded vocabulary of %d words",
+                  len(combined_vocab))
 
-  return combined_emb
+  return combined_vocab
 
 
 def main(unused_argv):
@@ -182,22 +203,19 @@ def main(unused_argv):
   word2vec = gensim.models.Word2Vec.load_word2vec_format(
       FLAGS.word2vec_model, binary=True)
 
-  # Run vocabulary expansion.
-  embedding_map = _expand_vocabulary(skip_thoughts_emb, skip_thoughts_vocab,
-                                     word2vec)
+  # Run vocabulary expansion. The embedding matrix is written directly to a
+  # memory mapped file, so it must be on a local file system.
+  embeddings_file = os.path.join(FLAGS.output_dir, "embeddings.npy")
+  vocab = _expand_vocabulary(skip_thoughts_emb, skip_thoughts_vocab, word2vec,
+                             embeddings_file, batch_size=FLAGS.batch_size)
+  tf.logging.info("Wrote embeddings file to %s", embeddings_file)
 
-  # Save the output.
-  vocab = embedding_map.keys()
+  # Save the vocabulary.
   vocab_file = os.path.join(FLAGS.output_dir, "vocab.txt")
   with tf.gfile.GFile(vocab_file, "w") as f:
     f.write("\n".join(vocab))
   tf.logging.info("Wrote vocabulary file to %s", vocab_file)
 
-  embeddings = np.array(embedding_map.values())
-  embeddings_file = os.path.join(FLAGS.output_dir, "embeddings.npy")
-  np.save(embeddings_file, embeddings)
-  tf.logging.info("Wrote embeddings file to %s", embeddings_file)
-
 
 if __name__ == "__main__":
   tf.app.run()
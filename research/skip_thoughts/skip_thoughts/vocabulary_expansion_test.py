@@ -0,0 +1,99 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for tensorflow_models.skip_thoughts.vocabulary_expansion."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from skip_thoughts import vocabulary_expansion
+
+
+class FakeWord2Vec(object):
+  """Mimics the vocab and lookups of gensim.models.Word2Vec."""
+
+  def __init__(self, words, embeddings):
+    self.vocab = collections.OrderedDict((w, None) for w in words)
+    self._ids = dict((w, i) for i, w in enumerate(words))
+    self._embeddings = embeddings
+
+  def __getitem__(self, words):
+    if isinstance(words, list):
+      return self._embeddings[[self._ids[w] for w in words]]
+    return self._embeddings[self._ids[words]]
+
+
+def _per_word_expansion(skip_thoughts_emb, skip_thoughts_vocab, word2vec):
+  """Expands the vocabulary with a regression fit and applied word by word."""
+  shared_words = [w for w in word2vec.vocab if w in skip_thoughts_vocab]
+  x = word2vec[shared_words].astype(np.float64)
+  y = skip_thoughts_emb[[skip_thoughts_vocab[w] for w in shared_words]]
+  # Ordinary least squares with an intercept, fit on the centered data.
+  weights = np.dot(np.linalg.pinv(x - x.mean(axis=0)), y - y.mean(axis=0))
+  bias = y.mean(axis=0) - np.dot(x.mean(axis=0), weights)
+
+  combined_emb = collections.OrderedDict()
+  for w in word2vec.vocab:
+    if "_" not in w:
+      combined_emb[w] = np.dot(word2vec[w], weights) + bias
+  for w in skip_thoughts_vocab:
+    combined_emb[w] = skip_thoughts_emb[skip_thoughts_vocab[w]]
+  return combined_emb
+
+
+class VocabularyExpansionTest(tf.test.TestCase):
+
+  def testMatchesPerWordRegression(self):
+    rng = np.random.RandomState(0)
+    w2v_words = ["w%d" % i for i in range(40)] + ["new_york", "w40"]
+    st_words = ["w%d" % i for i in range(0, 60, 3)] + ["<eos>", "<unk>"]
+    word2vec = FakeWord2Vec(w2v_words, rng.randn(len(w2v_words), 6))
+    skip_thoughts_vocab = collections.OrderedDict(
+        (w, i) for i, w in enumerate(st_words))
+    skip_thoughts_emb = rng.randn(len(st_words), 4).astype(np.float32)
+
+    embeddings_file = os.path.join(self.get_temp_dir(), "embeddings.npy")
+    # A batch size which does not divide the number of word2vec words.
+    vocab = vocabulary_expansion._expand_vocabulary(  # pylint: disable=protected-access
+        skip_thoughts_emb, skip_thoughts_vocab, word2vec, embeddings_file,
+        batch_size=7)
+    expected = _per_word_expansion(skip_thoughts_emb, skip_thoughts_vocab,
+                                   word2vec)
+
+    # The rows are in the order of the word2vec words without underscores,
+    # then of the skip-thoughts words which are not among them.
+    self.assertEqual(list(expected), vocab)
+    self.assertEqual(w2v_words[:40] + ["w40"], vocab[:41])
+    self.assertEqual(["w42", "w45", "w48", "w51", "w54", "w57", "<eos>",
+                      "<unk>"], vocab[41:])
+
+    embeddings = np.load(embeddings_file, mmap_mode="r")
+    self.assertEqual(np.float32, embeddings.dtype)
+    self.assertEqual((len(vocab), 4), embeddings.shape)
+    self.assertAllClose(np.array(list(expected.values())), embeddings,
+                        rtol=1e-5, atol=1e-5)
+    # Shared words keep their skip-thoughts embeddings.
+    self.assertAllEqual(skip_thoughts_emb[skip_thoughts_vocab["w3"]],
+                        embeddings[vocab.index("w3")])
+
+
+if __name__ == "__main__":
+  tf.test.main()
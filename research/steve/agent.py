@@ -119,7 +119,8 @@ class AgentManager(object):
     self.first = True
     return True
 
-def main(proc_num, evaluation, policy_replay_frame_queue, model_replay_frame_queue, policy_lock, config):
+def main(proc_num, evaluation, policy_replay_frame_queue, model_replay_frame_queue, policy_lock, config,
+         policy_replay_buffer=None, model_replay_buffer=None):
   try:
     np.random.seed((proc_num * int(time.time())) % (2 ** 32 - 1))
     agentmanager = AgentManager(proc_num, evaluation, policy_lock, config["evaluator_config"]["batch_size"] if evaluation else config["agent_config"]["batch_size"], config)
@@ -127,8 +128,13 @@ def main(proc_num, evaluation, policy_replay_frame_queue, model_replay_frame_que
     while True:
       new_frames = agentmanager.step()
       if not evaluation:
-        policy_replay_frame_queue.put(new_frames)
-        if model_replay_frame_queue is not None: model_replay_frame_queue.put(new_frames)
+        if policy_replay_buffer is not None:
+          # write straight into the learners' shared memory replay buffers
+          policy_replay_buffer.add_frames(new_frames)
+          if model_replay_buffer is not None: model_replay_buffer.add_frames(new_frames)
+        else:
+          policy_replay_frame_queue.put(new_frames)
+          if model_replay_frame_queue is not None: model_replay_frame_queue.put(new_frames)
         if frame_i % config["agent_config"]["reload_every_n"] == 0: agentmanager.reload()
         frame_i += len(new_frames)
 
@@ -30,7 +30,9 @@ class Learner(object):
     Generic object which runs the main training loop of anything that trains using
     a replay buffer. Handles updating, logging, saving/loading, batching, etc.
     """
-    def __init__(self, interactor_queue, lock, config, env_config, learner_config, **bonus_kwargs):
+    SHARED_REPLAY_POLL_SECS = 0.1
+
+    def __init__(self, interactor_queue, lock, config, env_config, learner_config, replay_buffer=None, **bonus_kwargs):
         self.learner_name = self.learner_name()
         self.interactor_queue = interactor_queue
         self.learner_lock = lock
@@ -47,11 +49,14 @@ class Learner(object):
         self.save_path = util.create_directory("%s/%s/%s/%s" % (self.config["output_root"], self.config["env"]["name"], self.config["name"], self.config["save_model_path"]))
         self.log_path = util.create_directory("%s/%s/%s/%s" % (self.config["output_root"], self.config["env"]["name"], self.config["name"],  self.config["log_path"])) + "/%s.log" % self.learner_name
 
-        # replay buffer to store data
+        # replay buffer to store data; a shared replay buffer is written to directly by the agents
         self.replay_buffer_lock = threading.RLock()
-        self.replay_buffer = ReplayBuffer(self.learner_config["replay_size"],
-                                          np.prod(self.env_config["obs_dims"]),
-                                          self.env_config["action_dim"])
+        if replay_buffer is None:
+            self.replay_buffer = ReplayBuffer(self.learner_config["replay_size"],
+                                              np.prod(self.env_config["obs_dims"]),
+                                              self.env_config["action_dim"])
+        else:
+            self.replay_buffer = replay_buffer
 
         # data loaders pull data from the replay buffer and put it into the tfqueue for model usage
         self.data_loaders = self.make_loader_placeholders()
@@ -125,6 +130,12 @@ class Learner(object):
         gathered_frames = self.total_frames - self.learner_config["frames_before_learning"]
         return gathered_frames > self.learner_config["frames_per_update"] * self.update_i
 
+    def _shared_replay_frame_limit(self, frames_before_terminate):
+        # the agents may write until the learner has the frames it needs, as checked by _have_enough_frames
+        if frames_before_terminate: return frames_before_terminate
+        if self.learner_config["frames_per_update"] is False: return None
+        return int(np.floor(self.learner_config["frames_before_learning"] + self.learner_config["frames_per_update"] * self.update_i)) + 1
+
     def _initialize(self):
         self.epoch = 0
         self.update_i = 0
@@ -196,6 +207,13 @@ class Learner(object):
         while not self.kill_threads:
             if self.learner_config["frames_per_update"] is not False and not continuous_poll:
                 with self.need_frames_notification: self.need_frames_notification.wait()
+            if self.interactor_queue is None:
+                # the agents write straight into the shared replay buffer, so let them write the frames needed next
+                # and track its count
+                self.replay_buffer.set_frame_limit(self._shared_replay_frame_limit(frames_before_terminate))
+                self.total_frames = self.replay_buffer.wait_for_count(self.total_frames + 1, self.SHARED_REPLAY_POLL_SECS)
+                if frames_before_terminate and self.total_frames >= frames_before_terminate: return
+                continue
             while not self.interactor_queue.empty():
                 new_frames = self.interactor_queue.get()
                 self._add_frames(new_frames)
@@ -16,6 +16,7 @@ from builtins import range
 # ==============================================================================
 
 import multiprocessing
+import numpy as np
 import os, sys, time
 
 from config import config, log_config
@@ -24,12 +25,13 @@ import util
 AGENT_COUNT = config["agent_config"]["count"]
 EVALUATOR_COUNT = config["evaluator_config"]["count"]
 MODEL_AUGMENTED = config["model_config"] is not False
+SHARED_REPLAY = config["shared_replay"]
 if config["resume"]:
   ROOT_PATH = "output/" + config["env"]["name"] + "/" + config["name"]
 else:
   ROOT_PATH = util.create_and_wipe_directory("output/" + config["env"]["name"] + "/" + config["name"])
 log_config()
-import learner, agent, valuerl_learner
+import learner, agent, replay, valuerl_learner
 if MODEL_AUGMENTED: import worldmodel_learner
 
 if __name__ == '__main__':
@@ -40,29 +42,38 @@ if __name__ == '__main__':
   policy_lock = multiprocessing.Lock()
   model_lock = multiprocessing.Lock() if MODEL_AUGMENTED else None
 
-  # queue
-  policy_replay_frame_queue = multiprocessing.Queue(1)
-  model_replay_frame_queue = multiprocessing.Queue(1) if MODEL_AUGMENTED else None
+  # queue, or shared memory replay buffers that the agents write into directly
+  if SHARED_REPLAY:
+    obs_dim = np.prod(config["env"]["obs_dims"])
+    policy_replay_buffer = replay.SharedReplayBuffer(config["policy_config"]["replay_size"], obs_dim, config["env"]["action_dim"])
+    model_replay_buffer = replay.SharedReplayBuffer(config["model_config"]["replay_size"], obs_dim, config["env"]["action_dim"]) if MODEL_AUGMENTED else None
+    policy_replay_frame_queue = None
+    model_replay_frame_queue = None
+  else:
+    policy_replay_buffer = None
+    model_replay_buffer = None
+    policy_replay_frame_queue = multiprocessing.Queue(1)
+    model_replay_frame_queue = multiprocessing.Queue(1) if MODEL_AUGMENTED else None
 
   # interactors
   for interact_proc_i in range(AGENT_COUNT):
-    interact_proc = multiprocessing.Process(target=agent.main, args=(interact_proc_i, False, policy_replay_frame_queue, model_replay_frame_queue, policy_lock, config))
+    interact_proc = multiprocessing.Process(target=agent.main, args=(interact_proc_i, False, policy_replay_frame_queue, model_replay_frame_queue, policy_lock, config, policy_replay_buffer, model_replay_buffer))
     all_procs.add(interact_proc)
     interaction_procs.add(interact_proc)
 
   # evaluators
   for interact_proc_i in range(EVALUATOR_COUNT):
-    interact_proc = multiprocessing.Process(target=agent.main, args=(interact_proc_i, True, policy_replay_frame_queue, model_replay_frame_queue, policy_lock, config))
+    interact_proc = multiprocessing.Process(target=agent.main, args=(interact_proc_i, True, policy_replay_frame_queue, model_replay_frame_queue, policy_lock, config, policy_replay_buffer, model_replay_buffer))
     all_procs.add(interact_proc)
     interaction_procs.add(interact_proc)
 
   # policy training
-  train_policy_proc = multiprocessing.Process(target=learner.run_learner, args=(valuerl_learner.ValueRLLearner, policy_replay_frame_queue, policy_lock, config, config["env"], config["policy_config"]), kwargs={"model_lock": model_lock})
+  train_policy_proc = multiprocessing.Process(target=learner.run_learner, args=(valuerl_learner.ValueRLLearner, policy_replay_frame_queue, policy_lock, config, config["env"], config["policy_config"]), kwargs={"model_lock": model_lock, "replay_buffer": policy_replay_buffer})
   all_procs.add(train_policy_proc)
 
   # model training
   if MODEL_AUGMENTED:
-    train_model_proc = multiprocessing.Process(target=learner.run_learner, args=(worldmodel_learner.WorldmodelLearner, model_replay_frame_queue, model_lock, config, config["env"], config["model_config"]))
+    train_model_proc = multiprocessing.Process(target=learner.run_learner, args=(worldmodel_learner.WorldmodelLearner, model_replay_frame_queue, model_lock, config, config["env"], config["model_config"]), kwargs={"replay_buffer": model_replay_buffer})
     all_procs.add(train_model_proc)
 
   # start all policies
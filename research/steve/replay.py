@@ -107,3 +107,115 @@ class ReplayBuffer(object):
         with open("%s/%s.reward_buffer.npz" % (path,name)) as f: self.reward_buffer = pickle.load(f)
         with open("%s/%s.done_buffer.npz" % (path,name)) as f: self.done_buffer = pickle.load(f)
         with open("%s/%s.count" % (path,name), "r") as f: self.count = int(f.read())
+
+class SharedReplayBuffer(ReplayBuffer):
+    """
+    A ReplayBuffer whose ring arrays live in shared memory. It is created by the
+    master process and handed to the agents, which write their frames directly
+    into it with add_frames, and to a learner, which samples batches from the
+    same memory. Frames are never pickled or sent between processes.
+
+    Slots are reserved and the write cursor is advanced under a single lock, so
+    concurrent agents never write to the same slot and a frame only becomes
+    visible to samplers once it has been fully written. As with ReplayBuffer,
+    once the buffer has wrapped around, a sampler may read a slot while it is
+    being overwritten.
+
+    The learner throttles the agents with set_frame_limit: add_frames blocks
+    while the count is at the limit, as agents block on a full frame queue.
+    """
+
+    def __init__(self, max_size, obs_dim, action_dim, roundrobin=True, ctx=multiprocessing):
+        self.max_size = max_size = int(max_size)
+        self.obs_dim = obs_dim = int(obs_dim)
+        self.action_dim = action_dim = int(action_dim)
+        self.roundrobin = roundrobin
+
+        self._shapes = {
+            "obs_buffer": [max_size, obs_dim],
+            "next_obs_buffer": [max_size, obs_dim],
+            "action_buffer": [max_size, action_dim],
+            "reward_buffer": [max_size],
+            "done_buffer": [max_size],
+        }
+        self._raw_buffers = dict((key, ctx.RawArray('d', int(np.prod(shape))))
+                                 for key, shape in self._shapes.items())
+        self._cursor = ctx.Value('q', 0)
+        # -1 for no limit; agents and the learner wait on the cursor lock for the count or the limit to change
+        self._frame_limit = ctx.RawValue('q', -1)
+        self._count_changed = ctx.Condition(self._cursor.get_lock())
+        self._make_views()
+
+    def _make_views(self):
+        for key, shape in self._shapes.items():
+            setattr(self, key, np.frombuffer(self._raw_buffers[key], dtype=np.float64).reshape(shape))
+
+    def __getstate__(self):
+        # the numpy views are rebuilt on top of the shared memory when unpickled
+        state = self.__dict__.copy()
+        for key in self._shapes: del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_views()
+
+    @property
+    def count(self):
+        # an aligned 64-bit read, so samplers never need to take the write lock
+        return self._cursor.get_obj().value
+
+    @count.setter
+    def count(self, value):
+        self._cursor.value = value
+
+    def _reserve(self, count, n):
+        positions = count + np.arange(n)
+        if self.roundrobin: return positions % self.max_size
+        full = positions >= self.max_size
+        positions[full] = np.random.randint(0, self.max_size, np.sum(full))
+        return positions
+
+    def set_frame_limit(self, limit):
+        """Lets add_frames write while the count is below limit, or without a limit if it is None."""
+        with self._count_changed:
+            self._frame_limit.value = -1 if limit is None else int(limit)
+            self._count_changed.notify_all()
+
+    def wait_for_count(self, min_count, timeout):
+        """Waits up to timeout seconds for the count to reach min_count, and returns the count."""
+        with self._count_changed:
+            if self._cursor.get_obj().value < min_count: self._count_changed.wait(timeout)
+            return self._cursor.get_obj().value
+
+    def add_frames(self, frames):
+        """
+        Writes a list of (obs, next_obs, action, reward, done) frames, returning the new count.
+        Blocks while the count is at the frame limit.
+        """
+        if not frames: return self.count
+        obs, next_obs, action, reward, done = [np.asarray(x) for x in zip(*frames)]
+        with self._count_changed:
+            while 0 <= self._frame_limit.value <= self._cursor.get_obj().value:
+                self._count_changed.wait()
+            count = self._cursor.get_obj().value
+            indices = self._reserve(count, len(frames))
+            self.obs_buffer[indices] = obs.reshape([len(frames), -1])
+            self.next_obs_buffer[indices] = next_obs.reshape([len(frames), -1])
+            self.action_buffer[indices] = action.reshape([len(frames), -1])
+            self.reward_buffer[indices] = reward
+            self.done_buffer[indices] = done
+            self._cursor.get_obj().value = count + len(frames)
+            self._count_changed.notify_all()
+        return count + len(frames)
+
+    def add_replay(self, obs, next_obs, action, reward, done):
+        self.add_frames([(obs, next_obs, action, reward, done)])
+
+    def load(self, path, name):
+        # ReplayBuffer.load replaces the buffers, so copy what it read back into shared memory
+        with self._cursor.get_lock():
+            ReplayBuffer.load(self, path, name)
+            loaded = dict((key, getattr(self, key)) for key in self._shapes)
+            self._make_views()
+            for key, data in loaded.items(): getattr(self, key)[...] = data
@@ -0,0 +1,119 @@
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+# Copyright 2018 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""
+Measures replay throughput of the queue based design, where agents put batches
+of frames on a multiprocessing.Queue and the learner copies them into its own
+ReplayBuffer, against the SharedReplayBuffer, which agents write into directly.
+
+For each design, agent processes produce frames as fast as they can while a
+learner process samples batches, and the frames ingested per second and the
+batches sampled per second are reported. No environment or model is involved.
+
+  python replay_benchmark.py --agents 2 --obs_dim 17 --action_dim 6 --seconds 10
+"""
+
+import argparse, multiprocessing, threading, time
+import numpy as np
+
+from replay import ReplayBuffer, SharedReplayBuffer
+
+
+def make_frames(args, seed):
+  rng = np.random.RandomState(seed)
+  return [(rng.randn(args.obs_dim), rng.randn(args.obs_dim), rng.randn(args.action_dim), rng.randn(), False)
+          for _ in range(args.frames_per_step)]
+
+def queue_agent(args, seed, queue, stop):
+  frames = make_frames(args, seed)
+  while not stop.is_set():
+    queue.put(frames)
+
+def shared_agent(args, seed, replay_buffer, stop):
+  frames = make_frames(args, seed)
+  while not stop.is_set():
+    replay_buffer.add_frames(frames)
+
+def queue_learner(args, queue, stop, results):
+  replay_buffer = ReplayBuffer(args.replay_size, args.obs_dim, args.action_dim)
+  replay_buffer_lock = threading.RLock()
+
+  # mirrors Learner._poll_interactors and Learner._add_frames
+  def poll():
+    while not stop.is_set():
+      while not queue.empty():
+        frames = queue.get()
+        with replay_buffer_lock:
+          for frame in frames: replay_buffer.add_replay(*frame)
+  poll_thread = threading.Thread(target=poll)
+  poll_thread.start()
+  results.put(sample(args, replay_buffer, stop))
+  poll_thread.join()
+
+def shared_learner(args, replay_buffer, stop, results):
+  results.put(sample(args, replay_buffer, stop))
+
+def sample(args, replay_buffer, stop):
+  while replay_buffer.count == 0 and not stop.is_set(): time.sleep(.001)
+  start_count, start = replay_buffer.count, time.time()
+  batches = 0
+  while not stop.is_set():
+    replay_buffer.random_batch(args.batch_size)
+    batches += 1
+  elapsed = time.time() - start
+  return (replay_buffer.count - start_count) / elapsed, batches / elapsed
+
+def run(args, design):
+  stop = multiprocessing.Event()
+  results = multiprocessing.Queue()
+  if design == "queue":
+    queue = multiprocessing.Queue(1)
+    agents = [multiprocessing.Process(target=queue_agent, args=(args, i, queue, stop)) for i in range(args.agents)]
+    learner = multiprocessing.Process(target=queue_learner, args=(args, queue, stop, results))
+  else:
+    replay_buffer = SharedReplayBuffer(args.replay_size, args.obs_dim, args.action_dim)
+    agents = [multiprocessing.Process(target=shared_agent, args=(args, i, replay_buffer, stop)) for i in range(args.agents)]
+    learner = multiprocessing.Process(target=shared_learner, args=(args, replay_buffer, stop, results))
+
+  for proc in agents + [learner]: proc.start()
+  time.sleep(args.seconds)
+  stop.set()
+  frames_per_sec, batches_per_sec = results.get()
+  if design == "queue":
+    # unblock agents waiting on a full queue
+    while any(proc.is_alive() for proc in agents):
+      try: queue.get(timeout=.1)
+      except Exception: pass
+  for proc in agents + [learner]: proc.join()
+  return frames_per_sec, batches_per_sec
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--agents", type=int, default=1)
+  parser.add_argument("--frames_per_step", type=int, default=8, help="frames sent per agent step (agent_config batch_size)")
+  parser.add_argument("--obs_dim", type=int, default=17)
+  parser.add_argument("--action_dim", type=int, default=6)
+  parser.add_argument("--batch_size", type=int, default=512)
+  parser.add_argument("--replay_size", type=int, default=1000000)
+  parser.add_argument("--seconds", type=float, default=10.)
+  args = parser.parse_args()
+
+  print("%d agents, %d frames/step, obs_dim %d, action_dim %d, batch_size %d" % (args.agents, args.frames_per_step, args.obs_dim, args.action_dim, args.batch_size))
+  for design in ["queue", "shared"]:
+    frames_per_sec, batches_per_sec = run(args, design)
+    print("%-8s %12.0f frames/sec ingested %10.1f batches/sec sampled" % (design, frames_per_sec, batches_per_sec))
@@ -0,0 +1,114 @@
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+# Copyright 2018 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import multiprocessing, threading, time, unittest
+import numpy as np
+
+from replay import ReplayBuffer, SharedReplayBuffer
+
+OBS_DIM = 3
+ACTION_DIM = 2
+
+def make_frames(start, n):
+    # frame i is filled with i, so the slot each frame lands in can be checked
+    return [(np.full(OBS_DIM, i), np.full(OBS_DIM, i + .5), np.full(ACTION_DIM, -i), float(i), i % 2 == 0)
+            for i in range(start, start + n)]
+
+def write_frames(replay_buffer, start, n):
+    replay_buffer.add_frames(make_frames(start, n))
+
+class SharedReplayBufferTest(unittest.TestCase):
+
+    def assertBuffersEqual(self, expected, actual):
+        for key in ["obs_buffer", "next_obs_buffer", "action_buffer", "reward_buffer", "done_buffer"]:
+            np.testing.assert_array_equal(getattr(expected, key), getattr(actual, key))
+        self.assertEqual(expected.count, actual.count)
+
+    def test_matches_replay_buffer(self):
+        expected = ReplayBuffer(5, OBS_DIM, ACTION_DIM)
+        actual = SharedReplayBuffer(5, OBS_DIM, ACTION_DIM)
+        for frame in make_frames(0, 3): expected.add_replay(*frame)
+        actual.add_frames(make_frames(0, 3))
+        self.assertBuffersEqual(expected, actual)
+
+    def test_ring_wraparound(self):
+        expected = ReplayBuffer(5, OBS_DIM, ACTION_DIM)
+        actual = SharedReplayBuffer(5, OBS_DIM, ACTION_DIM)
+        for start, n in [(0, 3), (3, 4), (7, 6)]:
+            for frame in make_frames(start, n): expected.add_replay(*frame)
+            self.assertEqual(start + n, actual.add_frames(make_frames(start, n)))
+            self.assertBuffersEqual(expected, actual)
+        # frames 8 to 12 are left, in slots 8 % 5 onwards
+        np.testing.assert_array_equal([10, 11, 12, 8, 9], actual.reward_buffer)
+
+    def test_sample_after_wraparound(self):
+        replay_buffer = SharedReplayBuffer(5, OBS_DIM, ACTION_DIM)
+        replay_buffer.add_frames(make_frames(0, 13))
+        obs, next_obs, action, reward, done, count = replay_buffer.random_batch(100)
+        self.assertEqual(13, count)
+        self.assertEqual(set(range(8, 13)), set(reward.astype(int)))
+        # every sampled row comes from a single frame
+        np.testing.assert_array_equal(obs, np.tile(reward[:, None], [1, OBS_DIM]))
+        np.testing.assert_array_equal(next_obs, obs + .5)
+        np.testing.assert_array_equal(action, -obs[:, :ACTION_DIM])
+        np.testing.assert_array_equal(done, reward % 2 == 0)
+
+    def test_child_process_writes(self):
+        replay_buffer = SharedReplayBuffer(5, OBS_DIM, ACTION_DIM)
+        proc = multiprocessing.Process(target=write_frames, args=(replay_buffer, 0, 7))
+        proc.start()
+        proc.join()
+        self.assertEqual(0, proc.exitcode)
+        self.assertEqual(7, replay_buffer.count)
+        np.testing.assert_array_equal([5, 6, 2, 3, 4], replay_buffer.reward_buffer)
+
+    @unittest.skipUnless(hasattr(multiprocessing, "get_context"), "needs multiprocessing contexts")
+    def test_views_reattach_in_spawned_process(self):
+        # a spawned process unpickles the buffer, so its views are rebuilt on the shared memory
+        ctx = multiprocessing.get_context("spawn")
+        replay_buffer = SharedReplayBuffer(5, OBS_DIM, ACTION_DIM, ctx=ctx)
+        replay_buffer.add_frames(make_frames(0, 2))
+        proc = ctx.Process(target=write_frames, args=(replay_buffer, 2, 5))
+        proc.start()
+        proc.join()
+        self.assertEqual(0, proc.exitcode)
+        self.assertEqual(7, replay_buffer.count)
+        np.testing.assert_array_equal([5, 6, 2, 3, 4], replay_buffer.reward_buffer)
+        np.testing.assert_array_equal(np.full(OBS_DIM, 6), replay_buffer.obs_buffer[1])
+
+    def test_frame_limit_blocks_writers(self):
+        replay_buffer = SharedReplayBuffer(10, OBS_DIM, ACTION_DIM)
+        replay_buffer.set_frame_limit(3)
+        writer = threading.Thread(target=lambda: [write_frames(replay_buffer, i * 2, 2) for i in range(4)])
+        writer.start()
+        # the second batch crosses the limit, and the third waits for it to be raised
+        self.assertEqual(4, replay_buffer.wait_for_count(4, 5.))
+        time.sleep(.1)
+        self.assertEqual(4, replay_buffer.count)
+        replay_buffer.set_frame_limit(None)
+        writer.join(5.)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(8, replay_buffer.count)
+
+    def test_wait_for_count_times_out(self):
+        replay_buffer = SharedReplayBuffer(10, OBS_DIM, ACTION_DIM)
+        replay_buffer.add_frames(make_frames(0, 2))
+        self.assertEqual(2, replay_buffer.wait_for_count(3, .01))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Computes embedding performance on analogy tasks.
+
+This is a Python equivalent of the analogy program built from analogy.cc that
+also supports 3CosMul.  Accepts as input one or more files containing four
+words per line (A B C D), and determines if D is the nearest neighbor (other
+than A, B and C) of
+
+  3CosAdd: vec(C) - vec(A) + vec(B), or
+  3CosMul: see Vecs.analogies().
+
+Any missing vocabulary items are scored as losses.
+
+Usage:
+
+  analogy.py --embeddings=<binvecs> --vocab=<vocab> eval1.tab eval2.tab ...
+
+Options:
+
+  --embeddings=<filename>: the vectors to test
+  --vocab=<filename>: the vocabulary file
+  --method=<add|mul|both>: the analogy method; default add
+  --nthreads=<integer>: the number of evaluation threads; default 8
+
+"""
+
+from __future__ import print_function
+import sys
+import time
+from getopt import GetoptError, getopt
+
+import numpy as np
+
+from vecs import Vecs
+
+try:
+  opts, args = getopt(sys.argv[1:], '',
+                      ['embeddings=', 'vocab=', 'method=', 'nthreads='])
+except GetoptError as e:
+  print(e, file=sys.stderr)
+  sys.exit(2)
+
+opt_embeddings = None
+opt_vocab = None
+opt_method = 'add'
+opt_nthreads = 8
+
+for o, a in opts:
+  if o == '--embeddings':
+    opt_embeddings = a
+  if o == '--vocab':
+    opt_vocab = a
+  if o == '--method':
+    opt_method = a
+  if o == '--nthreads':
+    opt_nthreads = int(a)
+
+if not opt_vocab:
+  print('please specify a vocabulary file with "--vocab"', file=sys.stderr)
+  sys.exit(2)
+
+if not opt_embeddings:
+  print('please specify the embeddings with "--embeddings"', file=sys.stderr)
+  sys.exit(2)
+
+if opt_method not in ('add', 'mul', 'both'):
+  print('--method must be one of add, mul or both', file=sys.stderr)
+  sys.exit(2)
+
+try:
+  vecs = Vecs(opt_vocab, opt_embeddings)
+except IOError as e:
+  print(e, file=sys.stderr)
+  sys.exit(1)
+
+
+def read_queries(lines):
+  """Returns the total number of analogies and the in-vocabulary ones."""
+  total, queries = 0, []
+  for lineno, line in enumerate(lines, start=1):
+    words = line.split()
+    if not words:
+      continue
+
+    if len(words) != 4:
+      print('expected four words at line %d' % lineno, file=sys.stderr)
+      continue
+
+    total += 1
+    idxs = [vecs.word_to_idx.get(w) for w in words]
+    if all(idx is not None for idx in idxs):
+      queries.append(idxs)
+
+  return total, np.array(queries, dtype=np.int64).reshape(-1, 4)
+
+
+methods = ['add', 'mul'] if opt_method == 'both' else [opt_method]
+
+for filename in args:
+  with open(filename, 'r') as lines:
+    total, queries = read_queries(lines)
+
+  for method in methods:
+    start = time.time()
+    answers = vecs.analogies(queries[:, :3], method, num_threads=opt_nthreads)
+    correct = np.sum(answers == queries[:, 3])
+    print('%0.3f %s (3Cos%s, %0.1fs)' % (
+        float(correct) / max(total, 1), filename, method.capitalize(),
+        time.time() - start))
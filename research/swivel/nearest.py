@@ -17,6 +17,7 @@
 """Simple tool for inspecting nearest neighbors and analogies."""
 
 from __future__ import print_function
+import os
 import re
 import sys
 from getopt import GetoptError, getopt
@@ -24,22 +25,33 @@ from getopt import GetoptError, getopt
 from vecs import Vecs
 
 try:
-  opts, args = getopt(sys.argv[1:], 'v:e:', ['vocab=', 'embeddings='])
+  opts, args = getopt(sys.argv[1:], 'v:e:i:',
+                      ['vocab=', 'embeddings=', 'index='])
 except GetoptError as e:
   print(e, file=sys.stderr)
   sys.exit(2)
 
 opt_vocab = 'vocab.txt'
 opt_embeddings = None
+opt_index = None
 
 for o, a in opts:
   if o in ('-v', '--vocab'):
     opt_vocab = a
   if o in ('-e', '--embeddings'):
     opt_embeddings = a
+  if o in ('-i', '--index'):
+    opt_index = a
 
 vecs = Vecs(opt_vocab, opt_embeddings)
 
+# With an index, neighbors are approximate; the index is built on first use.
+if opt_index:
+  if os.path.exists(opt_index):
+    vecs.load_index(opt_index)
+  else:
+    vecs.build_index().save(opt_index)
+
 while True:
   sys.stdout.write('query> ')
   sys.stdout.flush()
@@ -51,7 +63,7 @@ while True:
   parts = re.split(r'\s+', query)
 
   if len(parts) == 1:
-    res = vecs.neighbors(parts[0])
+    query = parts[0]
 
   elif len(parts) == 3:
     vs = [vecs.lookup(w) for w in parts]
@@ -61,16 +73,17 @@ while True:
 
       continue
 
-    res = vecs.neighbors(vs[2] - vs[0] + vs[1])
+    query = vs[2] - vs[0] + vs[1]
 
   else:
     print('use a single word to query neighbors, or three words for analogy')
     continue
 
+  res = vecs.neighbors_batch([query], k=20, approximate=bool(opt_index))[0]
   if not res:
     continue
 
-  for word, sim in res[:20]:
+  for word, sim in res:
     print('%0.4f: %s' % (sim, word))
 
   print()
@@ -53,14 +53,25 @@ Options:
   --bufsz <int>
       The number of co-occurrences that are buffered; default 16M.
 
+  --num_workers <int>
+      The number of worker processes; default 1.  With more than one worker,
+      the corpus is split into byte ranges that are counted in parallel, and
+      the shards are written in parallel as well.
+
 """
 
+from __future__ import print_function
+
 import itertools
 import math
+import multiprocessing
 import os
 import struct
 import sys
+import time
 
+import numpy as np
+import six
 from six.moves import xrange
 import tensorflow as tf
 
@@ -78,6 +89,9 @@ flags.DEFINE_string('vocab', '', 'Vocabulary to use instead of generating one')
 flags.DEFINE_integer('window_size', 10, 'The window size')
 flags.DEFINE_integer('bufsz', 16 * 1024 * 1024,
                      'The number of co-occurrences to buffer')
+flags.DEFINE_integer('num_workers', 1,
+                     'The number of processes used to count co-occurrences '
+                     'and write shards')
 
 FLAGS = flags.FLAGS
 
@@ -96,7 +110,8 @@ def create_vocabulary(lines):
   lines.seek(0, os.SEEK_SET)
 
   vocab = {}
-  for lineno, line in enumerate(lines, start=1):
+  # Iterate with readline() so that lines.tell() can report progress.
+  for lineno, line in enumerate(iter(lines.readline, ''), start=1):
     for word in words(line):
       vocab.setdefault(word, 0)
       vocab[word] += 1
@@ -109,7 +124,13 @@ def create_vocabulary(lines):
 
   sys.stdout.write('\n')
 
-  vocab = [(tok, n) for tok, n in vocab.iteritems() if n >= FLAGS.min_count]
+  return select_vocabulary(vocab)
+
+
+def select_vocabulary(counts):
+  """Chooses the vocabulary from a dict of token counts."""
+  vocab = [(tok, n) for tok, n in six.iteritems(counts)
+           if n >= FLAGS.min_count]
   vocab.sort(key=lambda kv: (-kv[1], kv[0]))
 
   num_words = min(len(vocab), FLAGS.max_vocab)
@@ -129,9 +150,9 @@ def write_vocab_and_sums(vocab, sums, vocab_filename, sums_filename):
   """Writes vocabulary and marginal sum files."""
   with open(os.path.join(FLAGS.output_dir, vocab_filename), 'w') as vocab_out:
     with open(os.path.join(FLAGS.output_dir, sums_filename), 'w') as sums_out:
-      for tok, cnt in itertools.izip(vocab, sums):
-        print >> vocab_out, tok
-        print >> sums_out, cnt
+      for tok, cnt in six.moves.zip(vocab, sums):
+        print(tok, file=vocab_out)
+        print(cnt, file=sums_out)
 
 
 def compute_coocs(lines, vocab):
@@ -147,7 +168,7 @@ def compute_coocs(lines, vocab):
   nbytes = lines.tell()
   lines.seek(0, os.SEEK_SET)
 
-  num_shards = len(vocab) / FLAGS.shard_size
+  num_shards = len(vocab) // FLAGS.shard_size
 
   shardfiles = {}
   for row in range(num_shards):
@@ -155,14 +176,14 @@ def compute_coocs(lines, vocab):
       filename = os.path.join(
           FLAGS.output_dir, 'shard-%03d-%03d.tmp' % (row, col))
 
-      shardfiles[(row, col)] = open(filename, 'w+')
+      shardfiles[(row, col)] = open(filename, 'wb+')
 
   def flush_coocs():
-    for (row_id, col_id), cnt in coocs.iteritems():
+    for (row_id, col_id), cnt in six.iteritems(coocs):
       row_shard = row_id % num_shards
-      row_off = row_id / num_shards
+      row_off = row_id // num_shards
       col_shard = col_id % num_shards
-      col_off = col_id / num_shards
+      col_off = col_id // num_shards
 
       # Since we only stored (a, b), we emit both (a, b) and (b, a).
       shardfiles[(row_shard, col_shard)].write(
@@ -174,12 +195,12 @@ def compute_coocs(lines, vocab):
   coocs = {}
   sums = [0.0] * len(vocab)
 
-  for lineno, line in enumerate(lines, start=1):
+  # Iterate with readline() so that lines.tell() can report progress.
+  for lineno, line in enumerate(iter(lines.readline, ''), start=1):
     # Computes the word IDs for each word in the sentence.  This has the effect
     # of "stretching" the window past OOV tokens.
-    wids = filter(
-        lambda wid: wid is not None,
-        (word_to_id.get(w) for w in words(line)))
+    wids = [wid for wid in (word_to_id.get(w) for w in words(line))
+            if wid is not None]
 
     for pos in xrange(len(wids)):
       lid = wids[pos]
@@ -221,10 +242,10 @@ def write_shards(vocab, shardfiles):
   temporary files are removed from the filesystem once they've been processed.
 
   """
-  num_shards = len(vocab) / FLAGS.shard_size
+  num_shards = len(vocab) // FLAGS.shard_size
 
   ix = 0
-  for (row, col), fh in shardfiles.iteritems():
+  for (row, col), fh in six.iteritems(shardfiles):
     ix += 1
     sys.stdout.write('\rwriting shard %d/%d' % (ix, len(shardfiles)))
     sys.stdout.flush()
@@ -280,9 +301,286 @@ def write_shards(vocab, shardfiles):
     }))
 
     filename = os.path.join(FLAGS.output_dir, 'shard-%03d-%03d.pb' % (row, col))
-    with open(filename, 'w') as out:
+    with open(filename, 'wb') as out:
+      out.write(example.SerializeToString())
+
+  sys.stdout.write('\n')
+
+
+def split_byte_ranges(filename, num_ranges):
+  """Splits a file into contiguous byte ranges of about the same size.
+
+  A line belongs to the range that contains its first byte, see _read_lines().
+  """
+  nbytes = os.path.getsize(filename)
+  bounds = [nbytes * i // num_ranges for i in range(num_ranges + 1)]
+  return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _read_lines(filename, start, end):
+  """Yields the text lines that start within the byte range [start, end)."""
+  with open(filename, 'rb') as fh:
+    if start > 0:
+      # Skip the line that started in the previous range.
+      fh.seek(start - 1)
+      fh.readline()
+    for line in iter(fh.readline, b''):
+      if fh.tell() - len(line) >= end:
+        break
+      yield line.decode('utf-8') if six.PY3 else line
+
+
+def _count_tokens(args):
+  """Counts the tokens in one byte range of the corpus."""
+  filename, start, end = args
+  counts = {}
+  for line in _read_lines(filename, start, end):
+    for word in words(line):
+      counts[word] = counts.get(word, 0) + 1
+  return counts
+
+
+def create_vocabulary_parallel(filename, num_workers):
+  """Generates a vocabulary, counting byte ranges of the corpus in parallel."""
+  pool = multiprocessing.Pool(num_workers)
+  try:
+    counts = {}
+    for chunk_counts in pool.imap_unordered(
+        _count_tokens,
+        [(filename, start, end)
+         for start, end in split_byte_ranges(filename, num_workers)]):
+      for word, count in six.iteritems(chunk_counts):
+        counts[word] = counts.get(word, 0) + count
+  finally:
+    pool.close()
+    pool.join()
+
+  return select_vocabulary(counts)
+
+
+def _reduce_pairs(keys, values):
+  """Sorts packed pair keys and sums the values of equal keys."""
+  keys, inverse = np.unique(keys, return_inverse=True)
+  return keys, np.bincount(inverse.ravel(), weights=values)
+
+
+# The number of tokens whose pairs _count_coocs() counts at once.
+_BATCH_TOKENS = 1024 * 1024
+
+# Set in each worker process by _init_cooc_worker().
+_worker_word_to_id = None
+
+
+def _init_cooc_worker(word_to_id):
+  global _worker_word_to_id
+  _worker_word_to_id = word_to_id
+
+
+def _count_coocs(args):
+  """Counts the co-occurrences in one byte range of the corpus.
+
+  Token pairs (a, b) with a <= b are packed into int64 keys a * V + b, where V
+  is the vocabulary size.  The pairs of a batch of lines are counted with
+  np.unique and merged into the running (sorted) counts.  When more than bufsz
+  pairs are buffered, the counts are spilled to temporary files, one per row
+  shard, that already contain both the (a, b) and the (b, a) entries.
+
+  Args:
+    args: A tuple (worker_id, filename, start, end, vocab_size, num_shards,
+      window_size, bufsz, output_dir).
+
+  Returns:
+    A tuple (sums, num_tokens, spill_files), where spill_files is a list of
+    (row_shard, filename) pairs.
+  """
+  (worker_id, filename, start, end, vocab_size, num_shards, window_size, bufsz,
+   output_dir) = args
+  word_to_id = _worker_word_to_id
+
+  sums = np.zeros(vocab_size, dtype=np.float64)
+  keys = np.zeros(0, dtype=np.int64)
+  values = np.zeros(0, dtype=np.float64)
+  spill_files = []
+  num_tokens = [0]
+
+  def count_batch(wids, line_lengths):
+    """Counts the pairs of a batch of lines of word ids."""
+    ids = np.array(wids, dtype=np.int64)
+    line_ids = np.repeat(np.arange(len(line_lengths)), line_lengths)
+    num_tokens[0] += len(ids)
+
+    # Every token co-occurs with itself once.  Since (a, a) is emitted for
+    # both halves of the matrix, only add 1/2.
+    batch_keys = [ids * vocab_size + ids]
+    batch_values = [np.full(len(ids), 0.5)]
+    sums[:] += np.bincount(ids, minlength=vocab_size)
+    for off in xrange(1, window_size + 1):
+      same_line = line_ids[:-off] == line_ids[off:]
+      lids = ids[:-off][same_line]
+      rids = ids[off:][same_line]
+      count = 1.0 / off
+      batch_keys.append(
+          np.minimum(lids, rids) * vocab_size + np.maximum(lids, rids))
+      batch_values.append(np.full(len(lids), count))
+      sums[:] += np.bincount(lids, minlength=vocab_size) * count
+      sums[:] += np.bincount(rids, minlength=vocab_size) * count
+
+    return _reduce_pairs(
+        np.concatenate(batch_keys), np.concatenate(batch_values))
+
+  def spill(keys, values):
+    """Writes the buffered counts into one temporary file per row shard."""
+    lids, rids = keys // vocab_size, keys % vocab_size
+    # Emit both (a, b) and (b, a).
+    rows = np.concatenate([lids, rids])
+    cols = np.concatenate([rids, lids])
+    values = np.concatenate([values, values]).astype(np.float32)
+    row_shards = rows % num_shards
+    order = np.argsort(row_shards, kind='mergesort')
+    bounds = np.searchsorted(row_shards[order], np.arange(num_shards + 1))
+    for row_shard in xrange(num_shards):
+      sel = order[bounds[row_shard]:bounds[row_shard + 1]]
+      if not len(sel):
+        continue
+      filename = os.path.join(
+          output_dir, 'rows-%03d-w%03d-%05d.tmp.npz' % (
+              row_shard, worker_id, len(spill_files)))
+      # Keep the local row offset and the global column id.
+      np.savez(filename, keys=(rows[sel] // num_shards) * vocab_size + cols[sel],
+               values=values[sel])
+      spill_files.append((row_shard, filename))
+
+  wids = []
+  line_lengths = []
+  for line in _read_lines(filename, start, end):
+    # Computes the word IDs for each word in the sentence.  This has the effect
+    # of "stretching" the window past OOV tokens.
+    line_wids = [wid for wid in (word_to_id.get(w) for w in words(line))
+                 if wid is not None]
+    wids.extend(line_wids)
+    line_lengths.append(len(line_wids))
+
+    if len(wids) >= _BATCH_TOKENS:
+      batch_keys, batch_values = count_batch(wids, line_lengths)
+      keys, values = _reduce_pairs(np.concatenate([keys, batch_keys]),
+                                   np.concatenate([values, batch_values]))
+      wids, line_lengths = [], []
+      if len(keys) > bufsz:
+        spill(keys, values)
+        keys = np.zeros(0, dtype=np.int64)
+        values = np.zeros(0, dtype=np.float64)
+
+  if wids:
+    batch_keys, batch_values = count_batch(wids, line_lengths)
+    keys, values = _reduce_pairs(np.concatenate([keys, batch_keys]),
+                                 np.concatenate([values, batch_values]))
+  if len(keys):
+    spill(keys, values)
+
+  return sums, num_tokens[0], spill_files
+
+
+def compute_coocs_parallel(filename, vocab, num_workers):
+  """Compute the co-occurrence statistics from the text in parallel.
+
+  The corpus is split into num_workers byte ranges which are counted in
+  separate processes, see _count_coocs().  Like compute_coocs(), this leaves
+  temporary files that write_shards_parallel() collates into the final shards.
+
+  Returns:
+    A tuple (rowfiles, sums, num_tokens), where rowfiles maps each row shard to
+    its temporary files and sums are the marginal sums.
+  """
+  word_to_id = {tok: idx for idx, tok in enumerate(vocab)}
+  num_shards = len(vocab) // FLAGS.shard_size
+
+  pool = multiprocessing.Pool(
+      num_workers, initializer=_init_cooc_worker, initargs=(word_to_id,))
+  try:
+    results = pool.map(_count_coocs, [
+        (worker_id, filename, start, end, len(vocab), num_shards,
+         FLAGS.window_size, FLAGS.bufsz, FLAGS.output_dir)
+        for worker_id, (start, end) in enumerate(
+            split_byte_ranges(filename, num_workers))])
+  finally:
+    pool.close()
+    pool.join()
+
+  rowfiles = {row: [] for row in xrange(num_shards)}
+  for _, _, spill_files in results:
+    for row, filename in spill_files:
+      rowfiles[row].append(filename)
+
+  sums = np.sum([worker_sums for worker_sums, _, _ in results], axis=0)
+  num_tokens = sum(worker_tokens for _, worker_tokens, _ in results)
+  return rowfiles, sums, num_tokens
+
+
+def _write_row_shards(args):
+  """Merges the temporary files of one row shard and writes its shards."""
+  row, filenames, vocab_size, num_shards, shard_size, output_dir = args
+
+  def _int64s(xs):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=list(xs)))
+
+  def _floats(xs):
+    return tf.train.Feature(float_list=tf.train.FloatList(value=list(xs)))
+
+  keys, values = [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+  for filename in filenames:
+    with np.load(filename) as data:
+      keys.append(data['keys'])
+      values.append(data['values'].astype(np.float64))
+    os.unlink(filename)
+
+  # Re-key by (column shard, local row, local column) so that a single sort
+  # groups entries by shard in the order write_shards() emits them.
+  keys = np.concatenate(keys)
+  row_offs, cols = keys // vocab_size, keys % vocab_size
+  col_shards, col_offs = cols % num_shards, cols // num_shards
+  keys, values = _reduce_pairs(
+      (col_shards * shard_size + row_offs) * shard_size + col_offs,
+      np.concatenate(values))
+  col_shards = keys // (shard_size * shard_size)
+  bounds = np.searchsorted(col_shards, np.arange(num_shards + 1))
+
+  for col in xrange(num_shards):
+    shard_keys = keys[bounds[col]:bounds[col + 1]] % (shard_size * shard_size)
+    example = tf.train.Example(features=tf.train.Features(feature={
+        'global_row': _int64s(
+            row + num_shards * i for i in range(shard_size)),
+        'global_col': _int64s(
+            col + num_shards * i for i in range(shard_size)),
+
+        'sparse_local_row': _int64s((shard_keys // shard_size).tolist()),
+        'sparse_local_col': _int64s((shard_keys % shard_size).tolist()),
+        'sparse_value': _floats(values[bounds[col]:bounds[col + 1]].tolist()),
+    }))
+
+    filename = os.path.join(output_dir, 'shard-%03d-%03d.pb' % (row, col))
+    with open(filename, 'wb') as out:
       out.write(example.SerializeToString())
 
+
+def write_shards_parallel(vocab, rowfiles, num_workers):
+  """Writes the shards from the files produced by compute_coocs_parallel().
+
+  Each row of shards is written by a separate task, and the temporary files are
+  removed from the filesystem once they've been processed.
+  """
+  num_shards = len(vocab) // FLAGS.shard_size
+  pool = multiprocessing.Pool(num_workers)
+  try:
+    for ix, _ in enumerate(pool.imap_unordered(_write_row_shards, [
+        (row, rowfiles[row], len(vocab), num_shards, FLAGS.shard_size,
+         FLAGS.output_dir)
+        for row in xrange(num_shards)]), start=1):
+      sys.stdout.write('\rwrote shard row %d/%d' % (ix, num_shards))
+      sys.stdout.flush()
+  finally:
+    pool.close()
+    pool.join()
+
   sys.stdout.write('\n')
 
 
@@ -295,16 +593,31 @@ def main(_):
   if FLAGS.vocab:
     with open(FLAGS.vocab, 'r') as lines:
       vocab = [line.strip() for line in lines]
+  elif FLAGS.num_workers > 1:
+    vocab = create_vocabulary_parallel(FLAGS.input, FLAGS.num_workers)
   else:
     with open(FLAGS.input, 'r') as lines:
       vocab = create_vocabulary(lines)
 
   # Now read the file again to determine the co-occurrence stats.
-  with open(FLAGS.input, 'r') as lines:
-    shardfiles, sums = compute_coocs(lines, vocab)
+  start = time.time()
+  if FLAGS.num_workers > 1:
+    rowfiles, sums, num_tokens = compute_coocs_parallel(
+        FLAGS.input, vocab, FLAGS.num_workers)
+
+    # Collect the temporary files of each row into the shards.
+    write_shards_parallel(vocab, rowfiles, FLAGS.num_workers)
+
+    elapsed = time.time() - start
+    print('%d tokens in %0.1fs (%d tokens/sec)' % (
+        num_tokens, elapsed, num_tokens / max(elapsed, 1e-6)))
+  else:
+    with open(FLAGS.input, 'r') as lines:
+      shardfiles, sums = compute_coocs(lines, vocab)
 
-  # Collect individual shards into the shards.recs file.
-  write_shards(vocab, shardfiles)
+    # Collect individual shards into the shards.recs file.
+    write_shards(vocab, shardfiles)
+    print('co-occurrences computed in %0.1fs' % (time.time() - start))
 
   # Now write the marginals.  They're symmetric for this application.
   write_vocab_and_sums(vocab, sums, 'row_vocab.txt', 'row_sums.txt')
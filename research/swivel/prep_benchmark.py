@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the throughput of prep.py in tokens per second.
+
+Runs the single process co-occurrence builder (compute_coocs() and
+write_shards()) and the parallel one (compute_coocs_parallel() and
+write_shards_parallel()) over the same corpus and vocabulary, and reports the
+in-vocabulary tokens processed per second by each.
+
+Usage:
+
+  prep_benchmark.py --input <text-file> --num_workers 8
+
+If no --input is given, a synthetic Zipfian corpus is generated.  All of the
+prep.py flags (--shard_size, --window_size, --min_count, ...) apply.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import prep
+
+flags = tf.app.flags
+
+flags.DEFINE_integer('num_synthetic_tokens', 10 * 1000 * 1000,
+                     'The size of the synthetic corpus used without --input')
+flags.DEFINE_integer('num_synthetic_words', 100000,
+                     'The number of distinct words in the synthetic corpus')
+
+FLAGS = flags.FLAGS
+
+
+def write_synthetic_corpus(filename):
+  """Writes a corpus of Zipf distributed words, in lines of 5-40 tokens."""
+  rng = np.random.RandomState(0)
+  ids = rng.zipf(1.2, size=FLAGS.num_synthetic_tokens)
+  ids = ids[ids <= FLAGS.num_synthetic_words]
+  line_ends = np.cumsum(rng.randint(5, 41, size=len(ids) // 5 + 1))
+  line_ends = line_ends[line_ends < len(ids)]
+  with open(filename, 'w') as out:
+    for line in np.split(ids, line_ends):
+      out.write(' '.join('w%d' % wid for wid in line))
+      out.write('\n')
+
+
+def time_sequential(vocab):
+  start = time.time()
+  with open(FLAGS.input, 'r') as lines:
+    shardfiles, _ = prep.compute_coocs(lines, vocab)
+  prep.write_shards(vocab, shardfiles)
+  return time.time() - start
+
+
+def time_parallel(vocab):
+  start = time.time()
+  rowfiles, _, num_tokens = prep.compute_coocs_parallel(
+      FLAGS.input, vocab, FLAGS.num_workers)
+  prep.write_shards_parallel(vocab, rowfiles, FLAGS.num_workers)
+  return time.time() - start, num_tokens
+
+
+def main(_):
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    if not FLAGS.input:
+      FLAGS.input = os.path.join(tmp_dir, 'corpus.txt')
+      write_synthetic_corpus(FLAGS.input)
+
+    FLAGS.output_dir = os.path.join(tmp_dir, 'shards')
+    os.makedirs(FLAGS.output_dir)
+
+    vocab = prep.create_vocabulary_parallel(
+        FLAGS.input, max(FLAGS.num_workers, 1))
+
+    timings = []
+    timings.append(('parallel', time_parallel(vocab)))
+    num_tokens = timings[0][1][1]
+    if FLAGS.num_workers > 1:
+      # The parallel path with a single worker isolates the NumPy counting.
+      num_workers, FLAGS.num_workers = FLAGS.num_workers, 1
+      timings.append(('parallel-1', time_parallel(vocab)))
+      FLAGS.num_workers = num_workers
+    timings.append(('sequential', (time_sequential(vocab), num_tokens)))
+
+    print('%d in-vocabulary tokens, %d words, %d workers' % (
+        num_tokens, len(vocab), FLAGS.num_workers))
+    baseline = timings[-1][1][0]
+    for name, (elapsed, _) in timings:
+      print('%-12s %8.1fs %12d tokens/sec %6.1fx' % (
+          name, elapsed, num_tokens / elapsed, baseline / elapsed))
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -12,67 +12,226 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import mmap
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import os
 
 from six import string_types
+from six.moves import xrange
+
+# The number of vocabulary rows scored at once by Vecs.top_k().
+BLOCK_SIZE = 65536
+
+
+def _top_k(scores, k):
+  """Returns the indices of the k largest scores in each row, best first."""
+  k = min(k, scores.shape[1])
+  if k < scores.shape[1]:
+    idxs = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+  else:
+    idxs = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+
+  top = np.take_along_axis(scores, idxs, axis=1)
+  order = np.argsort(-top, axis=1, kind='mergesort')
+  return (np.take_along_axis(idxs, order, axis=1),
+          np.take_along_axis(top, order, axis=1))
 
 
 class Vecs(object):
-  def __init__(self, vocab_filename, rows_filename, cols_filename=None):
-    """Initializes the vectors from a text vocabulary and binary data."""
+  def __init__(self, vocab_filename, rows_filename, cols_filename=None,
+               normalized_filename=None):
+    """Initializes the vectors from a text vocabulary and binary data.
+
+    If normalized_filename is specified, the normalized vectors are written to
+    that file (unless it is already up to date) and memory mapped from it, so
+    that they are computed once and shared by every process that uses them.
+    The row and column files they were computed from are recorded next to it,
+    in normalized_filename + '.sources'.
+    """
     with open(vocab_filename, 'r') as lines:
       self.vocab = [line.split()[0] for line in lines]
       self.word_to_idx = {word: idx for idx, word in enumerate(self.vocab)}
 
     n = len(self.vocab)
 
-    with open(rows_filename, 'r') as rows_fh:
-      rows_fh.seek(0, os.SEEK_END)
-      size = rows_fh.tell()
+    size = os.path.getsize(rows_filename)
+
+    # Make sure that the file size seems reasonable.
+    if size % (4 * n) != 0:
+      raise IOError(
+          'unexpected file size for binary vector file %s' % rows_filename)
+
+    if cols_filename and os.path.getsize(cols_filename) != size:
+      raise IOError('row and column vector files have different sizes')
+
+    dim = size // (4 * n)
+    shape = (n, dim)
+    sources = [rows_filename] + ([cols_filename] if cols_filename else [])
+
+    if normalized_filename and self._is_fresh(
+        normalized_filename, size, sources):
+      self.vecs = np.memmap(
+          normalized_filename, dtype=np.float32, mode='r', shape=shape)
+      self.index = None
+      return
+
+    # Memory map the rows.
+    rows = np.memmap(rows_filename, dtype=np.float32, mode='r', shape=shape)
 
-      # Make sure that the file size seems reasonable.
-      if size % (4 * n) != 0:
-        raise IOError(
-            'unexpected file size for binary vector file %s' % rows_filename)
+    # If column vectors were specified, then open them and add them to the
+    # row vectors.
+    cols = None
+    if cols_filename:
+      cols = np.memmap(cols_filename, dtype=np.float32, mode='r', shape=shape)
 
-      # Memory map the rows.
-      dim = size / (4 * n)
-      rows_mm = mmap.mmap(rows_fh.fileno(), 0, prot=mmap.PROT_READ)
-      rows = np.matrix(
-          np.frombuffer(rows_mm, dtype=np.float32).reshape(n, dim))
+    if normalized_filename:
+      # The vectors are written to a temporary file which is renamed into
+      # place once complete, so an interrupted run never leaves a partial file.
+      tmp_filename = '%s.tmp.%d' % (normalized_filename, os.getpid())
+      if os.path.exists(normalized_filename + '.sources'):
+        os.remove(normalized_filename + '.sources')
+      vecs = np.memmap(tmp_filename, dtype=np.float32, mode='w+', shape=shape)
+    else:
+      vecs = np.empty(shape, dtype=np.float32)
 
-      # If column vectors were specified, then open them and add them to the
-      # row vectors.
-      if cols_filename:
-        with open(cols_filename, 'r') as cols_fh:
-          cols_mm = mmap.mmap(cols_fh.fileno(), 0, prot=mmap.PROT_READ)
-          cols_fh.seek(0, os.SEEK_END)
-          if cols_fh.tell() != size:
-            raise IOError('row and column vector files have different sizes')
+    # Normalize so that dot products are just cosine similarity.  This is done
+    # a block at a time so that the inputs never have to fit in memory.
+    for start in xrange(0, n, BLOCK_SIZE):
+      block = np.array(rows[start:start + BLOCK_SIZE])
+      if cols is not None:
+        block += cols[start:start + BLOCK_SIZE]
 
-          cols = np.matrix(
-              np.frombuffer(cols_mm, dtype=np.float32).reshape(n, dim))
+      block /= np.linalg.norm(block, axis=1).reshape(-1, 1)
+      vecs[start:start + BLOCK_SIZE] = block
 
-          rows += cols
-          cols_mm.close()
+    if normalized_filename:
+      vecs.flush()
+      del vecs
+      os.rename(tmp_filename, normalized_filename)
+      self._write_sources(normalized_filename, sources)
+      vecs = np.memmap(
+          normalized_filename, dtype=np.float32, mode='r', shape=shape)
 
-      # Normalize so that dot products are just cosine similarity.
-      self.vecs = rows / np.linalg.norm(rows, axis=1).reshape(n, 1)
-      rows_mm.close()
+    self.vecs = vecs
+    self.index = None
+
+  @staticmethod
+  def _describe_sources(sources):
+    """Describes the sources by their absolute paths, sizes and mtimes."""
+    return ''.join(
+        '%s\t%d\t%r\n' % (os.path.abspath(source), os.path.getsize(source),
+                            os.path.getmtime(source))
+        for source in sources)
+
+  @classmethod
+  def _write_sources(cls, filename, sources):
+    """Records the sources that the normalized vectors in filename came from."""
+    tmp_filename = '%s.sources.tmp.%d' % (filename, os.getpid())
+    with open(tmp_filename, 'w') as f:
+      f.write(cls._describe_sources(sources))
+
+    os.rename(tmp_filename, filename + '.sources')
+
+  @classmethod
+  def _is_fresh(cls, filename, size, sources):
+    """Whether filename holds vectors normalized from the current sources."""
+    if not os.path.exists(filename) or os.path.getsize(filename) != size:
+      return False
+
+    try:
+      with open(filename + '.sources', 'r') as f:
+        recorded = f.read()
+    except IOError:
+      return False
+
+    return recorded == cls._describe_sources(sources)
 
   def similarity(self, word1, word2):
     """Computes the similarity of two tokens."""
     idx1 = self.word_to_idx.get(word1)
     idx2 = self.word_to_idx.get(word2)
-    if not idx1 or not idx2:
+    if idx1 is None or idx2 is None:
       return None
 
-    return float(self.vecs[idx1] * self.vecs[idx2].transpose())
+    return float(np.dot(self.vecs[idx1], self.vecs[idx2]))
+
+  def similarities(self, pairs):
+    """Computes the similarities of a list of (word1, word2) pairs.
+
+    Returns:
+      A list with the similarity of each pair, or None if either of the words
+      is not in the vocabulary.
+    """
+    idxs = [(self.word_to_idx.get(w1), self.word_to_idx.get(w2))
+            for w1, w2 in pairs]
+    known = [i for i, (idx1, idx2) in enumerate(idxs)
+             if idx1 is not None and idx2 is not None]
+
+    sims = [None] * len(pairs)
+    if known:
+      idxs1, idxs2 = zip(*[idxs[i] for i in known])
+      dots = np.einsum('ij,ij->i', self.vecs[list(idxs1)],
+                       self.vecs[list(idxs2)])
+      for i, sim in zip(known, dots):
+        sims[i] = float(sim)
+
+    return sims
+
+  def top_k(self, queries, k=10):
+    """Finds the k nearest neighbors of each query vector.
+
+    The queries are scored against BLOCK_SIZE vocabulary rows at a time, and
+    only the best k of each block are kept.
+
+    Args:
+      queries: a [num_queries, dim] array of query vectors.
+      k: the number of neighbors to return for each query.
+
+    Returns:
+      A tuple (indices, scores) of [num_queries, k] arrays, best first.
+    """
+    queries = np.asarray(queries, dtype=np.float32).reshape(
+        -1, self.vecs.shape[1])
+
+    best_idxs, best_scores = None, None
+    for start in xrange(0, len(self.vocab), BLOCK_SIZE):
+      scores = np.dot(queries, self.vecs[start:start + BLOCK_SIZE].T)
+      idxs, scores = _top_k(scores, k)
+      idxs += start
+      if best_idxs is None:
+        best_idxs, best_scores = idxs, scores
+      else:
+        merged_idxs, best_scores = _top_k(
+            np.hstack([best_scores, scores]), k)
+        best_idxs = np.take_along_axis(
+            np.hstack([best_idxs, idxs]), merged_idxs, axis=1)
+
+    return best_idxs, best_scores
+
+  def _query_vectors(self, queries):
+    """Looks up the word queries; returns (vectors, indices of known queries)."""
+    known, vectors = [], []
+    for i, query in enumerate(queries):
+      if isinstance(query, string_types):
+        idx = self.word_to_idx.get(query)
+        if idx is None:
+          continue
+
+        query = self.vecs[idx]
+
+      known.append(i)
+      vectors.append(np.asarray(query, dtype=np.float32).ravel())
+
+    return np.array(vectors).reshape(-1, self.vecs.shape[1]), known
+
+  def neighbors(self, query, k=None):
+    """Returns the nearest neighbors to the query (a word or vector).
+
+    If k is specified, only the k nearest neighbors are returned.
+    """
+    if k is not None:
+      return self.neighbors_batch([query], k)[0]
 
-  def neighbors(self, query):
-    """Returns the nearest neighbors to the query (a word or vector)."""
     if isinstance(query, string_types):
       idx = self.word_to_idx.get(query)
       if idx is None:
@@ -80,13 +239,260 @@ class Vecs(object):
 
       query = self.vecs[idx]
 
-    neighbors = self.vecs * query.transpose()
+    neighbors = np.dot(self.vecs, np.asarray(query, dtype=np.float32).ravel())
+    order = np.argsort(-neighbors, kind='mergesort')
+    return [(self.vocab[idx], float(neighbors[idx])) for idx in order]
+
+  def neighbors_batch(self, queries, k=10, approximate=False, nprobe=8):
+    """Returns the k nearest neighbors of each query (a word or vector).
+
+    Args:
+      queries: a list of words or vectors.
+      k: the number of neighbors to return for each query.
+      approximate: whether to search the index built by build_index() or
+        loaded by load_index() instead of all of the vectors.
+      nprobe: the number of index lists to search if approximate is set.
+
+    Returns:
+      A list with a list of (word, similarity) pairs for each query, or None if
+      the query is a word that is not in the vocabulary.
+
+    Raises:
+      ValueError: if approximate is set but there is no index.
+    """
+    if approximate and self.index is None:
+      raise ValueError('approximate search needs an index; see build_index()')
+
+    vectors, known = self._query_vectors(queries)
+    if approximate:
+      idxs, scores = self.index.search(self.vecs, vectors, k, nprobe)
+    else:
+      idxs, scores = self.top_k(vectors, k)
+
+    results = [None] * len(queries)
+    for i, query_idxs, query_scores in zip(known, idxs, scores):
+      results[i] = [(self.vocab[idx], float(score))
+                    for idx, score in zip(query_idxs, query_scores)
+                    if idx >= 0]
+
+    return results
+
+  def analogies(self, queries, method='add', num_threads=1, batch_size=256,
+                block_size=16384):
+    """Solves analogy queries "a is to b as c is to ?".
 
-    return sorted(
-      zip(self.vocab, neighbors.flat),
-      key=lambda kv: kv[1], reverse=True)
+    The answer is the word other than a, b and c that maximizes
+
+      3CosAdd: cos(d, b) - cos(d, a) + cos(d, c), or
+      3CosMul: cos'(d, b) * cos'(d, c) / (cos'(d, a) + 0.001),
+
+    where cos' = (cos + 1) / 2 (Levy and Goldberg, 2014).  The queries are
+    processed batch_size at a time: each distinct word of a batch is scored
+    against block_size vocabulary rows with a single matrix product, and the
+    scores of every query are assembled from those rows.  Batches are spread
+    over num_threads threads (NumPy releases the GIL in matrix products).
+
+    Args:
+      queries: a [num_queries, 3] array with the vocabulary indices of a, b
+        and c.
+      method: 'add' for 3CosAdd or 'mul' for 3CosMul.
+      num_threads: the number of threads to use.
+      batch_size: the number of queries per batch.
+      block_size: the number of vocabulary rows scored at once.
+
+    Returns:
+      A [num_queries] array with the vocabulary index of each answer.
+
+    Raises:
+      ValueError: if the method is unknown.
+    """
+    if method not in ('add', 'mul'):
+      raise ValueError('unknown analogy method %r' % method)
+
+    queries = np.asarray(queries, dtype=np.int64).reshape(-1, 3)
+
+    def solve(start):
+      batch = queries[start:start + batch_size]
+      words, batch = np.unique(batch, return_inverse=True)
+      batch = batch.reshape(-1, 3)
+      word_vecs = np.asarray(self.vecs[words])
+      rows = np.arange(len(batch))
+
+      best = np.zeros(len(batch), dtype=np.int64)
+      best_scores = np.full(len(batch), -np.inf, dtype=np.float32)
+      for block_start in xrange(0, len(self.vocab), block_size):
+        block = self.vecs[block_start:block_start + block_size]
+        sims = np.dot(word_vecs, block.T)
+        if method == 'add':
+          scores = sims[batch[:, 1]] - sims[batch[:, 0]] + sims[batch[:, 2]]
+        else:
+          sims = (sims + 1) / 2
+          scores = sims[batch[:, 1]] * sims[batch[:, 2]] / (
+              sims[batch[:, 0]] + 0.001)
+
+        # Exclude the query words from the answers.
+        for col in xrange(3):
+          excluded = words[batch[:, col]] - block_start
+          in_block = (excluded >= 0) & (excluded < scores.shape[1])
+          scores[rows[in_block], excluded[in_block]] = -np.inf
+
+        block_best = np.argmax(scores, axis=1)
+        block_scores = scores[rows, block_best]
+        better = block_scores > best_scores
+        best[better] = block_best[better] + block_start
+        best_scores[better] = block_scores[better]
+
+      return best
+
+    starts = list(xrange(0, len(queries), batch_size))
+    if num_threads > 1 and len(starts) > 1:
+      pool = ThreadPool(num_threads)
+      try:
+        answers = pool.map(solve, starts)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      answers = [solve(start) for start in starts]
+
+    return np.concatenate(answers) if answers else np.zeros(0, dtype=np.int64)
+
+  def build_index(self, num_lists=None, num_iters=10, sample_size=65536,
+                  seed=0):
+    """Builds an IVFIndex over the vectors for approximate neighbor search."""
+    self.index = IVFIndex.build(
+        self.vecs, num_lists, num_iters, sample_size, seed)
+    return self.index
+
+  def load_index(self, filename):
+    """Loads an IVFIndex saved with IVFIndex.save()."""
+    index = IVFIndex.load(filename)
+    if len(index.order) != len(self.vocab):
+      raise IOError('index %s does not match the vocabulary' % filename)
+
+    self.index = index
+    return index
 
   def lookup(self, word):
     """Returns the embedding for a token, or None if no embedding exists."""
     idx = self.word_to_idx.get(word)
     return None if idx is None else self.vecs[idx]
+
+
+class IVFIndex(object):
+  """An inverted file index for approximate nearest neighbor search.
+
+  The vectors are clustered with spherical k-means, and each vector is stored
+  in the list of its nearest centroid.  A query is only scored against the
+  vectors in the nprobe lists whose centroids are nearest to it.  The index
+  only stores the centroids and the list of each vector; the vectors themselves
+  are passed to search().
+  """
+
+  def __init__(self, centroids, order, offsets):
+    """Initializes the index.
+
+    Args:
+      centroids: a [num_lists, dim] array of unit length centroids.
+      order: the vector indices, sorted by list.
+      offsets: an array of num_lists + 1 offsets into order; the vectors of
+        list i are order[offsets[i]:offsets[i + 1]].
+    """
+    self.centroids = centroids
+    self.order = order
+    self.offsets = offsets
+
+  @classmethod
+  def build(cls, vecs, num_lists=None, num_iters=10, sample_size=65536,
+            seed=0):
+    """Clusters unit length vectors into an index.
+
+    Args:
+      vecs: a [n, dim] array of unit length vectors.
+      num_lists: the number of lists; defaults to about 4 * sqrt(n).
+      num_iters: the number of k-means iterations.
+      sample_size: the number of vectors the centroids are trained on.
+      seed: the random seed.
+
+    Returns:
+      An IVFIndex.
+    """
+    n = len(vecs)
+    if num_lists is None:
+      num_lists = int(4 * np.sqrt(n))
+
+    num_lists = max(1, min(num_lists, n))
+
+    rng = np.random.RandomState(seed)
+    sample = np.sort(rng.choice(n, min(n, max(sample_size, num_lists)),
+                                replace=False))
+    sample = np.asarray(vecs[sample])
+
+    centroids = sample[rng.choice(len(sample), num_lists, replace=False)]
+    for _ in xrange(num_iters):
+      assignments = cls._assign(centroids, sample)
+      sums = np.zeros_like(centroids)
+      np.add.at(sums, assignments, sample)
+      norms = np.linalg.norm(sums, axis=1)
+
+      # Keep the old centroid for empty clusters.
+      nonempty = norms > 0
+      centroids[nonempty] = sums[nonempty] / norms[nonempty].reshape(-1, 1)
+
+    assignments = np.concatenate([
+        cls._assign(centroids, vecs[start:start + BLOCK_SIZE])
+        for start in xrange(0, n, BLOCK_SIZE)])
+
+    order = np.argsort(assignments, kind='mergesort')
+    offsets = np.searchsorted(assignments[order], np.arange(num_lists + 1))
+    return cls(centroids, order, offsets)
+
+  @staticmethod
+  def _assign(centroids, vecs):
+    """Returns the index of the nearest centroid of each vector."""
+    return np.argmax(np.dot(vecs, centroids.T), axis=1)
+
+  @classmethod
+  def load(cls, filename):
+    with np.load(filename) as data:
+      return cls(data['centroids'], data['order'], data['offsets'])
+
+  def save(self, filename):
+    with open(filename, 'wb') as out:
+      np.savez(out, centroids=self.centroids, order=self.order,
+               offsets=self.offsets)
+
+  def search(self, vecs, queries, k=10, nprobe=8):
+    """Finds the approximate k nearest neighbors of each query vector.
+
+    Args:
+      vecs: the [n, dim] array of vectors that the index was built from.
+      queries: a [num_queries, dim] array of query vectors.
+      k: the number of neighbors to return for each query.
+      nprobe: the number of lists to search for each query.
+
+    Returns:
+      A tuple (indices, scores) of [num_queries, k] arrays, best first.  If
+      the searched lists have fewer than k vectors, the remaining indices are
+      -1 and the scores -inf.
+    """
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, vecs.shape[1])
+    probes, _ = _top_k(np.dot(queries, self.centroids.T), nprobe)
+
+    idxs = np.full((len(queries), k), -1, dtype=np.int64)
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    for i, query in enumerate(queries):
+      candidates = np.concatenate([
+          self.order[self.offsets[probe]:self.offsets[probe + 1]]
+          for probe in probes[i]])
+      if not len(candidates):
+        continue
+
+      # Gather the candidates in file order to keep memory mapped reads local.
+      candidates.sort()
+      best, best_scores = _top_k(
+          np.dot(vecs[candidates], query).reshape(1, -1), k)
+      idxs[i, :best.shape[1]] = candidates[best[0]]
+      scores[i, :best.shape[1]] = best_scores[0]
+
+    return idxs, scores
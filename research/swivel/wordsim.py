@@ -72,17 +72,15 @@ except IOError as e:
 
 
 def evaluate(lines):
-  acts, preds = [], []
-
-  with open(filename, 'r') as lines:
-    for line in lines:
-      w1, w2, act = line.strip().split('\t')
-      pred = vecs.similarity(w1, w2)
-      if pred is None:
-        continue
-
-      acts.append(float(act))
-      preds.append(pred)
+  pairs, acts = [], []
+  for line in lines:
+    w1, w2, act = line.strip().split('\t')
+    pairs.append((w1, w2))
+    acts.append(float(act))
+
+  preds = vecs.similarities(pairs)
+  acts = [act for act, pred in zip(acts, preds) if pred is not None]
+  preds = [pred for pred in preds if pred is not None]
 
   rho, _ = scipy.stats.spearmanr(acts, preds)
   return rho
@@ -18,6 +18,7 @@ from __future__ import absolute_import
 from __future__ import absolute_import
 from __future__ import division
 
+from multiprocessing.pool import ThreadPool
 import os
 import numpy as np
 from estimators.get_estimator import get_estimator
@@ -40,11 +41,43 @@ tf.app.flags.DEFINE_string(
 tf.app.flags.DEFINE_string(
     'checkpointdir', '/tmp/tcn', 'Path to model checkpoints.')
 tf.app.flags.DEFINE_string('outdir', '/tmp/tcn', 'Path to write summaries to.')
+tf.app.flags.DEFINE_integer(
+    'num_threads', 4, 'Number of sequences to compute alignments for at once.')
 FLAGS = tf.app.flags.FLAGS
 
 
+def compute_sequence_alignments(view_embeddings, num_views):
+  """Computes the cross-view alignment for all view pairs of a sequence.
+
+  Args:
+    view_embeddings: A [num_views, sequence length, embedding size] numpy
+      array holding the embedded views of one sequence.
+    num_views: Int, number of simultaneous views in the dataset.
+
+  Returns:
+    A list holding the alignment of every view pair (i, j), i < j.
+  """
+  alignments = []
+  for idx_i in range(num_views):
+    for idx_j in range(idx_i+1, num_views):
+      embeddings_view_i = view_embeddings[idx_i]
+      embeddings_view_j = view_embeddings[idx_j]
+
+      seq_len = len(embeddings_view_i)
+
+      times_i = np.arange(seq_len)
+      # Get the nearest time_index for each embedding in view_i.
+      times_j = util.KNNIdsBatch(embeddings_view_i, embeddings_view_j)[:, 0]
+
+      # Compute sequence view pair alignment.
+      alignments.append(
+          np.mean(np.abs(times_i-times_j)/float(seq_len)))
+  return alignments
+
+
 def compute_average_alignment(
-    seqname_to_embeddings, num_views, summary_writer, training_step):
+    seqname_to_embeddings, num_views, summary_writer, training_step,
+    num_threads=1):
   """Computes the average cross-view alignment for all sequence view pairs.
 
   Args:
@@ -53,30 +86,27 @@ def compute_average_alignment(
     num_views: Int, number of simultaneous views in the dataset.
     summary_writer: A `SummaryWriter` object.
     training_step: Int, the training step of the model used to embed images.
+    num_threads: Int, number of sequences to compute alignments for at once.
 
   Alignment is the scaled absolute difference between the ground truth time
   and the knn aligned time.
   abs(|time_i - knn_time|) / sequence_length
   """
+  def _align(view_embeddings):
+    return compute_sequence_alignments(view_embeddings, num_views)
+  all_embeddings = list(seqname_to_embeddings.values())
+  if num_threads > 1:
+    pool = ThreadPool(num_threads)
+    sequence_alignments = pool.map(_align, all_embeddings)
+    pool.close()
+  else:
+    sequence_alignments = [_align(e) for e in all_embeddings]
+
   all_alignments = []
-  for _, view_embeddings in seqname_to_embeddings.iteritems():
-    for idx_i in range(num_views):
-      for idx_j in range(idx_i+1, num_views):
-        embeddings_view_i = view_embeddings[idx_i]
-        embeddings_view_j = view_embeddings[idx_j]
-
-        seq_len = len(embeddings_view_i)
-
-        times_i = np.array(range(seq_len))
-        # Get the nearest time_index for each embedding in view_i.
-        times_j = np.array([util.KNNIdsWithDistances(
-            q, embeddings_view_j, k=1)[0][0] for q in embeddings_view_i])
-
-        # Compute sequence view pair alignment.
-        alignment = np.mean(
-            np.abs(np.array(times_i)-np.array(times_j))/float(seq_len))
-        all_alignments.append(alignment)
-        print('alignment so far %f' % alignment)
+  for alignments in sequence_alignments:
+    for alignment in alignments:
+      all_alignments.append(alignment)
+      print('alignment so far %f' % alignment)
   average_alignment = np.mean(all_alignments)
   print('Average alignment %f' % average_alignment)
   summ = tf.Summary(value=[tf.Summary.Value(
@@ -102,7 +132,8 @@ def evaluate_once(
   summary_dir = os.path.join(FLAGS.outdir, 'alignment_summaries')
   summary_writer = tf.summary.FileWriter(summary_dir)
   compute_average_alignment(
-      seqname_to_embeddings, num_views, summary_writer, ckpt_step)
+      seqname_to_embeddings, num_views, summary_writer, ckpt_step,
+      num_threads=FLAGS.num_threads)
 
 
 def main(_):
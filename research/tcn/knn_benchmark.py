@@ -0,0 +1,101 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Times the knn computations of alignment.py and labeled_eval.py.
+
+Random embeddings stand in for an embedded validation set, so no checkpoint
+or data is needed. Each evaluation is timed with the batched knn of
+util.KNNIdsBatch and with one util.KNNIdsWithDistances call per embedding.
+
+  python knn_benchmark.py --num_sequences 20 --sequence_length 200
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import numpy as np
+import alignment
+import labeled_eval
+from utils import util
+import tensorflow as tf
+
+tf.flags.DEFINE_integer('num_sequences', 20, 'Number of sequences.')
+tf.flags.DEFINE_integer('num_views', 2, 'Number of views per sequence.')
+tf.flags.DEFINE_integer('sequence_length', 200, 'Frames per view.')
+tf.flags.DEFINE_integer('embedding_size', 32, 'Embedding size.')
+tf.flags.DEFINE_integer('num_neighbors', 8, 'Neighbors for labeled eval.')
+tf.flags.DEFINE_boolean('run_per_embedding', True,
+                        'Also time one knn call per embedding.')
+FLAGS = tf.flags.FLAGS
+
+
+def per_embedding_alignments(view_embeddings, num_views):
+  alignments = []
+  for idx_i in range(num_views):
+    for idx_j in range(idx_i+1, num_views):
+      seq_len = len(view_embeddings[idx_i])
+      times_j = np.array([util.KNNIdsWithDistances(
+          q, view_embeddings[idx_j], k=1)[0][0]
+                          for q in view_embeddings[idx_i]])
+      alignments.append(
+          np.mean(np.abs(np.arange(seq_len)-times_j)/float(seq_len)))
+  return alignments
+
+
+def per_embedding_neighbors(data, tasks, n_neighbors):
+  indices = np.zeros((len(data), n_neighbors), dtype=np.int32)
+  for idx in range(len(data)):
+    others = np.where(tasks != tasks[idx])[0]
+    nearest = util.KNNIdsWithDistances(data[idx], data[others], k=n_neighbors)
+    indices[idx] = others[[i for i, _ in nearest]]
+  return indices
+
+
+def timed(fn, *args):
+  start = time.time()
+  result = fn(*args)
+  return result, time.time() - start
+
+
+def main(_):
+  rng = np.random.RandomState(0)
+  sequences = [rng.randn(FLAGS.num_views, FLAGS.sequence_length,
+                         FLAGS.embedding_size)
+               for _ in range(FLAGS.num_sequences)]
+  data = np.concatenate([s[0] for s in sequences])
+  tasks = np.repeat(np.arange(FLAGS.num_sequences), FLAGS.sequence_length)
+
+  batched = [lambda: [alignment.compute_sequence_alignments(
+      s, FLAGS.num_views) for s in sequences],
+             lambda: labeled_eval.nearest_cross_sequence_neighbors(
+                 data, tasks, FLAGS.num_neighbors)]
+  per_embedding = [lambda: [per_embedding_alignments(
+      s, FLAGS.num_views) for s in sequences],
+                   lambda: per_embedding_neighbors(
+                       data, tasks, FLAGS.num_neighbors)]
+  for name, fn, baseline in zip(['alignment', 'labeled knn'], batched,
+                                per_embedding):
+    result, batched_time = timed(fn)
+    print('%-12s batched: %.3fs' % (name, batched_time))
+    if FLAGS.run_per_embedding:
+      expected, baseline_time = timed(baseline)
+      assert np.allclose(result, expected)
+      print('%-12s per embedding: %.3fs (%.1fx)' % (
+          name, baseline_time, baseline_time / batched_time))
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -21,8 +21,6 @@ from __future__ import print_function
 from collections import defaultdict
 import os
 import numpy as np
-from sklearn.metrics.pairwise import pairwise_distances
-from six.moves import xrange
 import data_providers
 from estimators.get_estimator import get_estimator
 from utils import util
@@ -68,27 +66,11 @@ def nearest_cross_sequence_neighbors(data, tasks, n_neighbors=1):
       restricted to be from different named sequences (as defined in `tasks`).
   """
 
-  # Compute the pairwise sequence adjacency matrix from `tasks`.
-  num_data = data.shape[0]
-  tasks = np.array(tasks)
-  tasks = np.reshape(tasks, (num_data, 1))
-  assert len(tasks.shape) == 2
-  not_adjacent = (tasks != tasks.T)
-
-  # Compute the symmetric pairwise distance matrix.
-  pdist = pairwise_distances(data, metric='sqeuclidean')
-
-  # For every row in the pairwise distance matrix, only consider
-  # cross-sequence columns.
-  indices = np.zeros((num_data, n_neighbors), dtype=np.int32)
-  for idx in range(num_data):
-    # Restrict to cross_sequence neighbors.
-    distances = [(
-        pdist[idx][i], i) for i in xrange(num_data) if not_adjacent[idx][i]]
-    _, nearest_indices = zip(*sorted(
-        distances, key=lambda x: x[0])[:n_neighbors])
-    indices[idx] = nearest_indices
-  return indices
+  # Only consider cross-sequence neighbors, computing distances for a block
+  # of rows at a time.
+  return util.KNNIdsBatch(
+      data, data, k=n_neighbors, query_groups=tasks,
+      target_groups=tasks).astype(np.int32)
 
 
 def compute_cross_sequence_recall_at_k(retrieved_labels, labels, k_list):
@@ -42,6 +42,22 @@ class LabeledEvalTest(tf.test.TestCase):
     repeated_tasks = np.tile(np.reshape(tasks, (num_data, 1)), n_neighbors)
     self.assertTrue(np.all(np.not_equal(repeated_tasks, tasks[indices])))
 
+  def testNearestCrossSequenceNeighborsMatchesSortedDistances(self):
+    num_data = 50
+    n_neighbors = 5
+    data = np.random.randn(num_data, 3)
+    tasks = np.repeat(range(5), num_data // 5)
+
+    indices = labeled_eval.nearest_cross_sequence_neighbors(
+        data, tasks, n_neighbors=n_neighbors)
+
+    # Compare against sorting each row's cross-sequence distances.
+    for idx in range(num_data):
+      distances = [(np.sum((data[idx] - data[i])**2), i)
+                   for i in range(num_data) if tasks[i] != tasks[idx]]
+      expected = [i for _, i in sorted(distances)[:n_neighbors]]
+      self.assertAllEqual(expected, indices[idx])
+
   def testPerfectCrossSequenceRecall(self):
     # Make sure cross-sequence recall@k returns 1.0 for near-duplicate features.
     embeddings = np.random.randn(10, 2)
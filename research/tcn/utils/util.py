@@ -188,6 +188,74 @@ def KNNIdsWithDistances(query_vec, target_seq, k=1):
   return sorted_distances[:k]
 
 
+def SquaredDistances(query_seq, target_seq):
+  """Computes the [num_queries, num_targets] squared euclidean distances."""
+  query_seq = np.asarray(query_seq, dtype=np.float64)
+  target_seq = np.asarray(target_seq, dtype=np.float64)
+  distances = np.dot(query_seq, -2. * target_seq.T)
+  distances += np.sum(np.square(query_seq), axis=1)[:, None]
+  distances += np.sum(np.square(target_seq), axis=1)[None, :]
+  return np.maximum(distances, 0., out=distances)
+
+
+def _CandidateMargins(query_seq, target_seq):
+  """Bounds the rounding error of SquaredDistances for each query."""
+  scale = (np.sum(np.square(query_seq), axis=1) +
+           np.max(np.sum(np.square(target_seq), axis=1)))
+  return 1e-9 * scale + 1e-300
+
+
+def KNNIdsBatch(query_seq, target_seq, k=1, query_groups=None,
+                target_groups=None, block_size=1024):
+  """Gets the knn ids to every query vec from the target sequence.
+
+  Distances are computed with one matrix product per block of block_size
+  queries. As its rounding errors may reorder near ties, the targets within
+  that error of the k-th nearest one are then ranked by their exact
+  distances, with ties broken by the lower target id, as in KNNIds.
+
+  Args:
+    query_seq: A [num_queries, embedding size] array.
+    target_seq: A [num_targets, embedding size] array.
+    k: Int, the number of nearest ids to return for each query.
+    query_groups: Optional [num_queries] array. If set, together with
+      target_groups, only targets from a different group than the query are
+      considered.
+    target_groups: Optional [num_targets] array.
+    block_size: Int, the number of queries to compute distances for at once.
+
+  Returns:
+    An np.int64 array of size [num_queries, k] holding the knn ids.
+  """
+  query_seq = np.asarray(query_seq, dtype=np.float64)
+  target_seq = np.asarray(target_seq, dtype=np.float64)
+  assert np.shape(query_seq)[1:] == np.shape(target_seq)[1:]
+  if query_groups is not None:
+    query_groups = np.asarray(query_groups)
+    target_groups = np.asarray(target_groups)
+  ids = np.zeros((len(query_seq), k), dtype=np.int64)
+  for start in range(0, len(query_seq), block_size):
+    end = start + block_size
+    queries = query_seq[start:end]
+    distances = SquaredDistances(queries, target_seq)
+    if query_groups is not None:
+      distances[query_groups[start:end, None] == target_groups[None, :]] = (
+          np.inf)
+    kth = np.partition(distances, k - 1, axis=1)[:, k - 1]
+    margins = _CandidateMargins(queries, target_seq)
+    rows, cols = np.nonzero(distances <= (kth + 2 * margins)[:, None])
+    diffs = queries[rows] - target_seq[cols]
+    exact = np.where(np.isinf(distances[rows, cols]), np.inf,
+                     np.einsum('ij,ij->i', diffs, diffs))
+    # Sort the candidates by query, then exact distance, then target id.
+    order = np.lexsort((cols, exact, rows))
+    rows, cols = rows[order], cols[order]
+    ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    nearest = ranks < k
+    ids[start + rows[nearest], ranks[nearest]] = cols[nearest]
+  return ids
+
+
 def CopyLocalConfigsToCNS(outdir, configs, gfs_user):
   """Copies experiment yaml config files to the job_logdir on /cns."""
   assert configs
@@ -0,0 +1,69 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for tcn.utils.util."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+from utils import util
+
+
+class KNNIdsBatchTest(tf.test.TestCase):
+
+  def _assertMatchesKNNIds(self, queries, targets, k, block_size=1024):
+    ids = util.KNNIdsBatch(queries, targets, k=k, block_size=block_size)
+    for query, query_ids in zip(queries, ids):
+      self.assertAllEqual(util.KNNIds(query, targets, k=k), query_ids)
+
+  def testMatchesKNNIds(self):
+    rng = np.random.RandomState(0)
+    queries = rng.randn(50, 8)
+    targets = rng.randn(40, 8)
+    for k in [1, 3]:
+      self._assertMatchesKNNIds(queries, targets, k, block_size=16)
+
+  def testExactTiesPickLowerIds(self):
+    rng = np.random.RandomState(1)
+    targets = np.repeat(rng.randn(10, 4), 3, axis=0)
+    queries = targets[::3] + 1e-3 * rng.randn(10, 4)
+    self._assertMatchesKNNIds(queries, targets, k=4)
+
+  def testNearTiesOrderedByExactDistance(self):
+    # Far from the origin, the rounding errors of the matrix product exceed
+    # the differences between the distances to these targets.
+    rng = np.random.RandomState(2)
+    center = 1e4 * np.ones(16)
+    targets = center + 1e-6 * rng.randn(30, 16)
+    queries = center + 1e-6 * rng.randn(20, 16)
+    for k in [1, 5]:
+      self._assertMatchesKNNIds(queries, targets, k)
+
+  def testGroupsAreMasked(self):
+    rng = np.random.RandomState(3)
+    data = rng.randn(24, 3)
+    groups = np.repeat(np.arange(4), 6)
+    ids = util.KNNIdsBatch(data, data, k=6, query_groups=groups,
+                           target_groups=groups, block_size=5)
+    for i in range(len(data)):
+      others = np.nonzero(groups != groups[i])[0]
+      expected = others[util.KNNIds(data[i], data[others], k=6)]
+      self.assertAllEqual(expected, ids[i])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -13,12 +13,27 @@
 # limitations under the License.
 # ==============================================================================
 
-"""Batch reader to seq2seq attention model, with bucketing support."""
+"""Batch reader to seq2seq attention model, with bucketing support.
+
+Examples are read, converted to word ids, bucketed and padded into batches by
+worker processes, which pass the batches back to the trainer through slots in
+shared memory.
+
+Optionally, the conversion to word ids is done once and for all by
+WriteIdCache(), which writes an id cache of the data to a directory. A Batcher
+reading from the id cache skips parsing tf.Examples and tokenization.
+"""
 
 from collections import namedtuple
+import glob
+import hashlib
+import multiprocessing
+import os
+import random
 from random import shuffle
-from threading import Thread
-import time
+import struct
+import tempfile
+import traceback
 
 import numpy as np
 import six
@@ -34,6 +49,240 @@ ModelInput = namedtuple('ModelInput',
 
 BUCKET_CACHE_BATCH = 100
 QUEUE_NUM_BATCH = 100
+NUM_PROCESSES = 4
+# How often NextBatch() checks for dead worker processes while it waits.
+WATCH_INTERVAL_SECS = 10
+# A worker process that dies this many times in a row without producing a
+# batch makes NextBatch() raise, instead of being restarted forever.
+MAX_PROCESS_FAILURES = 3
+
+# Id cache files are named after their data file and a digest of the data file
+# path and of the settings the ids were computed with: the vocab, the feature
+# keys and the max number of sentences. The files start with _ID_CACHE_MAGIC
+# and the settings digest. Each example then is a header of the number of
+# article ids, of abstract ids, and the byte sizes of the article and abstract
+# texts, followed by the int32 ids and the texts.
+ID_CACHE_SUFFIX = '.ids'
+_ID_CACHE_MAGIC = b'textsum-ids-v2\n'
+_ID_CACHE_EXAMPLE_HEADER = struct.Struct('qqqq')
+
+
+def GetExampleIds(article, abstract, vocab, max_article_sentences,
+                  max_abstract_sentences):
+  """Converts an article and an abstract to word ids.
+
+  Args:
+    article: Article text, sentences marked by <s> and </s>.
+    abstract: Abstract text, sentences marked by <s> and </s>.
+    vocab: Vocabulary.
+    max_article_sentences: Max number of sentences used from article.
+    max_abstract_sentences: Max number of sentences used from abstract.
+
+  Returns:
+    enc_inputs: Word ids of the first sentences of the article.
+    dec_inputs: <s> followed by word ids of the first sentences of the abstract.
+    origin_article: Sentences of the article, without <s> and </s>.
+    origin_abstract: Sentences of the abstract, without <s> and </s>.
+  """
+  if six.PY3:
+    # The texts of tf.Examples are bytes.
+    article, abstract = [
+        text.decode('utf-8') if isinstance(text, bytes) else text
+        for text in (article, abstract)]
+  article_sentences = [sent.strip() for sent in
+                       data.ToSentences(article, include_token=False)]
+  abstract_sentences = [sent.strip() for sent in
+                        data.ToSentences(abstract, include_token=False)]
+
+  enc_inputs = []
+  # Use the <s> as the <GO> symbol for decoder inputs.
+  dec_inputs = [vocab.WordToId(data.SENTENCE_START)]
+
+  # Convert first N sentences to word IDs, stripping existing <s> and </s>.
+  for i in xrange(min(max_article_sentences, len(article_sentences))):
+    enc_inputs += data.GetWordIds(article_sentences[i], vocab)
+  for i in xrange(min(max_abstract_sentences, len(abstract_sentences))):
+    dec_inputs += data.GetWordIds(abstract_sentences[i], vocab)
+
+  return (enc_inputs, dec_inputs, ' '.join(article_sentences),
+          ' '.join(abstract_sentences))
+
+
+def _ToBytes(text):
+  return text.encode('utf-8') if isinstance(text, six.text_type) else text
+
+
+def _IdCacheSettingsDigest(vocab, article_key, abstract_key,
+                           max_article_sentences, max_abstract_sentences):
+  """Returns the sha1 digest of the settings an id cache is written with."""
+  digest = hashlib.sha1()
+  for value in [article_key, abstract_key, str(max_article_sentences),
+                str(max_abstract_sentences)]:
+    digest.update(_ToBytes(value) + b'\n')
+  for word_id in xrange(vocab.NumIds()):
+    digest.update(_ToBytes(vocab.IdToWord(word_id)) + b'\n')
+  return digest.digest()
+
+
+def _IdCacheFile(cache_dir, data_file, settings_digest):
+  """Returns the path of the id cache file of a data file."""
+  file_digest = hashlib.sha1(
+      _ToBytes(os.path.abspath(data_file)) + settings_digest).hexdigest()
+  return os.path.join(cache_dir, '%s.%s%s' % (
+      os.path.basename(data_file), file_digest[:16], ID_CACHE_SUFFIX))
+
+
+def _WriteIdCacheFile(args):
+  """Writes the id cache file of one data file."""
+  (data_file, cache_file, settings_digest, vocab, article_key, abstract_key,
+   max_article_sentences, max_abstract_sentences) = args
+  num_examples = 0
+  # A unique temporary file, as concurrent jobs may write the same cache file.
+  fd, tmp_file = tempfile.mkstemp(
+      dir=os.path.dirname(cache_file),
+      prefix=os.path.basename(cache_file) + '.', suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as writer:
+      writer.write(_ID_CACHE_MAGIC + settings_digest)
+      for ex in data.ExampleGen(data_file, num_epochs=1):
+        try:
+          article = data.GetExFeatureText(ex, article_key)
+          abstract = data.GetExFeatureText(ex, abstract_key)
+        except (IndexError, ValueError):
+          tf.logging.error('Failed to get article or abstract from example')
+          continue
+        enc_inputs, dec_inputs, article, abstract = GetExampleIds(
+            article, abstract, vocab, max_article_sentences,
+            max_abstract_sentences)
+        article, abstract = _ToBytes(article), _ToBytes(abstract)
+        writer.write(_ID_CACHE_EXAMPLE_HEADER.pack(
+            len(enc_inputs), len(dec_inputs), len(article), len(abstract)))
+        writer.write(np.array(enc_inputs, dtype=np.int32).tobytes())
+        writer.write(np.array(dec_inputs, dtype=np.int32).tobytes())
+        writer.write(article)
+        writer.write(abstract)
+        num_examples += 1
+    os.rename(tmp_file, cache_file)
+  finally:
+    if os.path.exists(tmp_file):
+      os.remove(tmp_file)
+  return num_examples
+
+
+def WriteIdCache(data_path, cache_dir, vocab, article_key, abstract_key,
+                 max_article_sentences, max_abstract_sentences,
+                 num_processes=NUM_PROCESSES):
+  """Writes the word ids of the examples of data files to an id cache.
+
+  Every data file gets an id cache file in cache_dir, named after the data file
+  and keyed by its path and the other arguments, so that data sets and settings
+  can share a cache_dir. Files already in the cache are not rewritten, so an
+  interrupted run resumes where it stopped.
+
+  Args:
+    data_path: tf.Example filepattern.
+    cache_dir: Directory of the id cache.
+    vocab: Vocabulary.
+    article_key: article feature key in tf.Example.
+    abstract_key: abstract feature key in tf.Example.
+    max_article_sentences: Max number of sentences used from article.
+    max_abstract_sentences: Max number of sentences used from abstract.
+    num_processes: Number of data files converted in parallel.
+
+  Returns:
+    The number of examples written to the id cache.
+  """
+  if not os.path.isdir(cache_dir):
+    os.makedirs(cache_dir)
+  settings_digest = _IdCacheSettingsDigest(
+      vocab, article_key, abstract_key, max_article_sentences,
+      max_abstract_sentences)
+  tasks = []
+  for data_file in sorted(glob.glob(data_path)):
+    cache_file = _IdCacheFile(cache_dir, data_file, settings_digest)
+    if not os.path.exists(cache_file):
+      tasks.append((data_file, cache_file, settings_digest, vocab, article_key,
+                    abstract_key, max_article_sentences,
+                    max_abstract_sentences))
+  tf.logging.info('Writing id cache of %d data files to %s', len(tasks),
+                  cache_dir)
+  if num_processes > 1 and len(tasks) > 1:
+    pool = multiprocessing.Pool(min(num_processes, len(tasks)))
+    try:
+      return sum(pool.map(_WriteIdCacheFile, tasks))
+    finally:
+      pool.close()
+      pool.join()
+  return sum(_WriteIdCacheFile(task) for task in tasks)
+
+
+def IdCacheGen(data_path, cache_dir, vocab, article_key, abstract_key,
+               max_article_sentences, max_abstract_sentences, num_epochs=None,
+               shard=0, num_shards=1):
+  """Generates the examples of data files from an id cache, like ExampleGen.
+
+  Args:
+    data_path: tf.Example filepattern.
+    cache_dir: Directory of the id cache written by WriteIdCache().
+    vocab: Vocabulary.
+    article_key: article feature key in tf.Example.
+    abstract_key: abstract feature key in tf.Example.
+    max_article_sentences: Max number of sentences used from article.
+    max_abstract_sentences: Max number of sentences used from abstract.
+    num_epochs: Number of times to go through the data. None means infinite.
+    shard: Index of the shard of each file to read.
+    num_shards: Number of shards. Shard i of a file consists of its examples
+      whose position in the file is i modulo num_shards.
+
+  Yields:
+    Tuples of (enc_inputs, dec_inputs, origin_article, origin_abstract), as
+    returned by GetExampleIds().
+
+  Raises:
+    ValueError: If a data file has no id cache file written with these
+      arguments.
+  """
+  settings_digest = _IdCacheSettingsDigest(
+      vocab, article_key, abstract_key, max_article_sentences,
+      max_abstract_sentences)
+  header = _ID_CACHE_MAGIC + settings_digest
+  filelist = [_IdCacheFile(cache_dir, data_file, settings_digest)
+              for data_file in glob.glob(data_path)]
+  assert filelist, 'Empty filelist.'
+  for f in filelist:
+    if not os.path.exists(f):
+      raise ValueError('Missing id cache file %s; write the id cache with '
+                       'WriteIdCache().' % f)
+  epoch = 0
+  while True:
+    if num_epochs is not None and epoch >= num_epochs:
+      break
+    random.shuffle(filelist)
+    for f in filelist:
+      with open(f, 'rb') as reader:
+        if reader.read(len(header)) != header:
+          raise ValueError('%s was written with other settings.' % f)
+        position = 0
+        while True:
+          header_bytes = reader.read(_ID_CACHE_EXAMPLE_HEADER.size)
+          if not header_bytes:
+            break
+          enc_len, dec_len, article_len, abstract_len = (
+              _ID_CACHE_EXAMPLE_HEADER.unpack(header_bytes))
+          ids_bytes = 4 * (enc_len + dec_len)
+          if position % num_shards != shard:
+            reader.seek(ids_bytes + article_len + abstract_len, 1)
+            position += 1
+            continue
+          ids = np.frombuffer(reader.read(ids_bytes), dtype=np.int32)
+          article = reader.read(article_len)
+          abstract = reader.read(abstract_len)
+          if six.PY3:
+            article, abstract = article.decode('utf-8'), abstract.decode('utf-8')
+          position += 1
+          yield (ids[:enc_len].tolist(), ids[enc_len:].tolist(), article,
+                 abstract)
+    epoch += 1
 
 
 class Batcher(object):
@@ -41,7 +290,8 @@ class Batcher(object):
 
   def __init__(self, data_path, vocab, hps,
                article_key, abstract_key, max_article_sentences,
-               max_abstract_sentences, bucketing=True, truncate_input=False):
+               max_abstract_sentences, bucketing=True, truncate_input=False,
+               num_processes=NUM_PROCESSES, id_cache_dir=None):
     """Batcher constructor.
 
     Args:
@@ -55,6 +305,10 @@ class Batcher(object):
       bucketing: Whether bucket articles of similar length into the same batch.
       truncate_input: Whether to truncate input that is too long. Alternative is
         to discard such examples.
+      num_processes: Number of worker processes, each reading a shard of every
+        data file.
+      id_cache_dir: If set, the examples of data_path are read from the id
+        cache written to this directory by WriteIdCache().
     """
     self._data_path = data_path
     self._vocab = vocab
@@ -65,22 +319,28 @@ class Batcher(object):
     self._max_abstract_sentences = max_abstract_sentences
     self._bucketing = bucketing
     self._truncate_input = truncate_input
-    self._input_queue = Queue.Queue(QUEUE_NUM_BATCH * self._hps.batch_size)
-    self._bucket_input_queue = Queue.Queue(QUEUE_NUM_BATCH)
-    self._input_threads = []
-    for _ in xrange(16):
-      self._input_threads.append(Thread(target=self._FillInputQueue))
-      self._input_threads[-1].daemon = True
-      self._input_threads[-1].start()
-    self._bucketing_threads = []
-    for _ in xrange(4):
-      self._bucketing_threads.append(Thread(target=self._FillBucketInputQueue))
-      self._bucketing_threads[-1].daemon = True
-      self._bucketing_threads[-1].start()
-
-    self._watch_thread = Thread(target=self._WatchThreads)
-    self._watch_thread.daemon = True
-    self._watch_thread.start()
+    self._num_processes = num_processes
+    self._id_cache_dir = id_cache_dir
+
+    # Each slot holds a batch of encoder inputs, decoder inputs, targets,
+    # encoder input lengths and decoder output lengths, in this order.
+    self._slot_width = hps.enc_timesteps + 2 * hps.dec_timesteps + 2
+    shared = multiprocessing.RawArray(
+        'i', QUEUE_NUM_BATCH * hps.batch_size * self._slot_width)
+    self._slots = np.frombuffer(shared, dtype=np.int32).reshape(
+        QUEUE_NUM_BATCH, hps.batch_size, self._slot_width)
+    self._free_slots = multiprocessing.Queue()
+    for slot in xrange(QUEUE_NUM_BATCH):
+      self._free_slots.put(slot)
+    # Holds (slot, process index, origin_articles, origin_abstracts) of
+    # filled slots.
+    self._full_slots = multiprocessing.Queue()
+    # Holds (process index, traceback) of the errors that kill processes.
+    self._errors = multiprocessing.Queue()
+    self._last_errors = {}
+    self._num_failures = [0] * num_processes
+
+    self._processes = [self._StartProcess(i) for i in xrange(num_processes)]
 
   def NextBatch(self):
     """Returns a batch of inputs for seq2seq attention model.
@@ -95,63 +355,80 @@ class Batcher(object):
       origin_articles: original article words.
       origin_abstracts: original abstract words.
     """
-    enc_batch = np.zeros(
-        (self._hps.batch_size, self._hps.enc_timesteps), dtype=np.int32)
-    enc_input_lens = np.zeros(
-        (self._hps.batch_size), dtype=np.int32)
-    dec_batch = np.zeros(
-        (self._hps.batch_size, self._hps.dec_timesteps), dtype=np.int32)
-    dec_output_lens = np.zeros(
-        (self._hps.batch_size), dtype=np.int32)
-    target_batch = np.zeros(
-        (self._hps.batch_size, self._hps.dec_timesteps), dtype=np.int32)
-    loss_weights = np.zeros(
-        (self._hps.batch_size, self._hps.dec_timesteps), dtype=np.float32)
-    origin_articles = ['None'] * self._hps.batch_size
-    origin_abstracts = ['None'] * self._hps.batch_size
-
-    buckets = self._bucket_input_queue.get()
-    for i in xrange(self._hps.batch_size):
-      (enc_inputs, dec_inputs, targets, enc_input_len, dec_output_len,
-       article, abstract) = buckets[i]
-
-      origin_articles[i] = article
-      origin_abstracts[i] = abstract
-      enc_input_lens[i] = enc_input_len
-      dec_output_lens[i] = dec_output_len
-      enc_batch[i, :] = enc_inputs[:]
-      dec_batch[i, :] = dec_inputs[:]
-      target_batch[i, :] = targets[:]
-      for j in xrange(dec_output_len):
-        loss_weights[i][j] = 1
+    while True:
+      self._WatchProcesses()
+      try:
+        slot, index, origin_articles, origin_abstracts = self._full_slots.get(
+            timeout=WATCH_INTERVAL_SECS)
+        break
+      except Queue.Empty:
+        pass
+    batch = self._slots[slot].copy()
+    self._free_slots.put(slot)
+    self._num_failures[index] = 0
+
+    enc_timesteps = self._hps.enc_timesteps
+    dec_timesteps = self._hps.dec_timesteps
+    enc_batch = batch[:, :enc_timesteps]
+    dec_batch = batch[:, enc_timesteps:enc_timesteps + dec_timesteps]
+    target_batch = batch[:, enc_timesteps + dec_timesteps:-2]
+    enc_input_lens = batch[:, -2]
+    dec_output_lens = batch[:, -1]
+    loss_weights = (np.arange(dec_timesteps) <
+                    dec_output_lens[:, np.newaxis]).astype(np.float32)
     return (enc_batch, dec_batch, target_batch, enc_input_lens, dec_output_lens,
             loss_weights, origin_articles, origin_abstracts)
 
-  def _FillInputQueue(self):
-    """Fill input queue with ModelInput."""
-    start_id = self._vocab.WordToId(data.SENTENCE_START)
+  def _StartProcess(self, index):
+    process = multiprocessing.Process(target=self._FillSlots, args=(index,))
+    process.daemon = True
+    process.start()
+    return process
+
+  def _WatchProcesses(self):
+    """Restarts dead worker processes.
+
+    Raises:
+      RuntimeError: If a process died MAX_PROCESS_FAILURES times in a row
+        without producing a batch.
+    """
+    while not self._errors.empty():
+      index, error = self._errors.get()
+      self._last_errors[index] = error
+    for i, process in enumerate(self._processes):
+      if not process.is_alive():
+        self._num_failures[i] += 1
+        error = self._last_errors.pop(i, 'Unknown error.')
+        tf.logging.error('Found input process %d dead:\n%s', i, error)
+        if self._num_failures[i] >= MAX_PROCESS_FAILURES:
+          raise RuntimeError(
+              'Input process %d died %d times in a row. Last error:\n%s' %
+              (i, self._num_failures[i], error))
+        self._processes[i] = self._StartProcess(i)
+
+  def _ExampleIdsGen(self, index):
+    """Generates word ids of the examples of a shard of the data."""
+    if self._id_cache_dir:
+      for example_ids in IdCacheGen(
+          self._data_path, self._id_cache_dir, self._vocab, self._article_key,
+          self._abstract_key, self._max_article_sentences,
+          self._max_abstract_sentences, shard=index,
+          num_shards=self._num_processes):
+        yield example_ids
+    else:
+      input_gen = self._TextGenerator(data.ExampleGen(
+          self._data_path, shard=index, num_shards=self._num_processes))
+      for article, abstract in input_gen:
+        yield GetExampleIds(article, abstract, self._vocab,
+                            self._max_article_sentences,
+                            self._max_abstract_sentences)
+
+  def _InputGen(self, index):
+    """Generates ModelInput of the examples of a shard of the data."""
     end_id = self._vocab.WordToId(data.SENTENCE_END)
     pad_id = self._vocab.WordToId(data.PAD_TOKEN)
-    input_gen = self._TextGenerator(data.ExampleGen(self._data_path))
-    while True:
-      (article, abstract) = six.next(input_gen)
-      article_sentences = [sent.strip() for sent in
-                           data.ToSentences(article, include_token=False)]
-      abstract_sentences = [sent.strip() for sent in
-                            data.ToSentences(abstract, include_token=False)]
-
-      enc_inputs = []
-      # Use the <s> as the <GO> symbol for decoder inputs.
-      dec_inputs = [start_id]
-
-      # Convert first N sentences to word IDs, stripping existing <s> and </s>.
-      for i in xrange(min(self._max_article_sentences,
-                          len(article_sentences))):
-        enc_inputs += data.GetWordIds(article_sentences[i], self._vocab)
-      for i in xrange(min(self._max_abstract_sentences,
-                          len(abstract_sentences))):
-        dec_inputs += data.GetWordIds(abstract_sentences[i], self._vocab)
-
+    for (enc_inputs, dec_inputs, origin_article,
+         origin_abstract) in self._ExampleIdsGen(index):
       # Filter out too-short input
       if (len(enc_inputs) < self._hps.min_input_len or
           len(dec_inputs) < self._hps.min_input_len):
@@ -184,24 +461,28 @@ class Batcher(object):
       dec_output_len = len(targets)
 
       # Pad if necessary
-      while len(enc_inputs) < self._hps.enc_timesteps:
-        enc_inputs.append(pad_id)
-      while len(dec_inputs) < self._hps.dec_timesteps:
-        dec_inputs.append(end_id)
-      while len(targets) < self._hps.dec_timesteps:
-        targets.append(end_id)
-
-      element = ModelInput(enc_inputs, dec_inputs, targets, enc_input_len,
-                           dec_output_len, ' '.join(article_sentences),
-                           ' '.join(abstract_sentences))
-      self._input_queue.put(element)
-
-  def _FillBucketInputQueue(self):
-    """Fill bucketed batches into the bucket_input_queue."""
+      enc_inputs = data.Pad(enc_inputs, pad_id, self._hps.enc_timesteps)
+      dec_inputs = data.Pad(dec_inputs, end_id, self._hps.dec_timesteps)
+      targets = data.Pad(targets, end_id, self._hps.dec_timesteps)
+
+      yield ModelInput(enc_inputs, dec_inputs, targets, enc_input_len,
+                       dec_output_len, origin_article, origin_abstract)
+
+  def _FillSlots(self, index):
+    """Fills slots with bucketed batches. Runs in worker process index."""
+    try:
+      self._FillSlotsLoop(index)
+    except Exception:
+      self._errors.put((index, traceback.format_exc()))
+      raise
+
+  def _FillSlotsLoop(self, index):
+    random.seed()  # Otherwise all worker processes shuffle alike.
+    input_gen = self._InputGen(index)
     while True:
       inputs = []
       for _ in xrange(self._hps.batch_size * BUCKET_CACHE_BATCH):
-        inputs.append(self._input_queue.get())
+        inputs.append(six.next(input_gen))
       if self._bucketing:
         inputs = sorted(inputs, key=lambda inp: inp.enc_len)
 
@@ -210,35 +491,20 @@ class Batcher(object):
         batches.append(inputs[i:i+self._hps.batch_size])
       shuffle(batches)
       for b in batches:
-        self._bucket_input_queue.put(b)
-
-  def _WatchThreads(self):
-    """Watch the daemon input threads and restart if dead."""
-    while True:
-      time.sleep(60)
-      input_threads = []
-      for t in self._input_threads:
-        if t.is_alive():
-          input_threads.append(t)
-        else:
-          tf.logging.error('Found input thread dead.')
-          new_t = Thread(target=self._FillInputQueue)
-          input_threads.append(new_t)
-          input_threads[-1].daemon = True
-          input_threads[-1].start()
-      self._input_threads = input_threads
-
-      bucketing_threads = []
-      for t in self._bucketing_threads:
-        if t.is_alive():
-          bucketing_threads.append(t)
-        else:
-          tf.logging.error('Found bucketing thread dead.')
-          new_t = Thread(target=self._FillBucketInputQueue)
-          bucketing_threads.append(new_t)
-          bucketing_threads[-1].daemon = True
-          bucketing_threads[-1].start()
-      self._bucketing_threads = bucketing_threads
+        batch = np.array(
+            [inp.enc_input + inp.dec_input + inp.target +
+             [inp.enc_len, inp.dec_len] for inp in b], dtype=np.int32)
+        slot = self._free_slots.get()
+        filled = False
+        try:
+          self._slots[slot] = batch
+          self._full_slots.put((slot, index,
+                                [inp.origin_article for inp in b],
+                                [inp.origin_abstract for inp in b]))
+          filled = True
+        finally:
+          if not filled:
+            self._free_slots.put(slot)
 
   def _TextGenerator(self, example_gen):
     """Generates article and abstract text from tf.Example."""
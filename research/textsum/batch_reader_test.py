@@ -0,0 +1,234 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for batch_reader."""
+
+import os
+import random
+import struct
+import tempfile
+
+import numpy as np
+import six
+from six.moves import xrange
+import tensorflow as tf
+
+from tensorflow.core.example import example_pb2
+import batch_reader
+import data
+import seq2seq_attention_model
+
+_WORDS = ['the', 'a', 'cat', 'dog', 'sat', 'ran', 'on', 'mat', 'far']
+
+
+def _Text(sentences):
+  return '<d> <p> %s </p> </d>' % ' '.join(
+      '<s> %s </s>' % sentence for sentence in sentences)
+
+
+def _ThreadReaderInput(article, abstract, vocab, hps, max_article_sentences,
+                       max_abstract_sentences):
+  """Converts an example like the thread based reader did, or returns None."""
+  start_id = vocab.WordToId(data.SENTENCE_START)
+  end_id = vocab.WordToId(data.SENTENCE_END)
+  pad_id = vocab.WordToId(data.PAD_TOKEN)
+  article_sentences = [sent.strip() for sent in
+                       data.ToSentences(article, include_token=False)]
+  abstract_sentences = [sent.strip() for sent in
+                        data.ToSentences(abstract, include_token=False)]
+  enc_inputs = []
+  dec_inputs = [start_id]
+  for i in xrange(min(max_article_sentences, len(article_sentences))):
+    enc_inputs += data.GetWordIds(article_sentences[i], vocab)
+  for i in xrange(min(max_abstract_sentences, len(abstract_sentences))):
+    dec_inputs += data.GetWordIds(abstract_sentences[i], vocab)
+  if (len(enc_inputs) < hps.min_input_len or
+      len(dec_inputs) < hps.min_input_len):
+    return None
+  if (len(enc_inputs) > hps.enc_timesteps or
+      len(dec_inputs) > hps.dec_timesteps):
+    return None
+  targets = dec_inputs[1:]
+  targets.append(end_id)
+  enc_input_len = len(enc_inputs)
+  dec_output_len = len(targets)
+  while len(enc_inputs) < hps.enc_timesteps:
+    enc_inputs.append(pad_id)
+  while len(dec_inputs) < hps.dec_timesteps:
+    dec_inputs.append(end_id)
+  while len(targets) < hps.dec_timesteps:
+    targets.append(end_id)
+  loss_weights = np.zeros(hps.dec_timesteps, dtype=np.float32)
+  for j in xrange(dec_output_len):
+    loss_weights[j] = 1
+  key = (' '.join(article_sentences), ' '.join(abstract_sentences))
+  return key, (enc_inputs, dec_inputs, targets, enc_input_len, dec_output_len,
+               loss_weights)
+
+
+class BatchReaderTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(BatchReaderTest, self).setUp()
+    self._dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    self._hps = seq2seq_attention_model.HParams(
+        mode='train', min_lr=0.01, lr=0.15, batch_size=2, enc_layers=1,
+        enc_timesteps=12, dec_timesteps=6, min_input_len=2, num_hidden=8,
+        emb_dim=8, max_grad_norm=2, num_softmax_samples=0)
+    self._vocab = self._WriteVocab('vocab', _WORDS)
+    self._data_path = os.path.join(self._dir, 'data-*')
+
+    # Examples of varied lengths, some too long or too short, with unknown
+    # words.
+    rng = random.Random(0)
+    self._texts = []
+    for i in xrange(2):
+      examples = []
+      for j in xrange(7):
+        article = _Text([
+            ' '.join(rng.choice(_WORDS + ['unknown'])
+                     for _ in xrange(rng.randint(0, 6))) + ' a%d%d' % (i, j)
+            for _ in xrange(rng.randint(1, 3))])
+        abstract = _Text([' '.join(rng.choice(_WORDS)
+                                   for _ in xrange(rng.randint(0, 6)))])
+        examples.append((article, abstract))
+      self._WriteData('data-%d' % i, examples)
+      self._texts.extend(examples)
+
+  def _WriteVocab(self, name, words):
+    vocab_file = os.path.join(self._dir, name)
+    with open(vocab_file, 'w') as f:
+      for word in [data.SENTENCE_START, data.SENTENCE_END, data.PAD_TOKEN,
+                   data.UNKNOWN_TOKEN] + words:
+        f.write('%s 1\n' % word)
+    return data.Vocab(vocab_file, 100)
+
+  def _WriteData(self, name, examples):
+    with open(os.path.join(self._dir, name), 'wb') as writer:
+      for article, abstract in examples:
+        tf_example = example_pb2.Example()
+        tf_example.features.feature['article'].bytes_list.value.extend(
+            [article.encode('utf-8')])
+        tf_example.features.feature['abstract'].bytes_list.value.extend(
+            [abstract.encode('utf-8')])
+        tf_example_str = tf_example.SerializeToString()
+        writer.write(struct.pack('q', len(tf_example_str)))
+        writer.write(tf_example_str)
+
+  def _MakeBatcher(self, num_processes=2, **kwargs):
+    batcher = batch_reader.Batcher(
+        self._data_path, self._vocab, self._hps, 'article', 'abstract', 2, 1,
+        num_processes=num_processes, **kwargs)
+    # pylint: disable=protected-access
+    self.addCleanup(lambda: [p.terminate() for p in batcher._processes])
+    return batcher
+
+  def _WriteIdCache(self, cache_dir, vocab=None, max_article_sentences=2):
+    return batch_reader.WriteIdCache(
+        self._data_path, cache_dir, vocab or self._vocab, 'article',
+        'abstract', max_article_sentences, 1, num_processes=2)
+
+  def _IdCacheGen(self, cache_dir, vocab=None, max_article_sentences=2,
+                  **kwargs):
+    return list(batch_reader.IdCacheGen(
+        self._data_path, cache_dir, vocab or self._vocab, 'article',
+        'abstract', max_article_sentences, 1, num_epochs=1, **kwargs))
+
+  def _CheckBatchesMatchThreadReader(self, num_processes, id_cache_dir=None):
+    batcher = self._MakeBatcher(num_processes, id_cache_dir=id_cache_dir)
+    expected = {}
+    for article, abstract in self._texts:
+      model_input = _ThreadReaderInput(article, abstract, self._vocab,
+                                       self._hps, 2, 1)
+      if model_input is not None:
+        expected[model_input[0]] = model_input[1]
+    self.assertGreater(len(expected), 4)
+    self.assertLess(len(expected), len(self._texts))
+
+    seen = set()
+    for _ in xrange(batch_reader.BUCKET_CACHE_BATCH):
+      batch = batcher.NextBatch()
+      for i, key in enumerate(zip(batch[6], batch[7])):
+        self.assertIn(key, expected)
+        for actual, expected_value in zip(batch[:6], expected[key]):
+          self.assertAllEqual(expected_value, actual[i])
+        seen.add(key)
+    if num_processes == 1:
+      # These batches hold the first batch_size * BUCKET_CACHE_BATCH examples,
+      # i.e. several epochs of the data.
+      self.assertEqual(set(expected), seen)
+
+  def testBatchesMatchThreadReader(self):
+    self._CheckBatchesMatchThreadReader(1)
+    self._CheckBatchesMatchThreadReader(2)
+
+  def testBatchesFromIdCacheMatchThreadReader(self):
+    cache_dir = os.path.join(self._dir, 'cache')
+    self._WriteIdCache(cache_dir)
+    self._CheckBatchesMatchThreadReader(1, id_cache_dir=cache_dir)
+    self._CheckBatchesMatchThreadReader(2, id_cache_dir=cache_dir)
+
+  def testIdCacheRoundTrip(self):
+    cache_dir = os.path.join(self._dir, 'cache')
+    self.assertEqual(len(self._texts), self._WriteIdCache(cache_dir))
+    self.assertEqual(0, self._WriteIdCache(cache_dir))
+    self.assertFalse([f for f in os.listdir(cache_dir) if '.tmp' in f])
+
+    expected = []
+    for ex in data.ExampleGen(self._data_path, num_epochs=1):
+      enc_inputs, dec_inputs, article, abstract = batch_reader.GetExampleIds(
+          data.GetExFeatureText(ex, 'article'),
+          data.GetExFeatureText(ex, 'abstract'), self._vocab, 2, 1)
+      expected.append((enc_inputs, dec_inputs, article, abstract))
+    self.assertEqual(sorted(expected), sorted(self._IdCacheGen(cache_dir)))
+    shards = (self._IdCacheGen(cache_dir, shard=0, num_shards=2) +
+              self._IdCacheGen(cache_dir, shard=1, num_shards=2))
+    self.assertEqual(sorted(expected), sorted(shards))
+
+  def testIdCacheKeyedBySettings(self):
+    cache_dir = os.path.join(self._dir, 'cache')
+    self._WriteIdCache(cache_dir)
+    other_vocab = self._WriteVocab('other_vocab', list(reversed(_WORDS)))
+    with self.assertRaises(ValueError):
+      self._IdCacheGen(cache_dir, vocab=other_vocab)
+    with self.assertRaises(ValueError):
+      self._IdCacheGen(cache_dir, max_article_sentences=3)
+
+    # Other settings get their own cache files in the same directory.
+    self.assertEqual(len(self._texts),
+                     self._WriteIdCache(cache_dir, vocab=other_vocab))
+    self.assertEqual(len(self._texts), len(self._IdCacheGen(
+        cache_dir, vocab=other_vocab)))
+    self.assertEqual(len(self._texts), len(self._IdCacheGen(cache_dir)))
+
+  def testRepeatedWorkerFailuresRaise(self):
+    # Without an unknown word token, every example fails to convert.
+    vocab_file = os.path.join(self._dir, 'vocab_without_unk')
+    with open(vocab_file, 'w') as f:
+      for word in [data.SENTENCE_START, data.SENTENCE_END, data.PAD_TOKEN]:
+        f.write('%s 1\n' % word)
+    self._vocab = data.Vocab(vocab_file, 100)
+    watch_interval_secs = batch_reader.WATCH_INTERVAL_SECS
+    batch_reader.WATCH_INTERVAL_SECS = 0.1
+    try:
+      batcher = self._MakeBatcher()
+      with six.assertRaisesRegex(self, RuntimeError, 'KeyError'):
+        batcher.NextBatch()
+    finally:
+      batch_reader.WATCH_INTERVAL_SECS = watch_interval_secs
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -75,7 +75,7 @@ class Vocab(object):
     return self._count
 
 
-def ExampleGen(data_path, num_epochs=None):
+def ExampleGen(data_path, num_epochs=None, shard=0, num_shards=1):
   """Generates tf.Examples from path of data files.
 
     Binary data format: <length><blob>. <length> represents the byte size
@@ -85,6 +85,9 @@ def ExampleGen(data_path, num_epochs=None):
   Args:
     data_path: path to tf.Example data files.
     num_epochs: Number of times to go through the data. None means infinite.
+    shard: Index of the shard of each file to read.
+    num_shards: Number of shards. Shard i of a file consists of its examples
+      whose position in the file is i modulo num_shards.
 
   Yields:
     Deserialized tf.Example.
@@ -100,11 +103,17 @@ def ExampleGen(data_path, num_epochs=None):
     random.shuffle(filelist)
     for f in filelist:
       reader = open(f, 'rb')
+      position = 0
       while True:
         len_bytes = reader.read(8)
         if not len_bytes: break
         str_len = struct.unpack('q', len_bytes)[0]
+        if position % num_shards != shard:
+          reader.seek(str_len, 1)  # Skip examples of other shards unparsed.
+          position += 1
+          continue
         example_str = struct.unpack('%ds' % str_len, reader.read(str_len))[0]
+        position += 1
         yield example_pb2.Example.FromString(example_str)
 
     epoch += 1
@@ -193,8 +202,10 @@ def SnippetGen(text, start_tok, end_tok, inclusive=True):
         yield text[start_p:cur]
       else:
         yield text[start_p+len(start_tok):end_p]
-    except ValueError as e:
-      raise StopIteration('no more snippets in text: %s' % e)
+    except ValueError:
+      # No more snippets in text. Raising StopIteration inside a generator is
+      # an error since Python 3.7.
+      return
 
 
 def GetExFeatureText(ex, key):
@@ -61,6 +61,11 @@ tf.app.flags.DEFINE_bool('use_bucketing', False,
 tf.app.flags.DEFINE_bool('truncate_input', False,
                          'Truncate inputs that are too long. If False, '
                          'examples that are too long are discarded.')
+tf.app.flags.DEFINE_integer('input_processes', batch_reader.NUM_PROCESSES,
+                            'Number of processes reading input batches.')
+tf.app.flags.DEFINE_string('id_cache_dir', '',
+                           'If set, word ids of the examples in data_path are '
+                           'cached in this directory, and read from there.')
 tf.app.flags.DEFINE_integer('num_gpus', 0, 'Number of gpus used.')
 tf.app.flags.DEFINE_integer('random_seed', 111, 'A seed value for randomness.')
 
@@ -183,11 +188,19 @@ def main(unused_argv):
       max_grad_norm=2,
       num_softmax_samples=4096)  # If 0, no sampled softmax.
 
+  if FLAGS.id_cache_dir:
+    batch_reader.WriteIdCache(
+        FLAGS.data_path, FLAGS.id_cache_dir, vocab, FLAGS.article_key,
+        FLAGS.abstract_key, FLAGS.max_article_sentences,
+        FLAGS.max_abstract_sentences, num_processes=FLAGS.input_processes)
+
   batcher = batch_reader.Batcher(
       FLAGS.data_path, vocab, hps, FLAGS.article_key,
       FLAGS.abstract_key, FLAGS.max_article_sentences,
       FLAGS.max_abstract_sentences, bucketing=FLAGS.use_bucketing,
-      truncate_input=FLAGS.truncate_input)
+      truncate_input=FLAGS.truncate_input,
+      num_processes=FLAGS.input_processes,
+      id_cache_dir=FLAGS.id_cache_dir or None)
   tf.set_random_seed(FLAGS.random_seed)
 
   if hps.mode == 'train':
@@ -42,6 +42,8 @@ from six.moves import xrange  # pylint: disable=redefined-builtin
 import numpy as np
 import tensorflow as tf
 
+import word2vec_data
+
 word2vec = tf.load_op_library(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'word2vec_ops.so'))
 
 flags = tf.app.flags
@@ -78,6 +80,14 @@ flags.DEFINE_float("subsample", 1e-3,
                    "Subsample threshold for word occurrence. Words that appear "
                    "with higher frequency will be randomly down-sampled. Set "
                    "to 0 to disable.")
+flags.DEFINE_string(
+    "preprocessed_dir", None,
+    "If set, the training text is encoded as word ids in this directory once "
+    "by several processes, and training examples are generated from them "
+    "with a tf.data pipeline instead of the skipgram op.")
+flags.DEFINE_integer("input_workers", 4,
+                     "Number of processes preprocessing the training text and "
+                     "of parallel example generators with --preprocessed_dir.")
 flags.DEFINE_boolean(
     "interactive", False,
     "If true, enters an IPython interactive session to play with the trained "
@@ -134,6 +144,12 @@ class Options(object):
     # Subsampling threshold for word occurrence.
     self.subsample = FLAGS.subsample
 
+    # Directory for the training text encoded as word ids, if used.
+    self.preprocessed_dir = FLAGS.preprocessed_dir
+
+    # Number of processes and threads reading preprocessed input.
+    self.input_workers = FLAGS.input_workers
+
     # How often to print statistics.
     self.statistics_interval = FLAGS.statistics_interval
 
@@ -345,13 +361,23 @@ class Word2Vec(object):
   def build_graph(self):
     """Build the graph for the full model."""
     opts = self._options
-    # The training data. A text file.
+    # The training data. A text file, or word ids preprocessed from it.
+    if opts.preprocessed_dir:
+      vocab_file, ids_file = word2vec_data.preprocess(
+          opts.train_data, opts.preprocessed_dir, opts.min_count,
+          num_processes=opts.input_workers)
+      skipgram = word2vec_data.skipgram_word2vec(
+          vocab_file, ids_file, batch_size=opts.batch_size,
+          window_size=opts.window_size, subsample=opts.subsample,
+          num_parallel_calls=opts.input_workers)
+    else:
+      skipgram = word2vec.skipgram_word2vec(filename=opts.train_data,
+                                            batch_size=opts.batch_size,
+                                            window_size=opts.window_size,
+                                            min_count=opts.min_count,
+                                            subsample=opts.subsample)
     (words, counts, words_per_epoch, self._epoch, self._words, examples,
-     labels) = word2vec.skipgram_word2vec(filename=opts.train_data,
-                                          batch_size=opts.batch_size,
-                                          window_size=opts.window_size,
-                                          min_count=opts.min_count,
-                                          subsample=opts.subsample)
+     labels) = skipgram
     (opts.vocab_words, opts.vocab_counts,
      opts.words_per_epoch) = self._session.run([words, counts, words_per_epoch])
     opts.vocab_size = len(opts.vocab_words)
@@ -0,0 +1,305 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Python input pipeline for the word2vec models.
+
+This replaces the input processing of the skipgram custom op:
+* preprocess() counts the words of the training text and encodes it as word
+  ids with several processes, and saves the vocabulary and a int32 .npy array
+  of the ids, which later runs reuse.
+* skipgram_word2vec() memory maps the ids and generates subsampled skip-gram
+  (example, label) batches with a tf.data pipeline of parallel workers. It
+  returns the same tensors as the skipgram custom op.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import multiprocessing
+import os
+
+import numpy as np
+import tensorflow as tf
+
+# Number of words of the training text each worker generates examples from at
+# a time, as the kSentenceSize words the skipgram op reads at a time.
+CHUNK_SIZE = 1000
+
+# Training text is split into ranges of about this many bytes for
+# preprocessing.
+_RANGE_BYTES = 1 << 26
+
+
+def _split_ranges(filename, num_ranges):
+  """Splits a text file into byte ranges that start and end at whitespace."""
+  size = os.path.getsize(filename)
+  bounds = [0]
+  with open(filename, "rb") as f:
+    for i in range(1, num_ranges):
+      pos = max(size * i // num_ranges, bounds[-1])
+      f.seek(pos)
+      while pos < size and not f.read(1).isspace():
+        pos += 1
+      bounds.append(min(pos, size))
+  bounds.append(size)
+  return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _read_words(filename, byte_range):
+  with open(filename, "rb") as f:
+    f.seek(byte_range[0])
+    return f.read(byte_range[1] - byte_range[0]).split()
+
+
+def _count_words(args):
+  filename, byte_range = args
+  words = _read_words(filename, byte_range)
+  return collections.Counter(words), len(words)
+
+
+_word2id = None
+
+
+def _set_word2id(word2id):
+  global _word2id
+  _word2id = word2id
+
+
+def _encode_words(args):
+  filename, byte_range, ids_file, offset = args
+  words = _read_words(filename, byte_range)
+  ids = np.load(ids_file, mmap_mode="r+")
+  ids[offset:offset + len(words)] = [_word2id.get(w, 0) for w in words]
+  ids.flush()
+
+
+def build_vocab(word_counts, corpus_size, min_count):
+  """Builds the vocabulary the same way the skipgram op does.
+
+  Args:
+    word_counts: Dictionary of word to its number of occurrences.
+    corpus_size: Int, number of words of the training text.
+    min_count: Int, the minimum number of occurrences of vocabulary words.
+
+  Returns:
+    vocab_words: List of words, "UNK" followed by the words that occur at least
+      min_count times in descending order of occurrences.
+    vocab_counts: np.int32 array of the occurrences of vocab_words, where
+      "UNK" counts all other words.
+  """
+  ordered = sorted(((w, c) for w, c in word_counts.items() if c >= min_count),
+                   key=lambda x: (-x[1], x[0]))
+  vocab_words = [b"UNK"] + [w for w, _ in ordered]
+  vocab_counts = np.array([0] + [c for _, c in ordered], dtype=np.int32)
+  vocab_counts[0] = corpus_size - vocab_counts.sum()
+  return vocab_words, vocab_counts
+
+
+def preprocess(train_data, output_dir, min_count, num_processes=4):
+  """Encodes a training text file as word ids, unless already done.
+
+  The outputs are reused as long as the training text keeps its size and
+  modification time.
+
+  Args:
+    train_data: Path of the training text file.
+    output_dir: Directory to save the vocabulary and the word ids in.
+    min_count: Int, the minimum number of occurrences of vocabulary words.
+    num_processes: Number of processes to read the training text with.
+
+  Returns:
+    vocab_file: Path of the vocabulary file, one "word count" line per word id.
+    ids_file: Path of a .npy file holding the int32 word ids of the text.
+  """
+  prefix = os.path.join(output_dir, "%s.min%d" % (
+      os.path.basename(train_data), min_count))
+  vocab_file, ids_file = prefix + ".vocab.txt", prefix + ".ids.npy"
+  source_file = prefix + ".source.txt"
+  # The size and mtime of the training text the files were computed from.
+  # They are taken before reading it, so that changes made while it is read
+  # are picked up by the next run.
+  stat = os.stat(train_data)
+  source = "%s %d %d\n" % (os.path.abspath(train_data), stat.st_size,
+                           stat.st_mtime_ns)
+  if os.path.exists(vocab_file) and os.path.exists(ids_file):
+    if os.path.exists(source_file):
+      with open(source_file, "r") as f:
+        if f.read() == source:
+          return vocab_file, ids_file
+  if not os.path.exists(output_dir):
+    os.makedirs(output_dir)
+  # The ids file is renamed into place last, so that its presence means that
+  # the vocabulary and source files beside it are complete.
+  if os.path.exists(ids_file):
+    os.remove(ids_file)
+
+  num_ranges = max(num_processes,
+                   os.path.getsize(train_data) // _RANGE_BYTES + 1)
+  ranges = _split_ranges(train_data, num_ranges)
+  pool = multiprocessing.Pool(num_processes)
+  word_counts = collections.Counter()
+  range_sizes = []
+  for counts, size in pool.imap(_count_words,
+                                [(train_data, r) for r in ranges]):
+    word_counts.update(counts)
+    range_sizes.append(size)
+  pool.close()
+  pool.join()
+  corpus_size = sum(range_sizes)
+
+  vocab_words, vocab_counts = build_vocab(word_counts, corpus_size, min_count)
+  print("Data file: %s contains %d words, %d unique words, %d unique "
+        "frequent words." % (train_data, corpus_size, len(word_counts),
+                             len(vocab_words) - 1))
+  del word_counts
+
+  # Each process writes the ids of its ranges into the memory mapped array.
+  ids = np.lib.format.open_memmap(ids_file + ".tmp.npy", mode="w+",
+                                  dtype=np.int32, shape=(corpus_size,))
+  del ids
+  offsets = np.cumsum([0] + range_sizes[:-1])
+  word2id = dict((w, i) for i, w in enumerate(vocab_words) if i > 0)
+  pool = multiprocessing.Pool(num_processes, _set_word2id, (word2id,))
+  pool.map(_encode_words, [(train_data, r, ids_file + ".tmp.npy", offset)
+                           for r, offset in zip(ranges, offsets)])
+  pool.close()
+  pool.join()
+
+  with open(vocab_file + ".tmp", "wb") as f:
+    for word, count in zip(vocab_words, vocab_counts):
+      f.write(b"%s %d\n" % (word, count))
+  os.rename(vocab_file + ".tmp", vocab_file)
+  with open(source_file + ".tmp", "w") as f:
+    f.write(source)
+  os.rename(source_file + ".tmp", source_file)
+  os.rename(ids_file + ".tmp.npy", ids_file)
+  return vocab_file, ids_file
+
+
+def load_vocab(vocab_file):
+  """Loads a vocabulary file written by preprocess()."""
+  vocab_words = []
+  vocab_counts = []
+  with open(vocab_file, "rb") as f:
+    for line in f:
+      word, count = line.rsplit(b" ", 1)
+      vocab_words.append(word)
+      vocab_counts.append(int(count))
+  return vocab_words, np.array(vocab_counts, dtype=np.int32)
+
+
+def skipgram_pairs(ids, keep_prob, window_size, rng):
+  """Generates the skip-gram pairs of a sequence of words.
+
+  Args:
+    ids: A 1-D array of word ids.
+    keep_prob: A 1-D array of the probability to keep each word id, for
+      subsampling.
+    window_size: Int, the maximum distance of a label from its example.
+    rng: A np.random.RandomState.
+
+  Returns:
+    examples: np.int32 array of example word ids.
+    labels: np.int32 array of label word ids.
+    positions: np.int64 array of the index in ids of the example word.
+  """
+  positions = np.nonzero(rng.random_sample(len(ids)) < keep_prob[ids])[0]
+  sentence = np.asarray(ids[positions], dtype=np.int32)
+  # As in the skipgram op, each example gets labels from a random window of
+  # 1 to window_size words on either side.
+  skip = 1 + rng.randint(window_size, size=len(sentence))
+  offsets = np.concatenate([np.arange(-window_size, 0),
+                            np.arange(1, window_size + 1)])
+  label_pos = np.arange(len(sentence))[:, None] + offsets[None, :]
+  valid = ((np.abs(offsets)[None, :] <= skip[:, None]) & (label_pos >= 0) &
+           (label_pos < len(sentence)))
+  rows, cols = np.nonzero(valid)
+  return (sentence[rows], sentence[label_pos[rows, cols]],
+          positions[rows].astype(np.int64))
+
+
+def subsample_keep_prob(vocab_counts, subsample):
+  """Computes the probability to keep each word when subsampling.
+
+  See Eq. 5 in http://arxiv.org/abs/1310.4546. Words are kept with
+  probability min(1, (sqrt(f / t) + 1) * t / f), where f is the word's count
+  and t is subsample times the number of words, as in the skipgram op.
+  """
+  if subsample <= 0:
+    return np.ones(len(vocab_counts), dtype=np.float64)
+  threshold = subsample * np.sum(vocab_counts)
+  counts = np.maximum(vocab_counts, 1).astype(np.float64)
+  return np.minimum(1., (np.sqrt(counts / threshold) + 1) * threshold / counts)
+
+
+def skipgram_word2vec(vocab_file, ids_file, batch_size, window_size,
+                      subsample, num_parallel_calls=4, seed=None):
+  """Builds the input of the word2vec models from preprocessed data.
+
+  Args:
+    vocab_file: Vocabulary file written by preprocess().
+    ids_file: Word ids file written by preprocess().
+    batch_size: Int, number of examples per batch.
+    window_size: Int, the maximum distance of a label from its example.
+    subsample: Float, subsample threshold for word occurrence.
+    num_parallel_calls: Number of chunks of text to generate examples from in
+      parallel.
+    seed: Optional int, seed of the example generation.
+
+  Returns:
+    The outputs of the skipgram op: the vocabulary words, their counts, the
+    number of words per epoch, and tensors of the current epoch, the number of
+    words processed and a batch of examples and labels.
+
+  Raises:
+    ValueError: If the training text contains too few words.
+  """
+  vocab_words, vocab_counts = load_vocab(vocab_file)
+  ids = np.load(ids_file, mmap_mode="r")
+  if len(ids) < window_size * 10:
+    raise ValueError("The text file %s contains too little data: %d words" %
+                     (ids_file, len(ids)))
+  keep_prob = subsample_keep_prob(vocab_counts, subsample)
+  num_chunks = (len(ids) + CHUNK_SIZE - 1) // CHUNK_SIZE
+  if seed is None:
+    seed = np.random.randint(1 << 30)
+
+  def _chunk_pairs(chunk):
+    rng = np.random.RandomState((seed + chunk) % (1 << 32))
+    start = (chunk % num_chunks) * CHUNK_SIZE
+    examples, labels, positions = skipgram_pairs(
+        ids[start:start + CHUNK_SIZE], keep_prob, window_size, rng)
+    epochs = np.full(len(examples), chunk // num_chunks, dtype=np.int32)
+    words = (chunk // num_chunks) * len(ids) + start + positions + 1
+    return examples, labels, epochs, words
+
+  def _generate(chunk):
+    return tf.py_func(_chunk_pairs, [chunk],
+                      [tf.int32, tf.int32, tf.int32, tf.int64],
+                      stateful=False)
+
+  dataset = tf.data.Dataset.range(np.iinfo(np.int64).max)
+  dataset = dataset.map(_generate, num_parallel_calls=num_parallel_calls)
+  dataset = dataset.flat_map(
+      lambda *t: tf.data.Dataset.from_tensor_slices(tuple(t)))
+  dataset = dataset.batch(batch_size).prefetch(4)
+  examples, labels, epochs, words = dataset.make_one_shot_iterator().get_next()
+  examples = tf.reshape(examples, [batch_size])
+  labels = tf.reshape(labels, [batch_size])
+
+  return (tf.constant(vocab_words), tf.constant(vocab_counts),
+          tf.constant(len(ids), dtype=tf.int64), tf.reduce_max(epochs),
+          tf.reduce_max(words), examples, labels)
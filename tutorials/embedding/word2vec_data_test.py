@@ -0,0 +1,145 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for word2vec_data module."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import word2vec_data
+
+
+class Word2VecDataTest(tf.test.TestCase):
+
+  def testPreprocess(self):
+    rng = np.random.RandomState(0)
+    words = [b"w%d" % rng.zipf(1.5) for _ in range(5000)]
+    train_data = self._writeText("preprocess-text.txt", words)
+    output_dir = os.path.join(self.get_temp_dir(), "preprocessed")
+
+    vocab_file, ids_file = word2vec_data.preprocess(
+        train_data, output_dir, min_count=3, num_processes=3)
+    vocab_words, vocab_counts = word2vec_data.load_vocab(vocab_file)
+    ids = np.load(ids_file)
+
+    counts = collections.Counter(words)
+    self.assertEqual(b"UNK", vocab_words[0])
+    self.assertEqual(sum(vocab_counts), len(words))
+    for word, count in zip(vocab_words[1:], vocab_counts[1:]):
+      self.assertEqual(counts[word], count)
+      self.assertGreaterEqual(count, 3)
+    self.assertTrue(np.all(np.diff(vocab_counts[1:]) <= 0))
+    word2id = dict((w, i) for i, w in enumerate(vocab_words))
+    self.assertAllEqual([word2id.get(w, 0) for w in words], ids)
+
+  def _writeText(self, name, words, line_length=37):
+    train_data = os.path.join(self.get_temp_dir(), name)
+    with open(train_data, "wb") as f:
+      for i in range(0, len(words), line_length):
+        f.write(b" ".join(words[i:i + line_length]) + b"\n")
+    return train_data
+
+  def testPreprocessRedoneForChangedText(self):
+    train_data = self._writeText("changed-text.txt",
+                                 [b"a", b"b", b"a", b"c"] * 10)
+    output_dir = os.path.join(self.get_temp_dir(), "changed")
+    vocab_file, ids_file = word2vec_data.preprocess(
+        train_data, output_dir, min_count=1, num_processes=2)
+    self.assertEqual(vocab_file, word2vec_data.preprocess(
+        train_data, output_dir, min_count=1, num_processes=2)[0])
+    self.assertEqual([b"UNK", b"a", b"b", b"c"],
+                     word2vec_data.load_vocab(vocab_file)[0])
+
+    # The same name and size, but other words and a later mtime.
+    self._writeText("changed-text.txt", [b"a", b"d", b"d", b"e"] * 10)
+    stat = os.stat(train_data)
+    os.utime(train_data, (stat.st_atime, stat.st_mtime + 10))
+    vocab_file, ids_file = word2vec_data.preprocess(
+        train_data, output_dir, min_count=1, num_processes=2)
+    self.assertEqual([b"UNK", b"d", b"a", b"e"],
+                     word2vec_data.load_vocab(vocab_file)[0])
+    self.assertAllEqual([2, 1, 1, 3] * 10, np.load(ids_file))
+    self.assertEqual(
+        sorted(os.listdir(output_dir)),
+        sorted(os.path.basename(f) for f in [
+            vocab_file, ids_file,
+            ids_file.replace(".ids.npy", ".source.txt")]))
+
+  def testSkipgramWord2Vec(self):
+    # Every word occurs once, so each word id stands for a position in the
+    # text.
+    words = [b"w%03d" % i for i in range(300)]
+    train_data = self._writeText("pipeline-text.txt", words)
+    vocab_file, ids_file = word2vec_data.preprocess(
+        train_data, os.path.join(self.get_temp_dir(), "pipeline"),
+        min_count=1, num_processes=2)
+    vocab_words, _ = word2vec_data.load_vocab(vocab_file)
+    positions = np.array([-1] + [words.index(w) for w in vocab_words[1:]])
+
+    batch_size = 50
+    with self.test_session() as sess:
+      (vocab_words_t, vocab_counts_t, words_per_epoch, epoch, total_words,
+       examples, labels) = word2vec_data.skipgram_word2vec(
+           vocab_file, ids_file, batch_size, window_size=2, subsample=0.,
+           num_parallel_calls=2, seed=1)
+      vocab_words_, vocab_counts_, words_per_epoch_ = sess.run(
+          [vocab_words_t, vocab_counts_t, words_per_epoch])
+      self.assertEqual(vocab_words, list(vocab_words_))
+      self.assertAllEqual([0] + [1] * 300, vocab_counts_)
+      self.assertEqual(300, words_per_epoch_)
+
+      last_epoch, last_words = 0, 0
+      for _ in range(40):
+        examples_, labels_, epoch_, total_words_ = sess.run(
+            [examples, labels, epoch, total_words])
+        self.assertEqual((batch_size,), examples_.shape)
+        self.assertEqual((batch_size,), labels_.shape)
+        distances = np.abs(positions[examples_] - positions[labels_])
+        self.assertTrue(np.all((distances >= 1) & (distances <= 2)))
+        self.assertGreaterEqual(epoch_, last_epoch)
+        self.assertGreaterEqual(total_words_, last_words)
+        last_epoch, last_words = epoch_, total_words_
+      # The 2000 examples take more than one pass over the text.
+      self.assertGreaterEqual(last_epoch, 1)
+      self.assertGreater(last_words, 300)
+
+  def testSkipgramPairs(self):
+    rng = np.random.RandomState(0)
+    ids = np.arange(100, dtype=np.int32)
+    keep_prob = np.ones(100)
+    examples, labels, positions = word2vec_data.skipgram_pairs(
+        ids, keep_prob, window_size=3, rng=rng)
+
+    self.assertAllEqual(examples, ids[positions])
+    distances = np.abs(labels - examples)
+    self.assertTrue(np.all((distances >= 1) & (distances <= 3)))
+    # Every example has labels on both sides, except at the ends.
+    self.assertAllEqual(np.unique(examples), ids)
+
+    keep_prob[::2] = 0.
+    examples, labels, _ = word2vec_data.skipgram_pairs(
+        ids, keep_prob, window_size=3, rng=rng)
+    self.assertTrue(np.all(examples % 2 == 1) and np.all(labels % 2 == 1))
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -41,6 +41,8 @@ from six.moves import xrange  # pylint: disable=redefined-builtin
 import numpy as np
 import tensorflow as tf
 
+import word2vec_data
+
 word2vec = tf.load_op_library(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'word2vec_ops.so'))
 
 flags = tf.app.flags
@@ -75,6 +77,14 @@ flags.DEFINE_float("subsample", 1e-3,
                    "Subsample threshold for word occurrence. Words that appear "
                    "with higher frequency will be randomly down-sampled. Set "
                    "to 0 to disable.")
+flags.DEFINE_string(
+    "preprocessed_dir", None,
+    "If set, the training text is encoded as word ids in this directory once "
+    "by several processes, and training examples are generated from them "
+    "with a tf.data pipeline instead of the skipgram op.")
+flags.DEFINE_integer("input_workers", 4,
+                     "Number of processes preprocessing the training text and "
+                     "of parallel example generators with --preprocessed_dir.")
 flags.DEFINE_boolean(
     "interactive", False,
     "If true, enters an IPython interactive session to play with the trained "
@@ -124,6 +134,12 @@ class Options(object):
     # Subsampling threshold for word occurrence.
     self.subsample = FLAGS.subsample
 
+    # Directory for the training text encoded as word ids, if used.
+    self.preprocessed_dir = FLAGS.preprocessed_dir
+
+    # Number of processes and threads reading preprocessed input.
+    self.input_workers = FLAGS.input_workers
+
     # Where to write out summaries.
     self.save_path = FLAGS.save_path
     if not os.path.exists(self.save_path):
@@ -176,13 +192,23 @@ class Word2Vec(object):
     """Build the model graph."""
     opts = self._options
 
-    # The training data. A text file.
+    # The training data. A text file, or word ids preprocessed from it.
+    if opts.preprocessed_dir:
+      vocab_file, ids_file = word2vec_data.preprocess(
+          opts.train_data, opts.preprocessed_dir, opts.min_count,
+          num_processes=opts.input_workers)
+      skipgram = word2vec_data.skipgram_word2vec(
+          vocab_file, ids_file, batch_size=opts.batch_size,
+          window_size=opts.window_size, subsample=opts.subsample,
+          num_parallel_calls=opts.input_workers)
+    else:
+      skipgram = word2vec.skipgram_word2vec(filename=opts.train_data,
+                                            batch_size=opts.batch_size,
+                                            window_size=opts.window_size,
+                                            min_count=opts.min_count,
+                                            subsample=opts.subsample)
     (words, counts, words_per_epoch, current_epoch, total_words_processed,
-     examples, labels) = word2vec.skipgram_word2vec(filename=opts.train_data,
-                                                    batch_size=opts.batch_size,
-                                                    window_size=opts.window_size,
-                                                    min_count=opts.min_count,
-                                                    subsample=opts.subsample)
+     examples, labels) = skipgram
     (opts.vocab_words, opts.vocab_counts,
      opts.words_per_epoch) = self._session.run([words, counts, words_per_epoch])
     opts.vocab_size = len(opts.vocab_words)
@@ -36,6 +36,7 @@ class Word2VecTest(tf.test.TestCase):
     FLAGS.train_data = os.path.join(self.get_temp_dir(), "test-text.txt")
     FLAGS.eval_data = os.path.join(self.get_temp_dir(), "eval-text.txt")
     FLAGS.save_path = self.get_temp_dir()
+    FLAGS.preprocessed_dir = None
     with open(FLAGS.train_data, "w") as f:
       f.write(
           """alice was beginning to get very tired of sitting by her sister on
@@ -57,6 +58,15 @@ class Word2VecTest(tf.test.TestCase):
     FLAGS.min_count = 0
     word2vec.main([])
 
+  def testWord2VecPreprocessed(self):
+    FLAGS.batch_size = 5
+    FLAGS.num_neg_samples = 10
+    FLAGS.epochs_to_train = 1
+    FLAGS.min_count = 0
+    FLAGS.preprocessed_dir = os.path.join(self.get_temp_dir(), "preprocessed")
+    FLAGS.input_workers = 2
+    word2vec.main([])
+
 
 if __name__ == "__main__":
   tf.test.main()